@@ -0,0 +1,44 @@
+"""facturas/pagos: programación del sondeo de cancelaciones en el SAT
+
+Última verificación, próxima verificación e intentos por documento, para que
+las cancelaciones EN_CANCELACION se consulten en el SAT de forma continua
+con backoff (en vez de un solo barrido diario a las 3:00).
+
+Revision ID: a6d0e4b8c3f2
+Revises: f5c9d3a7b2e1
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "a6d0e4b8c3f2"
+down_revision = "f5c9d3a7b2e1"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    for tabla in ("facturas", "pagos"):
+        op.add_column(tabla, sa.Column("ultima_verificacion_sat", sa.DateTime(), nullable=True))
+        op.add_column(tabla, sa.Column("proxima_verificacion_sat", sa.DateTime(), nullable=True))
+        op.add_column(
+            tabla,
+            sa.Column("intentos_verificacion_sat", sa.Integer(), nullable=False, server_default="0"),
+        )
+    op.create_index(
+        "ix_facturas_estatus_proxima_sat", "facturas", ["estatus", "proxima_verificacion_sat"]
+    )
+    op.create_index(
+        "ix_pagos_estatus_proxima_sat", "pagos", ["estatus", "proxima_verificacion_sat"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_pagos_estatus_proxima_sat", table_name="pagos")
+    op.drop_index("ix_facturas_estatus_proxima_sat", table_name="facturas")
+    for tabla in ("facturas", "pagos"):
+        op.drop_column(tabla, "intentos_verificacion_sat")
+        op.drop_column(tabla, "proxima_verificacion_sat")
+        op.drop_column(tabla, "ultima_verificacion_sat")
@@ -0,0 +1,59 @@
+"""trabajos_timbrado: cola de timbrado asíncrono
+
+Tabla que usan los workers de timbrado (`python -m app.worker` o el pool en el
+proceso web) para tomar facturas por timbrar sin bloquear un hilo de la API
+durante toda la llamada al PAC.
+
+Revision ID: e4b8c2f6a1d9
+Revises: d3f7a9c1e5b2
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "e4b8c2f6a1d9"
+down_revision = "d3f7a9c1e5b2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "trabajos_timbrado",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("empresa_id", sa.UUID(), sa.ForeignKey("empresas.id"), nullable=False),
+        sa.Column(
+            "factura_id", sa.UUID(),
+            sa.ForeignKey("facturas.id", ondelete="CASCADE"), nullable=False,
+        ),
+        sa.Column("usuario_id", sa.UUID(), nullable=True),
+        sa.Column("estado", sa.String(length=20), nullable=False),
+        sa.Column("intentos", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("resultado", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column("creado_en", sa.DateTime(), server_default=sa.text("now()"), nullable=False),
+        sa.Column("iniciado_en", sa.DateTime(), nullable=True),
+        sa.Column("terminado_en", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_trabajos_timbrado_empresa_id", "trabajos_timbrado", ["empresa_id"])
+    op.create_index("ix_trabajos_timbrado_factura_id", "trabajos_timbrado", ["factura_id"])
+    op.create_index(
+        "ix_trabajos_timbrado_estado_creado", "trabajos_timbrado", ["estado", "creado_en"]
+    )
+    # Un solo trabajo activo por factura: dos encolados simultáneos no duplican el timbrado
+    op.create_index(
+        "ux_trabajos_timbrado_factura_activo", "trabajos_timbrado", ["factura_id"],
+        unique=True, postgresql_where=sa.text("estado IN ('EN_COLA', 'EN_PROCESO')"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ux_trabajos_timbrado_factura_activo", table_name="trabajos_timbrado")
+    op.drop_index("ix_trabajos_timbrado_estado_creado", table_name="trabajos_timbrado")
+    op.drop_index("ix_trabajos_timbrado_factura_id", table_name="trabajos_timbrado")
+    op.drop_index("ix_trabajos_timbrado_empresa_id", table_name="trabajos_timbrado")
+    op.drop_table("trabajos_timbrado")
@@ -0,0 +1,48 @@
+"""ejecuciones_sync_sat: corridas de la sincronización de cancelaciones con el SAT
+
+Avance y tiempos de cada corrida del cron de cancelaciones para el panel de
+administración; la fila EN_CURSO sirve también de candado entre instancias.
+
+Revision ID: f5c9d3a7b2e1
+Revises: e4b8c2f6a1d9
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "f5c9d3a7b2e1"
+down_revision = "e4b8c2f6a1d9"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "ejecuciones_sync_sat",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("estado", sa.String(length=20), nullable=False),
+        sa.Column("origen", sa.String(length=20), nullable=False, server_default="cron"),
+        sa.Column("total", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("consultados", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("aplicados", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("cambios", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("errores", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("consulta_ms", sa.Integer(), nullable=True),
+        sa.Column("aplicacion_ms", sa.Integer(), nullable=True),
+        sa.Column("detalle", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("iniciado_en", sa.DateTime(), server_default=sa.text("now()"), nullable=False),
+        sa.Column("terminado_en", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_ejecuciones_sync_sat_estado_iniciado", "ejecuciones_sync_sat", ["estado", "iniciado_en"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_ejecuciones_sync_sat_estado_iniciado", table_name="ejecuciones_sync_sat")
+    op.drop_table("ejecuciones_sync_sat")
@@ -1,17 +1,24 @@
 from __future__ import annotations
 
+from functools import lru_cache
 from typing import Optional, List
-from fastapi import APIRouter, HTTPException, Query, Path
+from fastapi import APIRouter, HTTPException, Query, Path, Request, Response
 
 # Catálogos existentes
 from app.catalogos_sat.regimenes_fiscales import obtener_todos_regimenes
-from app.catalogos_sat.codigos_postales import obtener_todos_codigos_postales
+from app.catalogos_sat.codigos_postales import (
+    CODIGOS_POSTALES_SAT,
+    obtener_todos_codigos_postales,
+    resolver_codigo_postal,
+)
 from app.catalogos_sat.productos import (
+    PRODUCTOS_SERVICIOS_SAT,
     obtener_todos_productos,
     buscar_claves_producto,
     descripcion_clave_producto,
 )
 from app.catalogos_sat.unidades import (
+    UNIDADES_MEDIDA_SAT,
     obtener_todas_unidades,
     buscar_claves_unidad,
     descripcion_clave_unidad,
@@ -27,10 +34,74 @@ from app.catalogos_sat.facturacion import (
     obtener_todas_motivos_cancelacion,
 )
 
-from app.schemas.catalogos import CatalogoItem, CatalogoSearchItem
+from app.schemas.catalogos import CatalogoItem, CatalogoSearchItem, CodigoPostalInfo
+from app.utils.static_payload import (
+    CACHE_CONTROL,
+    build_json_payload,
+    dumps_json,
+    etag_matches,
+    not_modified,
+    payload_response,
+)
 
 router = APIRouter()
 
+# ────────────────────────────────────────────────────────────────
+# CATÁLOGOS COMPLETOS PRE-SERIALIZADOS
+#
+# Los catálogos grandes sólo cambian cuando el SAT publica una versión nueva
+# (es decir, con un despliegue). Se serializan y comprimen una vez por proceso
+# y se sirven con ETag fuerte + If-None-Match (304) y Cache-Control largo.
+
+_CATALOGOS_ESTATICOS = {
+    "codigos-postales": (obtener_todos_codigos_postales, CODIGOS_POSTALES_SAT, lambda it: it),
+    "productos": (
+        obtener_todos_productos,
+        PRODUCTOS_SERVICIOS_SAT,
+        lambda it: {"value": it["clave"], "label": it["descripcion"]},
+    ),
+    "unidades": (
+        obtener_todas_unidades,
+        UNIDADES_MEDIDA_SAT,
+        lambda it: {"value": it["clave"], "label": it["descripcion"]},
+    ),
+}
+
+
+@lru_cache(maxsize=None)
+def _payload(nombre: str):
+    obtener_todos, _, _ = _CATALOGOS_ESTATICOS[nombre]
+    return build_json_payload(obtener_todos())
+
+
+def _respuesta_catalogo(
+    request: Request, nombre: str, offset: Optional[int], limit: Optional[int]
+) -> Response:
+    """Catálogo completo desde el payload pre-comprimido, o una página si se pide."""
+    payload = _payload(nombre)
+    if offset is None and limit is None:
+        return payload_response(request, payload)
+
+    if etag_matches(request, payload.etag):
+        return not_modified(payload.etag)
+    _, catalogo, mapear = _CATALOGOS_ESTATICOS[nombre]
+    inicio = offset or 0
+    fin = inicio + limit if limit else len(catalogo)
+    pagina = [mapear(it) for it in catalogo[inicio:fin]]
+    return Response(
+        content=dumps_json(pagina),
+        media_type="application/json",
+        headers={
+            "ETag": f'"{payload.etag}-o{inicio}-l{limit or 0}"',
+            "Cache-Control": CACHE_CONTROL,
+            "X-Total-Count": str(len(catalogo)),
+        },
+    )
+
+
+_OFFSET = Query(None, ge=0, description="Paginación opcional: índice inicial")
+_LIMIT = Query(None, ge=1, le=5000, description="Paginación opcional: tamaño de página")
+
 # ────────────────────────────────────────────────────────────────
 # CATÁLOGOS GENERALES
 
@@ -70,34 +141,56 @@ def obtener_regimenes_fiscales():
 @router.get(
     "/codigos-postales", response_model=List[CatalogoItem], summary="Listar códigos postales"
 )
-def obtener_codigos_postales():
+def obtener_codigos_postales(
+    request: Request, offset: Optional[int] = _OFFSET, limit: Optional[int] = _LIMIT
+):
     """
-    Devuelve todos los códigos postales válidos.
+    Devuelve todos los códigos postales válidos (o una página con offset/limit).
     Cada elemento: { "clave": str, "descripcion": str }
     """
-    return obtener_todos_codigos_postales()
+    return _respuesta_catalogo(request, "codigos-postales", offset, limit)
 
 
 @router.get(
     "/productos", response_model=List[CatalogoSearchItem], summary="Listar claves de productos"
 )
-def obtener_productos():
+def obtener_productos(
+    request: Request, offset: Optional[int] = _OFFSET, limit: Optional[int] = _LIMIT
+):
     """
-    Obtiene todas las claves de productos del catálogo SAT.
+    Obtiene todas las claves de productos del catálogo SAT (o una página con offset/limit).
     Cada elemento: { "value": str, "label": str }
     """
-    return obtener_todos_productos()
+    return _respuesta_catalogo(request, "productos", offset, limit)
 
 
 @router.get(
     "/unidades", response_model=List[CatalogoSearchItem], summary="Listar claves de unidades"
 )
-def obtener_unidades():
+def obtener_unidades(
+    request: Request, offset: Optional[int] = _OFFSET, limit: Optional[int] = _LIMIT
+):
     """
-    Obtiene todas las claves de unidades de medida del catálogo SAT.
+    Obtiene todas las claves de unidades de medida del catálogo SAT (o una página con offset/limit).
     Cada elemento: { "value": str, "label": str }
     """
-    return obtener_todas_unidades()
+    return _respuesta_catalogo(request, "unidades", offset, limit)
+
+
+@router.get(
+    "/cp/{cp}", response_model=CodigoPostalInfo, summary="Resolver código postal (autollenado)"
+)
+def endpoint_resolver_cp(
+    cp: str = Path(..., min_length=4, max_length=5, pattern=r"^\d+$", description="Código postal"),
+):
+    """
+    Resuelve estado y claves c_Colonia de un CP con los catálogos SAT locales (sin red).
+    Pensado para autollenar formularios de dirección.
+    """
+    info = resolver_codigo_postal(cp)
+    if not info:
+        raise HTTPException(status_code=404, detail="Código postal no encontrado")
+    return info
 
 
 # ────────────────────────────────────────────────────────────────
@@ -109,12 +202,14 @@ def obtener_unidades():
 )
 def endpoint_buscar_productos(
     q: str = Query(..., min_length=3, description="Texto para filtrar claves/descripcion"),
+    limit: int = Query(25, ge=1, le=200, description="Máximo de resultados"),
 ):
     """
-    Busca claves de producto que contengan la cadena `q`.
+    Busca claves de producto que contengan la cadena `q` (sin distinguir acentos).
+    Orden: clave exacta > prefijo > subcadena.
     Retorna: lista de { "value": str, "label": str }
     """
-    items = buscar_claves_producto(q)
+    items = buscar_claves_producto(q, limit)
     # Normalizar a {value,label}
     return [{"value": it.get("clave"), "label": it.get("descripcion")} for it in items]
 
@@ -124,12 +219,14 @@ def endpoint_buscar_productos(
 )
 def endpoint_buscar_unidades(
     q: str = Query(..., min_length=2, description="Texto para filtrar claves/descripcion"),
+    limit: int = Query(25, ge=1, le=200, description="Máximo de resultados"),
 ):
     """
-    Busca claves de unidad que contengan la cadena `q`.
+    Busca claves de unidad que contengan la cadena `q` (sin distinguir acentos).
+    Orden: clave exacta > prefijo > subcadena.
     Retorna: lista de { "value": str, "label": str }
     """
-    items = buscar_claves_unidad(q)
+    items = buscar_claves_unidad(q, limit)
     # Normalizar a {value,label}
     return [{"value": it.get("clave"), "label": it.get("descripcion")} for it in items]
 
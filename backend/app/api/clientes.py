@@ -10,7 +10,7 @@ from uuid import UUID
 
 from app.utils.excel import generate_excel
 # Catálogos
-from app.catalogos_sat.regimenes_fiscales import REGIMENES_FISCALES_SAT
+from app.catalogos_sat.registro import indice as indice_sat
 
 from app.database import get_db
 from app.models.empresa import Empresa
@@ -187,8 +187,8 @@ def exportar_clientes_excel(
         nombre_razon_social=nombre_razon_social,
     )
 
-    # Mapa de regimenes
-    map_regimenes = {i["clave"]: i["descripcion"] for i in REGIMENES_FISCALES_SAT}
+    # Regímenes fiscales (índice O(1) por clave)
+    regimenes = indice_sat("c_regimenfiscal")
 
     data_list = []
     for c in items:
@@ -207,8 +207,8 @@ def exportar_clientes_excel(
 
         # Regimen fiscal description
         regimen_desc = c.regimen_fiscal
-        if c.regimen_fiscal and c.regimen_fiscal in map_regimenes:
-            regimen_desc = f"{c.regimen_fiscal} - {map_regimenes[c.regimen_fiscal]}"
+        if c.regimen_fiscal and regimenes.exists(c.regimen_fiscal):
+            regimen_desc = f"{c.regimen_fiscal} - {regimenes.label(c.regimen_fiscal)}"
 
         data_list.append({
             "nombre_comercial": c.nombre_comercial,
@@ -19,7 +19,7 @@ from app.services import auditoria_service as audit_svc
 from app.models.usuario import Usuario, RolUsuario
 from app.api import deps
 # Catálogos
-from app.catalogos_sat.facturacion import FORMA_PAGO
+from app.catalogos_sat.registro import indice as indice_sat
 
 router = APIRouter()
 
@@ -228,15 +228,15 @@ def exportar_egresos_excel(
     )
 
     # Nota: En Egresos, el campo 'metodo_pago' suele guardar claves de 'Forma de Pago' (example: 03, 01)
-    # por lo que usamos FORMA_PAGO para obtener la descripción.
-    map_formas = {i["clave"]: i["descripcion"] for i in FORMA_PAGO}
+    # por lo que usamos el catálogo c_FormaPago para obtener la descripción.
+    formas = indice_sat("c_formapago")
 
     data_list = []
     for e in items:
         # Metodo pago desc (usando catálogo de formas)
         metodo_desc = e.metodo_pago
-        if e.metodo_pago and e.metodo_pago in map_formas:
-            metodo_desc = f"{e.metodo_pago} - {map_formas[e.metodo_pago]}"
+        if e.metodo_pago and formas.exists(e.metodo_pago):
+            metodo_desc = f"{e.metodo_pago} - {formas.label(e.metodo_pago)}"
 
         # Clean Enums
         cat_str = e.categoria.value if hasattr(e.categoria, 'value') else str(e.categoria)
@@ -4,11 +4,11 @@ import logging
 import os
 from uuid import UUID
 from typing import List, Optional, Literal
-from datetime import date
+from datetime import date, datetime
 
 from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, status, Response
 from fastapi.responses import FileResponse, StreamingResponse
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, Field, field_validator
 from sqlalchemy.orm import Session, selectinload
 
 from app.utils.excel import generate_excel
@@ -31,14 +31,16 @@ from app.services.email_sender import EmailSendingError
 from app.models.email_config import EmailConfig
 from app.core.limiter import limiter
 from app.services import auditoria_service as audit_svc
+from app.services.sellado_lote import sellar_facturas_lote
+from app.services import cola_timbrado
+from app.services.timbrado_lote import encolar_facturas_lote
+from app.services import sync_cancelaciones_service
+from app.services import pdf_cache
+from app.services import paquete_service
+from app.models.empresa import Empresa
 
 # Catálogos para exportación
-from app.catalogos_sat.facturacion import (
-    METODO_PAGO, 
-    FORMA_PAGO, 
-    USO_CFDI
-)
-from app.catalogos_sat.regimenes_fiscales import REGIMENES_FISCALES_SAT
+from app.catalogos_sat.registro import indice as indice_sat
 
 logger = logging.getLogger("app")
 router = APIRouter()
@@ -90,6 +92,76 @@ class CancelarIn(BaseModel):
         return v
 
 
+class SellarLoteIn(BaseModel):
+    ids: List[UUID] = Field(..., min_length=1, max_length=500)
+
+
+class SellarLoteItem(BaseModel):
+    id: UUID
+    ok: bool
+    xml: Optional[str] = None
+    error: Optional[str] = None
+
+
+class SellarLoteOut(BaseModel):
+    total: int
+    sellados: int
+    errores: int
+    resultados: List[SellarLoteItem]
+
+
+class TimbrarLoteIn(BaseModel):
+    ids: List[UUID] = Field(..., min_length=1, max_length=500)
+
+
+class TimbrarLoteItem(BaseModel):
+    id: UUID
+    ok: bool
+    trabajo_id: Optional[UUID] = None
+    estado: Optional[str] = None
+    error: Optional[str] = None
+
+
+class TimbrarLoteOut(BaseModel):
+    total: int
+    encoladas: int
+    errores: int
+    resultados: List[TimbrarLoteItem]
+
+
+class TrabajoTimbradoOut(BaseModel):
+    id: UUID
+    factura_id: UUID
+    estado: str  # EN_COLA | EN_PROCESO | COMPLETADO | FALLIDO
+    intentos: int
+    error: Optional[str] = None
+    resultado: Optional[dict] = None
+    creado_en: Optional[datetime] = None
+    iniciado_en: Optional[datetime] = None
+    terminado_en: Optional[datetime] = None
+
+    model_config = {"from_attributes": True}
+
+
+class EjecucionSyncSATOut(BaseModel):
+    id: UUID
+    estado: str  # EN_CURSO | COMPLETADA | FALLIDA
+    origen: str
+    total: int
+    consultados: int
+    aplicados: int
+    cambios: int
+    errores: int
+    consulta_ms: Optional[int] = None
+    aplicacion_ms: Optional[int] = None
+    detalle: Optional[dict] = None
+    error: Optional[str] = None
+    iniciado_en: Optional[datetime] = None
+    terminado_en: Optional[datetime] = None
+
+    model_config = {"from_attributes": True}
+
+
 # ────────────────────────────────────────────────────────────────
 # Endpoints
 
@@ -163,9 +235,8 @@ def exportar_facturas_excel(
         offset=0,
     )
 
-    # Preparar mapas de catálogos
-    map_metodos = {i["clave"]: i["descripcion"] for i in METODO_PAGO}
-    # map_formas = {i["clave"]: i["descripcion"] for i in FORMA_PAGO} # Si se usa forma_pago
+    # Catálogos indexados (O(1) por clave)
+    metodos = indice_sat("c_metodopago")
     
     # Preparar datos para Excel
     data_list = []
@@ -176,8 +247,8 @@ def exportar_facturas_excel(
         
         # Obtener descripción de método de pago si existe
         metodo_desc = f.metodo_pago
-        if f.metodo_pago and f.metodo_pago in map_metodos:
-            metodo_desc = f"{f.metodo_pago} - {map_metodos[f.metodo_pago]}"
+        if f.metodo_pago and metodos.exists(f.metodo_pago):
+            metodo_desc = f"{f.metodo_pago} - {metodos.label(f.metodo_pago)}"
 
         data_list.append({
             "folio_completo": f"{f.serie or ''}-{f.folio or ''}",
@@ -219,6 +290,41 @@ def exportar_facturas_excel(
     return StreamingResponse(excel_file, headers=headers_resp, media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
 
 
+@router.get("/paquete", summary="ZIP con XML, PDF e índice CSV de las facturas timbradas del periodo")
+def descargar_paquete_facturas(
+    empresa_id: UUID = Query(...),
+    desde: date = Query(...),
+    hasta: date = Query(...),
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(deps.get_current_active_user),
+):
+    if current_user.rol == RolUsuario.SUPERVISOR and empresa_id != current_user.empresa_id:
+        raise HTTPException(status_code=403, detail="No autorizado para esta empresa")
+    if hasta < desde:
+        raise HTTPException(status_code=400, detail="'hasta' debe ser igual o posterior a 'desde'")
+    if db.get(Empresa, empresa_id) is None:
+        raise HTTPException(status_code=404, detail="Empresa no encontrada")
+
+    # Sólo las columnas del índice; XML y PDF se leen mientras se envía el ZIP
+    documentos = paquete_service.documentos_facturas(db, empresa_id, desde, hasta)
+    nombre = paquete_service.nombre_zip(db, "facturas", empresa_id, desde, hasta)
+    try:
+        audit_svc.registrar(
+            db=db, accion=audit_svc.EXPORTAR_PAQUETE, entidad="factura",
+            usuario_id=current_user.id, usuario_email=current_user.email,
+            empresa_id=empresa_id,
+            detalle={"registros": len(documentos), "desde": str(desde), "hasta": str(hasta)},
+        )
+        db.commit()
+    except Exception:
+        pass
+    return StreamingResponse(
+        paquete_service.generar_zip(documentos),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{nombre}"'},
+    )
+
+
 @router.put("/{id}", response_model=FacturaOut)
 def actualizar_factura_endpoint(
     id: UUID, 
@@ -375,7 +481,11 @@ def obtener_por_folio_endpoint(
 @limiter.limit("10/minute")
 def timbrar_endpoint(
     request: Request,
+    response: Response,
     id: UUID,
+    asincrono: Optional[bool] = Query(
+        None, description="Encola el timbrado y responde 202 con el id del trabajo"
+    ),
     db: Session = Depends(get_db),
     current_user: Usuario = Depends(deps.get_current_active_user),
 ):
@@ -385,6 +495,12 @@ def timbrar_endpoint(
     if current_user.rol == RolUsuario.SUPERVISOR and factura.empresa_id != current_user.empresa_id:
         raise HTTPException(status_code=404, detail="Factura no encontrada")
 
+    if settings.TIMBRADO_ASINCRONO if asincrono is None else asincrono:
+        trabajo = cola_timbrado.encolar_timbrado(db, factura, usuario_id=current_user.id)
+        response.status_code = status.HTTP_202_ACCEPTED
+        response.headers["Location"] = f"/api/facturas/timbrado/trabajos/{trabajo.id}"
+        return TrabajoTimbradoOut.model_validate(trabajo)
+
     result = srv.timbrar_factura(db, id)
     try:
         audit_svc.registrar(
@@ -399,6 +515,86 @@ def timbrar_endpoint(
     return result
 
 
+@router.get(
+    "/timbrado/trabajos/{trabajo_id}",
+    response_model=TrabajoTimbradoOut,
+    summary="Estado de un timbrado asíncrono",
+)
+def estado_trabajo_timbrado(
+    trabajo_id: UUID,
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(deps.get_current_active_user),
+):
+    trabajo = cola_timbrado.obtener_trabajo(db, trabajo_id)
+    if not trabajo or (
+        current_user.rol == RolUsuario.SUPERVISOR and trabajo.empresa_id != current_user.empresa_id
+    ):
+        raise HTTPException(status_code=404, detail="Trabajo de timbrado no encontrado")
+    return trabajo
+
+
+@router.get(
+    "/sat/sincronizaciones",
+    response_model=List[EjecucionSyncSATOut],
+    summary="Últimas ejecuciones de la sincronización de cancelaciones con el SAT",
+)
+def listar_sincronizaciones_sat(
+    limite: int = Query(20, ge=1, le=200),
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(deps.require_admin_or_above),
+):
+    return sync_cancelaciones_service.ultimas_ejecuciones(db, limite)
+
+
+@router.get("/sat/sondeo", summary="Estado del sondeo de cancelaciones en el SAT")
+def estado_sondeo_sat(
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(deps.require_admin_or_above),
+):
+    return sync_cancelaciones_service.estado_sondeo(db)
+
+
+@router.post(
+    "/sat/sincronizar",
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Lanza la sincronización de cancelaciones con el SAT en segundo plano",
+)
+def sincronizar_cancelaciones_sat(
+    background_tasks: BackgroundTasks,
+    current_user: Usuario = Depends(deps.require_admin_or_above),
+):
+    background_tasks.add_task(sync_cancelaciones_service.sincronizar_cancelaciones, origen="manual")
+    return {"detail": "Sincronización iniciada; consulta el avance en /api/facturas/sat/sincronizaciones"}
+
+
+@router.get("/pdf/cache", summary="Estado del caché de PDFs finales")
+def estado_cache_pdf(current_user: Usuario = Depends(deps.require_admin_or_above)):
+    return pdf_cache.estado()
+
+
+@router.delete("/pdf/cache", summary="Purga el caché de PDFs (todo o de una empresa)")
+def purgar_cache_pdf(
+    empresa_id: Optional[UUID] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(deps.require_admin_or_above),
+):
+    return {"eliminados": pdf_cache.purgar(db, empresa_id)}
+
+
+@router.post(
+    "/pdf/cache/reconstruir",
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Regenera en segundo plano los PDFs finales que no estén al día",
+)
+def reconstruir_cache_pdf(
+    background_tasks: BackgroundTasks,
+    empresa_id: Optional[UUID] = Query(None),
+    current_user: Usuario = Depends(deps.require_admin_or_above),
+):
+    background_tasks.add_task(pdf_cache.reconstruir, empresa_id=empresa_id)
+    return {"detail": "Reconstrucción iniciada; consulta el avance en /api/facturas/pdf/cache"}
+
+
 @router.post("/{id}/cancelar")
 def solicitar_cancelacion_endpoint(
     id: UUID, payload: CancelarIn,
@@ -488,6 +684,7 @@ def verificar_estado_sat(
             rfc_receptor=rfc_receptor.strip().upper(),
             total=total,
             uuid=factura.cfdi_uuid,
+            xml_path=factura.xml_path,
         )
     except RuntimeError as e:
         raise HTTPException(status_code=502, detail=f"Error al consultar SAT: {e}")
@@ -497,6 +694,7 @@ def verificar_estado_sat(
 
     estatus_anterior = factura.estatus
     nuevo_estatus, _ = sat_svc.aplicar_acuse_sat(factura, acuse)
+    sync_cancelaciones_service.registrar_verificacion(factura, acuse)
     db.add(factura)
 
     aud.registrar(
@@ -585,6 +783,55 @@ def generar_xml_preview(
     return Response(content=xml_bytes, media_type="application/xml")
 
 
+@router.post(
+    "/sellar-lote",
+    response_model=SellarLoteOut,
+    summary="Genera y sella el XML CFDI 4.0 (sin timbrar) de varias facturas",
+)
+def sellar_lote(
+    payload: SellarLoteIn,
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(deps.get_current_active_user),
+):
+    empresa_id = current_user.empresa_id if current_user.rol == RolUsuario.SUPERVISOR else None
+    resultados = sellar_facturas_lote(db, payload.ids, empresa_id=empresa_id)
+    sellados = sum(1 for r in resultados if r["ok"])
+    return SellarLoteOut(
+        total=len(resultados),
+        sellados=sellados,
+        errores=len(resultados) - sellados,
+        resultados=resultados,
+    )
+
+
+@router.post(
+    "/timbrar-lote",
+    response_model=TimbrarLoteOut,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Encola el timbrado de varias facturas (trabajo por factura)",
+)
+@limiter.limit("10/minute")
+def timbrar_lote(
+    request: Request,
+    payload: TimbrarLoteIn,
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(deps.get_current_active_user),
+):
+    # El estado de cada timbrado se consulta en /timbrado/trabajos/{trabajo_id};
+    # el worker registra la auditoría al terminar
+    empresa_id = current_user.empresa_id if current_user.rol == RolUsuario.SUPERVISOR else None
+    resultados = encolar_facturas_lote(
+        db, payload.ids, empresa_id=empresa_id, usuario_id=current_user.id
+    )
+    encoladas = sum(1 for r in resultados if r["ok"])
+    return TimbrarLoteOut(
+        total=len(resultados),
+        encoladas=encoladas,
+        errores=len(resultados) - encoladas,
+        resultados=resultados,
+    )
+
+
 @router.get("/{id}/preview-pdf", summary="PDF de vista previa (marca BORRADOR)")
 def preview_pdf(
     id: UUID,
@@ -602,16 +849,21 @@ def preview_pdf(
 @router.get("/{id}/pdf", summary="PDF final (TIMBRADA o CANCELADA)")
 def factura_pdf(
     id: UUID,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: Usuario = Depends(deps.get_current_active_user),
 ):
-    pdf_bytes = srv.generar_pdf_bytes(db, id, preview=False)
-    # El nombre del archivo se podría obtener del servicio también si se quisiera.
-    return Response(
-        content=pdf_bytes,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f'inline; filename="factura-{id}.pdf"'},
-    )
+    ruta, clave, pdf_bytes = srv.obtener_pdf_final(db, id)
+    headers = {"Content-Disposition": f'inline; filename="factura-{id}.pdf"'}
+    if ruta is None:
+        return Response(content=pdf_bytes, media_type="application/pdf", headers=headers)
+
+    # Servido desde el caché: la clave del PDF es el ETag
+    etag = f'"{clave}"'
+    headers.update({"ETag": etag, "Cache-Control": "private, no-cache"})
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return FileResponse(path=ruta, media_type="application/pdf", headers=headers)
 
 
 @router.get("/{id}/xml", summary="Descargar XML timbrado")
@@ -7,6 +7,8 @@ from sqlalchemy import text
 
 from app.database import get_db
 from app.config import settings
+from app.services import computo, pac_http
+from app.services.pac_router import get_router
 
 router = APIRouter()
 
@@ -36,4 +38,23 @@ def readiness(db: Session = Depends(get_db)):
             },
         )
 
-    return {"status": "ok", "db": db_status}
+    return {
+        "status": "ok",
+        "db": db_status,
+        "pac_http": pac_http.estadisticas(),
+        "pac_circuito": get_router().circuitos(),
+        "pac": get_router().metricas(),
+        "computo": computo.metricas(),
+    }
+
+
+@router.get("/pac", summary="Métricas de ruteo entre PACs", tags=["health"])
+def pac_metricas():
+    """Latencia y errores recientes por proveedor PAC, orden de preferencia y failovers."""
+    return get_router().metricas()
+
+
+@router.get("/computo", summary="Métricas del pool de cómputo", tags=["health"])
+def computo_metricas():
+    """Tareas de CPU (PDFs, sellos, CSF): cola, rechazos, timeouts y latencias por tarea."""
+    return computo.metricas()
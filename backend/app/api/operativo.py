@@ -48,6 +48,7 @@ from app.services import tecnico_service as svc_tecnico
 from app.services import unidad_service as svc_unidad
 from app.services import mantenimiento_unidad_service as svc_mant
 from app.services import auditoria_service as audit_svc
+from app.services import computo
 from app.services.credencial_service import generar_credencial_pdf
 
 # Directorios de archivos
@@ -337,7 +338,9 @@ def descargar_credencial(
 
     qr_data = f"{settings.APP_URL}/verificar/{tecnico_id}"
 
-    pdf_bytes = generar_credencial_pdf(
+    pdf_bytes = computo.ejecutar(
+        generar_credencial_pdf,
+        tarea="credencial",
         tecnico_id=tecnico_id,
         nombre=tecnico.nombre or "",
         primer_apellido=tecnico.primer_apellido or "",
@@ -25,6 +25,8 @@ from app.api import deps
 from app.schemas.pago import Pago as PagoSchema, PagoCreate, PagoListResponse, CancelacionRequest
 from app.schemas.factura import FacturaOut
 from app.services import pago_service
+from app.services import paquete_service
+from app.models.empresa import Empresa
 from app.services.pdf_pago import render_pago_pdf_bytes_from_model
 from app.services.email_sender import send_pago_email, EmailSendingError
 from app.schemas.factura import SendEmailIn
@@ -33,7 +35,7 @@ from app.core.limiter import limiter
 from app.services import auditoria_service as audit_svc
 
 # Catálogos
-from app.catalogos_sat.facturacion import FORMA_PAGO
+from app.catalogos_sat.registro import indice as indice_sat
 
 router = APIRouter()
 
@@ -150,8 +152,8 @@ def exportar_pagos_excel(
         fecha_hasta=fecha_hasta,
     )
 
-    # Mapa de formas de pago
-    map_formas = {i["clave"]: i["descripcion"] for i in FORMA_PAGO}
+    # Formas de pago (índice O(1) por clave)
+    formas = indice_sat("c_formapago")
 
     data_list = []
     for p in items:
@@ -161,8 +163,8 @@ def exportar_pagos_excel(
         
         # Forma de pago description
         forma_desc = p.forma_pago_p
-        if p.forma_pago_p and p.forma_pago_p in map_formas:
-            forma_desc = f"{p.forma_pago_p} - {map_formas[p.forma_pago_p]}"
+        if p.forma_pago_p and formas.exists(p.forma_pago_p):
+            forma_desc = f"{p.forma_pago_p} - {formas.label(p.forma_pago_p)}"
             
         # Moneda
         moneda = p.moneda_p if hasattr(p, 'moneda_p') else p.moneda # Fallback por si acaso modelo difiere
@@ -208,6 +210,41 @@ def exportar_pagos_excel(
     return StreamingResponse(excel_file, headers=headers_resp, media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
 
 
+@router.get("/paquete", summary="ZIP con XML, PDF e índice CSV de los complementos de pago timbrados del periodo")
+def descargar_paquete_pagos(
+    empresa_id: uuid.UUID = Query(...),
+    desde: date = Query(...),
+    hasta: date = Query(...),
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(deps.get_current_active_user),
+):
+    if current_user.rol == RolUsuario.SUPERVISOR and empresa_id != current_user.empresa_id:
+        raise HTTPException(status_code=403, detail="No autorizado para esta empresa")
+    if hasta < desde:
+        raise HTTPException(status_code=400, detail="'hasta' debe ser igual o posterior a 'desde'")
+    if db.get(Empresa, empresa_id) is None:
+        raise HTTPException(status_code=404, detail="Empresa no encontrada")
+
+    # Sólo las columnas del índice; XML y PDF se leen mientras se envía el ZIP
+    documentos = paquete_service.documentos_pagos(db, empresa_id, desde, hasta)
+    nombre = paquete_service.nombre_zip(db, "pagos", empresa_id, desde, hasta)
+    try:
+        audit_svc.registrar(
+            db=db, accion=audit_svc.EXPORTAR_PAQUETE, entidad="pago",
+            usuario_id=current_user.id, usuario_email=current_user.email,
+            empresa_id=empresa_id,
+            detalle={"registros": len(documentos), "desde": str(desde), "hasta": str(hasta)},
+        )
+        db.commit()
+    except Exception:
+        pass
+    return StreamingResponse(
+        paquete_service.generar_zip(documentos),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{nombre}"'},
+    )
+
+
 
 @router.get("/{pago_id}", response_model=PagoSchema)
 def leer_pago(
@@ -472,6 +509,7 @@ def verificar_estado_sat_pago(
     current_user: Usuario = Depends(deps.get_current_active_user),
 ):
     from app.services import sat_cfdi_service as sat_svc
+    from app.services.sync_cancelaciones_service import registrar_verificacion
 
     pago = db.query(Pago).filter(Pago.id == pago_id).first()
     if not pago:
@@ -494,6 +532,7 @@ def verificar_estado_sat_pago(
             rfc_receptor=(getattr(getattr(pago, "cliente", None), "rfc", None) or "").strip().upper(),
             total=0.0,  # los complementos de pago timbran con Total=0
             uuid=pago.uuid,
+            xml_path=pago.xml_path,
         )
     except RuntimeError as e:
         raise HTTPException(status_code=502, detail=f"Error al consultar SAT: {e}")
@@ -505,6 +544,7 @@ def verificar_estado_sat_pago(
 
     estatus_anterior = estatus_actual
     nuevo_estatus, _ = sat_svc.aplicar_acuse_sat_pago(pago, acuse)
+    registrar_verificacion(pago, acuse)
     db.add(pago)
 
     audit_svc.registrar(
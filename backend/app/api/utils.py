@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, status, UploadFile, File
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 from app.database import get_db
 from app.models.usuario import Usuario
@@ -33,4 +34,5 @@ async def parse_csf_document(
     - Régimen Fiscal (si es posible extraerlo)
     """
     content = await file.read()
-    return utils_service.parse_csf_pdf(content)
+    # Fuera del event loop: la lectura del PDF (y la espera del pool) bloquea
+    return await run_in_threadpool(utils_service.parse_csf_pdf, content)
@@ -0,0 +1,157 @@
+# app/catalogos_sat/busqueda.py
+"""
+Índice de búsqueda para autocompletar claves SAT (productos, unidades).
+
+Antes cada tecla recorría el catálogo completo haciendo `.lower()` de cada
+descripción. Aquí el catálogo se normaliza una sola vez por proceso (al primer
+uso) y se indexa con:
+
+  - claves normalizadas (exactas y ordenadas, para prefijos por bisección),
+  - palabras de la descripción → posiciones (prefijo de palabra),
+  - trigramas → posiciones (subcadena arbitraria; se verifica sólo la lista
+    del trigrama más raro de la consulta).
+
+La normalización quita acentos y mayúsculas ("vehículo" == "VEHICULO").
+Orden de resultados: clave exacta > prefijo de clave > prefijo de palabra >
+subcadena; dentro de cada grupo, el orden original del catálogo.
+"""
+from __future__ import annotations
+
+import re
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional
+
+from app.catalogos_sat.store import Catalogo, cargar_catalogo
+
+_PALABRA = re.compile(r"\w+")
+
+
+def normalizar(texto: Optional[str]) -> str:
+    """Minúsculas y sin acentos/diacríticos."""
+    if not texto:
+        return ""
+    descompuesto = unicodedata.normalize("NFKD", texto)
+    return "".join(ch for ch in descompuesto if not unicodedata.combining(ch)).casefold()
+
+
+def _trigramas(texto: str) -> Iterable[str]:
+    return {texto[i : i + 3] for i in range(len(texto) - 2)}
+
+
+class IndiceBusqueda:
+    """Índice de búsqueda de un catálogo con columnas `clave` y `descripcion`."""
+
+    def __init__(self, catalogo: Catalogo):
+        self._catalogo = catalogo
+        claves: List[str] = []
+        textos: List[str] = []
+        exactas: Dict[str, int] = {}
+        palabras: Dict[str, array] = {}
+        trigramas: Dict[str, array] = {}
+
+        for i, item in enumerate(catalogo):
+            clave = normalizar(item.get("clave"))
+            texto = f"{clave} {normalizar(item.get('descripcion'))}"
+            claves.append(clave)
+            textos.append(texto)
+            exactas.setdefault(clave, i)
+            for palabra in set(_PALABRA.findall(texto)):
+                palabras.setdefault(palabra, array("I")).append(i)
+            for tg in _trigramas(texto):
+                trigramas.setdefault(tg, array("I")).append(i)
+
+        self._claves = claves
+        self._textos = textos
+        self._exactas = exactas
+        self._por_clave = sorted(range(len(claves)), key=claves.__getitem__)
+        self._palabras = palabras
+        self._palabras_ordenadas = sorted(palabras)
+        self._trigramas = trigramas
+
+    def __len__(self) -> int:
+        return len(self._textos)
+
+    # ── grupos de resultados, cada uno en orden de catálogo ─────────────────
+    def _prefijo_clave(self, q: str) -> List[int]:
+        claves = self._claves
+        j = bisect_left(self._por_clave, q, key=claves.__getitem__)
+        out = []
+        while j < len(self._por_clave) and claves[self._por_clave[j]].startswith(q):
+            out.append(self._por_clave[j])
+            j += 1
+        return sorted(out)
+
+    def _prefijo_palabra(self, q: str) -> List[int]:
+        m = _PALABRA.match(q)
+        if not m:
+            return []
+        token = m.group(0)
+        ordenadas = self._palabras_ordenadas
+        candidatos = set()
+        j = bisect_left(ordenadas, token)
+        while j < len(ordenadas) and ordenadas[j].startswith(token):
+            candidatos.update(self._palabras[ordenadas[j]])
+            j += 1
+        if token == q:
+            return sorted(candidatos)
+        frontera = " " + q
+        return sorted(i for i in candidatos if frontera in " " + self._textos[i])
+
+    def _subcadena(self, q: str) -> Iterable[int]:
+        if len(q) < 3:
+            posiciones: Iterable[int] = range(len(self._textos))
+        else:
+            listas = [self._trigramas.get(tg) for tg in _trigramas(q)]
+            if any(lista is None for lista in listas):
+                return ()
+            posiciones = min(listas, key=len)
+        textos = self._textos
+        return (i for i in posiciones if q in textos[i])
+
+    def buscar(self, q: str, limit: int = 25) -> List[Dict[str, str]]:
+        """Filas que contienen `q` en clave o descripción, rankeadas, hasta `limit`."""
+        nq = normalizar(q).strip()
+        if not nq or limit <= 0:
+            return []
+
+        vistos: set = set()
+        orden: List[int] = []
+
+        def agregar(posiciones: Iterable[int]) -> bool:
+            for i in posiciones:
+                if i not in vistos:
+                    vistos.add(i)
+                    orden.append(i)
+                    if len(orden) >= limit:
+                        return True
+            return False
+
+        exacta = self._exactas.get(nq)
+        grupos = (
+            lambda: () if exacta is None else (exacta,),
+            lambda: self._prefijo_clave(nq),
+            lambda: self._prefijo_palabra(nq),
+            lambda: self._subcadena(nq),
+        )
+        for grupo in grupos:
+            if agregar(grupo()):
+                break
+        return [self._catalogo[i] for i in orden]
+
+
+_indices: Dict[str, IndiceBusqueda] = {}
+_lock = threading.Lock()
+
+
+def indice_busqueda(nombre: str) -> IndiceBusqueda:
+    """Índice de búsqueda del catálogo `nombre`, construido una vez por proceso."""
+    idx = _indices.get(nombre)
+    if idx is None:
+        with _lock:
+            idx = _indices.get(nombre)
+            if idx is None:
+                idx = _indices[nombre] = IndiceBusqueda(cargar_catalogo(nombre))
+    return idx
@@ -1,11 +1,139 @@
 # app/catalogos_sat/codigos_postales.py
-from typing import List, Dict
-from app.catalogos_sat.datos.c_codigopostal import CATALOGO as CODIGOS_POSTALES_SAT
+import threading
+from functools import lru_cache
+from typing import List, Dict, Optional, Tuple
+
+from app.catalogos_sat.registro import indice
+from app.catalogos_sat.store import cargar_catalogo
+
+CODIGOS_POSTALES_SAT = cargar_catalogo("c_codigopostal")
+
+# Nombres de c_Estado (la hoja convertida sólo conserva clave → país).
+# Mismo formato que guardan los clientes: mayúsculas con acentos.
+ESTADOS_MX: Dict[str, str] = {
+    "AGU": "AGUASCALIENTES",
+    "BCN": "BAJA CALIFORNIA",
+    "BCS": "BAJA CALIFORNIA SUR",
+    "CAM": "CAMPECHE",
+    "CHP": "CHIAPAS",
+    "CHH": "CHIHUAHUA",
+    "COA": "COAHUILA",
+    "COL": "COLIMA",
+    "CMX": "CIUDAD DE MÉXICO",
+    "DUR": "DURANGO",
+    "GUA": "GUANAJUATO",
+    "GRO": "GUERRERO",
+    "HID": "HIDALGO",
+    "JAL": "JALISCO",
+    "MEX": "ESTADO DE MÉXICO",
+    "MIC": "MICHOACÁN",
+    "MOR": "MORELOS",
+    "NAY": "NAYARIT",
+    "NLE": "NUEVO LEÓN",
+    "OAX": "OAXACA",
+    "PUE": "PUEBLA",
+    "QUE": "QUERÉTARO",
+    "ROO": "QUINTANA ROO",
+    "SLP": "SAN LUIS POTOSÍ",
+    "SIN": "SINALOA",
+    "SON": "SONORA",
+    "TAB": "TABASCO",
+    "TAM": "TAMAULIPAS",
+    "TLA": "TLAXCALA",
+    "VER": "VERACRUZ",
+    "YUC": "YUCATÁN",
+    "ZAC": "ZACATECAS",
+}
+
+# Rangos SEPOMEX por los dos primeros dígitos del CP: cada estado tiene rangos
+# exclusivos, así que basta el prefijo para resolverlo.
+_PREFIJOS_ESTADO: Tuple[Tuple[int, int, str], ...] = (
+    (1, 16, "CMX"), (20, 20, "AGU"), (21, 22, "BCN"), (23, 23, "BCS"),
+    (24, 24, "CAM"), (25, 27, "COA"), (28, 28, "COL"), (29, 30, "CHP"),
+    (31, 33, "CHH"), (34, 35, "DUR"), (36, 38, "GUA"), (39, 41, "GRO"),
+    (42, 43, "HID"), (44, 49, "JAL"), (50, 57, "MEX"), (58, 61, "MIC"),
+    (62, 62, "MOR"), (63, 63, "NAY"), (64, 67, "NLE"), (68, 71, "OAX"),
+    (72, 75, "PUE"), (76, 76, "QUE"), (77, 77, "ROO"), (78, 79, "SLP"),
+    (80, 82, "SIN"), (83, 85, "SON"), (86, 86, "TAB"), (87, 89, "TAM"),
+    (90, 90, "TLA"), (91, 96, "VER"), (97, 97, "YUC"), (98, 99, "ZAC"),
+)
+
+_CATALOGOS_COLONIA = ("c_colonia_1", "c_colonia_2", "c_colonia_3")
 
 
 def validar_codigo_postal(clave: str) -> bool:
-    return any(cp["clave"] == clave for cp in CODIGOS_POSTALES_SAT)
+    return indice("c_codigopostal").exists(clave)
 
 
 def obtener_todos_codigos_postales() -> List[Dict[str, str]]:
-    return CODIGOS_POSTALES_SAT
+    return list(CODIGOS_POSTALES_SAT)
+
+
+def limpiar_codigo_postal(cp: Optional[str]) -> str:
+    """Sólo dígitos, rellenado a 5 ("2280" → "02280"); "" si no hay dígitos."""
+    digitos = "".join(c for c in (cp or "") if c.isdigit())
+    return digitos.zfill(5) if digitos else ""
+
+
+def _estado_por_prefijo(cp: str) -> Optional[str]:
+    prefijo = int(cp[:2])
+    for lo, hi, estado in _PREFIJOS_ESTADO:
+        if lo <= prefijo <= hi:
+            return estado
+    return None
+
+
+_colonias_por_cp: Optional[Dict[str, Tuple[str, ...]]] = None
+_colonias_lock = threading.Lock()
+
+
+def _colonias() -> Dict[str, Tuple[str, ...]]:
+    """Índice inverso CP → claves c_Colonia, construido una vez por proceso."""
+    global _colonias_por_cp
+    if _colonias_por_cp is None:
+        with _colonias_lock:
+            if _colonias_por_cp is None:
+                tmp: Dict[str, List[str]] = {}
+                for nombre in _CATALOGOS_COLONIA:
+                    for item in cargar_catalogo(nombre):
+                        clave, cp = item.get("clave", ""), item.get("descripcion", "")
+                        # Las hojas traen filas de encabezado ("c_Colonia", "Versión CFDI"...)
+                        if clave.isdigit() and cp.isdigit():
+                            tmp.setdefault(cp, []).append(clave)
+                _colonias_por_cp = {cp: tuple(v) for cp, v in tmp.items()}
+    return _colonias_por_cp
+
+
+@lru_cache(maxsize=4096)
+def _resolver(cp: str) -> Optional[Tuple[str, Optional[str], Tuple[str, ...]]]:
+    cp = limpiar_codigo_postal(cp)
+    fila = indice("c_codigopostal").get(cp) if cp else None
+    if fila is None:
+        return None
+    estado = _estado_por_prefijo(cp)
+    if estado is None and fila.get("descripcion") in ESTADOS_MX:
+        estado = fila["descripcion"]
+    return cp, estado, _colonias().get(cp, ())
+
+
+def resolver_codigo_postal(cp: str) -> Optional[Dict]:
+    """
+    Resuelve un CP con los catálogos SAT locales, sin red.
+    Devuelve {"codigo_postal", "estado", "estado_nombre", "colonias_claves"} o
+    None si el CP no existe en c_CodigoPostal.
+
+    Las hojas convertidas de c_Colonia y c_Municipio sólo traen claves (sin
+    nombre del asentamiento ni del municipio), así que la respuesta lleva las
+    claves c_Colonia del CP y no incluye municipio. Cada llamada regresa un
+    dict nuevo: el caché guarda sólo tuplas.
+    """
+    resuelto = _resolver(cp)
+    if resuelto is None:
+        return None
+    cp, estado, colonias = resuelto
+    return {
+        "codigo_postal": cp,
+        "estado": estado,
+        "estado_nombre": ESTADOS_MX.get(estado),
+        "colonias_claves": list(colonias),
+    }
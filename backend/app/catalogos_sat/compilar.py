@@ -0,0 +1,61 @@
+# app/catalogos_sat/compilar.py
+"""
+Paso de compilación de catálogos SAT.
+
+Convierte cada `app/catalogos_sat/datos/c_*.py` al formato binario de
+`app.catalogos_sat.store` (ver ahí el layout). Se ejecuta en el build de la imagen
+y cada vez que se actualicen los catálogos del SAT:
+
+    cd backend/
+    python -m app.catalogos_sat.compilar                 # todos los catálogos
+    python -m app.catalogos_sat.compilar c_claveprodserv # solo algunos
+    python -m app.catalogos_sat.compilar --destino /data/sat/catalogos
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import os
+import sys
+import time
+from typing import List
+
+from app.catalogos_sat import store
+
+DATOS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "datos")
+
+
+def catalogos_disponibles() -> List[str]:
+    """Nombres de los módulos de catálogo presentes en `datos/`."""
+    return sorted(
+        os.path.splitext(os.path.basename(p))[0]
+        for p in glob.glob(os.path.join(DATOS_DIR, "c_*.py"))
+    )
+
+
+def compilar_catalogo(nombre: str, destino: str = store.COMPILADOS_DIR) -> int:
+    """Compila un catálogo a `<destino>/<nombre>.satcat`. Devuelve filas escritas."""
+    filas = store.cargar_fuente(nombre)
+    return store.escribir_catalogo(filas, os.path.join(destino, nombre + store.EXTENSION))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compila los catálogos SAT a formato mmap.")
+    parser.add_argument("nombres", nargs="*", help="Catálogos a compilar (default: todos)")
+    parser.add_argument("--destino", default=store.COMPILADOS_DIR, help="Directorio de salida")
+    args = parser.parse_args(argv)
+
+    nombres = args.nombres or catalogos_disponibles()
+    for nombre in nombres:
+        t0 = time.perf_counter()
+        filas = compilar_catalogo(nombre, args.destino)
+        ruta = os.path.join(args.destino, nombre + store.EXTENSION)
+        print(
+            f"{nombre:<24} {filas:>8} filas  {os.path.getsize(ruta) / 1024:>9.1f} KiB"
+            f"  {time.perf_counter() - t0:6.2f}s"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,13 @@
 # app/catalogos_sat/facturacion.py
-from app.catalogos_sat.datos.c_tipodecomprobante import CATALOGO as TIPO_COMPROBANTE
-from app.catalogos_sat.datos.c_formapago import CATALOGO as FORMA_PAGO
-from app.catalogos_sat.datos.c_metodopago import CATALOGO as METODO_PAGO
-from app.catalogos_sat.datos.c_tiporelacion import CATALOGO as TIPO_RELACION
-from app.catalogos_sat.datos.c_motivocancelacion import CATALOGO as MOTIVO_CANCELACION
+from app.catalogos_sat.registro import indice
+from app.catalogos_sat.store import cargar_catalogo
 
-from app.catalogos_sat.datos.c_usocfdi import CATALOGO as USO_CFDI
+TIPO_COMPROBANTE = cargar_catalogo("c_tipodecomprobante")
+FORMA_PAGO = cargar_catalogo("c_formapago")
+METODO_PAGO = cargar_catalogo("c_metodopago")
+TIPO_RELACION = cargar_catalogo("c_tiporelacion")
+MOTIVO_CANCELACION = cargar_catalogo("c_motivocancelacion")
+USO_CFDI = cargar_catalogo("c_usocfdi")
 
 
 # Para tipocomprobante
@@ -14,12 +16,12 @@ def obtener_todos_tipos_comprobante() -> list[dict]:
     Devuelve la lista de tipos de comprobante disponibles en CFDI 4.0.
     Cada elemento es {"clave": str, "descripcion": str}.
     """
-    return TIPO_COMPROBANTE
+    return list(TIPO_COMPROBANTE)
 
 
 def validar_clave_tipo_comprobante(clave: str) -> bool:
     """Comprueba que la clave exista en el catálogo."""
-    return any(item["clave"] == clave for item in TIPO_COMPROBANTE)
+    return indice("c_tipodecomprobante").exists(clave)
 
 
 # Para forma de pago
@@ -28,12 +30,12 @@ def obtener_todas_formas_pago() -> list[dict]:
     Devuelve la lista de formas de pago disponibles en CFDI 4.0.
     Cada elemento es {"clave": str, "descripcion": str}.
     """
-    return FORMA_PAGO
+    return list(FORMA_PAGO)
 
 
 def validar_clave_forma_pago(clave: str) -> bool:
     """Comprueba que la clave exista en el catálogo."""
-    return any(item["clave"] == clave for item in FORMA_PAGO)
+    return indice("c_formapago").exists(clave)
 
 
 # Para metodo de pago
@@ -42,12 +44,12 @@ def obtener_todos_metodos_pago() -> list[dict]:
     Devuelve la lista de métodos de pago disponibles en CFDI 4.0.
     Cada elemento es {"clave": str, "descripcion": str}.
     """
-    return METODO_PAGO
+    return list(METODO_PAGO)
 
 
 def validar_clave_metodo_pago(clave: str) -> bool:
     """Comprueba que la clave exista en el catálogo."""
-    return any(item["clave"] == clave for item in METODO_PAGO)
+    return indice("c_metodopago").exists(clave)
 
 
 # Para usocfdi
@@ -56,12 +58,12 @@ def obtener_todos_usos_cfdi() -> list[dict]:
     Devuelve la lista de usos de CFDI disponibles en CFDI 4.0.
     Cada elemento es {"clave": str, "descripcion": str}.
     """
-    return USO_CFDI
+    return list(USO_CFDI)
 
 
 def validar_clave_usos_cfdi(clave: str) -> bool:
     """Comprueba que la clave exista en el catálogo."""
-    return any(item["clave"] == clave for item in USO_CFDI)
+    return indice("c_usocfdi").exists(clave)
 
 
 # Para tipo de relacion
@@ -70,12 +72,12 @@ def obtener_todas_tipos_relacion() -> list[dict]:
     Devuelve la lista de tipos de relación disponibles en CFDI 4.0.
     Cada elemento es {"clave": str, "descripcion": str}.
     """
-    return TIPO_RELACION
+    return list(TIPO_RELACION)
 
 
 def validar_clave_tipo_relacion(clave: str) -> bool:
     """Comprueba que la clave exista en el catálogo."""
-    return any(item["clave"] == clave for item in TIPO_RELACION)
+    return indice("c_tiporelacion").exists(clave)
 
 
 # Para motivos de cancelación
@@ -84,9 +86,9 @@ def obtener_todas_motivos_cancelacion() -> list[dict]:
     Devuelve la lista de motivos de cancelación disponibles en CFDI 4.0.
     Cada elemento es {"clave": str, "descripcion": str}.
     """
-    return MOTIVO_CANCELACION
+    return list(MOTIVO_CANCELACION)
 
 
 def validar_clave_motivo_cancelacion(clave: str) -> bool:
     """Comprueba que la clave exista en el catálogo."""
-    return any(item["clave"] == clave for item in MOTIVO_CANCELACION)
+    return indice("c_motivocancelacion").exists(clave)
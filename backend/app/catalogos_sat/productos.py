@@ -1,6 +1,10 @@
 # app/catalogos_sat/productos.py
 from typing import List, Dict, Optional
-from app.catalogos_sat.datos.c_claveprodserv import CATALOGO as PRODUCTOS_SERVICIOS_SAT
+from app.catalogos_sat.busqueda import indice_busqueda
+from app.catalogos_sat.registro import indice
+from app.catalogos_sat.store import cargar_catalogo
+
+PRODUCTOS_SERVICIOS_SAT = cargar_catalogo("c_claveprodserv")
 
 
 def obtener_todos_productos() -> list[dict]:
@@ -13,19 +17,16 @@ def obtener_todos_productos() -> list[dict]:
 
 def validar_clave_producto(clave: str) -> bool:
     """Comprueba que la clave exista en el catálogo."""
-    return any(item["clave"] == clave for item in PRODUCTOS_SERVICIOS_SAT)
+    return indice("c_claveprodserv").exists(clave)
 
 
-def buscar_claves_producto(q: str) -> List[Dict[str, str]]:
-    q_lower = q.lower()
-    return [
-        item
-        for item in PRODUCTOS_SERVICIOS_SAT
-        if q_lower in item["clave"].lower() or q_lower in item["descripcion"].lower()
-    ][:25]
+def buscar_claves_producto(q: str, limit: int = 25) -> List[Dict[str, str]]:
+    """
+    Busca por clave/descripción sin distinguir acentos ni mayúsculas.
+    Orden: clave exacta > prefijo > subcadena.
+    """
+    return indice_busqueda("c_claveprodserv").buscar(q, limit)
 
 
 def descripcion_clave_producto(clave: str) -> Optional[Dict[str, str]]:
-    return next(
-        (item for item in PRODUCTOS_SERVICIOS_SAT if item["clave"] == clave), None
-    )
+    return indice("c_claveprodserv").get(clave)
@@ -1,28 +1,26 @@
 # app/catalogos_sat/regimenes_fiscales.py
 
 from typing import List, Dict
-from app.catalogos_sat.datos.c_regimenfiscal import CATALOGO as REGIMENES_FISCALES_SAT
+from app.catalogos_sat.registro import indice
+from app.catalogos_sat.store import cargar_catalogo
+
+REGIMENES_FISCALES_SAT = cargar_catalogo("c_regimenfiscal")
 
 
 def validar_regimen_fiscal(clave: str) -> bool:
     """Valida si la clave de régimen fiscal existe en el catálogo."""
-    return any(rf["clave"] == clave for rf in REGIMENES_FISCALES_SAT)
+    return indice("c_regimenfiscal").exists(clave)
 
 
 def obtener_descripcion_regimen(clave: str) -> str:
     """Obtiene la descripción del régimen fiscal dado su clave."""
-    for rf in REGIMENES_FISCALES_SAT:
-        if rf["clave"] == clave:
-            return rf["descripcion"]
-    return ""
+    return indice("c_regimenfiscal").label(clave, "")
 
 
 def obtener_clave_regimen_por_descripcion(descripcion: str) -> str | None:
     """Obtiene la clave del régimen fiscal dada su descripción."""
-    for rf in REGIMENES_FISCALES_SAT:
-        if rf["descripcion"] == descripcion:
-            return rf["clave"]
-    return None
+    rf = indice("c_regimenfiscal", "descripcion").get(descripcion)
+    return rf["clave"] if rf else None
 
 
 
@@ -30,4 +28,4 @@ def obtener_todos_regimenes() -> List[Dict[str, str]]:
     """
     Devuelve la lista completa de regímenes fiscales
     """
-    return REGIMENES_FISCALES_SAT
+    return list(REGIMENES_FISCALES_SAT)
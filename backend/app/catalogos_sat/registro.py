@@ -0,0 +1,84 @@
+# app/catalogos_sat/registro.py
+"""
+Registro de índices hash de catálogos SAT.
+
+Cada catálogo se indexa una sola vez por proceso (al primer uso, no al importar)
+en un dict inmutable `clave → posición de fila`, de modo que validar una clave o
+resolver su descripción es O(1) en lugar de recorrer la lista completa.
+
+El índice guarda posiciones, no copias de las filas: la fila se lee del almacén
+(`store.cargar_catalogo`, mmap compartido) sólo cuando se pide con `get`/`label`.
+
+    from app.catalogos_sat.registro import indice
+
+    indice("c_codigopostal").exists("22000")           # -> bool
+    indice("c_formapago").get("03")                    # -> dict | None
+    indice("c_regimenfiscal").label("601")             # -> "General de Ley..."
+    indice("c_regimenfiscal", "descripcion").get(desc) # índice por otra columna
+"""
+from __future__ import annotations
+
+import threading
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional, Tuple
+
+from app.catalogos_sat.store import Catalogo, cargar_catalogo
+
+
+class IndiceCatalogo:
+    """Índice inmutable `valor de columna → fila`; ante duplicados gana la primera."""
+
+    __slots__ = ("nombre", "columna", "_catalogo", "_posiciones")
+
+    def __init__(self, nombre: str, catalogo: Catalogo, columna: str = "clave"):
+        self.nombre = nombre
+        self.columna = columna
+        self._catalogo = catalogo
+        posiciones: Dict[str, int] = {}
+        if columna == "clave":
+            valores = catalogo.claves()
+        else:
+            valores = (item.get(columna, "") for item in catalogo)
+        for i, valor in enumerate(valores):
+            posiciones.setdefault(valor, i)
+        self._posiciones: Mapping[str, int] = MappingProxyType(posiciones)
+
+    def __len__(self) -> int:
+        return len(self._posiciones)
+
+    def __contains__(self, valor) -> bool:
+        return valor in self._posiciones
+
+    def exists(self, valor: Optional[str]) -> bool:
+        """True si `valor` existe en el catálogo."""
+        return valor in self._posiciones
+
+    def get(self, valor: Optional[str]) -> Optional[Dict[str, str]]:
+        """Fila completa ({"clave", "descripcion", ...}) o None."""
+        i = self._posiciones.get(valor)
+        return None if i is None else self._catalogo[i]
+
+    def label(self, valor: Optional[str], default: Optional[str] = None) -> Optional[str]:
+        """Descripción de la fila, o `default` si no existe."""
+        fila = self.get(valor)
+        return fila.get("descripcion", default) if fila else default
+
+
+_indices: Dict[Tuple[str, str], IndiceCatalogo] = {}
+_lock = threading.Lock()
+
+
+def indice(nombre: str, columna: str = "clave") -> IndiceCatalogo:
+    """
+    Índice del catálogo `nombre` (p. ej. "c_claveprodserv") por `columna`.
+    Se construye una sola vez por proceso; seguro bajo el threadpool de Starlette.
+    """
+    key = (nombre, columna)
+    idx = _indices.get(key)
+    if idx is None:
+        with _lock:
+            idx = _indices.get(key)
+            if idx is None:
+                idx = _indices[key] = IndiceCatalogo(nombre, cargar_catalogo(nombre), columna)
+    return idx
+
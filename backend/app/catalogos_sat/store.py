@@ -0,0 +1,283 @@
+# app/catalogos_sat/store.py
+"""
+Almacén compilado de catálogos SAT.
+
+Los catálogos de `app/catalogos_sat/datos/` son listas de dicts en Python; los más
+grandes (colonias, pedimentos, códigos postales, claves de producto) cuestan
+varios segundos de import y decenas de MB por worker de uvicorn.
+
+`python -m app.catalogos_sat.compilar` los convierte a un archivo binario columnar
+por catálogo (tabla de strings deduplicada + índice ordenado por clave) que aquí
+se abre con `mmap`: todos los workers comparten las mismas páginas del page cache
+y el import es prácticamente instantáneo.
+
+Formato (little-endian, secciones alineadas a 4 bytes):
+
+    magic       8s   b"SATCAT01"
+    nrows       u32
+    ncols       u32
+    nstrings    u32
+    blob_size   u32
+    columnas    ncols × (u16 longitud + utf-8), relleno a 4
+    filas       nrows × ncols u32   (id de string, orden original)
+    orden       nrows u32           (índices de fila ordenados por clave, estable)
+    offsets     (nstrings + 1) u32  (inicio de cada string dentro del blob)
+    blob        blob_size bytes     (strings utf-8 concatenados)
+
+Si el archivo compilado no existe o es más viejo que su módulo fuente se usa el
+módulo Python como respaldo, de modo que en desarrollo todo sigue funcionando
+sin correr el paso de compilación.
+"""
+from __future__ import annotations
+
+import importlib
+import importlib.util
+import logging
+import mmap
+import os
+import struct
+import sys
+from collections.abc import Sequence
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+logger = logging.getLogger("app")
+
+MAGIC = b"SATCAT01"
+EXTENSION = ".satcat"
+_HEADER = struct.Struct("<8sIIII")
+
+# Se leen del entorno (y no de Settings) para que el paso de compilación y los
+# scripts puedan importar los catálogos sin DATABASE_URL ni secretos.
+COMPILADOS_DIR = os.environ.get(
+    "SAT_CATALOGOS_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "compilados"),
+)
+_USAR_COMPILADOS = os.environ.get("SAT_CATALOGOS_COMPILADOS", "1") != "0"
+
+_PAQUETE_DATOS = "app.catalogos_sat.datos"
+
+
+def _pad4(n: int) -> int:
+    return (n + 3) & ~3
+
+
+def _u32(buf, offset: int, count: int):
+    """Vista u32 sobre `buf` sin copiar (little-endian nativo) o lista desempacada."""
+    if sys.byteorder == "little":
+        return memoryview(buf)[offset : offset + 4 * count].cast("I")
+    return list(struct.unpack_from(f"<{count}I", buf, offset))
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Escritura
+# ──────────────────────────────────────────────────────────────────────────────
+def escribir_catalogo(filas: Iterable[Dict[str, str]], ruta: str) -> int:
+    """
+    Serializa `filas` al formato compilado en `ruta` (escritura atómica).
+    Devuelve el número de filas escritas.
+    """
+    filas = list(filas)
+    columnas: List[str] = []
+    for fila in filas:
+        for col in fila:
+            if col not in columnas:
+                columnas.append(col)
+
+    ids: Dict[str, int] = {}
+    strings: List[bytes] = []
+
+    def _id(valor) -> int:
+        s = "" if valor is None else str(valor)
+        sid = ids.get(s)
+        if sid is None:
+            sid = ids[s] = len(strings)
+            strings.append(s.encode("utf-8"))
+        return sid
+
+    celdas = [_id(fila.get(col)) for fila in filas for col in columnas]
+
+    if "clave" in columnas:
+        orden = sorted(range(len(filas)), key=lambda i: str(filas[i].get("clave") or ""))
+    else:
+        orden = list(range(len(filas)))
+
+    offsets = [0]
+    for s in strings:
+        offsets.append(offsets[-1] + len(s))
+
+    cab_cols = b"".join(
+        struct.pack("<H", len(c.encode("utf-8"))) + c.encode("utf-8") for c in columnas
+    )
+    cab_cols += b"\0" * (_pad4(len(cab_cols)) - len(cab_cols))
+
+    partes = [
+        _HEADER.pack(MAGIC, len(filas), len(columnas), len(strings), offsets[-1]),
+        cab_cols,
+        struct.pack(f"<{len(celdas)}I", *celdas),
+        struct.pack(f"<{len(orden)}I", *orden),
+        struct.pack(f"<{len(offsets)}I", *offsets),
+        b"".join(strings),
+    ]
+
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+    tmp = f"{ruta}.tmp.{os.getpid()}"
+    with open(tmp, "wb") as fh:
+        for p in partes:
+            fh.write(p)
+    os.replace(tmp, ruta)
+    return len(filas)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Lectura
+# ──────────────────────────────────────────────────────────────────────────────
+class CatalogoCompilado(Sequence):
+    """
+    Catálogo de solo lectura respaldado por `mmap`.
+
+    Se comporta como la lista de dicts original (`len`, índice, iteración) y
+    además ofrece `buscar(clave)` por búsqueda binaria sobre el índice ordenado.
+    Cada acceso construye un dict nuevo; nada se materializa por adelantado.
+    """
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        with open(ruta, "rb") as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, nrows, ncols, nstrings, blob_size = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{ruta}: no es un catálogo SAT compilado")
+
+        pos = _HEADER.size
+        columnas = []
+        for _ in range(ncols):
+            (n,) = struct.unpack_from("<H", self._mm, pos)
+            columnas.append(bytes(self._mm[pos + 2 : pos + 2 + n]).decode("utf-8"))
+            pos += 2 + n
+        pos = _pad4(pos)
+
+        self.columnas: tuple = tuple(columnas)
+        self._nrows = nrows
+        self._ncols = ncols
+        self._celdas = _u32(self._mm, pos, nrows * ncols)
+        pos += 4 * nrows * ncols
+        self._orden = _u32(self._mm, pos, nrows)
+        pos += 4 * nrows
+        self._offsets = _u32(self._mm, pos, nstrings + 1)
+        pos += 4 * (nstrings + 1)
+        self._blob = memoryview(self._mm)[pos : pos + blob_size]
+        self._col_clave = columnas.index("clave") if "clave" in columnas else None
+
+    def _texto(self, sid: int) -> str:
+        return str(self._blob[self._offsets[sid] : self._offsets[sid + 1]], "utf-8")
+
+    def _celda(self, fila: int, col: int) -> str:
+        return self._texto(self._celdas[fila * self._ncols + col])
+
+    def _fila(self, i: int) -> Dict[str, str]:
+        base = i * self._ncols
+        return {
+            col: self._texto(self._celdas[base + j]) for j, col in enumerate(self.columnas)
+        }
+
+    def __len__(self) -> int:
+        return self._nrows
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._fila(j) for j in range(*i.indices(self._nrows))]
+        if i < 0:
+            i += self._nrows
+        if not 0 <= i < self._nrows:
+            raise IndexError(i)
+        return self._fila(i)
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        for i in range(self._nrows):
+            yield self._fila(i)
+
+    def claves(self) -> Iterator[str]:
+        """Itera las claves en orden original sin construir dicts."""
+        if self._col_clave is None:
+            return iter(())
+        return (self._celda(i, self._col_clave) for i in range(self._nrows))
+
+    def buscar(self, clave: str) -> Optional[Dict[str, str]]:
+        """Primera fila (en orden original) con `clave`, o None. O(log n)."""
+        if self._col_clave is None:
+            return None
+        lo, hi = 0, self._nrows
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._celda(self._orden[mid], self._col_clave) < clave:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._nrows:
+            fila = self._orden[lo]
+            if self._celda(fila, self._col_clave) == clave:
+                return self._fila(fila)
+        return None
+
+
+class CatalogoEnMemoria(list):
+    """Respaldo cuando no hay archivo compilado: la lista original con `buscar`."""
+
+    _indice: Optional[Dict[str, Dict[str, str]]] = None
+
+    def claves(self) -> Iterator[str]:
+        return (item.get("clave", "") for item in self)
+
+    def buscar(self, clave: str) -> Optional[Dict[str, str]]:
+        if self._indice is None:
+            indice: Dict[str, Dict[str, str]] = {}
+            for item in self:
+                indice.setdefault(item.get("clave", ""), item)
+            self._indice = indice
+        return self._indice.get(clave)
+
+
+Catalogo = Union[CatalogoCompilado, CatalogoEnMemoria]
+
+
+def ruta_compilada(nombre: str) -> str:
+    return os.path.join(COMPILADOS_DIR, nombre + EXTENSION)
+
+
+def ruta_fuente(nombre: str) -> Optional[str]:
+    """Ruta del módulo `datos/<nombre>.py` sin importarlo, o None si no existe."""
+    try:
+        spec = importlib.util.find_spec(f"{_PAQUETE_DATOS}.{nombre}")
+    except ModuleNotFoundError:
+        return None
+    return spec.origin if spec else None
+
+
+def cargar_fuente(nombre: str) -> List[Dict[str, str]]:
+    """Importa el módulo Python original del catálogo y devuelve su CATALOGO."""
+    return importlib.import_module(f"{_PAQUETE_DATOS}.{nombre}").CATALOGO
+
+
+@lru_cache(maxsize=None)
+def cargar_catalogo(nombre: str) -> Catalogo:
+    """
+    Devuelve el catálogo `nombre` (p. ej. "c_claveprodserv"), una vez por proceso.
+
+    Prefiere el archivo compilado; si falta, está desactivado
+    (SAT_CATALOGOS_COMPILADOS=0) o es más viejo que el módulo fuente, importa el
+    módulo Python. Si no existe ninguno de los dos se propaga ModuleNotFoundError,
+    igual que con el import directo.
+    """
+    compilado = ruta_compilada(nombre)
+    if _USAR_COMPILADOS and os.path.exists(compilado):
+        fuente = ruta_fuente(nombre)
+        if fuente is None or os.path.getmtime(compilado) >= os.path.getmtime(fuente):
+            return CatalogoCompilado(compilado)
+        logger.warning(
+            "[Catálogos SAT] %s compilado es anterior a su fuente; usando módulo Python. "
+            "Ejecuta `python -m app.catalogos_sat.compilar`.",
+            nombre,
+        )
+    return CatalogoEnMemoria(cargar_fuente(nombre))
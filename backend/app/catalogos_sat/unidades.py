@@ -1,6 +1,10 @@
 # app/catalogos_sat/unidades.py
 from typing import List, Dict, Optional
-from app.catalogos_sat.datos.c_claveunidad import CATALOGO as UNIDADES_MEDIDA_SAT
+from app.catalogos_sat.busqueda import indice_busqueda
+from app.catalogos_sat.registro import indice
+from app.catalogos_sat.store import cargar_catalogo
+
+UNIDADES_MEDIDA_SAT = cargar_catalogo("c_claveunidad")
 
 
 def obtener_todas_unidades() -> list[dict]:
@@ -13,17 +17,16 @@ def obtener_todas_unidades() -> list[dict]:
 
 def validar_clave_unidad(clave: str) -> bool:
     """Comprueba que la unidad exista en el catálogo."""
-    return any(item["clave"] == clave for item in UNIDADES_MEDIDA_SAT)
+    return indice("c_claveunidad").exists(clave)
 
 
-def buscar_claves_unidad(q: str) -> List[Dict[str, str]]:
-    q_lower = q.lower()
-    return [
-        item
-        for item in UNIDADES_MEDIDA_SAT
-        if q_lower in item["clave"].lower() or q_lower in item["descripcion"].lower()
-    ][:25]
+def buscar_claves_unidad(q: str, limit: int = 25) -> List[Dict[str, str]]:
+    """
+    Busca por clave/descripción sin distinguir acentos ni mayúsculas.
+    Orden: clave exacta > prefijo > subcadena.
+    """
+    return indice_busqueda("c_claveunidad").buscar(q, limit)
 
 
 def descripcion_clave_unidad(clave: str) -> Optional[Dict[str, str]]:
-    return next((item for item in UNIDADES_MEDIDA_SAT if item["clave"] == clave), None)
+    return indice("c_claveunidad").get(clave)
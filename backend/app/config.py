@@ -1,5 +1,5 @@
 # app/config.py
-from typing import List
+from typing import Dict, List
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -17,11 +17,89 @@ class Settings(BaseSettings):
     CERT_DIR: str = "/data/certificados"
     DATA_DIR: str = "/data"
     CADENA40_XSLT_PATH: str = "/data/sat/cadenaoriginal_4_0.xslt"
+    # Cadena original: "nativa" (Python; XSLT sólo si hay nodos no cubiertos),
+    # "verificar" (calcula ambas, usa el XSLT y registra diferencias) o "xslt".
+    CADENA_ORIGINAL_MODO: str = "nativa"
+    # Procesos para sellar en lote (0 = uno por núcleo); si se define, también
+    # es el tamaño del pool de cómputo cuando COMPUTO_WORKERS es 0
+    SELLADO_WORKERS: int = 0
     
     # Facturación Moderna (PAC) — requeridos en .env, sin defaults en código
     FM_USER_ID: str
     FM_USER_PASS: str
     FM_TIMBRADO_URL: str = "http://t1.facturacionmoderna.com/timbrado/soap"
+    # Endpoints alternos de FM; el router (pac_router) hace failover entre todos
+    FM_TIMBRADO_URLS_RESPALDO: List[str] = []
+    # Reenviar a otro PAC aunque la petición pudo haber llegado (timeout de lectura).
+    # Con False sólo se hace failover si la conexión ni siquiera se abrió.
+    PAC_FAILOVER_TRAS_ENVIO: bool = False
+    PAC_VENTANA_METRICAS: int = 50  # llamadas recientes por proveedor
+    # Reintentos (sólo si la petición no llegó al PAC), backoff base en segundos
+    PAC_REINTENTOS: int = 2
+    PAC_REINTENTO_BASE_S: float = 0.5
+    # Circuit breaker por proveedor
+    PAC_CB_MIN_MUESTRAS: int = 5
+    PAC_CB_TASA_ERROR: float = 0.5
+    PAC_CB_LATENCIA_MS: float = 30000.0
+    PAC_CB_ENFRIAMIENTO_S: float = 30.0
+    # Storage del PAC de donde se descargan los acuses de cancelación
+    FM_STORAGE_URL: str = "https://storage.facturacionmoderna.com"
+    # Cliente HTTP compartido del PAC (segundos / conexiones)
+    FM_TIMEOUT_CONNECT: float = 10.0
+    FM_TIMEOUT_TIMBRAR: float = 60.0
+    FM_TIMEOUT_CANCELAR: float = 60.0
+    FM_MAX_CONNECTIONS: int = 20
+    FM_MAX_KEEPALIVE: int = 10
+    FM_KEEPALIVE_EXPIRY: float = 30.0
+    FM_HTTP2: bool = False  # requiere el paquete h2 y una URL https
+    # SOAP crudo del timbrado en el log: fracción muestreada (0-1) y bytes máximos.
+    # Con error (Fault, SOAP inválido) siempre se loguea.
+    FM_LOG_SOAP_MUESTREO: float = 0.0
+    FM_LOG_SOAP_MAX_BYTES: int = 20000
+
+    # Web service público del SAT para consultar el estado de un CFDI
+    SAT_CONSULTA_URL: str = (
+        "https://consultaqr.facturaelectronica.sat.gob.mx/ConsultaCFDIService.svc"
+    )
+    SAT_MAX_CONNECTIONS: int = 10  # conexiones del cliente compartido
+    # Cron de cancelaciones (app/services/sync_cancelaciones_service.py)
+    SAT_SYNC_CONCURRENCIA: int = 8  # consultas simultáneas al SAT
+    SAT_SYNC_LOTE: int = 100  # documentos por commit al aplicar resultados
+    # Una ejecución EN_CURSO más vieja que esto se considera muerta
+    SAT_SYNC_LEASE_MINUTOS: int = 120
+    # Sondeo adaptativo de cancelaciones (reemplaza el barrido diario de las 3:00)
+    SAT_POLL_ACTIVO: bool = True
+    SAT_POLL_INTERVALO_S: int = 60
+    SAT_POLL_RPM: int = 30  # presupuesto global de consultas al SAT por minuto
+    SAT_POLL_PRIMERA_MIN: float = 2.0  # primera verificación tras solicitar la cancelación
+    SAT_POLL_BASE_MIN: float = 5.0
+    SAT_POLL_MAX_MIN: float = 720.0  # tope del backoff esperando al receptor
+    SAT_POLL_RECLAMO_MIN: float = 10.0  # reintento si la consulta del ciclo falló
+
+    # Timbrado asíncrono (cola en BD, ver app/services/cola_timbrado.py)
+    TIMBRADO_ASINCRONO: bool = False  # modo por defecto de POST /facturas/{id}/timbrar
+    TIMBRADO_WORKERS: int = 4  # hilos del pool de timbrado
+    # Si es False, los trabajos sólo los procesa `python -m app.worker`
+    TIMBRADO_WORKERS_EN_PROCESO: bool = True
+    TIMBRADO_POLL_SEGUNDOS: float = 2.0
+    TIMBRADO_LIMITE_POR_EMPRESA: int = 2
+    # Excepciones por empresa, JSON: {"<empresa_id>": 5}
+    TIMBRADO_LIMITES_EMPRESA: Dict[str, int] = {}
+    # Timbrados simultáneos de POST /facturas/timbrar-lote y del cron de programaciones
+    TIMBRADO_LOTE_CONCURRENCIA: int = 8
+
+    # PDF final generado en segundo plano al timbrar (ver app/services/pdf_cache.py)
+    PDF_PRERENDER_ACTIVO: bool = True
+    PDF_PRERENDER_WORKERS: int = 2
+    # Hilos que generan/leen PDFs para el ZIP de GET /facturas/paquete y /pagos/paquete
+    PAQUETE_WORKERS: int = 4
+
+    # Pool de procesos para PDFs, sellos y lectura de CSF (ver app/services/computo.py)
+    COMPUTO_ACTIVO: bool = True
+    COMPUTO_WORKERS: int = 0  # 0 = SELLADO_WORKERS, o uno por núcleo
+    COMPUTO_MAX_PENDIENTES: int = 16  # tareas en cola + en ejecución; más → 503
+    COMPUTO_ESPERA_S: float = 5.0  # espera máxima por un lugar en la cola
+    COMPUTO_TIMEOUT_S: float = 60.0  # por tarea; se responde 504
 
     # URL pública del frontend (para QR de credenciales)
     APP_URL: str = "https://app.sistemas-erp.com"
@@ -51,105 +51,32 @@ from contextlib import asynccontextmanager
 from apscheduler.schedulers.background import BackgroundScheduler
 
 
-_SAT_SYNC_LOCK_KEY = 0x53415453  # "SATS" en hex — clave fija para pg_advisory_lock
-
-
 def _sync_cancelaciones_job():
     """
-    Cron 1x/día: verifica en el SAT todas las facturas EN_CANCELACION.
+    Cron 1x/día: verifica en el SAT todas las facturas y pagos EN_CANCELACION.
 
-    Usa pg_try_advisory_lock para evitar ejecución doble si hay más de una instancia
-    del proceso web activa (blue/green deploy, reinicio sin apagado graceful, etc.).
-    Si otra instancia ya tiene el lock, este invocation se omite silenciosamente.
+    Consultas concurrentes con el cliente HTTP compartido y commits por lote
+    (ver `app.services.sync_cancelaciones_service`). Si otra instancia del
+    proceso web ya está sincronizando, esta invocación se omite.
     """
-    from app.database import SessionLocal
-    from app.models.factura import Factura
-    from app.services import sat_cfdi_service as sat_svc
-    from sqlalchemy import text
-    from sqlalchemy.orm import joinedload
+    from app.services.sync_cancelaciones_service import sincronizar_cancelaciones
 
-    db = SessionLocal()
     try:
-        # ── Lock distribuido vía PostgreSQL advisory lock (transaction-level) ──
-        # pg_try_advisory_xact_lock se libera automáticamente en commit/rollback,
-        # sin depender del ciclo de vida de la conexión en el pool de SQLAlchemy.
-        # Esto evita que el lock quede pegado a una conexión idle del pool.
-        lock_acquired = db.execute(
-            text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": _SAT_SYNC_LOCK_KEY}
-        ).scalar()
-
-        if not lock_acquired:
-            logger.info("[SAT Sync] Otra instancia ya ejecuta el cron — saltando.")
-            db.rollback()
-            return
-
-        # ── Cargar facturas con joinedload para evitar N+1 ────────────────────
-        pendientes = (
-            db.query(Factura)
-            .options(
-                joinedload(Factura.empresa),
-                joinedload(Factura.cliente),
-            )
-            .filter(Factura.estatus == "EN_CANCELACION", Factura.cfdi_uuid.isnot(None))
-            .all()
-        )
-        logger.info("[SAT Sync] Verificando %d facturas EN_CANCELACION", len(pendientes))
-
-        for f in pendientes:
-            rfc_emisor = getattr(f.empresa, "rfc", None) or ""
-            rfc_receptor = getattr(f.cliente, "rfc", None) or ""
-            try:
-                acuse = sat_svc.consultar_cfdi(
-                    rfc_emisor=rfc_emisor.strip().upper(),
-                    rfc_receptor=rfc_receptor.strip().upper(),
-                    total=float(f.total or 0),
-                    uuid=f.cfdi_uuid,
-                )
-                nuevo_estatus, hubo_cambio = sat_svc.aplicar_acuse_sat(f, acuse)
-                if hubo_cambio:
-                    db.add(f)
-                    logger.info(
-                        "[SAT Sync] Factura %s-%s → %s",
-                        f.serie, f.folio, nuevo_estatus,
-                    )
-                else:
-                    logger.debug("[SAT Sync] Factura %s-%s sin cambio", f.serie, f.folio)
-            except Exception as exc:
-                logger.warning("[SAT Sync] Error verificando factura %s: %s", f.id, exc)
-
-        # ── Complementos de pago EN_CANCELACION ───────────────────────────────
-        from app.models.pago import Pago, EstatusPago
-
-        pagos_pend = (
-            db.query(Pago)
-            .options(joinedload(Pago.empresa), joinedload(Pago.cliente))
-            .filter(Pago.estatus == EstatusPago.EN_CANCELACION, Pago.uuid.isnot(None))
-            .all()
-        )
-        logger.info("[SAT Sync] Verificando %d pagos EN_CANCELACION", len(pagos_pend))
-
-        for p in pagos_pend:
-            try:
-                acuse = sat_svc.consultar_cfdi(
-                    rfc_emisor=(getattr(p.empresa, "rfc", None) or "").strip().upper(),
-                    rfc_receptor=(getattr(p.cliente, "rfc", None) or "").strip().upper(),
-                    total=0.0,  # los complementos de pago timbran con Total=0
-                    uuid=p.uuid,
-                )
-                nuevo_estatus, hubo_cambio = sat_svc.aplicar_acuse_sat_pago(p, acuse)
-                if hubo_cambio:
-                    db.add(p)
-                    logger.info("[SAT Sync] Pago %s → %s", p.uuid, nuevo_estatus)
-            except Exception as exc:
-                logger.warning("[SAT Sync] Error verificando pago %s: %s", p.id, exc)
-
-        # commit libera el xact_lock automáticamente
-        db.commit()
+        resumen = sincronizar_cancelaciones()
+        if resumen:
+            logger.info("[SAT Sync] Resumen: %s", {k: v for k, v in resumen.items() if k != "detalle"})
     except Exception as exc:
         logger.error("[SAT Sync] Error general en cron: %s", exc)
-        db.rollback()
-    finally:
-        db.close()
+
+
+def _sondeo_sat_job():
+    """Cada SAT_POLL_INTERVALO_S: verifica en el SAT las cancelaciones que ya toca revisar."""
+    from app.services.sync_cancelaciones_service import sondear
+
+    try:
+        sondear()
+    except Exception as exc:
+        logger.error("[SAT Sondeo] Error en ciclo: %s", exc)
 
 
 def _ejecutar_programaciones_job():
@@ -168,14 +95,25 @@ def _ejecutar_programaciones_job():
 
 
 _scheduler = BackgroundScheduler(timezone="America/Mexico_City")
-_scheduler.add_job(
-    _sync_cancelaciones_job,
-    trigger="cron",
-    hour=3,        # 3:00 AM hora México
-    minute=0,
-    id="sync_cancelaciones_sat",
-    replace_existing=True,
-)
+if settings.SAT_POLL_ACTIVO:
+    _scheduler.add_job(
+        _sondeo_sat_job,
+        trigger="interval",
+        seconds=settings.SAT_POLL_INTERVALO_S,
+        id="sondeo_cancelaciones_sat",
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True,
+    )
+else:
+    _scheduler.add_job(
+        _sync_cancelaciones_job,
+        trigger="cron",
+        hour=3,        # 3:00 AM hora México
+        minute=0,
+        id="sync_cancelaciones_sat",
+        replace_existing=True,
+    )
 _scheduler.add_job(
     _ejecutar_programaciones_job,
     trigger="cron",
@@ -188,13 +126,27 @@ _scheduler.add_job(
 
 @asynccontextmanager
 async def lifespan(app_: FastAPI):
+    from app.services import pac_http, sat_cfdi_service
+    from app.services.cfdi40_xml import warm_xslt_cache
+    from app.services.computo import shutdown_pool
+    from app.services.cola_timbrado import detener_workers
+
+    # Compila el XSLT de cadena original antes de la primera factura
+    warm_xslt_cache()
+    pac_http.abrir_cliente()
     _scheduler.start()
-    logger.info("[SAT Sync] Scheduler iniciado — cron diario 03:00 AM MX")
+    if settings.SAT_POLL_ACTIVO:
+        logger.info("[SAT Sync] Scheduler iniciado — sondeo cada %ss", settings.SAT_POLL_INTERVALO_S)
+    else:
+        logger.info("[SAT Sync] Scheduler iniciado — cron diario 03:00 AM MX")
     yield
     _scheduler.shutdown(wait=False)
+    shutdown_pool()
+    detener_workers(timeout=5)
+    pac_http.cerrar_cliente()
+    sat_cfdi_service.cerrar_cliente()
     logger.info("[SAT Sync] Scheduler detenido")
 
-
 app = FastAPI(
     title="ERP/CRM Desarrollo NORTON",
     description="Un ERP/CRM para fumigaciones, jardinería y extintores.",
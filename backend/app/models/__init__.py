@@ -31,6 +31,8 @@ from .orden_servicio import OrdenServicio, HistorialEstadoOS
 from .equipo import TipoEquipo, TipoEquipoCampo, EstadoEquipo, EquipoControl
 from .croquis import Croquis
 from .certificado_servicio import CertificadoServicio
+from .trabajo_timbrado import TrabajoTimbrado
+from .ejecucion_sync_sat import EjecucionSyncSAT
 
 # Usar uno de los Base como referencia unificada
 Base = BaseCliente
@@ -75,4 +77,6 @@ __all__ = [
     "EstadoEquipo",
     "EquipoControl",
     "Croquis",
+    "TrabajoTimbrado",
+    "EjecucionSyncSAT",
 ]
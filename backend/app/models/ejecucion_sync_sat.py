@@ -0,0 +1,46 @@
+# app/models/ejecucion_sync_sat.py
+import uuid
+
+import sqlalchemy as sa
+from sqlalchemy import Column, DateTime, Index, Integer, String, Text, func
+from sqlalchemy.dialects.postgresql import UUID, JSONB
+
+from app.models.base import Base
+
+_JSON_TYPE = sa.JSON().with_variant(JSONB(), "postgresql")
+
+# Estados de una ejecución
+EN_CURSO = "EN_CURSO"
+COMPLETADA = "COMPLETADA"
+FALLIDA = "FALLIDA"
+
+
+class EjecucionSyncSAT(Base):
+    """
+    Una corrida de la sincronización de cancelaciones con el SAT
+    (`app.services.sync_cancelaciones_service`): avance, tiempos y resultado.
+    La fila EN_CURSO funciona además como candado entre instancias.
+    """
+    __tablename__ = "ejecuciones_sync_sat"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    estado = Column(String(20), nullable=False, default=EN_CURSO)
+    origen = Column(String(20), nullable=False, default="cron")  # cron | manual
+
+    total = Column(Integer, nullable=False, default=0)
+    consultados = Column(Integer, nullable=False, default=0)
+    aplicados = Column(Integer, nullable=False, default=0)
+    cambios = Column(Integer, nullable=False, default=0)
+    errores = Column(Integer, nullable=False, default=0)
+    # Tiempos por etapa (ms) y conteo por estatus resultante
+    consulta_ms = Column(Integer, nullable=True)
+    aplicacion_ms = Column(Integer, nullable=True)
+    detalle = Column(_JSON_TYPE, nullable=True)
+    error = Column(Text, nullable=True)
+
+    iniciado_en = Column(DateTime, server_default=func.now(), nullable=False)
+    terminado_en = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_ejecuciones_sync_sat_estado_iniciado", "estado", "iniciado_en"),
+    )
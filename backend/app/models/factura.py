@@ -70,6 +70,10 @@ class Factura(Base):
     cfdi_uuid = Column(String(36), nullable=True)
     fecha_timbrado = Column(DateTime, nullable=True)
     fecha_solicitud_cancelacion = Column(DateTime, nullable=True)
+    # Sondeo del SAT mientras está EN_CANCELACION (sync_cancelaciones_service)
+    ultima_verificacion_sat = Column(DateTime, nullable=True)
+    proxima_verificacion_sat = Column(DateTime, nullable=True)
+    intentos_verificacion_sat = Column(Integer, nullable=False, default=0, server_default="0")
     no_certificado = Column(String(20), nullable=True)
     no_certificado_sat = Column(String(20), nullable=True)
     sello_cfdi = Column(Text, nullable=True)
@@ -121,6 +125,7 @@ class Factura(Base):
         Index("ix_facturas_fechas_pago", "fecha_pago", "fecha_cobro"),
         Index("ix_facturas_fecha_emision", "fecha_emision"),
         Index("ix_facturas_estatus", "estatus"),
+        Index("ix_facturas_estatus_proxima_sat", "estatus", "proxima_verificacion_sat"),
     )
 
     def __repr__(self) -> str:
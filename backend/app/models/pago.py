@@ -11,6 +11,8 @@ from sqlalchemy import (
     Enum as SQLAlchemyEnum,
     JSON,
     UniqueConstraint,
+    Index,
+    Integer,
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID
@@ -30,6 +32,7 @@ class Pago(Base):
     __tablename__ = "pagos"
     __table_args__ = (
         UniqueConstraint('folio', 'empresa_id', name='uq_pago_folio_empresa'),
+        Index('ix_pagos_estatus_proxima_sat', 'estatus', 'proxima_verificacion_sat'),
     )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -66,6 +69,10 @@ class Pago(Base):
     # Fecha en que se solicitó la cancelación al SAT (mientras está EN_CANCELACION).
     # Se limpia cuando el SAT resuelve (cancelado o rechazado).
     fecha_solicitud_cancelacion = Column(DateTime, nullable=True)
+    # Sondeo del SAT mientras está EN_CANCELACION (sync_cancelaciones_service)
+    ultima_verificacion_sat = Column(DateTime, nullable=True)
+    proxima_verificacion_sat = Column(DateTime, nullable=True)
+    intentos_verificacion_sat = Column(Integer, nullable=False, default=0, server_default="0")
     folio_fiscal_sustituto = Column(String(36), nullable=True)
     no_certificado = Column(String(20), nullable=True)
     no_certificado_sat = Column(String(20), nullable=True)
@@ -0,0 +1,52 @@
+# app/models/trabajo_timbrado.py
+import uuid
+
+import sqlalchemy as sa
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, String, Text, func, text
+from sqlalchemy.dialects.postgresql import UUID, JSONB
+
+from app.models.base import Base
+
+_JSON_TYPE = sa.JSON().with_variant(JSONB(), "postgresql")
+
+# Estados de un trabajo de timbrado
+EN_COLA = "EN_COLA"
+EN_PROCESO = "EN_PROCESO"
+COMPLETADO = "COMPLETADO"
+FALLIDO = "FALLIDO"
+
+# Sólo un trabajo activo por factura (índice único parcial)
+_ACTIVO = text("estado IN ('EN_COLA', 'EN_PROCESO')")
+
+
+class TrabajoTimbrado(Base):
+    """
+    Timbrado de una factura encolado para los workers (`app.services.cola_timbrado`).
+    El endpoint responde 202 con el id y el cliente consulta el estado.
+    """
+    __tablename__ = "trabajos_timbrado"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    empresa_id = Column(UUID(as_uuid=True), ForeignKey("empresas.id"), nullable=False, index=True)
+    factura_id = Column(
+        UUID(as_uuid=True), ForeignKey("facturas.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    usuario_id = Column(UUID(as_uuid=True), nullable=True)
+
+    estado = Column(String(20), nullable=False, default=EN_COLA)
+    intentos = Column(Integer, nullable=False, default=0)
+    # Detalle del error (FALLIDO) y respuesta del timbrado (COMPLETADO)
+    error = Column(Text, nullable=True)
+    resultado = Column(_JSON_TYPE, nullable=True)
+
+    creado_en = Column(DateTime, server_default=func.now(), nullable=False)
+    iniciado_en = Column(DateTime, nullable=True)
+    terminado_en = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_trabajos_timbrado_estado_creado", "estado", "creado_en"),
+        Index(
+            "ux_trabajos_timbrado_factura_activo", "factura_id",
+            unique=True, postgresql_where=_ACTIVO, sqlite_where=_ACTIVO,
+        ),
+    )
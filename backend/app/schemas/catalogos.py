@@ -1,4 +1,6 @@
 # app/schemas/catalogos.py
+from typing import List, Optional
+
 from pydantic import BaseModel
 
 
@@ -10,3 +12,10 @@ class CatalogoItem(BaseModel):
 class CatalogoSearchItem(BaseModel):
     value: str
     label: str
+
+
+class CodigoPostalInfo(BaseModel):
+    codigo_postal: str
+    estado: Optional[str] = None
+    estado_nombre: Optional[str] = None
+    colonias_claves: List[str] = []  # claves c_Colonia (el catálogo no trae nombres)
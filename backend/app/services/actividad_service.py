@@ -98,6 +98,7 @@ ACCION_LABEL: Dict[str, str] = {
     "ENVIAR_FACTURA_EMAIL": "Facturas enviadas por correo",
     "ENVIAR_PAGO_EMAIL": "Pagos enviados por correo",
     "EXPORTAR_EXCEL": "Exportaciones a Excel",
+    "EXPORTAR_PAQUETE": "Paquetes XML/PDF descargados",
     "VERIFICAR_SAT": "Verificaciones SAT",
     "REVERTIR_CANCELACION": "Reversiones de cancelación",
 }
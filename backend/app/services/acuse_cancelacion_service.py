@@ -19,7 +19,6 @@ import httpx
 from app.config import settings
 from app.core.logger import logger
 
-_STORAGE_BASE = "https://storage.facturacionmoderna.com"
 _RFC_PUBLICO_GENERAL = "XAXX010101000"
 _ACUSES_DIR = os.path.join(settings.DATA_DIR, "acuses")
 _TIMEOUT = 30.0
@@ -96,8 +95,9 @@ def descargar_acuse_xml(doc, *, forzar: bool = False) -> bytes:
         with open(cache_path, "rb") as fh:
             return fh.read()
 
-    page_url = f"{_STORAGE_BASE}/cfdis/download/{emisor}/{receptor}/{uuid}"
-    acuse_url = f"{_STORAGE_BASE}/cfdis/recacuse/{emisor}/{receptor}/{uuid}/cfdi/txt"
+    base = settings.FM_STORAGE_URL.rstrip("/")
+    page_url = f"{base}/cfdis/download/{emisor}/{receptor}/{uuid}"
+    acuse_url = f"{base}/cfdis/recacuse/{emisor}/{receptor}/{uuid}/cfdi/txt"
 
     try:
         with httpx.Client(timeout=_TIMEOUT, follow_redirects=True) as client:
@@ -277,7 +277,10 @@ def obtener_acuse(
     ``doc`` puede ser una Factura o un Pago; ``etiqueta`` distingue el nombre
     del archivo entre ambos (una factura y un pago pueden compartir serie-folio).
     """
-    xml_bytes = descargar_acuse_xml(doc, forzar=forzar)
+    from app.services.pac_router import get_router
+
+    # El router elige el storage del PAC que timbró el comprobante
+    xml_bytes = get_router().descargar_acuse(doc, forzar=forzar)
     base = f"{etiqueta}_{doc.serie}-{doc.folio}"
     if (fmt or "pdf").lower() == "xml":
         return xml_bytes, "application/xml", f"{base}.xml"
@@ -111,6 +111,7 @@ ENVIAR_FACTURA_EMAIL = "ENVIAR_FACTURA_EMAIL"
 ENVIAR_PAGO_EMAIL = "ENVIAR_PAGO_EMAIL"
 
 EXPORTAR_EXCEL = "EXPORTAR_EXCEL"
+EXPORTAR_PAQUETE = "EXPORTAR_PAQUETE"
 
 VERIFICAR_SAT = "VERIFICAR_SAT"
 REVERTIR_CANCELACION = "REVERTIR_CANCELACION"
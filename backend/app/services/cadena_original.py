@@ -0,0 +1,279 @@
+# app/services/cadena_original.py
+"""
+Cadena original CFDI 4.0 sin XSLT.
+
+Genera el `||...||` directamente desde el árbol del comprobante (el mismo
+`Element` que arman `cfdi40_xml` y `pago20_xml`, o los bytes del XML),
+siguiendo las reglas de `cadenaoriginal_4_0.xslt` y sus includes:
+
+  - Requerido: `|` + valor (o `|` solo si falta el atributo).
+  - Opcional:  `|` + valor sólo si el atributo existe.
+  - Valores con `normalize-space` de XPath: sólo espacio, tab, CR y LF
+    cuentan como blancos (no `str.split()`, que también parte en NBSP, etc.).
+
+Cubre Comprobante, InformacionGlobal, CfdiRelacionados, Emisor, Receptor,
+Conceptos (con ACuentaTerceros, InformacionAduanera, CuentaPredial y Parte),
+Impuestos y los complementos que emite esta app: Pagos 2.0 e Impuestos
+Locales. Cualquier otro nodo lanza `CadenaNoSoportada` y quien llama debe
+usar el XSLT oficial.
+"""
+from __future__ import annotations
+
+import re
+from typing import Dict, Iterator, List, Sequence, Tuple, Union
+from xml.etree.ElementTree import Element, fromstring
+
+NS_CFDI = "http://www.sat.gob.mx/cfd/4"
+NS_PAGO20 = "http://www.sat.gob.mx/Pagos20"
+NS_IMPLOCAL = "http://www.sat.gob.mx/implocal"
+
+# Prefijos usados por los builders que no trabajan en notación {ns}tag
+_PREFIJOS_CONOCIDOS = {"cfdi": NS_CFDI, "pago20": NS_PAGO20, "implocal": NS_IMPLOCAL}
+
+R, O = True, False  # Requerido / Opcional
+Spec = Sequence[Tuple[str, bool]]
+
+# ── Atributos por nodo, en el orden del XSLT ─────────────────────────────────
+COMPROBANTE: Spec = (
+    ("Version", R), ("Serie", O), ("Folio", O), ("Fecha", R), ("FormaPago", O),
+    ("NoCertificado", R), ("CondicionesDePago", O), ("SubTotal", R), ("Descuento", O),
+    ("Moneda", R), ("TipoCambio", O), ("Total", R), ("TipoDeComprobante", R),
+    ("Exportacion", R), ("MetodoPago", O), ("LugarExpedicion", R), ("Confirmacion", O),
+)
+INFORMACION_GLOBAL: Spec = (("Periodicidad", R), ("Meses", R), ("Año", R))
+EMISOR: Spec = (("Rfc", R), ("Nombre", R), ("RegimenFiscal", R), ("FacAtrAdquirente", O))
+RECEPTOR: Spec = (
+    ("Rfc", R), ("Nombre", R), ("DomicilioFiscalReceptor", R), ("ResidenciaFiscal", O),
+    ("NumRegIdTrib", O), ("RegimenFiscalReceptor", R), ("UsoCFDI", R),
+)
+CONCEPTO: Spec = (
+    ("ClaveProdServ", R), ("NoIdentificacion", O), ("Cantidad", R), ("ClaveUnidad", R),
+    ("Unidad", O), ("Descripcion", R), ("ValorUnitario", R), ("Importe", R),
+    ("Descuento", O), ("ObjetoImp", R),
+)
+CONCEPTO_TRASLADO: Spec = (
+    ("Base", R), ("Impuesto", R), ("TipoFactor", R), ("TasaOCuota", O), ("Importe", O),
+)
+CONCEPTO_RETENCION: Spec = (
+    ("Base", R), ("Impuesto", R), ("TipoFactor", R), ("TasaOCuota", R), ("Importe", R),
+)
+A_CUENTA_TERCEROS: Spec = (
+    ("RfcACuentaTerceros", R), ("NombreACuentaTerceros", R),
+    ("RegimenFiscalACuentaTerceros", R), ("DomicilioFiscalACuentaTerceros", R),
+)
+PARTE: Spec = (
+    ("ClaveProdServ", R), ("NoIdentificacion", O), ("Cantidad", R), ("Unidad", O),
+    ("Descripcion", R), ("ValorUnitario", O), ("Importe", O),
+)
+RETENCION: Spec = (("Impuesto", R), ("Importe", R))
+TRASLADO: Spec = CONCEPTO_TRASLADO
+
+# Pagos 2.0
+PAGOS_TOTALES: Spec = (
+    ("TotalRetencionesIVA", O), ("TotalRetencionesISR", O), ("TotalRetencionesIEPS", O),
+    ("TotalTrasladosBaseIVA16", O), ("TotalTrasladosImpuestoIVA16", O),
+    ("TotalTrasladosBaseIVA8", O), ("TotalTrasladosImpuestoIVA8", O),
+    ("TotalTrasladosBaseIVA0", O), ("TotalTrasladosImpuestoIVA0", O),
+    ("TotalTrasladosBaseIVAExento", O), ("MontoTotalPagos", R),
+)
+PAGO: Spec = (
+    ("FechaPago", R), ("FormaDePagoP", R), ("MonedaP", R), ("TipoCambioP", O), ("Monto", R),
+    ("NumOperacion", O), ("RfcEmisorCtaOrd", O), ("NomBancoOrdExt", O), ("CtaOrdenante", O),
+    ("RfcEmisorCtaBen", O), ("CtaBeneficiario", O), ("TipoCadPago", O), ("CertPago", O),
+    ("CadPago", O), ("SelloPago", O),
+)
+DOCTO_RELACIONADO: Spec = (
+    ("IdDocumento", R), ("Serie", O), ("Folio", O), ("MonedaDR", R), ("EquivalenciaDR", O),
+    ("NumParcialidad", R), ("ImpSaldoAnt", R), ("ImpPagado", R), ("ImpSaldoInsoluto", R),
+    ("ObjetoImpDR", R),
+)
+RETENCION_DR: Spec = (
+    ("BaseDR", R), ("ImpuestoDR", R), ("TipoFactorDR", R), ("TasaOCuotaDR", R), ("ImporteDR", R),
+)
+TRASLADO_DR: Spec = (
+    ("BaseDR", R), ("ImpuestoDR", R), ("TipoFactorDR", R), ("TasaOCuotaDR", O), ("ImporteDR", O),
+)
+RETENCION_P: Spec = (("ImpuestoP", R), ("ImporteP", R))
+TRASLADO_P: Spec = (
+    ("BaseP", R), ("ImpuestoP", R), ("TipoFactorP", R), ("TasaOCuotaP", O), ("ImporteP", O),
+)
+
+# Impuestos locales 1.0
+IMPLOCAL: Spec = (("version", R), ("TotaldeRetenciones", R), ("TotaldeTraslados", R))
+IMPLOCAL_RETENCION: Spec = (("ImpLocRetenido", R), ("TasadeRetencion", R), ("Importe", R))
+IMPLOCAL_TRASLADO: Spec = (("ImpLocTrasladado", R), ("TasadeTraslado", R), ("Importe", R))
+
+_COMPROBANTE_HIJOS = {
+    "InformacionGlobal", "CfdiRelacionados", "Emisor", "Receptor",
+    "Conceptos", "Impuestos", "Complemento", "Addenda",
+}
+
+_BLANCOS = re.compile(r"[ \t\r\n]+")
+
+
+class CadenaNoSoportada(ValueError):
+    """El comprobante trae nodos que el generador nativo no cubre; usar XSLT."""
+
+
+def normalize_space(valor: str) -> str:
+    """`normalize-space()` de XPath 1.0/2.0."""
+    return _BLANCOS.sub(" ", valor).strip(" ")
+
+
+class _Generador:
+    def __init__(self, prefijos: Dict[str, str]):
+        self.prefijos = prefijos
+        self.partes: List[str] = []
+
+    def nombre(self, el: Element) -> Tuple[str, str]:
+        tag = el.tag
+        if tag[:1] == "{":
+            ns, _, local = tag[1:].partition("}")
+            return ns, local
+        prefijo, sep, local = tag.partition(":")
+        if not sep:
+            return "", tag
+        return self.prefijos.get(prefijo, prefijo), local
+
+    def hijos(self, el: Element, ns: str, local: str) -> Iterator[Element]:
+        for h in el:
+            if isinstance(h.tag, str) and self.nombre(h) == (ns, local):
+                yield h
+
+    def attrs(self, el: Element, spec: Spec) -> None:
+        out = self.partes
+        for nombre, requerido in spec:
+            valor = el.get(nombre)
+            if valor is not None:
+                out.append("|" + normalize_space(valor))
+            elif requerido:
+                out.append("|")
+
+    # ── cfdi:Comprobante ─────────────────────────────────────────────────────
+    def comprobante(self, el: Element) -> None:
+        if self.nombre(el) != (NS_CFDI, "Comprobante"):
+            raise CadenaNoSoportada(f"raíz {el.tag!r} no es cfdi:Comprobante 4.0")
+        if el.get("Version") != "4.0":
+            raise CadenaNoSoportada(f"Version={el.get('Version')!r}")
+        for h in el:
+            if not isinstance(h.tag, str):
+                continue
+            ns, local = self.nombre(h)
+            if ns != NS_CFDI or local not in _COMPROBANTE_HIJOS:
+                raise CadenaNoSoportada(f"nodo {h.tag!r} en Comprobante")
+
+        self.attrs(el, COMPROBANTE)
+        for n in self.hijos(el, NS_CFDI, "InformacionGlobal"):
+            self.attrs(n, INFORMACION_GLOBAL)
+        for rel in self.hijos(el, NS_CFDI, "CfdiRelacionados"):
+            self.attrs(rel, (("TipoRelacion", R),))
+            for uuid in self.hijos(rel, NS_CFDI, "CfdiRelacionado"):
+                self.attrs(uuid, (("UUID", R),))
+        for n in self.hijos(el, NS_CFDI, "Emisor"):
+            self.attrs(n, EMISOR)
+        for n in self.hijos(el, NS_CFDI, "Receptor"):
+            self.attrs(n, RECEPTOR)
+        for conceptos in self.hijos(el, NS_CFDI, "Conceptos"):
+            for concepto in self.hijos(conceptos, NS_CFDI, "Concepto"):
+                self.concepto(concepto)
+        for imp in self.hijos(el, NS_CFDI, "Impuestos"):
+            self.impuestos(imp)
+        for comp in self.hijos(el, NS_CFDI, "Complemento"):
+            for h in comp:
+                if isinstance(h.tag, str):
+                    self.complemento(h)
+
+    def concepto(self, el: Element) -> None:
+        self.attrs(el, CONCEPTO)
+        for imp in self.hijos(el, NS_CFDI, "Impuestos"):
+            for grupo in self.hijos(imp, NS_CFDI, "Traslados"):
+                for t in self.hijos(grupo, NS_CFDI, "Traslado"):
+                    self.attrs(t, CONCEPTO_TRASLADO)
+        for imp in self.hijos(el, NS_CFDI, "Impuestos"):
+            for grupo in self.hijos(imp, NS_CFDI, "Retenciones"):
+                for r in self.hijos(grupo, NS_CFDI, "Retencion"):
+                    self.attrs(r, CONCEPTO_RETENCION)
+        for n in self.hijos(el, NS_CFDI, "ACuentaTerceros"):
+            self.attrs(n, A_CUENTA_TERCEROS)
+        for n in self.hijos(el, NS_CFDI, "InformacionAduanera"):
+            self.attrs(n, (("NumeroPedimento", R),))
+        for n in self.hijos(el, NS_CFDI, "CuentaPredial"):
+            self.attrs(n, (("Numero", R),))
+        if any(True for _ in self.hijos(el, NS_CFDI, "ComplementoConcepto")):
+            raise CadenaNoSoportada("ComplementoConcepto")
+        for parte in self.hijos(el, NS_CFDI, "Parte"):
+            self.attrs(parte, PARTE)
+            for n in self.hijos(parte, NS_CFDI, "InformacionAduanera"):
+                self.attrs(n, (("NumeroPedimento", R),))
+
+    def impuestos(self, el: Element) -> None:
+        for grupo in self.hijos(el, NS_CFDI, "Retenciones"):
+            for r in self.hijos(grupo, NS_CFDI, "Retencion"):
+                self.attrs(r, RETENCION)
+        self.attrs(el, (("TotalImpuestosRetenidos", O),))
+        for grupo in self.hijos(el, NS_CFDI, "Traslados"):
+            for t in self.hijos(grupo, NS_CFDI, "Traslado"):
+                self.attrs(t, TRASLADO)
+        self.attrs(el, (("TotalImpuestosTrasladados", O),))
+
+    # ── Complementos ─────────────────────────────────────────────────────────
+    def complemento(self, el: Element) -> None:
+        nombre = self.nombre(el)
+        if nombre == (NS_PAGO20, "Pagos"):
+            self.pagos20(el)
+        elif nombre == (NS_IMPLOCAL, "ImpuestosLocales"):
+            self.implocal(el)
+        else:
+            raise CadenaNoSoportada(f"complemento {el.tag!r}")
+
+    def pagos20(self, el: Element) -> None:
+        if el.get("Version") != "2.0":
+            raise CadenaNoSoportada(f"Pagos Version={el.get('Version')!r}")
+        self.attrs(el, (("Version", R),))
+        for n in self.hijos(el, NS_PAGO20, "Totales"):
+            self.attrs(n, PAGOS_TOTALES)
+        for pago in self.hijos(el, NS_PAGO20, "Pago"):
+            self.attrs(pago, PAGO)
+            for docto in self.hijos(pago, NS_PAGO20, "DoctoRelacionado"):
+                self.attrs(docto, DOCTO_RELACIONADO)
+                for imp in self.hijos(docto, NS_PAGO20, "ImpuestosDR"):
+                    for grupo in self.hijos(imp, NS_PAGO20, "RetencionesDR"):
+                        for r in self.hijos(grupo, NS_PAGO20, "RetencionDR"):
+                            self.attrs(r, RETENCION_DR)
+                    for grupo in self.hijos(imp, NS_PAGO20, "TrasladosDR"):
+                        for t in self.hijos(grupo, NS_PAGO20, "TrasladoDR"):
+                            self.attrs(t, TRASLADO_DR)
+            for imp in self.hijos(pago, NS_PAGO20, "ImpuestosP"):
+                for grupo in self.hijos(imp, NS_PAGO20, "RetencionesP"):
+                    for r in self.hijos(grupo, NS_PAGO20, "RetencionP"):
+                        self.attrs(r, RETENCION_P)
+                for grupo in self.hijos(imp, NS_PAGO20, "TrasladosP"):
+                    for t in self.hijos(grupo, NS_PAGO20, "TrasladoP"):
+                        self.attrs(t, TRASLADO_P)
+
+    def implocal(self, el: Element) -> None:
+        self.attrs(el, IMPLOCAL)
+        for n in self.hijos(el, NS_IMPLOCAL, "RetencionesLocales"):
+            self.attrs(n, IMPLOCAL_RETENCION)
+        for n in self.hijos(el, NS_IMPLOCAL, "TrasladosLocales"):
+            self.attrs(n, IMPLOCAL_TRASLADO)
+
+
+def _prefijos(root: Element) -> Dict[str, str]:
+    """Prefijos declarados como atributos `xmlns:x` (builders sin notación {ns})."""
+    prefijos = dict(_PREFIJOS_CONOCIDOS)
+    for k, v in root.attrib.items():
+        if k.startswith("xmlns:"):
+            prefijos[k[6:]] = v
+    return prefijos
+
+
+def cadena_original_40(xml: Union[bytes, Element]) -> str:
+    """
+    Cadena original de un CFDI 4.0 (con o sin Pagos 2.0 / implocal).
+    Lanza `CadenaNoSoportada` si el comprobante trae nodos no cubiertos.
+    """
+    root = fromstring(xml) if isinstance(xml, (bytes, bytearray, str)) else xml
+    gen = _Generador(_prefijos(root))
+    gen.comprobante(root)
+    return "|" + "".join(gen.partes) + "||"
@@ -181,6 +181,10 @@ class CertificadoService:
         with open(path, "wb") as buf:
             shutil.copyfileobj(upload_file.file, buf)
         logger.info("💾 Guardado archivo: %s", path)
+        # {empresa_id}.cer / .key → descartar el CSD cacheado para sellar
+        from app.services.cfdi40_xml import invalidar_csd_cache
+
+        invalidar_csd_cache(os.path.splitext(filename)[0])
         return path
 
     @staticmethod
@@ -9,7 +9,6 @@ registro de la empresa.
 """
 from __future__ import annotations
 
-import os
 from io import BytesIO
 from typing import Optional, Tuple, List
 from uuid import UUID
@@ -17,7 +16,7 @@ from uuid import UUID
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
 
-from app.config import settings
+from app.services import render_assets
 from app.models.certificado_servicio import CertificadoServicio
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -140,11 +139,7 @@ MESES = [
 
 
 def _logo_path(empresa) -> Optional[str]:
-    rel = getattr(empresa, "logo", None)
-    if not rel:
-        return None
-    path = os.path.join(settings.DATA_DIR, rel)
-    return path if os.path.isfile(path) else None
+    return render_assets.ruta_logo_empresa(empresa)
 
 
 def _fmt_rfc(rfc: str) -> str:
@@ -160,7 +155,6 @@ def _fmt_rfc(rfc: str) -> str:
 def generar_pdf(cert: CertificadoServicio) -> bytes:
     from reportlab.lib.pagesizes import letter
     from reportlab.lib.colors import HexColor, black, white
-    from reportlab.lib.utils import ImageReader
     from reportlab.pdfgen import canvas
 
     W, H = letter  # 612 x 792
@@ -177,17 +171,11 @@ def generar_pdf(cert: CertificadoServicio) -> bytes:
     ML, MR = 28, 584  # márgenes del contenido (izq/der)
 
     # ── Encabezado ───────────────────────────────────────────────────────────
-    logo = _logo_path(emp)
+    logo = render_assets.logo(_logo_path(emp), 150.0, 92.0)
     if logo:
         try:
-            img = ImageReader(logo)
-            iw, ih = img.getSize()
-            dw = 150.0
-            dh = dw * ih / iw
-            if dh > 92:
-                dh = 92.0
-                dw = dh * iw / ih
-            c.drawImage(img, 42, H - 42 - dh, width=dw, height=dh, mask="auto")
+            dw, dh = render_assets.ajustar(logo.ancho, logo.alto, 150.0, 92.0)
+            c.drawImage(logo.imagen, 42, H - 42 - dh, width=dw, height=dh, mask="auto")
         except Exception:
             pass
 
@@ -3,8 +3,13 @@ from __future__ import annotations
 
 import os
 import re
+import time
 import base64
-from typing import Optional, List, Tuple, Dict
+import hashlib
+import hmac
+import tempfile
+import threading
+from typing import Callable, Optional, List, Tuple, Dict, Union
 from uuid import UUID
 from datetime import datetime, timedelta, timezone
 from decimal import Decimal, ROUND_HALF_UP, getcontext
@@ -16,6 +21,7 @@ from sqlalchemy.orm import Session, selectinload
 from app.config import settings
 from app.models.factura import Factura
 from app.models.factura_detalle import FacturaDetalle
+from app.services.cadena_original import CadenaNoSoportada, cadena_original_40
 
 # ─────────────────────────────────────────────────────────────────────────────
 # crypto / xslt
@@ -185,13 +191,8 @@ def _get_empresa_csd_password(empresa) -> Optional[str]:
     return s or None
 
 
-def _load_csd_cert_for_empresa(
-    empresa,
-) -> Tuple[Optional[str], Optional[str], Optional[bytes]]:
+def _read_csd_cert(cer_path: str) -> Tuple[Optional[str], Optional[str], Optional[bytes]]:
     try:
-        cer_path = os.path.join(settings.CERT_DIR, f"{empresa.id}.cer")
-        if not os.path.exists(cer_path):
-            return None, None, None
         data = open(cer_path, "rb").read()
 
         if not _CRYPTO_OK:
@@ -213,25 +214,7 @@ def _load_csd_cert_for_empresa(
         return None, None, None
 
 
-def _load_csd_key_for_empresa(empresa):
-    if not _CRYPTO_OK:
-        return None
-
-    key_path = os.path.join(settings.CERT_DIR, f"{empresa.id}.key")
-    if not os.path.exists(key_path):
-        if logger:
-            logger.info(f"[CSD] No existe KEY: {key_path}")
-        else:
-            print(f"[CSD] No existe KEY: {key_path}")
-        return None
-
-    pwd = _get_empresa_csd_password(empresa)
-    if not pwd:
-        if logger:
-            logger.warning("[CSD] Password DB vacía/nula")
-        else:
-            print("[CSD] Password DB vacía/nula")
-        return None
+def _read_csd_key(key_path: str, pwd: str):
     pwd_bytes = pwd.encode("utf-8")
     key_bytes = open(key_path, "rb").read()
 
@@ -262,10 +245,132 @@ def _load_csd_key_for_empresa(empresa):
     return None
 
 
+# ─────────────────────────────────────────────────────────────────────────────
+# Caché de CSD por empresa
+# ─────────────────────────────────────────────────────────────────────────────
+# El .cer parseado y la llave descifrada se guardan en memoria del proceso,
+# validados contra (mtime, tamaño) del archivo y la huella de la contraseña
+# (HMAC con SECRET_KEY): un archivo nuevo o un cambio de contraseña invalida
+# solo. En los workers de `computo` la contraseña no llega con la tarea: se
+# lee de la BD sólo cuando la llave de esa empresa y huella no está cacheada.
+# CertificadoService además invalida explícitamente al subir archivos. Los
+# fallos se recuerdan CSD_NEGATIVE_TTL segundos para no repetir DER/PEM/P12 en
+# cada sello.
+CSD_NEGATIVE_TTL = 60.0
+
+_csd_cache: Dict[Tuple[str, str], Tuple[tuple, float, object]] = {}
+_csd_cache_lock = threading.Lock()
+
+
+def _file_signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _csd_cached(clave: Tuple[str, str], firma: tuple, cargar, es_fallo) -> object:
+    ahora = time.monotonic()
+    entry = _csd_cache.get(clave)
+    if entry is not None and entry[0] == firma and entry[1] > ahora:
+        return entry[2]
+    with _csd_cache_lock:
+        entry = _csd_cache.get(clave)
+        if entry is not None and entry[0] == firma and entry[1] > time.monotonic():
+            return entry[2]
+        valor = cargar()
+        expira = time.monotonic() + CSD_NEGATIVE_TTL if es_fallo(valor) else float("inf")
+        _csd_cache[clave] = (firma, expira, valor)
+        return valor
+
+
+def invalidar_csd_cache(empresa_id=None) -> None:
+    """Olvida el CSD cacheado de una empresa (o de todas si empresa_id es None)."""
+    with _csd_cache_lock:
+        if empresa_id is None:
+            _csd_cache.clear()
+            return
+        for tipo in ("cer", "key"):
+            _csd_cache.pop((str(empresa_id), tipo), None)
+
+
+def _load_csd_cert_for_empresa(
+    empresa,
+) -> Tuple[Optional[str], Optional[str], Optional[bytes]]:
+    cer_path = os.path.join(settings.CERT_DIR, f"{empresa.id}.cer")
+    firma = _file_signature(cer_path)
+    if firma is None:
+        return None, None, None
+    return _csd_cached(
+        (str(empresa.id), "cer"),
+        firma,
+        lambda: _read_csd_cert(cer_path),
+        lambda v: v[1] is None,
+    )
+
+
+def _huella_contrasena(pwd: str) -> str:
+    return hmac.new(settings.SECRET_KEY.encode("utf-8"), pwd.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def _load_csd_key(empresa_id, huella: str, contrasena: Callable[[], Optional[str]]):
+    """Llave de la empresa desde la caché; `contrasena()` sólo se llama si hay que descifrarla."""
+    if not _CRYPTO_OK:
+        return None
+
+    key_path = os.path.join(settings.CERT_DIR, f"{empresa_id}.key")
+    firma = _file_signature(key_path)
+    if firma is None:
+        if logger:
+            logger.info(f"[CSD] No existe KEY: {key_path}")
+        else:
+            print(f"[CSD] No existe KEY: {key_path}")
+        return None
+
+    def cargar():
+        pwd = contrasena()
+        if not pwd:
+            if logger:
+                logger.warning("[CSD] Password DB vacía/nula")
+            else:
+                print("[CSD] Password DB vacía/nula")
+            return None
+        return _read_csd_key(key_path, pwd)
+
+    return _csd_cached((str(empresa_id), "key"), firma + (huella,), cargar, lambda v: v is None)
+
+
+def _load_csd_key_for_empresa(empresa):
+    pwd = _get_empresa_csd_password(empresa)
+    if not pwd:
+        if logger:
+            logger.warning("[CSD] Password DB vacía/nula")
+        else:
+            print("[CSD] Password DB vacía/nula")
+        return None
+    return _load_csd_key(empresa.id, _huella_contrasena(pwd), lambda: pwd)
+
+
+def _contrasena_csd_desde_bd(empresa_id: str) -> Optional[str]:
+    """Contraseña del CSD leída por el worker con su propia sesión."""
+    from types import SimpleNamespace
+
+    from app.database import SessionLocal
+    from app.models.empresa import Empresa
+
+    db = SessionLocal()
+    try:
+        raw = db.query(Empresa.contrasena).filter(Empresa.id == UUID(str(empresa_id))).scalar()
+    finally:
+        db.close()
+    return _get_empresa_csd_password(SimpleNamespace(contrasena=raw))
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # XSLT helpers
 # ─────────────────────────────────────────────────────────────────────────────
-def _find_xslt_cadena40_path() -> Optional[str]:
+def _xslt_cadena40_candidates() -> List[str]:
     candidates = []
     p = getattr(settings, "CADENA40_XSLT_PATH", None)
     if p:
@@ -275,7 +380,11 @@ def _find_xslt_cadena40_path() -> Optional[str]:
     candidates.append(
         os.path.join(base, "sat", "cadenaoriginal_4_0", "cadenaoriginal_4_0.xslt")
     )
+    return candidates
 
+
+def _find_xslt_cadena40_path() -> Optional[str]:
+    candidates = _xslt_cadena40_candidates()
     if logger:
         logger.info("Buscando XSLT en settings/candidates:")
     else:
@@ -347,21 +456,141 @@ def _rewrite_xslt_urls_to_local(xslt_path: str, sat_base_dir: str) -> str:
         return match.group(0)
 
     text2 = re.sub(r'href\s*=\s*"([^"]+)"', repl, text)
-    tmp_path = xslt_path + ".local.saxon.xslt"
-    with open(tmp_path, "w", encoding="utf-8") as f:
+    # Nombre único junto al original: los includes relativos se resuelven desde
+    # ahí y dos procesos compilando a la vez no se pisan el archivo.
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=os.path.basename(xslt_path) + ".",
+        suffix=".local.saxon.xslt",
+        dir=os.path.dirname(xslt_path),
+    )
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
         f.write(text2)
     return tmp_path
 
 
-def _apply_xslt10_with_lxml(xml_bytes: bytes, xslt_path: str) -> Optional[str]:
-    base_sat_dir = os.path.join(getattr(settings, "DATA_DIR", "/data"), "sat")
-    parser = LET.XMLParser()
-    parser.resolvers.add(SATResolver(base_sat_dir))
+def _sat_base_dir() -> str:
+    return os.path.join(getattr(settings, "DATA_DIR", "/data"), "sat")
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Caché de XSLT compilados
+# ─────────────────────────────────────────────────────────────────────────────
+# Compilar el XSLT de cadena original (con sus ~40 includes de complementos)
+# cuesta decenas de ms con lxml y cientos con Saxon; se hace una sola vez por
+# proceso y se recompila sólo si cambia el mtime del archivo. Los compilados
+# son seguros entre hilos: lxml crea un contexto de transformación por llamada
+# y un PyXsltExecutable de Saxon se puede ejecutar en paralelo.
+_saxon_proc = None
+
+
+def _get_saxon_processor():
+    """PySaxonProcessor único por proceso (SaxonC recomienda no crear uno por llamada)."""
+    global _saxon_proc
+    if _saxon_proc is None:
+        _saxon_proc = saxonche.PySaxonProcessor(license=False)
+    return _saxon_proc
+
+
+class _XsltCompilado:
+    """Transformación compilada de un XSLT concreto (ruta + mtime)."""
+
+    def __init__(self, path: str, mtime_ns: int):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.version = _xslt_version(path) or "1.0"
+        self.motor = "saxon" if self.version.startswith("2") else "lxml"
+        if self.motor == "saxon":
+            self._compilar_saxon()
+        else:
+            self._compilar_lxml()
+
+    def _compilar_lxml(self):
+        if not _LXML_OK:
+            raise RuntimeError("lxml no está disponible.")
+        parser = LET.XMLParser()
+        parser.resolvers.add(SATResolver(_sat_base_dir()))
+        self._transform = LET.XSLT(LET.parse(self.path, parser))
+
+    def _compilar_saxon(self):
+        if not _SAXON_OK:
+            raise RuntimeError("saxonche no está instalado (XSLT 2.0).")
+        base_sat_dir = _sat_base_dir()
+        xslt_local = _rewrite_xslt_urls_to_local(self.path, base_sat_dir)
+        try:
+            proc = _get_saxon_processor()
+            xsltproc = proc.new_xslt30_processor()
+            xsltproc.set_cwd(base_sat_dir)
+            self._proc = proc
+            self._executable = xsltproc.compile_stylesheet(stylesheet_file=xslt_local)
+        finally:
+            try:
+                os.remove(xslt_local)
+            except Exception:
+                pass
+
+    def __call__(self, xml_bytes: bytes) -> str:
+        if self.motor == "saxon":
+            doc = self._proc.parse_xml(xml_text=xml_bytes.decode("utf-8"))
+            result = self._executable.transform_to_string(xdm_node=doc)
+            return (result or "").strip()
+        return str(self._transform(LET.fromstring(xml_bytes))).strip()
+
+
+_xslt_cache: Dict[str, _XsltCompilado] = {}
+_xslt_cache_lock = threading.Lock()
+_xslt_cadena40_path: Optional[str] = None
+
+
+def _get_xslt_compilado(path: str) -> _XsltCompilado:
+    """Compilado vigente de `path`; recompila (una sola vez, bajo lock) si cambió el mtime."""
+    mtime_ns = os.stat(path).st_mtime_ns
+    entry = _xslt_cache.get(path)
+    if entry is None or entry.mtime_ns != mtime_ns:
+        with _xslt_cache_lock:
+            entry = _xslt_cache.get(path)
+            if entry is None or entry.mtime_ns != mtime_ns:
+                t0 = time.perf_counter()
+                entry = _XsltCompilado(path, mtime_ns)
+                _xslt_cache[path] = entry
+                (logger.info if logger else print)(
+                    f"XSLT compilado: {path} (version={entry.version}, motor={entry.motor}, "
+                    f"{(time.perf_counter() - t0) * 1000:.0f} ms)"
+                )
+    return entry
+
+
+def _resolve_xslt_cadena40_path() -> Optional[str]:
+    """Ruta del XSLT de cadena original; se busca (con log) sólo la primera vez."""
+    global _xslt_cadena40_path
+    path = _xslt_cadena40_path
+    if path is None or not os.path.exists(path):
+        path = _xslt_cadena40_path = _find_xslt_cadena40_path()
+    return path
+
+
+def warm_xslt_cache() -> bool:
+    """Compila el XSLT de cadena original al arrancar. False si no se pudo."""
+    xslt_path = _resolve_xslt_cadena40_path()
+    if not xslt_path:
+        (logger.warning if logger else print)("No se encontró el XSLT de cadena original.")
+        return False
     try:
-        xslt_doc = LET.parse(xslt_path, parser)
-        transform = LET.XSLT(xslt_doc)
-        result = transform(LET.fromstring(xml_bytes))
-        return str(result).strip()
+        _get_xslt_compilado(xslt_path)
+        return True
+    except Exception as e:
+        (logger.warning if logger else print)(f"No se pudo precompilar el XSLT: {e}")
+        return False
+
+
+def _build_cadena_original_40_xslt(xml_bytes: bytes) -> Optional[str]:
+    xslt_path = _resolve_xslt_cadena40_path()
+    if not xslt_path:
+        (logger.error if logger else print)(
+            "No se encontró el XSLT de cadena original."
+        )
+        return None
+    try:
+        return _get_xslt_compilado(xslt_path)(xml_bytes)
     except Exception as e:
         head = b""
         try:
@@ -369,50 +598,51 @@ def _apply_xslt10_with_lxml(xml_bytes: bytes, xslt_path: str) -> Optional[str]:
                 head = f.read(200)
         except Exception:
             pass
-        (logger.error if logger else print)(f"Error XSLT 1.0: {e}. Head: {head!r}")
+        (logger.error if logger else print)(
+            f"Error XSLT ({xslt_path}): {e}. Head: {head!r}"
+        )
         return None
 
 
-def _apply_xslt20_with_saxon(xml_bytes: bytes, xslt_path: str) -> Optional[str]:
-    if not _SAXON_OK:
-        (logger.error if logger else print)("saxonche no está instalado (XSLT 2.0).")
-        return None
-    base_sat_dir = os.path.join(getattr(settings, "DATA_DIR", "/data"), "sat")
-    xslt_local = _rewrite_xslt_urls_to_local(xslt_path, base_sat_dir)
-    try:
-        with saxonche.PySaxonProcessor(license=False) as proc:
-            xsltproc = proc.new_xslt30_processor()
-            xsltproc.set_cwd(base_sat_dir)
-            executable = xsltproc.compile_stylesheet(stylesheet_file=xslt_local)
-            doc = proc.parse_xml(xml_text=xml_bytes.decode("utf-8"))
-            result = executable.transform_to_string(xdm_node=doc)
-            return (result or "").strip()
-    except Exception as e:
-        (logger.error if logger else print)(f"Error XSLT 2.0 Saxon/C: {e}")
-        return None
-    finally:
+def _build_cadena_original_40(xml: Union[bytes, Element]) -> Optional[str]:
+    """
+    Cadena original 4.0 del comprobante (bytes o el `Element` ya armado).
+    Según settings.CADENA_ORIGINAL_MODO usa el generador nativo, el XSLT, o
+    ambos comparándolos ("verificar", devuelve el del XSLT).
+    """
+    modo = (getattr(settings, "CADENA_ORIGINAL_MODO", "nativa") or "nativa").lower()
+    nativa = None
+    if modo != "xslt":
         try:
-            os.remove(xslt_local)
-        except Exception:
-            pass
-
+            nativa = cadena_original_40(xml)
+        except CadenaNoSoportada as e:
+            (logger.info if logger else print)(
+                f"Cadena original nativa no aplica ({e}); se usa XSLT."
+            )
+        except Exception as e:
+            (logger.warning if logger else print)(
+                f"Error en cadena original nativa: {e}; se usa XSLT."
+            )
+        if nativa is not None and modo != "verificar":
+            return nativa
 
-def _build_cadena_original_40(xml_bytes: bytes) -> Optional[str]:
-    xslt_path = _find_xslt_cadena40_path()
-    if not xslt_path:
+    xml_bytes = (
+        xml
+        if isinstance(xml, (bytes, bytearray))
+        else tostring(xml, encoding="UTF-8", xml_declaration=False)
+    )
+    cadena = _build_cadena_original_40_xslt(xml_bytes)
+    if nativa is not None and cadena is not None and nativa != cadena:
+        pos = next(
+            (i for i, (a, b) in enumerate(zip(nativa, cadena)) if a != b),
+            min(len(nativa), len(cadena)),
+        )
         (logger.error if logger else print)(
-            "No se encontró el XSLT de cadena original."
+            f"Cadena original nativa difiere del XSLT en la posición {pos}: "
+            f"nativa={nativa[max(0, pos - 40):pos + 40]!r} "
+            f"xslt={cadena[max(0, pos - 40):pos + 40]!r}"
         )
-        return None
-    ver = _xslt_version(xslt_path) or "1.0"
-    (logger.info if logger else print)(f"Usando XSLT: {xslt_path} (version={ver})")
-    if ver.startswith("2"):
-        return _apply_xslt20_with_saxon(xml_bytes, xslt_path)
-    else:
-        if not _LXML_OK:
-            (logger.error if logger else print)("lxml no está disponible.")
-            return None
-        return _apply_xslt10_with_lxml(xml_bytes, xslt_path)
+    return cadena
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -603,6 +833,12 @@ def build_cfdi40_xml_sin_timbrar(db: Session, factura_id: UUID) -> bytes:
     if not f:
         raise ValueError("Factura no encontrada")
 
+    compro = _armar_comprobante_cfdi40(db, f)
+    return _sellar_comprobante(compro, f.empresa)
+
+
+def _armar_comprobante_cfdi40(db: Session, f: Factura) -> Element:
+    """Arma el árbol del Comprobante (sin Sello) de una factura ya cargada."""
     emp = f.empresa
     cli = f.cliente
     conceptos: List[FacturaDetalle] = list(f.conceptos or [])
@@ -1012,16 +1248,24 @@ def build_cfdi40_xml_sin_timbrar(db: Session, factura_id: UUID) -> bytes:
         except Exception:
             pass
 
-    # ── Cadena Original y Firma ──────────────────────────────────────────────
-    xml_tmp = tostring(compro, encoding="UTF-8", xml_declaration=False)
-    print("Intentando generar Cadena Original 4.0…")
-    cadena = _build_cadena_original_40(xml_tmp)
+    return compro
+
+
+# ── Cadena Original y Firma ──────────────────────────────────────────────────
+def _calcular_sello_cfdi40(xml: Union[bytes, Element], emp) -> str:
+    """Cadena original + firma RSA-SHA256 del comprobante; Sello en base64."""
+    return _firmar_cfdi40(xml, lambda: _load_csd_key_for_empresa(emp))
+
+
+def _firmar_cfdi40(xml: Union[bytes, Element], cargar_llave: Callable[[], object]) -> str:
+    (logger.debug if logger else print)("Intentando generar Cadena Original 4.0…")
+    cadena = _build_cadena_original_40(xml)
     if not cadena:
         raise RuntimeError(
             "No se pudo generar la Cadena Original 4.0. Revisa los logs anteriores (ruta, versión XSLT y resolver)."
         )
 
-    private_key = _load_csd_key_for_empresa(emp)
+    private_key = cargar_llave()
     if not private_key:
         raise RuntimeError(
             "No se pudo cargar la llave privada del CSD (verifica .key y contraseña en DB)."
@@ -1030,9 +1274,43 @@ def build_cfdi40_xml_sin_timbrar(db: Session, factura_id: UUID) -> bytes:
     sello_b64 = _sign_cadena_sha256_pkcs1v15(cadena, private_key)
     if not sello_b64:
         raise RuntimeError("No se pudo firmar la cadena original (sello vacío).")
-    print(f"Sello generado (len={len(sello_b64)}).")
+    (logger.debug if logger else print)(f"Sello generado (len={len(sello_b64)}).")
+    return sello_b64
+
+
+def sellar_xml(xml_sin_sello: bytes, empresa_id: str, huella_contrasena: str) -> str:
+    """
+    Sello de un XML serializado; es la tarea que corre en el pool de `computo`.
+    Recibe la huella de la contraseña, no la contraseña: el worker la lee de
+    la BD sólo si su caché no tiene la llave de esa empresa con esa huella.
+    """
+    return _firmar_cfdi40(
+        xml_sin_sello,
+        lambda: _load_csd_key(empresa_id, huella_contrasena, lambda: _contrasena_csd_desde_bd(empresa_id)),
+    )
+
+
+def tarea_sello(compro: Element, emp) -> tuple:
+    """Argumentos de `sellar_xml` para el comprobante (sin la contraseña)."""
+    pwd = _get_empresa_csd_password(emp)
+    return (
+        tostring(compro, encoding="UTF-8", xml_declaration=False),
+        str(emp.id),
+        _huella_contrasena(pwd) if pwd else "",
+    )
+
+
+def sello_cfdi40(compro: Element, emp) -> str:
+    """Sello del comprobante; en el pool de cómputo si está activo."""
+    from app.services import computo
+
+    if not computo.activo():
+        return _calcular_sello_cfdi40(compro, emp)
+    return computo.ejecutar(sellar_xml, *tarea_sello(compro, emp), tarea="sello")
+
 
-    compro.set("Sello", sello_b64)
+def _sellar_comprobante(compro: Element, emp) -> bytes:
+    compro.set("Sello", sello_cfdi40(compro, emp))
 
     xml_final = tostring(compro, encoding="UTF-8", xml_declaration=True)
     print(f"XML CFDI listo (bytes={len(xml_final)}).")
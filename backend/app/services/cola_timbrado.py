@@ -0,0 +1,318 @@
+# app/services/cola_timbrado.py
+"""
+Cola de timbrado asíncrono respaldada en la tabla `trabajos_timbrado`.
+
+`POST /api/facturas/{id}/timbrar?asincrono=true` encola y responde 202; un
+pool de hilos (en el proceso web, iniciado al primer encolado, o aparte con
+`python -m app.worker`) toma los trabajos y los timbra con el mismo camino
+que el modo síncrono (`factura_service.timbrar_factura`). Así una llamada
+lenta al PAC ocupa un hilo del worker, no uno del threadpool de la API.
+
+La toma de trabajos respeta un máximo de timbrados simultáneos por empresa
+(`TIMBRADO_LIMITE_POR_EMPRESA`, con excepciones en `TIMBRADO_LIMITES_EMPRESA`).
+En PostgreSQL la toma se serializa con un advisory lock de transacción para
+que varios procesos worker no rebasen el límite.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional
+from uuid import UUID
+
+from fastapi import HTTPException
+from sqlalchemy import func, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.factura import Factura
+from app.models.trabajo_timbrado import (
+    COMPLETADO,
+    EN_COLA,
+    EN_PROCESO,
+    FALLIDO,
+    TrabajoTimbrado,
+)
+
+logger = logging.getLogger("app")
+
+_COLA_LOCK_KEY = 0x54494D42  # "TIMB" en hex — clave fija para pg_advisory_xact_lock
+# Campos de la respuesta de timbrado que se guardan en el trabajo
+_CAMPOS_RESULTADO = ("uuid", "fecha_timbrado", "no_certificado_sat", "xml_path")
+
+
+def limite_empresa(empresa_id) -> int:
+    """Timbrados simultáneos permitidos para la empresa."""
+    limites = settings.TIMBRADO_LIMITES_EMPRESA or {}
+    return int(limites.get(str(empresa_id), settings.TIMBRADO_LIMITE_POR_EMPRESA))
+
+
+def _activo_de_factura(db: Session, factura_id: UUID) -> Optional[TrabajoTimbrado]:
+    return (
+        db.query(TrabajoTimbrado)
+        .filter(
+            TrabajoTimbrado.factura_id == factura_id,
+            TrabajoTimbrado.estado.in_((EN_COLA, EN_PROCESO)),
+        )
+        .first()
+    )
+
+
+def encolar_timbrado(
+    db: Session, factura: Factura, usuario_id: Optional[UUID] = None
+) -> TrabajoTimbrado:
+    """
+    Encola el timbrado de una factura en BORRADOR. Si ya hay un trabajo
+    activo para la factura se devuelve ese en lugar de crear otro; el índice
+    único parcial `ux_trabajos_timbrado_factura_activo` cubre la carrera entre
+    dos encolados simultáneos.
+    """
+    if factura.estatus != "BORRADOR":
+        raise HTTPException(
+            status_code=400, detail="Solo se puede timbrar una factura en BORRADOR"
+        )
+    trabajo = _activo_de_factura(db, factura.id)
+    if trabajo is None:
+        trabajo = TrabajoTimbrado(
+            empresa_id=factura.empresa_id,
+            factura_id=factura.id,
+            usuario_id=usuario_id,
+            estado=EN_COLA,
+            intentos=0,
+            creado_en=datetime.utcnow(),
+        )
+        db.add(trabajo)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Otro encolado de la misma factura confirmó primero
+            db.rollback()
+            trabajo = _activo_de_factura(db, factura.id)
+            if trabajo is None:
+                raise
+        else:
+            db.refresh(trabajo)
+    if settings.TIMBRADO_WORKERS_EN_PROCESO:
+        iniciar_workers().despertar()
+    return trabajo
+
+
+def obtener_trabajo(db: Session, trabajo_id: UUID) -> Optional[TrabajoTimbrado]:
+    return db.query(TrabajoTimbrado).filter(TrabajoTimbrado.id == trabajo_id).first()
+
+
+def tomar_trabajo(db: Session) -> Optional[TrabajoTimbrado]:
+    """
+    Marca EN_PROCESO el trabajo en cola más antiguo cuya empresa no haya
+    llegado a su límite de timbrados simultáneos. Hace commit.
+    """
+    if db.bind.dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _COLA_LOCK_KEY})
+
+    en_proceso = dict(
+        db.query(TrabajoTimbrado.empresa_id, func.count(TrabajoTimbrado.id))
+        .filter(TrabajoTimbrado.estado == EN_PROCESO)
+        .group_by(TrabajoTimbrado.empresa_id)
+        .all()
+    )
+    saturadas = [e for e, n in en_proceso.items() if n >= limite_empresa(e)]
+
+    q = db.query(TrabajoTimbrado).filter(TrabajoTimbrado.estado == EN_COLA)
+    if saturadas:
+        q = q.filter(TrabajoTimbrado.empresa_id.notin_(saturadas))
+    trabajo = q.order_by(TrabajoTimbrado.creado_en).first()
+    if trabajo is None:
+        db.rollback()
+        return None
+
+    trabajo.estado = EN_PROCESO
+    trabajo.iniciado_en = datetime.utcnow()
+    trabajo.intentos = (trabajo.intentos or 0) + 1
+    db.commit()  # libera el advisory lock
+    db.refresh(trabajo)
+    return trabajo
+
+
+def _terminar(db: Session, trabajo_id: UUID, estado: str, resultado=None, error=None) -> None:
+    trabajo = obtener_trabajo(db, trabajo_id)
+    if trabajo is None:  # la factura se borró mientras tanto
+        return
+    trabajo.estado = estado
+    trabajo.resultado = resultado
+    trabajo.error = error
+    trabajo.terminado_en = datetime.utcnow()
+    db.commit()
+
+
+def ejecutar_trabajo(db: Session, trabajo: TrabajoTimbrado) -> str:
+    """Timbra la factura del trabajo y guarda el resultado. Devuelve el estado final."""
+    from app.services import auditoria_service as audit_svc
+    from app.services import factura_service as srv
+    from app.models.usuario import Usuario
+
+    trabajo_id, factura_id = trabajo.id, trabajo.factura_id
+    # La fila queda bloqueada hasta el commit del timbrado: otro trabajo o el
+    # /timbrar síncrono de la misma factura esperan y luego la ven TIMBRADA
+    factura = (
+        db.query(Factura)
+        .filter(Factura.id == factura_id)
+        .with_for_update()
+        .populate_existing()
+        .first()
+    )
+    if factura is not None and factura.estatus == "TIMBRADA":
+        # Retomado tras una caída del worker: el PAC ya había timbrado
+        _terminar(db, trabajo_id, COMPLETADO, resultado={"uuid": factura.cfdi_uuid})
+        return COMPLETADO
+
+    try:
+        res = srv.timbrar_factura(db, factura_id)
+    except HTTPException as e:
+        db.rollback()
+        logger.warning("[Timbrado] Trabajo %s falló: %s", trabajo_id, e.detail)
+        _terminar(db, trabajo_id, FALLIDO, error=str(e.detail))
+        return FALLIDO
+    except Exception as e:
+        db.rollback()
+        logger.exception("[Timbrado] Error inesperado en trabajo %s", trabajo_id)
+        _terminar(db, trabajo_id, FALLIDO, error=str(e))
+        return FALLIDO
+
+    resultado = {k: res.get(k) for k in _CAMPOS_RESULTADO if res.get(k) is not None}
+    usuario = (
+        db.query(Usuario).filter(Usuario.id == trabajo.usuario_id).first()
+        if trabajo.usuario_id else None
+    )
+    audit_svc.registrar(
+        db=db, accion=audit_svc.TIMBRAR_FACTURA, entidad="factura",
+        usuario_id=trabajo.usuario_id,
+        usuario_email=getattr(usuario, "email", None),
+        empresa_id=trabajo.empresa_id, entidad_id=str(factura_id),
+        detalle={"serie": factura.serie, "folio": factura.folio, "trabajo_id": str(trabajo_id)},
+    )
+    _terminar(db, trabajo_id, COMPLETADO, resultado=resultado)
+    return COMPLETADO
+
+
+def recuperar_colgados(db: Session) -> int:
+    """
+    Cierra los trabajos EN_PROCESO que llevan más del doble del timeout de
+    timbrado (worker caído). No se regresan a la cola: el worker pudo caer
+    después de que el PAC timbró y antes del commit, y reintentar generaría un
+    CFDI duplicado. Si la factura ya quedó TIMBRADA el trabajo se completa; si
+    no, queda FALLIDO para que alguien verifique en el PAC antes de reintentar.
+    """
+    limite = datetime.utcnow() - timedelta(seconds=2 * settings.FM_TIMEOUT_TIMBRAR + 60)
+    colgados: List[TrabajoTimbrado] = (
+        db.query(TrabajoTimbrado)
+        .filter(TrabajoTimbrado.estado == EN_PROCESO, TrabajoTimbrado.iniciado_en < limite)
+        .all()
+    )
+    for t in colgados:
+        factura = db.get(Factura, t.factura_id)
+        if factura is not None and factura.estatus == "TIMBRADA":
+            t.estado = COMPLETADO
+            t.resultado = {"uuid": factura.cfdi_uuid}
+        else:
+            t.estado = FALLIDO
+            t.error = (
+                "El timbrado se interrumpió y pudo haber llegado al PAC; "
+                "verificar en el PAC antes de reintentar"
+            )
+        t.terminado_en = datetime.utcnow()
+    if colgados:
+        db.commit()
+        logger.warning("[Timbrado] %d trabajo(s) colgados cerrados", len(colgados))
+    return len(colgados)
+
+
+def procesar_siguiente(session_factory: Callable[[], Session]) -> bool:
+    """Toma y ejecuta un trabajo. False si no había ninguno disponible."""
+    db = session_factory()
+    try:
+        trabajo = tomar_trabajo(db)
+        if trabajo is None:
+            return False
+        ejecutar_trabajo(db, trabajo)
+        return True
+    finally:
+        db.close()
+
+
+class PoolTimbrado:
+    """Hilos que vacían la cola; duermen `TIMBRADO_POLL_SEGUNDOS` si no hay trabajo."""
+
+    def __init__(self, num_hilos: int, session_factory: Optional[Callable[[], Session]] = None):
+        self.num_hilos = max(1, num_hilos)
+        self._session_factory = session_factory
+        self._hilos: List[threading.Thread] = []
+        self._alto = threading.Event()
+        self._hay_trabajo = threading.Event()
+
+    def _factory(self) -> Session:
+        if self._session_factory is None:
+            from app.database import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory()
+
+    def _ciclo(self, indice: int) -> None:
+        ultima_revision = 0.0
+        while not self._alto.is_set():
+            try:
+                # Un solo hilo revisa trabajos colgados, a lo más una vez por minuto
+                ahora = datetime.utcnow().timestamp()
+                if indice == 0 and ahora - ultima_revision > 60:
+                    ultima_revision = ahora
+                    db = self._factory()
+                    try:
+                        recuperar_colgados(db)
+                    finally:
+                        db.close()
+                if procesar_siguiente(self._factory):
+                    continue
+            except Exception as exc:
+                logger.error("[Timbrado] Error en worker %d: %s", indice, exc)
+            self._hay_trabajo.wait(settings.TIMBRADO_POLL_SEGUNDOS)
+            self._hay_trabajo.clear()
+
+    def iniciar(self) -> "PoolTimbrado":
+        for i in range(self.num_hilos):
+            h = threading.Thread(target=self._ciclo, args=(i,), name=f"timbrado-{i}", daemon=True)
+            h.start()
+            self._hilos.append(h)
+        logger.info("[Timbrado] Pool de %d hilos iniciado", self.num_hilos)
+        return self
+
+    def despertar(self) -> None:
+        self._hay_trabajo.set()
+
+    def detener(self, timeout: Optional[float] = None) -> None:
+        self._alto.set()
+        self._hay_trabajo.set()
+        for h in self._hilos:
+            h.join(timeout)
+        self._hilos.clear()
+
+
+_pool: Optional[PoolTimbrado] = None
+_pool_lock = threading.Lock()
+
+
+def iniciar_workers(num_hilos: Optional[int] = None) -> PoolTimbrado:
+    """Pool de timbrado del proceso, creado al primer uso (idempotente)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PoolTimbrado(num_hilos or settings.TIMBRADO_WORKERS).iniciar()
+    return _pool
+
+
+def detener_workers(timeout: Optional[float] = None) -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.detener(timeout)
+            _pool = None
@@ -0,0 +1,381 @@
+# app/services/computo.py
+"""
+Servicio de cómputo: pool de procesos para el trabajo de CPU que antes corría
+en el threadpool de Starlette (render de PDFs con ReportLab, cadena original
+y firma RSA, lectura de la CSF con pypdf). Ahí competía por el GIL con los
+endpoints de I/O del mismo worker: mientras se generaba un PDF, un GET de
+catálogo podía esperar cientos de ms.
+
+  - Workers de larga vida (`COMPUTO_WORKERS`, 0 = uno por núcleo) que al
+    arrancar compilan el XSLT, importan los generadores de PDF y cargan los
+    índices de catálogos SAT que usan, así la primera tarea no paga eso.
+    Es el mismo pool que usa `sellado_lote` para sellar en lote.
+  - `ejecutar(fn, *args)` manda `fn` (función de módulo, serializable) al
+    pool y espera el resultado; el hilo del endpoint queda bloqueado sin
+    tomar el GIL.
+  - Contrapresión: a lo más `COMPUTO_MAX_PENDIENTES` tareas en cola o en
+    ejecución. Si no hay lugar en `COMPUTO_ESPERA_S` segundos se responde 503
+    (`ComputoSaturado`) en vez de acumular hilos del threadpool esperando.
+  - Timeout por tarea (`COMPUTO_TIMEOUT_S`) → 504 (`ComputoTimeout`). La tarea
+    sigue en el worker y ocupa su lugar hasta que termina.
+  - `metricas()`: por tarea, totales, errores, timeouts, rechazos y p50/p95/p99
+    de espera (cola + serialización) y de ejecución en el worker. Se exponen
+    en `GET /health/computo`.
+
+Las tareas que leen la BD (`render_factura`, `render_pago`,
+`render_presupuesto` y el sello, que lee ahí la contraseña del CSD) abren su
+propia sesión en el worker, así que sólo ven datos ya confirmados. Con
+`COMPUTO_ACTIVO=False` todo corre en el hilo que llama, como antes (y con la
+sesión del llamador).
+"""
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FuturoTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Deque, Dict, Optional, Tuple, TypeVar
+from uuid import UUID
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app.config import settings
+
+logger = logging.getLogger("app")
+
+T = TypeVar("T")
+
+_VENTANA = 500  # tiempos recientes por tarea para los percentiles
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_cupos: Optional[threading.BoundedSemaphore] = None
+_cupos_max = 0
+_pendientes = 0
+
+_lock = threading.Lock()
+_contadores: Dict[str, Dict[str, int]] = {}
+_tiempos: Dict[str, Tuple[Deque[float], Deque[float]]] = {}
+
+
+class ComputoError(HTTPException):
+    """El pool de cómputo no pudo atender la tarea (no es un error de la tarea)."""
+
+
+class ComputoSaturado(ComputoError):
+    def __init__(self) -> None:
+        super().__init__(
+            status_code=503,
+            detail="El servidor está ocupado generando documentos. Intenta de nuevo en unos segundos.",
+            headers={"Retry-After": "5"},
+        )
+
+
+class ComputoTimeout(ComputoError):
+    def __init__(self, nombre: str, timeout: float) -> None:
+        super().__init__(
+            status_code=504,
+            detail=f"La generación ({nombre}) tardó más de {timeout:g} s. Intenta de nuevo.",
+        )
+
+
+def activo() -> bool:
+    return bool(settings.COMPUTO_ACTIVO)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Pool
+# ─────────────────────────────────────────────────────────────────────────────
+def num_workers() -> int:
+    n = settings.COMPUTO_WORKERS or getattr(settings, "SELLADO_WORKERS", 0) or 0
+    return n if n > 0 else (os.cpu_count() or 1)
+
+
+def _init_worker() -> None:
+    """Precalienta el worker: XSLT, generadores de PDF y catálogos SAT."""
+    from xml.etree.ElementTree import register_namespace
+
+    register_namespace("cfdi", "http://www.sat.gob.mx/cfd/4")
+    register_namespace("xsi", "http://www.w3.org/2001/XMLSchema-instance")
+    register_namespace("implocal", "http://www.sat.gob.mx/implocal")
+    from app.services import cfdi40_xml
+
+    cfdi40_xml.warm_xslt_cache()
+
+    try:
+        from app.catalogos_sat.registro import indice
+        from app.services import credencial_service, pdf_factura, pdf_generator, pdf_pago  # noqa: F401
+
+        for catalogo in (
+            "c_claveunidad", "c_formapago", "c_metodopago", "c_regimenfiscal", "c_tiporelacion", "c_usocfdi",
+        ):
+            indice(catalogo)
+    except Exception as e:  # el worker sirve igual; lo que falte se carga al primer uso
+        logger.warning("[Computo] Precalentamiento incompleto: %s", e)
+
+
+def _contexto() -> multiprocessing.context.BaseContext:
+    """
+    Los workers no se crean con fork: el proceso web ya tiene hilos (threadpool,
+    scheduler, pre-render) y un fork puede heredar un lock tomado. Con
+    forkserver (spawn donde no existe) arrancan limpios, leen la configuración
+    del entorno y abren sus propias conexiones.
+    """
+    metodo = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(metodo)
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Pool de procesos, creado al primer uso y compartido por el proceso web."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=num_workers(), mp_context=_contexto(), initializer=_init_worker
+                )
+                logger.info("[Computo] Pool de %d procesos iniciado", num_workers())
+    return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _semaforo() -> threading.BoundedSemaphore:
+    global _cupos, _cupos_max
+    maximo = max(1, settings.COMPUTO_MAX_PENDIENTES)
+    with _pool_lock:
+        if _cupos is None or _cupos_max != maximo:
+            _cupos, _cupos_max = threading.BoundedSemaphore(maximo), maximo
+        return _cupos
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Métricas
+# ─────────────────────────────────────────────────────────────────────────────
+def _contar(nombre: str, campo: str, espera_ms: Optional[float] = None, ejecucion_ms: Optional[float] = None) -> None:
+    with _lock:
+        cont = _contadores.setdefault(
+            nombre, {"total": 0, "errores": 0, "timeouts": 0, "rechazadas": 0, "en_linea": 0}
+        )
+        cont[campo] += 1
+        if ejecucion_ms is not None:
+            esperas, ejecuciones = _tiempos.setdefault(nombre, (deque(maxlen=_VENTANA), deque(maxlen=_VENTANA)))
+            esperas.append(espera_ms or 0.0)
+            ejecuciones.append(ejecucion_ms)
+
+
+def _percentiles(valores, prefijo: str) -> Dict[str, float]:
+    if not valores:
+        return {}
+    orden = sorted(valores)
+
+    def p(q: float) -> float:
+        return round(orden[min(len(orden) - 1, int(len(orden) * q))], 1)
+
+    return {f"{prefijo}_p50_ms": p(0.50), f"{prefijo}_p95_ms": p(0.95), f"{prefijo}_p99_ms": p(0.99)}
+
+
+def metricas() -> Dict[str, Any]:
+    with _lock:
+        tareas = {}
+        for nombre, cont in _contadores.items():
+            esperas, ejecuciones = _tiempos.get(nombre, ((), ()))
+            tareas[nombre] = {**cont, **_percentiles(esperas, "espera"), **_percentiles(ejecuciones, "ejecucion")}
+        pendientes = _pendientes
+    return {
+        "activo": activo(),
+        "workers": num_workers(),
+        "pool_iniciado": _pool is not None,
+        "pendientes": pendientes,
+        "max_pendientes": settings.COMPUTO_MAX_PENDIENTES,
+        "tareas": tareas,
+    }
+
+
+def reiniciar_metricas() -> None:
+    with _lock:
+        _contadores.clear()
+        _tiempos.clear()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Envío de tareas
+# ─────────────────────────────────────────────────────────────────────────────
+def _medido(fn: Callable[..., T], args: tuple, kwargs: dict) -> Tuple[T, float]:
+    """Corre en el worker: resultado y ms de CPU de la tarea."""
+    t0 = time.perf_counter()
+    return fn(*args, **kwargs), (time.perf_counter() - t0) * 1000
+
+
+def _nombre(fn: Callable, tarea: Optional[str]) -> str:
+    return tarea or getattr(fn, "__name__", "tarea").lstrip("_")
+
+
+def enviar(
+    fn: Callable[..., T], *args, tarea: Optional[str] = None, espera: Optional[float] = None, **kwargs
+) -> "Future[T]":
+    """
+    Encola `fn(*args, **kwargs)` en el pool y regresa el futuro del resultado.
+    Lanza `ComputoSaturado` si no hay lugar en `espera` segundos
+    (default `COMPUTO_ESPERA_S`).
+    """
+    global _pendientes
+    nombre = _nombre(fn, tarea)
+    cupos = _semaforo()
+    if not cupos.acquire(timeout=settings.COMPUTO_ESPERA_S if espera is None else espera):
+        _contar(nombre, "rechazadas")
+        logger.warning("[Computo] Pool saturado, se rechaza %s", nombre)
+        raise ComputoSaturado()
+
+    t0 = time.perf_counter()
+    try:
+        interno = get_pool().submit(_medido, fn, args, kwargs)
+    except BrokenProcessPool:
+        # Un worker murió (OOM, señal): se recrea el pool para la siguiente
+        shutdown_pool()
+        cupos.release()
+        raise
+    except BaseException:
+        cupos.release()
+        raise
+    with _lock:
+        _pendientes += 1
+
+    futuro: "Future[T]" = Future()
+    # Cancelar el futuro (timeout) saca la tarea de la cola si aún no empieza
+    futuro.add_done_callback(lambda f: f.cancelled() and interno.cancel())
+
+    def _terminado(f: Future) -> None:
+        global _pendientes
+        with _lock:
+            _pendientes -= 1
+        cupos.release()
+        if f.cancelled():
+            futuro.cancel()
+            return
+        error = f.exception()
+        if error is not None:
+            if isinstance(error, BrokenProcessPool):
+                shutdown_pool()
+            _contar(nombre, "errores")
+            if not futuro.cancelled():
+                futuro.set_exception(error)
+            return
+        resultado, ejecucion_ms = f.result()
+        total_ms = (time.perf_counter() - t0) * 1000
+        _contar(nombre, "total", max(0.0, total_ms - ejecucion_ms), ejecucion_ms)
+        if not futuro.cancelled():
+            futuro.set_result(resultado)
+
+    interno.add_done_callback(_terminado)
+    return futuro
+
+
+def ejecutar(
+    fn: Callable[..., T], *args, tarea: Optional[str] = None, timeout: Optional[float] = None, **kwargs
+) -> T:
+    """
+    Corre `fn(*args, **kwargs)` en el pool y regresa su resultado (o relanza su
+    excepción). Con el servicio inactivo corre aquí mismo.
+    """
+    nombre = _nombre(fn, tarea)
+    if not activo():
+        t0 = time.perf_counter()
+        try:
+            resultado = fn(*args, **kwargs)
+        except Exception:
+            _contar(nombre, "errores")
+            raise
+        _contar(nombre, "en_linea", 0.0, (time.perf_counter() - t0) * 1000)
+        return resultado
+
+    timeout = settings.COMPUTO_TIMEOUT_S if timeout is None else timeout
+    futuro = enviar(fn, *args, tarea=nombre, **kwargs)
+    try:
+        return futuro.result(timeout=timeout)
+    except FuturoTimeout:
+        futuro.cancel()
+        _contar(nombre, "timeouts")
+        logger.warning("[Computo] %s excedió %s s", nombre, timeout)
+        raise ComputoTimeout(nombre, timeout)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Tareas con BD: en el worker abren su propia sesión
+# ─────────────────────────────────────────────────────────────────────────────
+def _sesion() -> Session:
+    from app.database import SessionLocal
+
+    return SessionLocal()
+
+
+def _pdf_factura(factura_id: UUID, preview: bool) -> bytes:
+    from app.services.pdf_factura import render_factura_pdf_bytes_from_model
+
+    db = _sesion()
+    try:
+        return render_factura_pdf_bytes_from_model(db, factura_id, preview=preview)
+    finally:
+        db.close()
+
+
+def _pdf_pago(pago_id: UUID, preview: bool) -> bytes:
+    from app.services.pdf_pago import render_pago_pdf_bytes_from_model
+
+    db = _sesion()
+    try:
+        return render_pago_pdf_bytes_from_model(db, pago_id, preview=preview)
+    finally:
+        db.close()
+
+
+def _pdf_presupuesto(presupuesto_id: UUID) -> bytes:
+    from app.models.presupuestos import Presupuesto
+    from app.services.pdf_generator import render_presupuesto_pdf_bytes
+
+    db = _sesion()
+    try:
+        presupuesto = db.get(Presupuesto, presupuesto_id)
+        if presupuesto is None:
+            raise ValueError("Presupuesto no encontrado")
+        return render_presupuesto_pdf_bytes(presupuesto, db)
+    finally:
+        db.close()
+
+
+def render_factura(db: Session, factura_id: UUID, *, preview: bool = False) -> bytes:
+    """PDF de la factura (mismo resultado que `render_factura_pdf_bytes_from_model`)."""
+    if not activo():
+        from app.services.pdf_factura import render_factura_pdf_bytes_from_model
+
+        return ejecutar(render_factura_pdf_bytes_from_model, db, factura_id, preview=preview, tarea="pdf_factura")
+    return ejecutar(_pdf_factura, factura_id, preview)
+
+
+def render_pago(db: Session, pago_id: UUID, *, preview: bool = False) -> bytes:
+    """PDF del complemento de pago (mismo resultado que `render_pago_pdf_bytes_from_model`)."""
+    if not activo():
+        from app.services.pdf_pago import render_pago_pdf_bytes_from_model
+
+        return ejecutar(render_pago_pdf_bytes_from_model, db, pago_id, preview=preview, tarea="pdf_pago")
+    return ejecutar(_pdf_pago, pago_id, preview)
+
+
+def render_presupuesto(db: Session, presupuesto) -> bytes:
+    """PDF del presupuesto (mismo resultado que `render_presupuesto_pdf_bytes`)."""
+    if not activo():
+        from app.services.pdf_generator import render_presupuesto_pdf_bytes
+
+        return ejecutar(render_presupuesto_pdf_bytes, presupuesto, db, tarea="pdf_presupuesto")
+    return ejecutar(_pdf_presupuesto, presupuesto.id)
@@ -11,7 +11,6 @@ import os
 from typing import Optional
 from uuid import UUID
 
-import qrcode
 from PIL import Image as PILImage
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import mm
@@ -19,6 +18,7 @@ from reportlab.lib.utils import ImageReader
 from reportlab.pdfgen import canvas as rl_canvas
 
 from app.config import settings
+from app.services import render_assets
 
 CARD_W = 86 * mm
 CARD_H = 135 * mm
@@ -44,12 +44,6 @@ def _load_img(path: str | None) -> Optional[PILImage.Image]:
         return None
 
 
-def _fit(img: PILImage.Image, max_w: float, max_h: float) -> tuple[float, float]:
-    iw, ih = img.size
-    r = min(max_w / iw, max_h / ih)
-    return iw * r, ih * r
-
-
 def _buf(img: PILImage.Image, flatten: bool = False) -> io.BytesIO:
     """Serializa a PNG. Con flatten=True composita sobre blanco (elimina alpha)."""
     if flatten or img.mode == "RGB":
@@ -62,15 +56,6 @@ def _buf(img: PILImage.Image, flatten: bool = False) -> io.BytesIO:
     return b
 
 
-def _qr_black(data: str) -> io.BytesIO:
-    qr = qrcode.QRCode(version=2, box_size=4, border=1,
-                       error_correction=qrcode.constants.ERROR_CORRECT_M)
-    qr.add_data(data)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white").convert("RGB")
-    return _buf(img)
-
-
 def _darken(hex_color: str, f: float = 0.20) -> colors.Color:
     h = hex_color.lstrip("#")
     r, g, b = int(h[0:2], 16) / 255, int(h[2:4], 16) / 255, int(h[4:6], 16) / 255
@@ -210,13 +195,12 @@ def _draw_front(c: rl_canvas.Canvas, *, color_hex: str,
     logo_area_bottom = wave_bottom_y + 6 * mm
     logo_center_y    = (logo_area_top + logo_area_bottom) / 2
 
-    logo_path = os.path.join(settings.DATA_DIR, "logos", f"{empresa_id}.png")
-    logo_img = _load_img(logo_path)
-    if logo_img:
-        max_lw = CARD_W - 16 * mm
-        max_lh = (logo_area_top - logo_area_bottom) * 0.60
-        lw, lh = _fit(logo_img, max_lw, max_lh)
-        c.drawImage(ImageReader(_buf(logo_img)),
+    max_lw = CARD_W - 16 * mm
+    max_lh = (logo_area_top - logo_area_bottom) * 0.60
+    logo = render_assets.logo(os.path.join(settings.DATA_DIR, "logos", f"{empresa_id}.png"), max_lw, max_lh)
+    if logo:
+        lw, lh = render_assets.ajustar(logo.ancho, logo.alto, max_lw, max_lh)
+        c.drawImage(logo.imagen,
                     (CARD_W - lw) / 2, logo_center_y - lh / 2,
                     width=lw, height=lh, mask="auto", preserveAspectRatio=True)
     else:
@@ -359,20 +343,21 @@ def _draw_back(c: rl_canvas.Canvas, *, color_hex: str,
 
     c.setFillColor(colors.white)
     c.roundRect(qr_x - 1.5, qr_y - 1.5, QR_SIZE + 3, QR_SIZE + 3, 3, fill=1, stroke=0)
-    c.drawImage(ImageReader(_qr_black(qr_data)), qr_x, qr_y, width=QR_SIZE, height=QR_SIZE)
+    render_assets.dibujar_qr(c, qr_data, qr_x, qr_y, QR_SIZE, version=2)
 
     # ── Logo empresa (derecha de la ola inferior, estilo Card Depot) ──────────
-    logo_path = os.path.join(settings.DATA_DIR, "logos", f"{empresa_id}.png")
-    logo_img = _load_img(logo_path)
     logo_area_x = qr_x + QR_SIZE + 3 * mm
     logo_area_w = CARD_W - logo_area_x - M
     logo_area_h = wave_top_y - 3 * mm
+    logo = render_assets.logo(
+        os.path.join(settings.DATA_DIR, "logos", f"{empresa_id}.png"), logo_area_w, logo_area_h * 0.55
+    )
 
-    if logo_img:
-        lw, lh = _fit(logo_img, logo_area_w, logo_area_h * 0.55)
+    if logo:
+        lw, lh = render_assets.ajustar(logo.ancho, logo.alto, logo_area_w, logo_area_h * 0.55)
         lx = logo_area_x + (logo_area_w - lw) / 2
         ly = (wave_top_y - M * 0.5 - lh) / 2
-        c.drawImage(ImageReader(_buf(logo_img)), lx, ly, width=lw, height=lh,
+        c.drawImage(logo.imagen, lx, ly, width=lw, height=lh,
                     mask="auto", preserveAspectRatio=True)
     else:
         c.setFillColor(colors.white)
@@ -165,8 +165,9 @@ def send_invoice_email(
     if factura.estatus in ("CANCELADA", "EN_CANCELACION"):
         try:
             from app.services import acuse_cancelacion_service as acuse_svc
+            from app.services.pac_router import get_router
 
-            acuse_xml = acuse_svc.descargar_acuse_xml(factura)
+            acuse_xml = get_router().descargar_acuse(factura)
             acuse_pdf = acuse_svc.generar_pdf_acuse(acuse_xml, factura)
             base = f"acuse_cancelacion_{factura.serie}-{factura.folio}"
             _adjuntar_bytes(acuse_pdf, f"{base}.pdf")
@@ -15,17 +15,14 @@ from app.models.factura import Factura
 from app.models.factura_detalle import FacturaDetalle
 from app.schemas.factura import FacturaCreate, FacturaUpdate
 from app.models.associations import cliente_empresa as cliente_empresa_association
-from app.services.timbrado_factmoderna import FacturacionModernaPAC
+from app.services.pac_router import get_router
 from app.services.cfdi40_xml import build_cfdi40_xml_sin_timbrar
 from app.services import notificacion_service as notif_svc
 from app.services.pac_errors import interpretar_error_pac
-from app.services.pdf_factura import (
-    render_factura_pdf_bytes_from_model,
-    load_factura_full,
-)
+from app.services import computo, pdf_cache
+from app.services.pdf_factura import load_factura_full
 
 logger = logging.getLogger("app")
-_pac = FacturacionModernaPAC()
 
 # ────────────────────────────────────────────────────────────────
 # FOLIO
@@ -371,7 +368,14 @@ def duplicar_factura(db: Session, factura_id: UUID) -> Factura:
 
 
 def timbrar_factura(db: Session, factura_id: UUID) -> dict:
-    factura = db.query(Factura).filter(Factura.id == factura_id).first()
+    # Bloqueo de fila hasta el commit del timbrado (ver cola_timbrado.ejecutar_trabajo)
+    factura = (
+        db.query(Factura)
+        .filter(Factura.id == factura_id)
+        .with_for_update()
+        .populate_existing()
+        .first()
+    )
     if not factura:
         raise HTTPException(status_code=404, detail="Factura no encontrada")
     if factura.estatus != "BORRADOR":
@@ -380,7 +384,7 @@ def timbrar_factura(db: Session, factura_id: UUID) -> dict:
         )
 
     try:
-        result = _pac.timbrar_factura(
+        result = get_router().timbrar_factura(
             db=db,
             factura_id=factura_id,
             generar_pdf=False,
@@ -431,7 +435,7 @@ def solicitar_cancelacion_cfdi(
         )
 
     try:
-        out = _pac.solicitar_cancelacion_cfdi(
+        out = get_router().solicitar_cancelacion_cfdi(
             db=db,
             factura_id=factura_id,
             motivo=motivo,
@@ -488,9 +492,39 @@ def generar_pdf_bytes(db: Session, factura_id: UUID, preview: bool) -> bytes:
             status_code=409, detail="Debe estar TIMBRADA o CANCELADA para PDF final"
         )
     try:
-        return render_factura_pdf_bytes_from_model(
-            db, factura_id, preview=preview, logo_path=None
+        if not preview and pdf_cache.es_cacheable(factura):
+            return pdf_cache.leer_pdf(db, factura)
+        return computo.render_factura(db, factura_id, preview=preview)
+    except computo.ComputoError:
+        raise
+    except Exception as e:
+        logger.exception("Error de servicio al generar PDF para %s", factura_id)
+        raise HTTPException(
+            status_code=500, detail=f"Error interno al generar PDF: {e}"
         )
+
+
+def obtener_pdf_final(db: Session, factura_id: UUID) -> Tuple[Optional[str], str, Optional[bytes]]:
+    """
+    PDF final para descarga: (ruta en caché, etag, None) si la factura es
+    cacheable, o (None, "", bytes) si hay que servirlo recién generado.
+    """
+    factura = load_factura_full(db, factura_id)
+    if not factura:
+        raise HTTPException(
+            status_code=404, detail="Factura no encontrada para generar PDF"
+        )
+    if factura.estatus == "BORRADOR":
+        raise HTTPException(
+            status_code=409, detail="Debe estar TIMBRADA o CANCELADA para PDF final"
+        )
+    try:
+        if pdf_cache.es_cacheable(factura):
+            ruta, clave = pdf_cache.obtener_pdf(db, factura)
+            return ruta, clave, None
+        return None, "", computo.render_factura(db, factura_id, preview=False)
+    except computo.ComputoError:
+        raise
     except Exception as e:
         logger.exception("Error de servicio al generar PDF para %s", factura_id)
         raise HTTPException(
@@ -33,6 +33,9 @@ def interpretar_error_pac(exc: Exception | str) -> Tuple[int, str]:
       5. Respuesta del PAC no interpretable — mensaje genérico; el XML completo
          queda en el log, nunca en la pantalla del usuario.
     """
+    if isinstance(exc, PACNoDisponible):
+        return 503, str(exc)
+
     msg = str(exc)
 
     m = re.search(r"<faultstring>(.*?)</faultstring>", msg, flags=re.IGNORECASE | re.DOTALL)
@@ -53,3 +56,64 @@ def interpretar_error_pac(exc: Exception | str) -> Tuple[int, str]:
 
     logger.warning("Respuesta del PAC no interpretable: %s", msg[:4000])
     return 502, _GENERICO
+
+
+class ErrorRedPAC(RuntimeError):
+    """
+    Falla de red hablando con un PAC.
+
+    ``enviada`` indica si la petición pudo haber llegado al PAC (timeout de
+    lectura, conexión cortada a media respuesta): en ese caso el PAC pudo haber
+    timbrado y no es seguro reenviar el comprobante a otro PAC. Si la conexión
+    ni siquiera se abrió (``enviada=False``) el reintento es seguro.
+    """
+
+    def __init__(self, mensaje: str, *, enviada: bool = True):
+        super().__init__(mensaje)
+        self.enviada = enviada
+
+
+def error_de_red(exc: Exception, contexto: str) -> ErrorRedPAC:
+    """Envuelve una excepción de httpx indicando si la petición salió del proceso."""
+    import httpx
+
+    sin_enviar = isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+    return ErrorRedPAC(f"Error de red al {contexto}: {exc}", enviada=not sin_enviar)
+
+
+class RespuestaPAC(RuntimeError):
+    """
+    El PAC contestó y rechazó la solicitud (SOAP Fault o HTTP 4xx). Para el
+    circuit breaker es una llamada sana; los errores locales (cadena
+    original, llave del CSD, sello) no son `RespuestaPAC` y no cuentan.
+    """
+
+
+class ErrorServidorPAC(ErrorRedPAC):
+    """
+    HTTP 5xx sin SOAP Fault: respondió un gateway/balanceador o el PAC está
+    caído, no el servicio de timbrado. Para el circuit breaker cuenta como
+    falla. La petición llegó al servidor, así que se trata como enviada.
+    """
+
+    def __init__(self, mensaje: str, status_code: int):
+        super().__init__(mensaje, enviada=True)
+        self.status_code = status_code
+
+
+_FAULT_SOAP = re.compile(r"<(?:\w+:)?Fault[\s>]", re.IGNORECASE)
+
+
+def error_http(status_code: int, cuerpo: str, mensaje: str) -> RuntimeError:
+    """
+    Error para una respuesta HTTP >= 400 del PAC. Un 4xx o un SOAP Fault (que
+    en SOAP 1.1 llega con HTTP 500) es `RespuestaPAC`; un 5xx sin Fault es
+    `ErrorServidorPAC`.
+    """
+    if status_code >= 500 and not _FAULT_SOAP.search(cuerpo or ""):
+        return ErrorServidorPAC(mensaje, status_code)
+    return RespuestaPAC(mensaje)
+
+
+class PACNoDisponible(RuntimeError):
+    """Todos los PAC tienen el circuito abierto: se falla de inmediato, sin esperar timeouts."""
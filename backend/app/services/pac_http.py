@@ -0,0 +1,190 @@
+# app/services/pac_http.py
+"""
+Cliente HTTP compartido para el PAC (Facturación Moderna).
+
+Un solo `httpx.Client` por proceso con keep-alive y límites de conexiones,
+abierto en el `lifespan` de FastAPI y cerrado al apagar. Antes cada timbrado
+o cancelación abría un cliente nuevo (TCP + TLS por petición).
+
+Cada POST registra sus tiempos (conexión TCP, TLS, espera del servidor y
+total, y si reutilizó una conexión viva) vía el hook `trace` de httpcore;
+`estadisticas()` resume lo acumulado en el proceso. `post_soap_stream` deja
+leer el cuerpo por bloques (timbrado con PDF/adjuntos) sin cargarlo entero.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+import httpx
+
+from app.config import settings
+
+logger = logging.getLogger("app")
+
+_client: Optional[httpx.Client] = None
+_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, Dict[str, float]] = {}
+
+
+def _http2_disponible() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _timeout(operacion: str) -> httpx.Timeout:
+    por_operacion = {
+        "timbrar": settings.FM_TIMEOUT_TIMBRAR,
+        "cancelar": settings.FM_TIMEOUT_CANCELAR,
+    }
+    return httpx.Timeout(
+        por_operacion.get(operacion, settings.FM_TIMEOUT_TIMBRAR),
+        connect=settings.FM_TIMEOUT_CONNECT,
+    )
+
+
+def abrir_cliente() -> httpx.Client:
+    """Crea el cliente compartido (idempotente)."""
+    global _client
+    with _lock:
+        if _client is None or _client.is_closed:
+            http2 = bool(settings.FM_HTTP2)
+            if http2 and not _http2_disponible():
+                logger.warning("[PAC HTTP] FM_HTTP2 activo pero falta el paquete 'h2'; se usa HTTP/1.1")
+                http2 = False
+            _client = httpx.Client(
+                http2=http2,
+                timeout=_timeout("timbrar"),
+                limits=httpx.Limits(
+                    max_connections=settings.FM_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.FM_MAX_KEEPALIVE,
+                    keepalive_expiry=settings.FM_KEEPALIVE_EXPIRY,
+                ),
+            )
+            logger.info(
+                "[PAC HTTP] Cliente abierto (http2=%s, max_conn=%s, keepalive=%s)",
+                http2, settings.FM_MAX_CONNECTIONS, settings.FM_MAX_KEEPALIVE,
+            )
+        return _client
+
+
+def cerrar_cliente() -> None:
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def get_client() -> httpx.Client:
+    """Cliente compartido; si no se abrió en el lifespan (scripts, cron) se abre aquí."""
+    client = _client
+    if client is None or client.is_closed:
+        client = abrir_cliente()
+    return client
+
+
+class _Medicion:
+    """Acumula los eventos `trace` de httpcore de una sola petición."""
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.marcas: Dict[str, float] = {}
+
+    def __call__(self, evento: str, info: dict) -> None:
+        self.marcas.setdefault(evento.split(".", 1)[-1], time.perf_counter())
+
+    def _ms(self, ini: str, fin: str) -> float:
+        a, b = self.marcas.get(ini), self.marcas.get(fin)
+        return (b - a) * 1000 if a is not None and b is not None else 0.0
+
+    def resumen(self) -> Dict[str, float]:
+        return {
+            "reutilizada": "connect_tcp.started" not in self.marcas,
+            "connect_ms": self._ms("connect_tcp.started", "connect_tcp.complete"),
+            "tls_ms": self._ms("start_tls.started", "start_tls.complete"),
+            "servidor_ms": self._ms("send_request_body.complete", "receive_response_headers.complete"),
+            "total_ms": (time.perf_counter() - self.t0) * 1000,
+        }
+
+
+def _acumular(operacion: str, m: Dict[str, float]) -> None:
+    with _stats_lock:
+        s = _stats.setdefault(
+            operacion,
+            {"peticiones": 0, "reutilizadas": 0, "connect_ms": 0.0, "tls_ms": 0.0, "servidor_ms": 0.0, "total_ms": 0.0},
+        )
+        s["peticiones"] += 1
+        s["reutilizadas"] += 1 if m["reutilizada"] else 0
+        for k in ("connect_ms", "tls_ms", "servidor_ms", "total_ms"):
+            s[k] += m[k]
+
+
+def estadisticas() -> Dict[str, Dict[str, float]]:
+    """Por operación: peticiones, reutilizadas y promedios de tiempos en ms."""
+    with _stats_lock:
+        out = {}
+        for op, s in _stats.items():
+            n = s["peticiones"] or 1
+            out[op] = {
+                "peticiones": s["peticiones"],
+                "reutilizadas": s["reutilizadas"],
+                **{f"{k}_prom": round(s[k] / n, 1) for k in ("connect_ms", "tls_ms", "servidor_ms", "total_ms")},
+            }
+        return out
+
+
+def post_soap(
+    operacion: str, url: str, content, headers: dict, timeout: Optional[float] = None
+) -> httpx.Response:
+    """POST con el cliente compartido, timeout de la operación y medición de tiempos."""
+    medicion = _Medicion()
+    resp = get_client().post(
+        url,
+        content=content,
+        headers=headers,
+        timeout=_timeout(operacion) if timeout is None else timeout,
+        extensions={"trace": medicion},
+    )
+    m = medicion.resumen()
+    _acumular(operacion, m)
+    logger.info(
+        "[PAC HTTP] %s HTTP %s reutilizada=%s connect=%.0fms tls=%.0fms servidor=%.0fms total=%.0fms",
+        operacion, resp.status_code, m["reutilizada"], m["connect_ms"], m["tls_ms"],
+        m["servidor_ms"], m["total_ms"],
+    )
+    return resp
+
+
+@contextmanager
+def post_soap_stream(
+    operacion: str, url: str, content, headers: dict, timeout: Optional[float] = None
+) -> Iterator[httpx.Response]:
+    """Como `post_soap`, pero sin leer el cuerpo: el llamador lo consume con `iter_bytes()`."""
+    medicion = _Medicion()
+    with get_client().stream(
+        "POST",
+        url,
+        content=content,
+        headers=headers,
+        timeout=_timeout(operacion) if timeout is None else timeout,
+        extensions={"trace": medicion},
+    ) as resp:
+        try:
+            yield resp
+        finally:
+            m = medicion.resumen()
+            _acumular(operacion, m)
+            logger.info(
+                "[PAC HTTP] %s HTTP %s reutilizada=%s connect=%.0fms tls=%.0fms servidor=%.0fms total=%.0fms (stream)",
+                operacion, resp.status_code, m["reutilizada"], m["connect_ms"], m["tls_ms"],
+                m["servidor_ms"], m["total_ms"],
+            )
@@ -0,0 +1,276 @@
+# app/services/pac_respuesta.py
+"""
+Lectura en streaming de la respuesta SOAP de timbrado del PAC.
+
+El cuerpo HTTP se alimenta por bloques a un parser incremental (expat). El
+texto Base64 de los nodos de interés (CFDI timbrado y, si se pidieron, PDF,
+CBB y TXT) se decodifica conforme llega y se escribe directo a un archivo
+temporal en el directorio destino; nunca se arma la cadena Base64 completa ni
+el árbol del SOAP. Los bytes del CFDI se pasan además a un segundo parser que
+extrae en la misma pasada los atributos del TimbreFiscalDigital y el
+NoCertificado del Comprobante.
+
+Del SOAP crudo sólo se guardan los primeros `FM_LOG_SOAP_MAX_BYTES` para el
+log, que es muestreado (`FM_LOG_SOAP_MUESTREO`) y siempre se emite si hay error.
+"""
+from __future__ import annotations
+
+import base64
+import binascii
+import logging
+import os
+import random
+import tempfile
+from typing import Dict, Iterable, Optional
+from xml.parsers import expat
+
+from app.config import settings
+from app.services.pac_errors import RespuestaPAC
+
+logger = logging.getLogger("app")
+
+# Nodos del SOAP que traen el CFDI timbrado (Base64), como los buscaba el parser DOM
+NODOS_CFDI = ("xml", "cfdi", "xmltimbrado", "cfditimbrado", "response", "returnxml")
+ADJUNTOS = ("pdf", "cbb", "txt")
+
+_ATRIBUTOS_TFD = {
+    "UUID": "uuid",
+    "FechaTimbrado": "fecha_timbrado",
+    "RfcProvCertif": "rfc_prov_certif",
+    "SelloCFD": "sello_cfdi",
+    "NoCertificadoSAT": "no_certificado_sat",
+    "SelloSAT": "sello_sat",
+}
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit(":", 1)[-1]
+
+
+class _LectorTFD:
+    """Parser incremental del CFDI decodificado: TFD + Comprobante@NoCertificado."""
+
+    def __init__(self):
+        self.tfd: Dict[str, Optional[str]] = {}
+        self.no_certificado: Optional[str] = None
+        self.valido = True
+        self._parser = expat.ParserCreate()
+        self._parser.StartElementHandler = self._inicio
+
+    def _inicio(self, tag: str, attrs: Dict[str, str]) -> None:
+        local = _local(tag)
+        if local == "Comprobante" and self.no_certificado is None:
+            self.no_certificado = attrs.get("NoCertificado")
+        elif local == "TimbreFiscalDigital" and not self.tfd:
+            self.tfd = {clave: attrs.get(attr) for attr, clave in _ATRIBUTOS_TFD.items()}
+
+    def alimentar(self, datos: bytes, final: bool = False) -> None:
+        if not self.valido:
+            return
+        try:
+            self._parser.Parse(datos, final)
+        except expat.ExpatError:
+            # Se resuelve con el fallback por regex sobre el archivo guardado
+            self.valido = False
+
+
+class _SalidaB64:
+    """Decodifica Base64 por bloques (múltiplos de 4) y escribe a un temporal."""
+
+    def __init__(self, directorio: str, sufijo: str, lector: Optional[_LectorTFD] = None):
+        os.makedirs(directorio, exist_ok=True)
+        fd, self.ruta = tempfile.mkstemp(dir=directorio, prefix=".pac-", suffix=sufijo)
+        self._fh = os.fdopen(fd, "wb")
+        self._resto = ""
+        self._lector = lector
+        self.tamano = 0
+        self.inicio = b""
+        self.fin = b""
+
+    def _volcar(self, datos: bytes) -> None:
+        self._fh.write(datos)
+        self.tamano += len(datos)
+        if len(self.inicio) < 400:
+            self.inicio += datos[: 400 - len(self.inicio)]
+        self.fin = (self.fin + datos)[-400:]
+        if self._lector is not None:
+            self._lector.alimentar(datos)
+
+    def escribir(self, texto: str) -> None:
+        datos = self._resto + "".join(texto.split())
+        corte = len(datos) - len(datos) % 4
+        self._resto = datos[corte:]
+        if corte:
+            self._volcar(base64.b64decode(datos[:corte], validate=True))
+
+    def cerrar(self) -> None:
+        try:
+            if self._resto:
+                # Base64 sin padding al final
+                self._volcar(base64.b64decode(self._resto + "=" * (-len(self._resto) % 4), validate=True))
+                self._resto = ""
+            if self._lector is not None:
+                self._lector.alimentar(b"", final=True)
+        finally:
+            self._fh.close()
+
+    def descartar(self) -> None:
+        if not self._fh.closed:
+            self._fh.close()
+        try:
+            os.remove(self.ruta)
+        except OSError:
+            pass
+
+
+class RespuestaTimbrado:
+    """
+    Resultado de leer la respuesta de timbrado.
+    `cfdi` y `adjuntos` son archivos temporales en el directorio destino; el
+    llamador los mueve a su nombre final (`os.replace`) o llama `descartar()`.
+    """
+
+    def __init__(self, directorio: str, adjuntos: Iterable[str] = ()):
+        self.directorio = directorio
+        self.lector = _LectorTFD()
+        self.cfdi: Optional[_SalidaB64] = None
+        self.adjuntos: Dict[str, _SalidaB64] = {}
+        self._buscados = {a.lower() for a in adjuntos}
+        self.fault_code: Optional[str] = None
+        self.fault_string: Optional[str] = None
+
+        self._pila: list = []
+        self._salida: Optional[_SalidaB64] = None
+        self._salida_nivel = 0
+        self._salida_nombre = ""
+        self._en_fault = 0
+        self._campo_fault: Optional[str] = None
+        self._texto_fault: list = []
+
+        self._parser = expat.ParserCreate()
+        self._parser.buffer_text = True
+        self._parser.StartElementHandler = self._inicio
+        self._parser.EndElementHandler = self._fin
+        self._parser.CharacterDataHandler = self._texto
+
+    # ── handlers de expat ────────────────────────────────────────────────
+    def _inicio(self, tag: str, attrs: Dict[str, str]) -> None:
+        local = _local(tag).lower()
+        self._pila.append(local)
+        nivel = len(self._pila)
+
+        if self._salida is not None and nivel > self._salida_nivel:
+            # El nodo tiene hijos: no era el que trae el Base64
+            if self._salida.tamano == 0:
+                self._salida.descartar()
+                self._salida = None
+
+        if local == "fault":
+            self._en_fault = nivel
+        elif self._en_fault and local in ("faultcode", "faultstring"):
+            self._campo_fault = local
+            self._texto_fault = []
+        elif self._salida is None:
+            if local in NODOS_CFDI and self.cfdi is None:
+                self._abrir(local, ".xml", self.lector, nivel)
+            elif local in self._buscados and local not in self.adjuntos:
+                self._abrir(local, "." + local, None, nivel)
+
+    def _abrir(self, nombre: str, sufijo: str, lector: Optional[_LectorTFD], nivel: int) -> None:
+        self._salida = _SalidaB64(self.directorio, sufijo, lector)
+        self._salida_nivel = nivel
+        self._salida_nombre = nombre
+
+    def _texto(self, texto: str) -> None:
+        if self._salida is not None and len(self._pila) == self._salida_nivel:
+            self._salida.escribir(texto)
+        elif self._campo_fault:
+            self._texto_fault.append(texto)
+
+    def _fin(self, tag: str) -> None:
+        nivel = len(self._pila)
+        local = self._pila.pop()
+        if self._salida is not None and nivel == self._salida_nivel:
+            salida, self._salida = self._salida, None
+            if salida.tamano == 0 and not salida._resto:
+                salida.descartar()  # nodo vacío: se sigue buscando otro
+                return
+            try:
+                salida.cerrar()
+            except (binascii.Error, ValueError):
+                salida.descartar()
+                raise
+            if self._salida_nombre in NODOS_CFDI:
+                self.cfdi = salida
+            else:
+                self.adjuntos[self._salida_nombre] = salida
+        elif self._campo_fault == local:
+            valor = "".join(self._texto_fault).strip()
+            if local == "faultcode":
+                self.fault_code = valor
+            else:
+                self.fault_string = valor
+            self._campo_fault = None
+        elif local == "fault" and nivel == self._en_fault:
+            self._en_fault = 0
+
+    # ── API ──────────────────────────────────────────────────────────────
+    def alimentar(self, bloque: bytes, final: bool = False) -> None:
+        self._parser.Parse(bloque, final)
+
+    def descartar(self) -> None:
+        for salida in [self.cfdi, self._salida, *self.adjuntos.values()]:
+            if salida is not None:
+                salida.descartar()
+
+
+def leer_respuesta_timbrado(
+    bloques: Iterable[bytes],
+    directorio: str,
+    *,
+    adjuntos: Iterable[str] = (),
+    contexto: str = "PAC SOAP",
+) -> RespuestaTimbrado:
+    """
+    Consume la respuesta por bloques. Levanta RuntimeError con los mismos
+    mensajes que el parser anterior (SOAP inválido, Fault, sin <xml>, Base64);
+    el Fault como `RespuestaPAC`.
+    Si falla, borra los temporales que haya creado.
+    """
+    limite = settings.FM_LOG_SOAP_MAX_BYTES
+    muestra = bytearray()
+    resp = RespuestaTimbrado(directorio, adjuntos)
+    error: Optional[str] = None
+    try:
+        for bloque in bloques:
+            if len(muestra) < limite:
+                muestra += bloque[: limite - len(muestra)]
+            resp.alimentar(bloque)
+        resp.alimentar(b"", final=True)
+    except expat.ExpatError as e:
+        error = f"Respuesta SOAP inválida: {e}"
+    except (binascii.Error, ValueError) as e:
+        error = f"No se pudo decodificar el XML timbrado (base64): {e}"
+    except BaseException:
+        resp.descartar()
+        raise
+
+    es_fault = error is None and bool(resp.fault_code or resp.fault_string)
+    if es_fault:
+        error = f"PAC devolvió Fault: {resp.fault_code or ''} {resp.fault_string or ''}".strip()
+    if error is None and resp.cfdi is None:
+        error = "No se encontró el nodo <xml> (CFDI timbrado en Base64) en la respuesta del PAC."
+
+    if error is not None or random.random() < settings.FM_LOG_SOAP_MUESTREO:
+        texto = muestra.decode("utf-8", "replace")
+        if len(muestra) >= limite:
+            texto += "\n... [truncated]"
+        (logger.warning if error else logger.info)("[%s]\n%s", contexto, texto)
+    if error is not None:
+        resp.descartar()
+        raise RespuestaPAC(error) if es_fault else RuntimeError(error)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("[CFDI preview:head]\n%s", resp.cfdi.inicio.decode("utf-8", "ignore"))
+        logger.debug("[CFDI preview:tail]\n%s", resp.cfdi.fin.decode("utf-8", "ignore"))
+    return resp
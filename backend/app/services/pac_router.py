@@ -0,0 +1,430 @@
+# app/services/pac_router.py
+"""
+Interfaz de proveedor PAC y router con failover.
+
+`ProveedorPAC` es el contrato que cumple `FacturacionModernaPAC` (timbrar,
+timbrar pago, cancelar y descargar acuse). `PACRouter` implementa el mismo
+contrato sobre varios proveedores: lleva una ventana móvil de latencia y
+errores de red por proveedor, elige el más sano y, si la conexión falla,
+reintenta con el siguiente.
+
+Nunca se timbra dos veces el mismo comprobante: antes de pasar al siguiente
+proveedor se relee de la BD si ya tiene UUID (TFD guardado), y si la petición
+pudo haber llegado al PAC (timeout de lectura) no se reenvía a otro a menos que
+`PAC_FAILOVER_TRAS_ENVIO` lo permita.
+
+Cada proveedor tiene además un circuit breaker (`Circuito`): si en la ventana
+la tasa de errores de red o la latencia p95 rebasan el umbral, el circuito se
+abre y las llamadas fallan de inmediato (`PACNoDisponible`, HTTP 503) en lugar
+de esperar el timeout completo; tras `PAC_CB_ENFRIAMIENTO_S` deja pasar una
+sola sonda (semiabierto) que lo cierra o lo vuelve a abrir. Un HTTP 5xx sin
+SOAP Fault (`ErrorServidorPAC`) cuenta como falla; un Fault o un 4xx
+(`RespuestaPAC`) es una respuesta del PAC y cuenta como llamada sana. Los
+errores locales antes de enviar (cadena original, CSD) no se registran y, si
+la llamada era la sonda, la liberan. Las fallas en las
+que la petición no llegó al PAC se reintentan con backoff exponencial y jitter
+(`PAC_REINTENTOS`), revisando antes si el comprobante ya tiene UUID.
+
+Proveedores: el endpoint principal `FM_TIMBRADO_URL` y los de respaldo en
+`FM_TIMBRADO_URLS_RESPALDO`.
+"""
+from __future__ import annotations
+
+import logging
+import math
+import random
+from abc import ABC, abstractmethod
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.services.pac_errors import ErrorRedPAC, PACNoDisponible, RespuestaPAC
+
+logger = logging.getLogger("app")
+
+
+class ProveedorPAC(ABC):
+    """Contrato de un PAC. Los errores de red se reportan con `ErrorRedPAC`."""
+
+    nombre: str = "pac"
+    # RfcProvCertif que pone este PAC en el TFD (para saber quién timbró)
+    rfcs_certificacion: Tuple[str, ...] = ()
+
+    @abstractmethod
+    def timbrar_factura(self, *, db: Session, factura_id: UUID, **opciones) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def timbrar_pago(self, *, db: Session, pago_id: UUID, **opciones) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def solicitar_cancelacion_cfdi(
+        self, *, db: Session, factura_id: UUID, motivo: str, folio_sustitucion: Optional[str] = None
+    ) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def solicitar_cancelacion_pago(
+        self, *, db: Session, pago_id: UUID, motivo: str, folio_sustituto: Optional[str] = None
+    ) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def descargar_acuse(self, doc, *, forzar: bool = False) -> bytes:
+        ...
+
+
+class _Ventana:
+    """Últimas N llamadas de un proveedor: (ok, latencia_ms)."""
+
+    def __init__(self, tamano: int):
+        self._datos: Deque[Tuple[bool, float]] = deque(maxlen=tamano)
+        self._lock = threading.Lock()
+        self.ultima_falla: Optional[float] = None
+
+    def registrar(self, ok: bool, ms: float) -> None:
+        with self._lock:
+            self._datos.append((ok, ms))
+            if not ok:
+                self.ultima_falla = time.time()
+
+    def reiniciar(self) -> None:
+        with self._lock:
+            self._datos.clear()
+
+    def resumen(self) -> Dict[str, Any]:
+        with self._lock:
+            datos = list(self._datos)
+        n = len(datos)
+        errores = sum(1 for ok, _ in datos if not ok)
+        tiempos = sorted(ms for _, ms in datos)
+
+        def pct(p: float) -> float:
+            return round(tiempos[min(n - 1, int(n * p))], 1) if n else 0.0
+
+        return {
+            "muestras": n,
+            "errores": errores,
+            "tasa_error": round(errores / n, 3) if n else 0.0,
+            "latencia_p50_ms": pct(0.5),
+            "latencia_p95_ms": pct(0.95),
+            "ultima_falla": self.ultima_falla,
+        }
+
+
+CERRADO = "cerrado"
+ABIERTO = "abierto"
+SEMIABIERTO = "semiabierto"
+
+
+class Circuito:
+    """
+    Circuit breaker de un proveedor, evaluado sobre su `_Ventana`.
+    cerrado → abierto: con al menos `PAC_CB_MIN_MUESTRAS` llamadas, la tasa de
+    errores llega a `PAC_CB_TASA_ERROR` o la p95 a `PAC_CB_LATENCIA_MS`.
+    abierto → semiabierto: pasado el enfriamiento, una sola llamada de sonda.
+    semiabierto → cerrado si la sonda sale bien y rápido; si no, abierto otra vez.
+    """
+
+    def __init__(self, ventana: _Ventana):
+        self.ventana = ventana
+        self.estado = CERRADO
+        self.abierto_en: Optional[float] = None
+        self.aperturas = 0
+        self._sonda_en_curso = False
+        self._lock = threading.Lock()
+
+    def permitir(self) -> bool:
+        with self._lock:
+            if self.estado == CERRADO:
+                return True
+            if self.estado == ABIERTO:
+                if time.monotonic() - (self.abierto_en or 0) < settings.PAC_CB_ENFRIAMIENTO_S:
+                    return False
+                self.estado = SEMIABIERTO
+            if self._sonda_en_curso:
+                return False
+            self._sonda_en_curso = True
+            return True
+
+    def liberar_sonda(self) -> None:
+        """
+        La sonda no llegó a medir al PAC (el comprobante ya estaba aplicado o
+        la llamada terminó con una excepción ajena a la red): se sigue en
+        semiabierto y la siguiente llamada hace de sonda.
+        """
+        with self._lock:
+            self._sonda_en_curso = False
+
+    def _abrir(self) -> None:
+        self.estado = ABIERTO
+        self.abierto_en = time.monotonic()
+        self.aperturas += 1
+
+    def registrar(self, ok: bool, ms: float) -> None:
+        self.ventana.registrar(ok, ms)
+        with self._lock:
+            if self.estado == SEMIABIERTO:
+                self._sonda_en_curso = False
+                if ok and ms < settings.PAC_CB_LATENCIA_MS:
+                    self.estado = CERRADO
+                    self.ventana.reiniciar()
+                else:
+                    self._abrir()
+                return
+            if self.estado != CERRADO:
+                return
+            r = self.ventana.resumen()
+            if r["muestras"] >= settings.PAC_CB_MIN_MUESTRAS and (
+                r["tasa_error"] >= settings.PAC_CB_TASA_ERROR
+                or r["latencia_p95_ms"] >= settings.PAC_CB_LATENCIA_MS
+            ):
+                self._abrir()
+
+    def resumen(self) -> Dict[str, Any]:
+        with self._lock:
+            restante = 0.0
+            if self.estado == ABIERTO and self.abierto_en is not None:
+                restante = max(0.0, settings.PAC_CB_ENFRIAMIENTO_S - (time.monotonic() - self.abierto_en))
+            return {
+                "estado": self.estado,
+                "aperturas": self.aperturas,
+                "reabre_en_s": round(restante, 1),
+                "sonda_en_curso": self._sonda_en_curso,
+            }
+
+
+def _backoff(intento: int) -> float:
+    """Backoff exponencial con jitter completo: U(0, base·2^(intento-1))."""
+    return random.uniform(0, settings.PAC_REINTENTO_BASE_S * (2 ** (intento - 1)))
+
+
+def _factura_ya_timbrada(db: Session, factura_id: UUID) -> Optional[Dict[str, Any]]:
+    from app.models.factura import Factura
+
+    fila = (
+        db.query(Factura.cfdi_uuid, Factura.xml_path)
+        .filter(Factura.id == factura_id, Factura.cfdi_uuid.isnot(None))
+        .first()
+    )
+    if fila is None:
+        return None
+    return {"timbrada": True, "uuid": fila.cfdi_uuid, "xml_path": fila.xml_path}
+
+
+def _pago_ya_timbrado(db: Session, pago_id: UUID) -> Optional[Dict[str, Any]]:
+    from app.models.pago import Pago
+
+    fila = db.query(Pago.uuid).filter(Pago.id == pago_id, Pago.uuid.isnot(None)).first()
+    return {"timbrada": True, "uuid": fila.uuid} if fila else None
+
+
+class PACRouter(ProveedorPAC):
+    nombre = "router"
+
+    def __init__(self, proveedores: Sequence[ProveedorPAC], ventana: int = 50):
+        if not proveedores:
+            raise ValueError("Se requiere al menos un proveedor PAC")
+        self.proveedores: List[ProveedorPAC] = list(proveedores)
+        self._ventanas = {p.nombre: _Ventana(ventana) for p in self.proveedores}
+        self._circuitos = {p.nombre: Circuito(self._ventanas[p.nombre]) for p in self.proveedores}
+        self._elegido: Dict[str, int] = {p.nombre: 0 for p in self.proveedores}
+        self._failovers = 0
+        self._lock = threading.Lock()
+
+    # ── Decisión ────────────────────────────────────────────────────────────
+
+    def _puntaje(self, p: ProveedorPAC) -> float:
+        """Menor es mejor: latencia típica castigada por la tasa de errores de red."""
+        r = self._ventanas[p.nombre].resumen()
+        if not r["muestras"]:
+            return 0.0
+        return r["latencia_p50_ms"] * (1 + 10 * r["tasa_error"]) + 1000 * r["tasa_error"]
+
+    def orden(self) -> List[ProveedorPAC]:
+        # Circuitos abiertos al final; sorted es estable: a igual puntaje se
+        # respeta el orden configurado
+        return sorted(
+            self.proveedores,
+            key=lambda p: (self._circuitos[p.nombre].estado == ABIERTO, self._puntaje(p)),
+        )
+
+    def circuitos(self) -> Dict[str, str]:
+        return {nombre: c.estado for nombre, c in self._circuitos.items()}
+
+    def _ejecutar(
+        self,
+        operacion: str,
+        llamar: Callable[[ProveedorPAC], Dict[str, Any]],
+        ya_hecho: Optional[Callable[[], Optional[Dict[str, Any]]]] = None,
+        candidatos: Optional[List[ProveedorPAC]] = None,
+    ) -> Dict[str, Any]:
+        ultimo: Optional[ErrorRedPAC] = None
+        intentados = 0
+        candidatos = candidatos or self.orden()
+        for prov in candidatos:
+            circuito = self._circuitos[prov.nombre]
+            for intento in range(settings.PAC_REINTENTOS + 1):
+                if not circuito.permitir():
+                    break
+                # Si el circuito estaba semiabierto esta llamada es la sonda:
+                # cualquier salida sin registrar el resultado la libera
+                registrado = False
+                try:
+                    if intentados:
+                        # Antes de reenviar (reintento o failover): ¿ya quedó aplicado?
+                        previo = ya_hecho() if ya_hecho else None
+                        if previo is not None:
+                            logger.warning("[PAC] %s ya estaba aplicado; no se reenvía a %s", operacion, prov.nombre)
+                            return previo
+                        if intento:
+                            espera = _backoff(intento)
+                            logger.warning(
+                                "[PAC] Reintento %d de %s en %s en %.2fs: %s",
+                                intento, operacion, prov.nombre, espera, ultimo,
+                            )
+                            time.sleep(espera)
+                        else:
+                            with self._lock:
+                                self._failovers += 1
+                            logger.warning("[PAC] Failover de %s a %s: %s", operacion, prov.nombre, ultimo)
+                    intentados += 1
+
+                    t0 = time.perf_counter()
+                    try:
+                        res = llamar(prov)
+                    except ErrorRedPAC as e:
+                        # Red o HTTP 5xx sin Fault (ErrorServidorPAC): el PAC no atendió
+                        circuito.registrar(False, (time.perf_counter() - t0) * 1000)
+                        registrado = True
+                        ultimo = e
+                        if e.enviada and not settings.PAC_FAILOVER_TRAS_ENVIO:
+                            # El PAC pudo haber timbrado: reenviar arriesga un CFDI duplicado
+                            raise
+                        continue
+                    except RespuestaPAC:
+                        # El PAC contestó (SOAP Fault, HTTP 4xx): está vivo. Los
+                        # errores locales (cadena, CSD, sello) no se registran
+                        circuito.registrar(True, (time.perf_counter() - t0) * 1000)
+                        registrado = True
+                        raise
+                    circuito.registrar(True, (time.perf_counter() - t0) * 1000)
+                    registrado = True
+                finally:
+                    if not registrado:
+                        circuito.liberar_sonda()
+                with self._lock:
+                    self._elegido[prov.nombre] += 1
+                return res
+
+        if ultimo is None:
+            raise PACNoDisponible(self._mensaje_no_disponible(candidatos))
+        raise ultimo
+
+    def _mensaje_no_disponible(self, candidatos: Sequence[ProveedorPAC]) -> str:
+        """Cuándo reintentar, según el estado real de los circuitos que se saltaron."""
+        circuitos = [self._circuitos[p.nombre].resumen() for p in candidatos]
+        mensaje = (
+            "El PAC no está respondiendo y se suspendieron temporalmente los envíos "
+            "para no dejar solicitudes esperando."
+        )
+        if any(c["estado"] == SEMIABIERTO and c["sonda_en_curso"] for c in circuitos):
+            return f"{mensaje} Se está verificando si ya responde; intenta de nuevo en unos segundos."
+        espera = min((c["reabre_en_s"] for c in circuitos if c["estado"] == ABIERTO), default=0)
+        return f"{mensaje} Intenta de nuevo en {max(1, math.ceil(espera))} s."
+
+    def metricas(self) -> Dict[str, Any]:
+        """Estado por proveedor y decisiones del router, para tableros."""
+        orden = [p.nombre for p in self.orden()]
+        with self._lock:
+            elegido, failovers = dict(self._elegido), self._failovers
+        return {
+            "orden": orden,
+            "failovers": failovers,
+            "proveedores": {
+                p.nombre: {
+                    **self._ventanas[p.nombre].resumen(),
+                    "circuito": self._circuitos[p.nombre].resumen(),
+                    "puntaje": round(self._puntaje(p), 1),
+                    "elegido": elegido[p.nombre],
+                }
+                for p in self.proveedores
+            },
+        }
+
+    # ── Contrato ProveedorPAC ───────────────────────────────────────────────
+
+    def timbrar_factura(self, *, db: Session, factura_id: UUID, **opciones) -> Dict[str, Any]:
+        return self._ejecutar(
+            "timbrar",
+            lambda p: p.timbrar_factura(db=db, factura_id=factura_id, **opciones),
+            lambda: _factura_ya_timbrada(db, factura_id),
+        )
+
+    def timbrar_pago(self, *, db: Session, pago_id: UUID, **opciones) -> Dict[str, Any]:
+        return self._ejecutar(
+            "timbrar_pago",
+            lambda p: p.timbrar_pago(db=db, pago_id=pago_id, **opciones),
+            lambda: _pago_ya_timbrado(db, pago_id),
+        )
+
+    def solicitar_cancelacion_cfdi(
+        self, *, db: Session, factura_id: UUID, motivo: str, folio_sustitucion: Optional[str] = None
+    ) -> Dict[str, Any]:
+        return self._ejecutar(
+            "cancelar",
+            lambda p: p.solicitar_cancelacion_cfdi(
+                db=db, factura_id=factura_id, motivo=motivo, folio_sustitucion=folio_sustitucion
+            ),
+        )
+
+    def solicitar_cancelacion_pago(
+        self, *, db: Session, pago_id: UUID, motivo: str, folio_sustituto: Optional[str] = None
+    ) -> Dict[str, Any]:
+        return self._ejecutar(
+            "cancelar_pago",
+            lambda p: p.solicitar_cancelacion_pago(
+                db=db, pago_id=pago_id, motivo=motivo, folio_sustituto=folio_sustituto
+            ),
+        )
+
+    def descargar_acuse(self, doc, *, forzar: bool = False) -> bytes:
+        """El acuse vive en el storage del PAC que timbró: se busca por RfcProvCertif."""
+        rfc = (getattr(doc, "rfc_proveedor_sat", None) or "").strip().upper()
+        duenos = [p for p in self.proveedores if rfc and rfc in p.rfcs_certificacion]
+        return (duenos or self.orden())[0].descargar_acuse(doc, forzar=forzar)
+
+
+_router: Optional[PACRouter] = None
+_router_lock = threading.Lock()
+
+
+def _crear_proveedores() -> List[ProveedorPAC]:
+    from app.services.timbrado_factmoderna import FacturacionModernaPAC
+
+    proveedores: List[ProveedorPAC] = [FacturacionModernaPAC()]
+    for i, url in enumerate(settings.FM_TIMBRADO_URLS_RESPALDO, start=1):
+        proveedores.append(FacturacionModernaPAC(url=url, nombre=f"facturacion_moderna_respaldo{i}"))
+    return proveedores
+
+
+def get_router() -> PACRouter:
+    """Router del proceso, creado al primer uso con los proveedores configurados."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = PACRouter(_crear_proveedores(), ventana=settings.PAC_VENTANA_METRICAS)
+    return _router
+
+
+def reiniciar_router() -> None:
+    global _router
+    with _router_lock:
+        _router = None
@@ -7,12 +7,10 @@ from decimal import Decimal, ROUND_HALF_UP
 
 from app.models.pago import Pago, PagoDocumentoRelacionado
 from app.services.cfdi40_xml import (
-    _build_cadena_original_40,
-    _load_csd_key_for_empresa,
-    _sign_cadena_sha256_pkcs1v15,
     _load_csd_cert_for_empresa,
     _fmt_cfdi_fecha_local,
     money2,
+    sello_cfdi40,
     tasa6,
 )
 
@@ -364,25 +362,8 @@ def build_pago20_xml_sin_timbrar(db: Session, pago_id: UUID) -> bytes:
                 )
     # --- END: ImpuestosP ---
 
-    xml_sin_sello = tostring(comprobante, encoding="UTF-8", xml_declaration=False)
-
-    cadena_original = _build_cadena_original_40(xml_sin_sello)
-    if not cadena_original:
-        raise RuntimeError(
-            "No se pudo generar la Cadena Original 4.0 para el complemento de pago."
-        )
-
-    private_key = _load_csd_key_for_empresa(empresa)
-    if not private_key:
-        raise RuntimeError(
-            "No se pudo cargar la llave privada del CSD para firmar el pago."
-        )
-
-    sello = _sign_cadena_sha256_pkcs1v15(cadena_original, private_key)
-    if not sello:
-        raise RuntimeError("No se pudo firmar la cadena original del pago.")
-
-    comprobante.set("Sello", sello)
+    # Cadena original + firma (en el pool de cómputo si está activo)
+    comprobante.set("Sello", sello_cfdi40(comprobante, empresa))
 
     xml_final = tostring(comprobante, encoding="UTF-8", xml_declaration=True)
 
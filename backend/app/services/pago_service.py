@@ -7,9 +7,9 @@ from decimal import Decimal, ROUND_HALF_UP
 from app.models.pago import Pago, PagoDocumentoRelacionado, EstatusPago
 from app.models.factura import Factura
 from app.schemas.pago import PagoCreate
-from app.services.timbrado_factmoderna import FacturacionModernaPAC
+from app.services.pac_router import get_router
 from app.services.pac_errors import interpretar_error_pac
-from app.services.pdf_pago import render_pago_pdf_bytes_from_model
+from app.services import computo, pdf_cache
 from app.services.email_sender import send_pago_email, EmailSendingError
 from app.services import notificacion_service as notif_svc
 import os
@@ -21,8 +21,6 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-_pac = FacturacionModernaPAC()
-
 
 def siguiente_folio_pago(db: Session, empresa_id: UUID, serie: str) -> int:
     logger.info(
@@ -220,8 +218,12 @@ def listar_facturas_pendientes_por_cliente(
 def get_pago_pdf(db: Session, pago_id: UUID) -> tuple[bytes, str]:
     try:
         pago = db.query(Pago).filter(Pago.id == pago_id).first()
-        preview = not (pago and pago.estatus == EstatusPago.TIMBRADO)
-        pdf_bytes = render_pago_pdf_bytes_from_model(db, pago_id, preview=preview)
+        if pago and pdf_cache.es_cacheable_pago(pago):
+            # Timbrado o cancelado: PDF final desde el caché en disco
+            pdf_bytes = pdf_cache.leer_pdf_pago(db, pago)
+        else:
+            preview = not (pago and pago.estatus == EstatusPago.TIMBRADO)
+            pdf_bytes = computo.render_pago(db, pago_id, preview=preview)
         folio_str = (
             f"{pago.serie}-{pago.folio}"
             if pago and pago.serie
@@ -233,6 +235,8 @@ def get_pago_pdf(db: Session, pago_id: UUID) -> tuple[bytes, str]:
         return pdf_bytes, filename
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
+    except computo.ComputoError:
+        raise
     except Exception as e:
         # Idealmente, aquí se registraría el error `e` en un sistema de logging
         raise HTTPException(
@@ -768,7 +772,7 @@ def timbrar_pago(db: Session, pago_id: UUID) -> dict:
         )
 
     try:
-        result = _pac.timbrar_pago(
+        result = get_router().timbrar_pago(
             db=db,
             pago_id=pago_id,
             generar_cbb=False,
@@ -879,7 +883,7 @@ def cancelar_pago_sat(
 
     try:
         # 1. Llamada al PAC
-        res = _pac.solicitar_cancelacion_pago(
+        res = get_router().solicitar_cancelacion_pago(
             db=db,
             pago_id=pago_id,
             motivo=motivo,
@@ -0,0 +1,300 @@
+# app/services/paquete_service.py
+"""
+Paquete ZIP de XML + PDF timbrados por periodo, para el contador.
+
+`GET /api/facturas/paquete` y `GET /api/pagos/paquete` responden con un ZIP
+que se genera mientras se envía, sin armarlo en memoria ni en disco:
+
+  - `zipfile` escribe sobre `_Salida`, un destino sin `seek`, así que cada
+    entrada lleva data descriptor y lo escrito se entrega al cliente en
+    bloques de `BLOQUE` bytes;
+  - los XML se copian por bloques desde `xml_path`;
+  - los PDF salen del caché de `pdf_cache` (se renderizan si faltan) en un
+    pool de `PAQUETE_WORKERS` hilos, con sesión propia cada uno y a lo más
+    `2 × workers` comprobantes adelantados;
+  - `indice.csv` (UTF-8 con BOM, para Excel) va al final y anota lo que no se
+    pudo incluir; mientras tanto vive en un archivo temporal.
+
+Así la memoria no crece con el número de comprobantes del periodo.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import logging
+import os
+import tempfile
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Callable, Iterator, List, Optional
+from uuid import UUID
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.cliente import Cliente
+from app.models.empresa import Empresa
+from app.models.factura import Factura
+from app.models.pago import Pago
+from app.services import pdf_cache, pdf_factura, pdf_pago
+
+logger = logging.getLogger("app")
+
+BLOQUE = 64 * 1024
+
+_COLUMNAS = [
+    "tipo", "serie", "folio", "fecha", "uuid", "rfc_receptor", "receptor",
+    "total", "moneda", "estatus", "xml", "pdf", "observaciones",
+]
+
+
+@dataclass(frozen=True)
+class Documento:
+    tipo: str  # pdf_cache.FACTURA | pdf_cache.PAGO
+    id: UUID
+    nombre: str  # base de los archivos dentro del ZIP
+    serie: Optional[str]
+    folio: Optional[str]
+    fecha: Optional[datetime]
+    uuid: str
+    rfc_receptor: str
+    receptor: str
+    total: Optional[Decimal]
+    moneda: Optional[str]
+    estatus: str
+    xml_path: Optional[str]
+
+
+class _Salida:
+    """Destino de `zipfile` sin seek: acumula lo escrito hasta que se entrega."""
+
+    def __init__(self) -> None:
+        self._partes: List[bytes] = []
+        self.pendiente = 0
+
+    def write(self, datos) -> int:
+        self._partes.append(bytes(datos))
+        self.pendiente += len(datos)
+        return len(datos)
+
+    def flush(self) -> None:
+        pass
+
+    def vaciar(self) -> bytes:
+        datos = b"".join(self._partes)
+        self._partes.clear()
+        self.pendiente = 0
+        return datos
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Selección de comprobantes
+# ─────────────────────────────────────────────────────────────────────────────
+def _limites(desde: date, hasta: date):
+    return datetime.combine(desde, datetime.min.time()), datetime.combine(hasta + timedelta(days=1), datetime.min.time())
+
+
+def nombre_zip(db: Session, prefijo: str, empresa_id: UUID, desde: date, hasta: date) -> str:
+    empresa = db.get(Empresa, empresa_id)
+    rfc = (getattr(empresa, "rfc", "") or "EMISOR").upper()
+    return f"{prefijo}_{rfc}_{desde:%Y%m%d}-{hasta:%Y%m%d}.zip"
+
+
+def _nombres_unicos(rfc: str):
+    usados = set()
+
+    def nombre(serie, folio, doc_id) -> str:
+        base = f"{rfc}-{serie}-{folio}" if serie and folio else f"{rfc}-{doc_id}"
+        if base in usados:
+            base = f"{base}-{doc_id}"
+        usados.add(base)
+        return base
+
+    return nombre
+
+
+def documentos_facturas(db: Session, empresa_id: UUID, desde: date, hasta: date) -> List[Documento]:
+    """Facturas timbradas (incluye canceladas) del periodo, por fecha de emisión (o de timbrado)."""
+    empresa = db.get(Empresa, empresa_id)
+    nombre = _nombres_unicos((getattr(empresa, "rfc", "") or "EMISOR").upper())
+    ini, fin = _limites(desde, hasta)
+    fecha = func.coalesce(Factura.fecha_emision, Factura.fecha_timbrado)
+    filas = (
+        db.query(
+            Factura.id, Factura.serie, Factura.folio, fecha, Factura.cfdi_uuid,
+            Cliente.rfc, Cliente.nombre_razon_social, Factura.total, Factura.moneda,
+            Factura.estatus, Factura.xml_path,
+        )
+        .outerjoin(Cliente, Cliente.id == Factura.cliente_id)
+        .filter(
+            Factura.empresa_id == empresa_id,
+            Factura.estatus.in_(pdf_cache.ESTATUS_CACHEABLES),
+            Factura.cfdi_uuid.isnot(None),
+            fecha >= ini,
+            fecha < fin,
+        )
+        .order_by(fecha, Factura.serie, Factura.folio)
+        .all()
+    )
+    return [
+        Documento(
+            pdf_cache.FACTURA, fid, nombre(serie, folio, fid), serie, str(folio) if folio is not None else None,
+            fecha_doc, uuid, rfc or "", receptor or "", total, moneda, estatus, xml_path,
+        )
+        for fid, serie, folio, fecha_doc, uuid, rfc, receptor, total, moneda, estatus, xml_path in filas
+    ]
+
+
+def documentos_pagos(db: Session, empresa_id: UUID, desde: date, hasta: date) -> List[Documento]:
+    """Complementos de pago timbrados (incluye cancelados) del periodo, por fecha de emisión."""
+    empresa = db.get(Empresa, empresa_id)
+    nombre = _nombres_unicos((getattr(empresa, "rfc", "") or "EMISOR").upper())
+    ini, fin = _limites(desde, hasta)
+    fecha = func.coalesce(Pago.fecha_emision, Pago.fecha_pago)
+    filas = (
+        db.query(
+            Pago.id, Pago.serie, Pago.folio, fecha, Pago.uuid, Cliente.rfc, Cliente.nombre_razon_social,
+            Pago.monto, Pago.moneda_p, Pago.estatus, Pago.xml_path,
+        )
+        .outerjoin(Cliente, Cliente.id == Pago.cliente_id)
+        .filter(
+            Pago.empresa_id == empresa_id,
+            Pago.estatus.in_(pdf_cache.ESTATUS_CACHEABLES_PAGO),
+            Pago.uuid.isnot(None),
+            fecha >= ini,
+            fecha < fin,
+        )
+        .order_by(fecha, Pago.serie, Pago.folio)
+        .all()
+    )
+    return [
+        Documento(
+            pdf_cache.PAGO, pid, nombre(serie, folio, pid), serie, folio, fecha_doc, uuid, rfc or "",
+            receptor or "", monto, moneda, getattr(estatus, "value", estatus), xml_path,
+        )
+        for pid, serie, folio, fecha_doc, uuid, rfc, receptor, monto, moneda, estatus, xml_path in filas
+    ]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Generación del ZIP
+# ─────────────────────────────────────────────────────────────────────────────
+def _ruta_xml(xml_path: Optional[str]) -> Optional[str]:
+    """Ruta del XML dentro de DATA_DIR (misma regla que la descarga individual)."""
+    if not xml_path:
+        return None
+    base = os.path.realpath(settings.DATA_DIR)
+    ruta = xml_path if os.path.isabs(xml_path) else os.path.join(base, xml_path.lstrip("/"))
+    ruta = os.path.realpath(ruta)
+    if not ruta.startswith(base) or not os.path.isfile(ruta):
+        return None
+    return ruta
+
+
+def _ruta_pdf(doc: Documento, session_factory: Callable[[], Session]) -> str:
+    """Corre en el pool: PDF del caché, renderizado si falta."""
+    db = session_factory()
+    try:
+        if doc.tipo == pdf_cache.FACTURA:
+            return pdf_cache.obtener_pdf(db, pdf_factura.load_factura_full(db, doc.id))[0]
+        return pdf_cache.obtener_pdf_pago(db, pdf_pago.load_pago_full(db, doc.id))[0]
+    finally:
+        db.close()
+
+
+def _copiar(zf: zipfile.ZipFile, salida: _Salida, nombre: str, fh, fecha, comprimir: bool) -> Iterator[bytes]:
+    info = zipfile.ZipInfo(nombre, date_time=(fecha or datetime.now()).timetuple()[:6])
+    info.compress_type = zipfile.ZIP_DEFLATED if comprimir else zipfile.ZIP_STORED
+    with zf.open(info, "w") as destino:
+        while True:
+            datos = fh.read(BLOQUE)
+            if not datos:
+                break
+            destino.write(datos)
+            if salida.pendiente >= BLOQUE:
+                yield salida.vaciar()
+    if salida.pendiente:
+        yield salida.vaciar()
+
+
+def generar_zip(
+    documentos: List[Documento],
+    *,
+    session_factory: Optional[Callable[[], Session]] = None,
+    workers: Optional[int] = None,
+) -> Iterator[bytes]:
+    """Genera el ZIP por bloques: `xml/<nombre>.xml`, `pdf/<nombre>.pdf` e `indice.csv`."""
+    if session_factory is None:
+        from app.database import SessionLocal as session_factory
+    workers = max(1, workers or settings.PAQUETE_WORKERS)
+
+    salida = _Salida()
+    restantes = iter(documentos)
+    en_curso: deque = deque()
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="paquete-pdf")
+    indice = tempfile.TemporaryFile()
+    texto = io.TextIOWrapper(indice, encoding="utf-8-sig", newline="")
+    escritor = csv.writer(texto)
+    escritor.writerow(_COLUMNAS)
+
+    def adelantar() -> None:
+        while len(en_curso) < 2 * workers:
+            doc = next(restantes, None)
+            if doc is None:
+                return
+            en_curso.append((doc, pool.submit(_ruta_pdf, doc, session_factory)))
+
+    t0 = time.perf_counter()
+    incluidos = faltantes = 0
+    try:
+        with zipfile.ZipFile(salida, "w") as zf:
+            adelantar()
+            while en_curso:
+                doc, futuro = en_curso.popleft()
+                adelantar()
+                observaciones = []
+
+                xml = f"xml/{doc.nombre}.xml"
+                ruta = _ruta_xml(doc.xml_path)
+                if ruta is None:
+                    xml, observaciones = "", ["XML no encontrado"]
+                else:
+                    with open(ruta, "rb") as fh:
+                        yield from _copiar(zf, salida, xml, fh, doc.fecha, comprimir=True)
+
+                pdf = f"pdf/{doc.nombre}.pdf"
+                try:
+                    with open(futuro.result(), "rb") as fh:
+                        yield from _copiar(zf, salida, pdf, fh, doc.fecha, comprimir=False)
+                except Exception as e:
+                    logger.warning("[Paquete] Sin PDF para %s %s: %s", doc.tipo, doc.id, e)
+                    pdf = ""
+                    observaciones.append("PDF no disponible")
+
+                incluidos += 1
+                faltantes += bool(observaciones)
+                escritor.writerow([
+                    doc.tipo, doc.serie or "", doc.folio or "",
+                    doc.fecha.isoformat(sep=" ") if doc.fecha else "", doc.uuid, doc.rfc_receptor,
+                    doc.receptor, doc.total if doc.total is not None else "", doc.moneda or "",
+                    doc.estatus, xml, pdf, "; ".join(observaciones),
+                ])
+
+            texto.flush()
+            indice.seek(0)
+            yield from _copiar(zf, salida, "indice.csv", indice, None, comprimir=True)
+        # Directorio central
+        yield salida.vaciar()
+        logger.info(
+            "[Paquete] %d comprobantes (%d incompletos) en %d ms",
+            incluidos, faltantes, (time.perf_counter() - t0) * 1000,
+        )
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        texto.close()
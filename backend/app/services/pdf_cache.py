@@ -0,0 +1,432 @@
+# app/services/pdf_cache.py
+"""
+Caché en disco del PDF final de facturas y complementos de pago.
+
+Un comprobante timbrado ya no cambia salvo su estatus, así que su PDF se
+guarda en `DATA_DIR/cache/pdf/<id>/<clave>.pdf` y se sirve desde ahí en la
+descarga, el correo y la descarga masiva. La clave es un hash de:
+
+  - id, estatus y UUID fiscal del comprobante;
+  - la versión de la plantilla: `PLANTILLA_VERSION` de pdf_factura más el hash
+    del código de pdf_factura, pdf_pago y render_assets, así que un despliegue
+    que toque el render (incluidos logo y QR) la cambia solo;
+  - el hash del logo de la empresa;
+  - en facturas, lo que se imprime y sí puede editarse después de timbrar:
+    observaciones, datos bancarios de la empresa (banco, beneficiario, cuenta
+    y CLABE) y sus datos de contacto del encabezado (nombre comercial,
+    dirección, teléfono y correo).
+
+Los datos fiscales impresos (RFC, nombre y régimen del emisor y del receptor,
+dirección del receptor) no entran en la clave: deben coincidir con el CFDI
+timbrado, así que el PDF los conserva como estaban en su primer render.
+
+Cualquier cambio produce otra clave (pasar a EN_CANCELACION o CANCELADA, subir
+otro logo, …) y el PDF anterior se borra al escribir el nuevo. La clave es
+también el ETag de la descarga.
+
+Pre-render: al timbrar (o confirmarse una cancelación) `programar_prerender`
+genera el PDF vigente en un pool de `PDF_PRERENDER_WORKERS` hilos, así la
+primera descarga ya es una lectura de archivo. En cancelaciones también
+descarga el acuse del PAC para dejarlo en su caché. Los tiempos de render
+quedan en `estado()["prerender"]`.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.factura import Factura
+from app.models.pago import EstatusPago, Pago
+from app.services import computo, pdf_factura, pdf_pago, render_assets
+
+logger = logging.getLogger("app")
+
+FACTURA = "factura"
+PAGO = "pago"
+
+# Estatus con PDF final estable (BORRADOR sólo tiene vista previa)
+ESTATUS_CACHEABLES = ("TIMBRADA", "EN_CANCELACION", "CANCELADA")
+ESTATUS_CACHEABLES_PAGO = (EstatusPago.TIMBRADO, EstatusPago.EN_CANCELACION, EstatusPago.CANCELADO)
+
+_version: Optional[str] = None
+_logos: Dict[str, Tuple[Tuple[int, int], str]] = {}
+_lock = threading.Lock()
+
+_pool: Optional[ThreadPoolExecutor] = None
+_metricas: Dict[str, int] = {"programados": 0, "generados": 0, "vigentes": 0, "acuses": 0, "errores": 0}
+_tiempos: Deque[int] = deque(maxlen=200)  # ms de los últimos render en segundo plano
+
+
+def directorio() -> str:
+    return os.path.join(settings.DATA_DIR, "cache", "pdf")
+
+
+def version_plantilla() -> str:
+    """
+    PLANTILLA_VERSION + hash del código de pdf_factura, pdf_pago y
+    render_assets (logo y QR), una vez por proceso.
+    """
+    global _version
+    if _version is None:
+        h = hashlib.sha256(pdf_factura.PLANTILLA_VERSION.encode())
+        for modulo in (pdf_factura, pdf_pago, render_assets):
+            with open(modulo.__file__, "rb") as fh:
+                h.update(fh.read())
+        _version = f"{pdf_factura.PLANTILLA_VERSION}-{h.hexdigest()[:12]}"
+    return _version
+
+
+def _hash_logo(ruta: Optional[str]) -> str:
+    if not ruta:
+        return "-"
+    try:
+        st = os.stat(ruta)
+    except OSError:
+        return "-"
+    firma = (st.st_mtime_ns, st.st_size)
+    with _lock:
+        entry = _logos.get(ruta)
+        if entry is not None and entry[0] == firma:
+            return entry[1]
+    with open(ruta, "rb") as fh:
+        digest = hashlib.sha256(fh.read()).hexdigest()
+    with _lock:
+        _logos[ruta] = (firma, digest)
+    return digest
+
+
+def es_cacheable(f: Factura) -> bool:
+    return f.estatus in ESTATUS_CACHEABLES and bool(f.cfdi_uuid)
+
+
+def clave_pdf(f: Factura) -> str:
+    """Clave del PDF vigente de la factura (requiere `f.empresa` cargada)."""
+    emp = f.empresa
+    partes = [
+        str(f.id),
+        str(f.estatus),
+        str(f.cfdi_uuid or ""),
+        version_plantilla(),
+        _hash_logo(pdf_factura._guess_logo_path_for_factura(f)),
+        str(f.observaciones or ""),
+        str(getattr(emp, "nombre_banco", None) or ""),
+        str(getattr(emp, "beneficiario", None) or ""),
+        str(getattr(emp, "numero_cuenta", None) or ""),
+        str(getattr(emp, "clabe", None) or ""),
+        str(getattr(emp, "nombre_comercial", None) or ""),
+        str(pdf_factura._compose_address(emp) or ""),
+        str(getattr(emp, "telefono", None) or ""),
+        str(getattr(emp, "email", None) or ""),
+    ]
+    return hashlib.sha256("\x1f".join(partes).encode()).hexdigest()[:32]
+
+
+def es_cacheable_pago(p: Pago) -> bool:
+    return p.estatus in ESTATUS_CACHEABLES_PAGO and bool(p.uuid)
+
+
+def clave_pdf_pago(p: Pago) -> str:
+    """Clave del PDF vigente del complemento de pago (requiere `p.empresa` cargada)."""
+    partes = [
+        str(p.id),
+        str(getattr(p.estatus, "value", p.estatus)),
+        str(p.uuid or ""),
+        version_plantilla(),
+        _hash_logo(render_assets.ruta_logo_empresa(p.empresa)),
+    ]
+    return hashlib.sha256("\x1f".join(partes).encode()).hexdigest()[:32]
+
+
+def _escribir(carpeta: str, clave: str, contenido: bytes) -> str:
+    """Escritura atómica del PDF; borra las versiones anteriores del comprobante."""
+    os.makedirs(carpeta, exist_ok=True)
+    ruta = os.path.join(carpeta, f"{clave}.pdf")
+    fd, tmp = tempfile.mkstemp(dir=carpeta, prefix=".tmp-", suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(contenido)
+        os.replace(tmp, ruta)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    for nombre in os.listdir(carpeta):
+        if nombre.endswith(".pdf") and nombre != f"{clave}.pdf" and not nombre.startswith(".tmp-"):
+            try:
+                os.remove(os.path.join(carpeta, nombre))
+            except OSError:
+                pass
+    return ruta
+
+
+def _vigente(doc_id, clave: str) -> str:
+    return os.path.join(directorio(), str(doc_id), f"{clave}.pdf")
+
+
+def _generar(doc_id, clave: str, render: Callable[[], bytes], etiqueta: str) -> Tuple[str, int]:
+    """Renderiza y guarda el PDF; regresa (ruta, ms del render)."""
+    t0 = time.perf_counter()
+    contenido = render()
+    ruta = _escribir(os.path.join(directorio(), str(doc_id)), clave, contenido)
+    ms = int((time.perf_counter() - t0) * 1000)
+    logger.info("[PDF Cache] Generado %s (%d KB) en %d ms", etiqueta, len(contenido) // 1024, ms)
+    return ruta, ms
+
+
+def obtener_pdf(db: Session, f: Factura) -> Tuple[str, str]:
+    """
+    (ruta, clave) del PDF final de una factura cacheable; lo genera si no
+    existe la versión vigente. `f` debe venir con empresa, cliente y conceptos.
+    """
+    clave = clave_pdf(f)
+    ruta = _vigente(f.id, clave)
+    if not os.path.exists(ruta):
+        ruta, _ = _generar(
+            f.id, clave,
+            lambda: computo.render_factura(db, f.id),
+            f"factura {f.serie}-{f.folio} ({f.estatus})",
+        )
+    return ruta, clave
+
+
+def obtener_pdf_pago(db: Session, p: Pago) -> Tuple[str, str]:
+    """(ruta, clave) del PDF final de un complemento de pago cacheable."""
+    clave = clave_pdf_pago(p)
+    ruta = _vigente(p.id, clave)
+    if not os.path.exists(ruta):
+        ruta, _ = _generar(
+            p.id, clave,
+            lambda: computo.render_pago(db, p.id),
+            f"pago {p.serie or ''}-{p.folio} ({getattr(p.estatus, 'value', p.estatus)})",
+        )
+    return ruta, clave
+
+
+def leer_pdf(db: Session, f: Factura) -> bytes:
+    ruta, _ = obtener_pdf(db, f)
+    with open(ruta, "rb") as fh:
+        return fh.read()
+
+
+def leer_pdf_pago(db: Session, p: Pago) -> bytes:
+    ruta, _ = obtener_pdf_pago(db, p)
+    with open(ruta, "rb") as fh:
+        return fh.read()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Pre-render en segundo plano
+# ─────────────────────────────────────────────────────────────────────────────
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=max(1, settings.PDF_PRERENDER_WORKERS), thread_name_prefix="pdf-prerender"
+            )
+        return _pool
+
+
+def _contar(campo: str, ms: Optional[int] = None) -> None:
+    with _lock:
+        _metricas[campo] += 1
+        if ms is not None:
+            _tiempos.append(ms)
+
+
+def programar_prerender(
+    tipo: str,
+    doc_id: UUID,
+    *,
+    acuse: bool = False,
+    session_factory: Optional[Callable[[], Session]] = None,
+) -> Optional[Future]:
+    """
+    Encola el render del PDF vigente de una factura (`FACTURA`) o pago (`PAGO`)
+    recién timbrado o cancelado; con `acuse=True` también precarga el acuse de
+    cancelación. Llamar después del commit. Nunca lanza: si no se puede
+    encolar, la primera descarga lo genera como siempre.
+    """
+    if not settings.PDF_PRERENDER_ACTIVO:
+        return None
+    try:
+        futuro = _executor().submit(_prerender, tipo, doc_id, acuse, session_factory)
+    except RuntimeError:  # pool cerrado (apagado del proceso)
+        return None
+    _contar("programados")
+    return futuro
+
+
+def _prerender(
+    tipo: str, doc_id: UUID, acuse: bool, session_factory: Optional[Callable[[], Session]]
+) -> Optional[str]:
+    if session_factory is None:
+        from app.database import SessionLocal as session_factory
+
+    db = session_factory()
+    try:
+        if tipo == FACTURA:
+            doc = pdf_factura.load_factura_full(db, doc_id)
+            if doc is None or not es_cacheable(doc):
+                return None
+            clave = clave_pdf(doc)
+            render = lambda: computo.render_factura(db, doc_id)
+            etiqueta, prefijo = f"factura {doc.serie}-{doc.folio} ({doc.estatus})", "acuse_cancelacion"
+        else:
+            doc = pdf_pago.load_pago_full(db, doc_id)
+            if doc is None or not es_cacheable_pago(doc):
+                return None
+            clave = clave_pdf_pago(doc)
+            render = lambda: computo.render_pago(db, doc_id)
+            etiqueta = f"pago {doc.serie or ''}-{doc.folio} ({getattr(doc.estatus, 'value', doc.estatus)})"
+            prefijo = "acuse_cancelacion_pago"
+
+        ruta = _vigente(doc_id, clave)
+        if os.path.exists(ruta):
+            _contar("vigentes")
+        else:
+            ruta, ms = _generar(doc_id, clave, render, f"{etiqueta} en segundo plano")
+            _contar("generados", ms)
+
+        if acuse:
+            from app.services.acuse_cancelacion_service import AcuseError, obtener_acuse
+
+            try:
+                obtener_acuse(doc, "xml", etiqueta=prefijo)
+                _contar("acuses")
+            except AcuseError as e:
+                # Puede tardar en publicarse; la descarga manual lo reintenta
+                logger.info("[PDF Cache] Acuse de %s aún no disponible: %s", etiqueta, e)
+        return ruta
+    except Exception:
+        logger.exception("[PDF Cache] Falló el pre-render del %s %s", tipo, doc_id)
+        _contar("errores")
+        return None
+    finally:
+        db.close()
+
+
+def metricas_prerender() -> Dict:
+    with _lock:
+        datos: Dict = dict(_metricas)
+        ultimo = _tiempos[-1] if _tiempos else None
+        tiempos = sorted(_tiempos)
+    if tiempos:
+        datos["ultimo_ms"] = ultimo
+        datos["p50_ms"] = tiempos[len(tiempos) // 2]
+        datos["p95_ms"] = tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))]
+    return datos
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Administración
+# ─────────────────────────────────────────────────────────────────────────────
+def estado() -> Dict:
+    archivos = total = 0
+    base = directorio()
+    if os.path.isdir(base):
+        for raiz, _, nombres in os.walk(base):
+            for nombre in nombres:
+                if nombre.endswith(".pdf") and not nombre.startswith(".tmp-"):
+                    archivos += 1
+                    total += os.path.getsize(os.path.join(raiz, nombre))
+    return {
+        "directorio": base,
+        "version_plantilla": version_plantilla(),
+        "archivos": archivos,
+        "bytes": total,
+        "prerender": metricas_prerender(),
+    }
+
+
+def purgar(db: Optional[Session] = None, empresa_id: Optional[UUID] = None) -> int:
+    """Borra el caché (todo, o sólo los comprobantes de una empresa). Regresa cuántos PDFs eliminó."""
+    base = directorio()
+    if not os.path.isdir(base):
+        return 0
+    if empresa_id is None:
+        carpetas = [os.path.join(base, n) for n in os.listdir(base)]
+    else:
+        ids = db.query(Factura.id).filter(Factura.empresa_id == empresa_id).all()
+        ids += db.query(Pago.id).filter(Pago.empresa_id == empresa_id).all()
+        carpetas = [os.path.join(base, str(doc_id)) for (doc_id,) in ids]
+    eliminados = 0
+    for carpeta in carpetas:
+        if not os.path.isdir(carpeta):
+            continue
+        eliminados += sum(1 for n in os.listdir(carpeta) if n.endswith(".pdf") and not n.startswith(".tmp-"))
+        shutil.rmtree(carpeta, ignore_errors=True)
+    logger.info("[PDF Cache] Purgado: %d PDFs (empresa=%s)", eliminados, empresa_id or "todas")
+    return eliminados
+
+
+def reconstruir(
+    session_factory: Optional[Callable[[], Session]] = None,
+    empresa_id: Optional[UUID] = None,
+    lote: int = 50,
+) -> Dict:
+    """
+    Genera el PDF vigente de cada factura y pago cacheable que no lo tenga (y
+    con ello borra sus versiones viejas). Sesión nueva por lote para no
+    acumular objetos; un comprobante que falle no detiene al resto.
+    """
+    if session_factory is None:
+        from app.database import SessionLocal as session_factory
+
+    db = session_factory()
+    try:
+        qf = db.query(Factura.id).filter(Factura.estatus.in_(ESTATUS_CACHEABLES), Factura.cfdi_uuid.isnot(None))
+        qp = db.query(Pago.id).filter(Pago.estatus.in_(ESTATUS_CACHEABLES_PAGO), Pago.uuid.isnot(None))
+        if empresa_id is not None:
+            qf = qf.filter(Factura.empresa_id == empresa_id)
+            qp = qp.filter(Pago.empresa_id == empresa_id)
+        docs = [(FACTURA, fid) for (fid,) in qf.order_by(Factura.fecha_emision).all()]
+        docs += [(PAGO, pid) for (pid,) in qp.order_by(Pago.fecha_pago).all()]
+    finally:
+        db.close()
+
+    tipos = {
+        FACTURA: (pdf_factura.load_factura_full, es_cacheable, clave_pdf, obtener_pdf),
+        PAGO: (pdf_pago.load_pago_full, es_cacheable_pago, clave_pdf_pago, obtener_pdf_pago),
+    }
+    resumen = {"total": len(docs), "generados": 0, "vigentes": 0, "errores": 0}
+    t0 = time.perf_counter()
+    for i in range(0, len(docs), lote):
+        db = session_factory()
+        try:
+            for tipo, doc_id in docs[i : i + lote]:
+                cargar, cacheable, clave_de, obtener = tipos[tipo]
+                doc = cargar(db, doc_id)
+                if doc is None or not cacheable(doc):
+                    continue
+                try:
+                    if os.path.exists(_vigente(doc_id, clave_de(doc))):
+                        resumen["vigentes"] += 1
+                        continue
+                    obtener(db, doc)
+                    resumen["generados"] += 1
+                except Exception:
+                    logger.exception("[PDF Cache] No se pudo generar el PDF del %s %s", tipo, doc_id)
+                    resumen["errores"] += 1
+        finally:
+            db.close()
+    resumen["ms"] = int((time.perf_counter() - t0) * 1000)
+    logger.info(
+        "[PDF Cache] Reconstrucción: %d comprobantes, %d generados, %d vigentes, %d errores en %d ms",
+        resumen["total"], resumen["generados"], resumen["vigentes"], resumen["errores"], resumen["ms"],
+    )
+    return resumen
@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import os
 from io import BytesIO
 from decimal import Decimal
 from typing import List, Optional
@@ -14,7 +13,6 @@ from reportlab.lib import colors
 from reportlab.pdfgen import canvas
 from reportlab.platypus import Table, TableStyle
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.utils import ImageReader
 
 from sqlalchemy.orm import Session
 from sqlalchemy import func
@@ -22,7 +20,7 @@ from sqlalchemy import func
 from app.models.factura import Factura
 from app.models.cliente import Cliente
 from app.models.empresa import Empresa
-from app.config import settings
+from app.services import render_assets
 from app.services.pdf_factura import _money, _draw_label_wrap, _wrap_lines, _to_tijuana
 
 # Layout constants
@@ -94,27 +92,11 @@ def generate_account_statement_pdf(db: Session, empresa_id: UUID, cliente_id: UU
     y = PAGE_H - MARGIN
     
     # --- Header (Logo & Company Info) ---
-    logo_path = None
-    if empresa.logo:
-        p = empresa.logo
-        if not os.path.isabs(p):
-            p = os.path.join(settings.DATA_DIR, p)
-        if os.path.exists(p):
-            logo_path = p
-    elif empresa.id:
-         # Try default path
-        p1 = os.path.join(settings.DATA_DIR, "logos", "empresas", f"{empresa.id}.png")
-        p2 = os.path.join(settings.DATA_DIR, "logos", f"{empresa.id}.png")
-        if os.path.exists(p1): logo_path = p1
-        elif os.path.exists(p2): logo_path = p2
-
-    if logo_path:
+    logo = render_assets.logo(render_assets.ruta_logo_empresa(empresa), LOGO_W, LOGO_H)
+    if logo:
         try:
-            img = ImageReader(logo_path)
-            iw, ih = img.getSize()
-            scale = min(LOGO_W / iw, LOGO_H / ih)
-            dw, dh = iw * scale, ih * scale
-            c.drawImage(img, MARGIN, y - dh, width=dw, height=dh, mask="auto")
+            dw, dh = render_assets.ajustar(logo.ancho, logo.alto, LOGO_W, LOGO_H)
+            c.drawImage(logo.imagen, MARGIN, y - dh, width=dw, height=dh, mask="auto")
         except:
             pass
             
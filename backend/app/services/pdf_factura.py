@@ -1,7 +1,6 @@
 # app/services/pdf_factura.py
 from __future__ import annotations
 
-import os
 from io import BytesIO
 from decimal import Decimal, ROUND_HALF_UP
 from typing import List, Optional, Tuple
@@ -11,7 +10,6 @@ try:
     from zoneinfo import ZoneInfo
 except ImportError:
     from backports.zoneinfo import ZoneInfo
-from functools import lru_cache
 from urllib.parse import urlencode
 from collections import defaultdict
 
@@ -21,28 +19,20 @@ from reportlab.lib import colors
 from reportlab.pdfgen import canvas
 from reportlab.platypus import Table, TableStyle, Paragraph
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.utils import ImageReader
 
 from sqlalchemy.orm import Session, selectinload
 
 from app.models.factura import Factura
 from app.models.factura_detalle import FacturaDetalle
-from app.config import settings
 
 # Catálogos para etiquetas CLAVE — DESCRIPCIÓN
-from app.catalogos_sat.regimenes_fiscales import obtener_todos_regimenes
-from app.catalogos_sat.facturacion import (
-    obtener_todos_metodos_pago,
-    obtener_todas_formas_pago,
-    obtener_todos_usos_cfdi,
-    obtener_todas_tipos_relacion,
-)
+from app.catalogos_sat.registro import indice as indice_sat
+from app.services import render_assets
 
-# (Opcional) catálogo de UNIDADES; si no existe, se maneja con fallback.
-try:
-    from app.catalogos_sat.unidades import obtener_todas_unidades as _fetch_unidades_sat
-except Exception:  # pragma: no cover
-    _fetch_unidades_sat = None
+# Forma parte de la clave del caché de PDFs (pdf_cache) junto con el hash de
+# este archivo; subirla invalida los PDFs cacheados aunque el código no cambie
+# (p. ej. al cambiar una fuente o un asset).
+PLANTILLA_VERSION = "1"
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Layout / estilos
@@ -151,82 +141,47 @@ def load_factura_full(db: Session, factura_id: UUID) -> Optional[Factura]:
 # ──────────────────────────────────────────────────────────────────────────────
 # Catálogos CLAVE — DESCRIPCIÓN
 # ──────────────────────────────────────────────────────────────────────────────
-@lru_cache(maxsize=1)
-def _regimen_map() -> dict:
-    return {x["clave"]: x["descripcion"] for x in obtener_todos_regimenes()}
-
-
 def _regimen_label(clave: Optional[str]) -> Optional[str]:
     if not clave:
         return None
-    d = _regimen_map().get(clave)
+    d = indice_sat("c_regimenfiscal").label(clave)
     return f"{clave} — {d}" if d else clave
 
 
-@lru_cache(maxsize=1)
-def _metodo_map() -> dict:
-    return {x["clave"]: x["descripcion"] for x in obtener_todos_metodos_pago()}
-
-
 def _metodo_label(clave: Optional[str]) -> Optional[str]:
     if not clave:
         return None
-    d = _metodo_map().get(clave)
+    d = indice_sat("c_metodopago").label(clave)
     return f"{clave} — {d}" if d else clave
 
 
-@lru_cache(maxsize=1)
-def _forma_map() -> dict:
-    return {x["clave"]: x["descripcion"] for x in obtener_todas_formas_pago()}
-
-
 def _forma_label(clave: Optional[str]) -> Optional[str]:
     if not clave:
         return None
     clave_fmt = f"{int(clave):02d}" if clave.isdigit() else clave
-    d = _forma_map().get(clave) or _forma_map().get(clave_fmt)
+    formas = indice_sat("c_formapago")
+    d = formas.label(clave) or formas.label(clave_fmt)
     return f"{clave_fmt} — {d}" if d else clave_fmt
 
 
-@lru_cache(maxsize=1)
-def _uso_map() -> dict:
-    return {x["clave"]: x["descripcion"] for x in obtener_todos_usos_cfdi()}
-
-
 def _uso_label(clave: Optional[str]) -> Optional[str]:
     if not clave:
         return None
-    d = _uso_map().get(clave)
+    d = indice_sat("c_usocfdi").label(clave)
     return f"{clave} — {d}" if d else clave
 
 
-@lru_cache(maxsize=1)
-def _rel_map() -> dict:
-    return {x["clave"]: x["descripcion"] for x in obtener_todas_tipos_relacion()}
-
-
 def _rel_label(clave: Optional[str]) -> Optional[str]:
     if not clave:
         return None
-    d = _rel_map().get(clave)
+    d = indice_sat("c_tiporelacion").label(clave)
     return f"{clave} — {d}" if d else clave
 
 
-# Unidades SAT (opcional)
-@lru_cache(maxsize=1)
-def _unidad_map() -> dict:
-    if _fetch_unidades_sat is None:
-        return {}
-    try:
-        return {u["clave"]: u.get("descripcion") for u in (_fetch_unidades_sat() or [])}
-    except Exception:
-        return {}
-
-
 def _unidad_label(clave: Optional[str], desc_hint: Optional[str] = None) -> str:
     if not clave:
         return ""
-    d = desc_hint or _unidad_map().get(clave)
+    d = desc_hint or indice_sat("c_claveunidad").label(clave)
     return f"{clave}-{d}" if d else str(clave)
 
 
@@ -377,27 +332,7 @@ def _draw_watermark(c: canvas.Canvas, text: str):
 # Logo y CBB
 # ──────────────────────────────────────────────────────────────────────────────
 def _guess_logo_path_for_factura(f: Factura) -> Optional[str]:
-    try:
-        emp = getattr(f, "empresa", None)
-        candidates: List[str] = []
-        if emp is None:
-            return None
-        if getattr(emp, "logo", None):
-            p = emp.logo
-            if not os.path.isabs(p):
-                p = os.path.join(settings.DATA_DIR, p)
-            candidates.append(p)
-        if getattr(emp, "id", None):
-            candidates.append(
-                os.path.join(settings.DATA_DIR, "logos", "empresas", f"{emp.id}.png")
-            )
-            candidates.append(os.path.join(settings.DATA_DIR, "logos", f"{emp.id}.png"))
-        for p in candidates:
-            if p and os.path.exists(p):
-                return p
-    except Exception:
-        pass
-    return None
+    return render_assets.ruta_logo_empresa(getattr(f, "empresa", None))
 
 
 def _tt_param(total) -> str:
@@ -426,23 +361,9 @@ def _build_sat_qr_url(f) -> str:
 
 def _draw_cbb_qr(c: canvas.Canvas, f: Factura) -> bool:
     try:
-        import qrcode
-
-        url = _build_sat_qr_url(f)
-        qr = qrcode.QRCode(
-            version=2,
-            error_correction=getattr(__import__("qrcode.constants"), "ERROR_CORRECT_M"),
-            box_size=10,
-            border=1,
-        )
-        qr.add_data(url)
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="black", back_color="white")
-        ir = ImageReader(img.convert("RGB"))
-
         x = CONTENT_X1 - CBB_SIZE
         y = FOOTER_TOP_Y - CBB_SIZE - CBB_SIZE - 8
-        c.drawImage(ir, x, y, width=CBB_SIZE, height=CBB_SIZE, mask="auto")
+        render_assets.dibujar_qr(c, _build_sat_qr_url(f), x, y, CBB_SIZE, version=2)
         return True
     except Exception:
         return False
@@ -454,15 +375,13 @@ def _draw_cbb_qr(c: canvas.Canvas, f: Factura) -> bool:
 def _draw_header(c: canvas.Canvas, f: Factura, logo_path: Optional[str]) -> float:
     # LOGO (arriba derecha)
     y_below_logo = CONTENT_Y1 - 38
-    if logo_path:
+    logo = render_assets.logo(logo_path, LOGO_W, LOGO_H)
+    if logo:
         try:
-            img = ImageReader(logo_path)
-            iw, ih = img.getSize()
-            scale = min(LOGO_W / iw, LOGO_H / ih)
-            dw, dh = iw * scale, ih * scale
+            dw, dh = render_assets.ajustar(logo.ancho, logo.alto, LOGO_W, LOGO_H)
             x_logo = CONTENT_X1 - LOGO_W + (LOGO_W - dw) / 2.0
             y_logo = CONTENT_Y1 - LOGO_H + (LOGO_H - dh) / 2.0
-            c.drawImage(img, x_logo, y_logo, width=dw, height=dh, mask="auto")
+            c.drawImage(logo.imagen, x_logo, y_logo, width=dw, height=dh, mask="auto")
             y_below_logo = y_logo - 3
         except Exception:
             pass
@@ -523,15 +442,10 @@ def _draw_header(c: canvas.Canvas, f: Factura, logo_path: Optional[str]) -> floa
         desc_tipo = tipo_code # Por defecto muestra "04"
         
         try:
-            cat_rel = obtener_todas_tipos_relacion() # devuelve list[dict]
-            # Busco match normalizando AMBOS lados a 2 dígitos
-            # Así "4" encuentra a "04" y viceversa
-            found = next(
-                (x for x in cat_rel if x["clave"].zfill(2) == tipo_code), 
-                None
-            )
+            # Las claves del catálogo ya vienen a 2 dígitos ("04"), igual que tipo_code
+            found = indice_sat("c_tiporelacion").label(tipo_code)
             if found:
-                desc_tipo = f"{tipo_code} - {found['descripcion']}"
+                desc_tipo = f"{tipo_code} - {found}"
         except Exception:
             pass
 
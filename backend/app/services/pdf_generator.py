@@ -1,7 +1,6 @@
 # backend/app/services/pdf_generator.py
 from __future__ import annotations
 
-import os
 from io import BytesIO
 from decimal import Decimal
 from typing import List, Optional
@@ -13,14 +12,13 @@ from reportlab.lib import colors
 from reportlab.pdfgen import canvas
 from reportlab.platypus import Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.utils import ImageReader
 from reportlab.lib.enums import TA_RIGHT, TA_CENTER, TA_LEFT
 
 from sqlalchemy.orm import Session
 
 from app.models.presupuestos import Presupuesto
 from app.models.presupuestos import PresupuestoDetalle
-from app.config import settings
+from app.services import render_assets
 
 # --- Configuración de Diseño ---
 PAGE_W, PAGE_H = letter
@@ -134,33 +132,17 @@ def _numero_a_letras(monto: Decimal) -> str:
         return ""
 
 def _draw_logo(c: canvas.Canvas, logo_path: Optional[str], x: float, y: float, max_w: float, max_h: float):
-    if logo_path and os.path.exists(logo_path):
+    logo = render_assets.logo(logo_path, max_w, max_h)
+    if logo:
         try:
-            img = ImageReader(logo_path)
-            iw, ih = img.getSize()
-            aspect = ih / float(iw)
-            
             # Calcular dimensiones manteniendo aspecto
-            width = max_w
-            height = width * aspect
-            
-            if height > max_h:
-                height = max_h
-                width = height / aspect
-                
-            c.drawImage(img, x, y - height, width=width, height=height, mask="auto")
+            width, height = render_assets.ajustar(logo.ancho, logo.alto, max_w, max_h)
+            c.drawImage(logo.imagen, x, y - height, width=width, height=height, mask="auto")
         except Exception:
             pass
 
 def _guess_logo_path(presupuesto: Presupuesto) -> Optional[str]:
-    emp = getattr(presupuesto, "empresa", None)
-    if emp and getattr(emp, "logo", None):
-        p = emp.logo
-        if not os.path.isabs(p):
-            p = os.path.join(settings.DATA_DIR, p)
-        if os.path.exists(p):
-            return p
-    return None
+    return render_assets.ruta_logo_empresa(getattr(presupuesto, "empresa", None))
 
 def _compose_address(obj) -> Optional[str]:
     """
@@ -222,15 +204,13 @@ def _draw_header_info(c: canvas.Canvas, p: Presupuesto, logo_path: Optional[str]
     LOGO_H = 1.5 * inch
     y_below_logo = top_y - 30
 
-    if logo_path and os.path.exists(logo_path):
+    logo = render_assets.logo(logo_path, LOGO_W, LOGO_H)
+    if logo:
         try:
-            img = ImageReader(logo_path)
-            iw, ih = img.getSize()
-            scale = min(LOGO_W / iw, LOGO_H / ih)
-            dw, dh = iw * scale, ih * scale
+            dw, dh = render_assets.ajustar(logo.ancho, logo.alto, LOGO_W, LOGO_H)
             x_logo = (PAGE_W - MARGIN_X) - LOGO_W + (LOGO_W - dw) / 2.0
             y_logo = top_y - LOGO_H + (LOGO_H - dh) / 2.0
-            c.drawImage(img, x_logo, y_logo, width=dw, height=dh, mask="auto")
+            c.drawImage(logo.imagen, x_logo, y_logo, width=dw, height=dh, mask="auto")
             y_below_logo = y_logo - 3
         except Exception:
             pass
@@ -698,4 +678,7 @@ def render_presupuesto_pdf_bytes(presupuesto: Presupuesto, db: Session) -> bytes
     return buf.getvalue()
 
 def generate_presupuesto_pdf(presupuesto: Presupuesto, db: Session) -> bytes:
-    return render_presupuesto_pdf_bytes(presupuesto, db)
\ No newline at end of file
+    # En el pool de cómputo si está activo (app/services/computo.py)
+    from app.services import computo
+
+    return computo.render_presupuesto(db, presupuesto)
\ No newline at end of file
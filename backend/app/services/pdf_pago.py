@@ -1,7 +1,6 @@
 # app/services/pdf_pago.py
 from __future__ import annotations
 
-import os
 from io import BytesIO
 from typing import List, Optional
 from uuid import UUID
@@ -12,12 +11,11 @@ from reportlab.lib.units import inch
 from reportlab.lib import colors
 from reportlab.pdfgen import canvas
 from reportlab.platypus import Table, TableStyle, Paragraph
-from reportlab.lib.utils import ImageReader
 
 from sqlalchemy.orm import Session, selectinload
 
 from app.models.pago import Pago, PagoDocumentoRelacionado, EstatusPago
-from app.config import settings
+from app.services import render_assets
 
 # Reutilizar helpers y catálogos del servicio de facturas
 from .pdf_factura import (
@@ -103,26 +101,13 @@ def _build_pago_qr_url(p: Pago) -> str:
 
 def _draw_pago_qr(c: canvas.Canvas, p: Pago):
     try:
-        import qrcode
-
-        url = _build_pago_qr_url(p)
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_M,
-            box_size=10,
-            border=1,
-        )
-        qr.add_data(url)
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="black", back_color="white")
-        ir = ImageReader(img.convert("RGB"))
-        c.drawImage(
-            ir,
+        render_assets.dibujar_qr(
+            c,
+            _build_pago_qr_url(p),
             CONTENT_X0,
             FOOTER_TOP_Y - CBB_SIZE - 0.35 * inch,
-            width=CBB_SIZE,
-            height=CBB_SIZE,
-            mask="auto",
+            CBB_SIZE,
+            version=1,
         )
     except Exception as e:
         print(f"Error generando QR para pago: {e}")
@@ -132,15 +117,13 @@ def _draw_pago_qr(c: canvas.Canvas, p: Pago):
 def _draw_pago_header(c: canvas.Canvas, p: Pago, logo_path: Optional[str]) -> float:
     # Logo (similar a factura)
     y_below_logo = CONTENT_Y1 - 20
-    if logo_path:
+    logo = render_assets.logo(logo_path, LOGO_W, LOGO_H)
+    if logo:
         try:
-            img = ImageReader(logo_path)
-            iw, ih = img.getSize()
-            scale = min(LOGO_W / iw, LOGO_H / ih)
-            dw, dh = iw * scale, ih * scale
+            dw, dh = render_assets.ajustar(logo.ancho, logo.alto, LOGO_W, LOGO_H)
             x_logo = CONTENT_X1 - dw - 0.1 * inch
             y_logo = CONTENT_Y1 - dh - 0.1 * inch
-            c.drawImage(img, x_logo, y_logo, width=dw, height=dh, mask="auto")
+            c.drawImage(logo.imagen, x_logo, y_logo, width=dw, height=dh, mask="auto")
             y_below_logo = y_logo - 3
         except Exception:
             pass
@@ -351,9 +334,7 @@ def render_pago_pdf_bytes_from_model(
         raise ValueError("Complemento de Pago no encontrado")
 
     if not logo_path:
-        # Adaptar la función de logos si es necesario
-        if p.empresa and hasattr(p.empresa, "logo") and p.empresa.logo:
-            logo_path = os.path.join(settings.DATA_DIR, p.empresa.logo)
+        logo_path = render_assets.ruta_logo_empresa(p.empresa)
 
     watermark_text = None
     if p.estatus == EstatusPago.CANCELADO:
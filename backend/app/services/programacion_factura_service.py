@@ -193,13 +193,30 @@ def _construir_factura_create(prog: ProgramacionFactura, hoy: date):
     )
 
 
+def _avanzar_programacion(prog: ProgramacionFactura, hoy: date) -> None:
+    prog.ultima_ejecucion   = datetime.utcnow()
+    prog.facturas_generadas += 1
+    proxima = calcular_proxima(prog.periodicidad, hoy)
+
+    if proxima is None or (prog.fecha_fin and proxima > prog.fecha_fin):
+        prog.activo           = False
+        prog.proxima_ejecucion = hoy   # dejar la última fecha ejecutada
+    else:
+        prog.proxima_ejecucion = proxima
+
+
 def ejecutar_programaciones_pendientes(db: Session) -> dict:
     """
     Busca todas las programaciones activas cuya proxima_ejecucion <= hoy
     y las ejecuta: crea la factura, timbra y envía según configuración.
     Llamado por el cron diario en main.py.
+
+    Primero crea todas las facturas (commit por programación), luego timbra
+    las que correspondan en un solo lote concurrente (`timbrado_lote`) y al
+    final envía los correos de las que timbraron.
     """
-    from app.services.factura_service import crear_factura, timbrar_factura
+    from app.services.factura_service import crear_factura
+    from app.services.timbrado_lote import timbrar_facturas_lote
     from app.services import email_sender
 
     hoy = date.today()
@@ -219,59 +236,56 @@ def ejecutar_programaciones_pendientes(db: Session) -> dict:
     stats = {"procesadas": 0, "timbradas": 0, "enviadas": 0, "errores": 0}
     logger.info("[ProgFacturas] %d programaciones pendientes para %s", len(pendientes), hoy)
 
+    # 1 — Crear facturas BORRADOR y avanzar cada programación
+    creadas = []  # (factura_id, serie, folio, empresa_id, auto_timbrar, auto_enviar, emails)
     for prog in pendientes:
         try:
-            # 1 — Crear factura BORRADOR
             payload = _construir_factura_create(prog, hoy)
             factura = crear_factura(db, payload)
             db.flush()
             logger.info("[ProgFacturas] Factura creada: %s-%s (prog %s)", factura.serie, factura.folio, prog.id)
 
-            # 2 — Timbrar si corresponde
-            timbrado_ok = False
-            if prog.auto_timbrar:
-                try:
-                    timbrar_factura(db, factura.id)
-                    timbrado_ok = True
-                    stats["timbradas"] += 1
-                    logger.info("[ProgFacturas] Timbrada: %s-%s", factura.serie, factura.folio)
-                except Exception as e:
-                    logger.error("[ProgFacturas] Error timbrando %s-%s: %s", factura.serie, factura.folio, e)
-
-            # 3 — Enviar por correo si corresponde (solo si timbró OK)
-            if prog.auto_enviar and timbrado_ok and prog.emails_destino:
-                for email in prog.emails_destino:
-                    try:
-                        email_sender.send_invoice_email(
-                            db=db,
-                            empresa_id=prog.empresa_id,
-                            factura_id=factura.id,
-                            recipient_email=email,
-                        )
-                        stats["enviadas"] += 1
-                        logger.info("[ProgFacturas] Email enviado a %s (factura %s-%s)", email, factura.serie, factura.folio)
-                    except Exception as e:
-                        logger.warning("[ProgFacturas] Error enviando email a %s: %s", email, e)
-
-            # 4 — Actualizar programación
-            prog.ultima_ejecucion   = datetime.utcnow()
-            prog.facturas_generadas += 1
-            proxima = calcular_proxima(prog.periodicidad, hoy)
-
-            if proxima is None or (prog.fecha_fin and proxima > prog.fecha_fin):
-                prog.activo           = False
-                prog.proxima_ejecucion = hoy   # dejar la última fecha ejecutada
-            else:
-                prog.proxima_ejecucion = proxima
-
+            _avanzar_programacion(prog, hoy)
             db.add(prog)
             db.commit()
+            creadas.append((
+                factura.id, factura.serie, factura.folio, prog.empresa_id,
+                prog.auto_timbrar, prog.auto_enviar, list(prog.emails_destino or []),
+            ))
             stats["procesadas"] += 1
-
         except Exception as e:
             db.rollback()
             logger.error("[ProgFacturas] Error procesando programacion %s: %s", prog.id, e)
             stats["errores"] += 1
 
+    # 2 — Timbrar en lote las que corresponda
+    por_timbrar = [c[0] for c in creadas if c[4]]
+    timbradas = set()
+    if por_timbrar:
+        for res in timbrar_facturas_lote(db, por_timbrar):
+            if res["ok"]:
+                timbradas.add(res["id"])
+            else:
+                logger.error("[ProgFacturas] Error timbrando factura %s: %s", res["id"], res["error"])
+        stats["timbradas"] = len(timbradas)
+        logger.info("[ProgFacturas] Timbradas %d de %d", len(timbradas), len(por_timbrar))
+
+    # 3 — Enviar por correo si corresponde (solo si timbró OK)
+    for factura_id, serie, folio, empresa_id, _, auto_enviar, emails in creadas:
+        if not (auto_enviar and factura_id in timbradas and emails):
+            continue
+        for email in emails:
+            try:
+                email_sender.send_invoice_email(
+                    db=db,
+                    empresa_id=empresa_id,
+                    factura_id=factura_id,
+                    recipient_email=email,
+                )
+                stats["enviadas"] += 1
+                logger.info("[ProgFacturas] Email enviado a %s (factura %s-%s)", email, serie, folio)
+            except Exception as e:
+                logger.warning("[ProgFacturas] Error enviando email a %s: %s", email, e)
+
     logger.info("[ProgFacturas] Resumen: %s", stats)
     return stats
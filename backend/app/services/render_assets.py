@@ -0,0 +1,189 @@
+# app/services/render_assets.py
+"""
+Recursos compartidos por los generadores de PDF (facturas, pagos,
+presupuestos, estados de cuenta, certificados y credenciales).
+
+  - `ruta_logo_empresa(emp)`: ruta del logo de la empresa. Candidatos, en
+    orden: `emp.logo` (absoluta o relativa a DATA_DIR),
+    `DATA_DIR/logos/empresas/<id>.png` y `DATA_DIR/logos/<id>.png`. Se cachea
+    por empresa durante `LOGO_RUTA_TTL_S` segundos, así un PDF de varias
+    páginas o un lote no repite los `os.path.exists`.
+  - `logo(ruta, max_w, max_h)`: el logo ya decodificado en un `ImageReader`,
+    reducido a `PX_POR_PUNTO` píxeles por punto de la caja donde se dibuja
+    (un PNG de 3000 px en una caja de 2.5" se embebía completo en cada PDF).
+    LRU de `LOGOS_MAX` entradas por (ruta, mtime, tamaño, caja): subir otro
+    logo cambia la firma y se vuelve a leer.
+  - `dibujar_qr(c, datos, ...)`: el QR como rectángulos vectoriales en el
+    canvas, sin pasar por PIL ni PNG. La matriz sale de `qrcode` (mismos
+    parámetros que antes) y los módulos se agrupan en tramos horizontales.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from PIL import Image as PILImage
+from reportlab.lib import colors
+from reportlab.lib.utils import ImageReader
+
+from app.config import settings
+
+logger = logging.getLogger("app")
+
+LOGOS_MAX = 64
+LOGO_RUTA_TTL_S = 60.0
+PX_POR_PUNTO = 3  # ~216 dpi en la caja del logo
+
+_lock = threading.Lock()
+_logos: "OrderedDict[Tuple, Logo]" = OrderedDict()
+_rutas: Dict[Tuple[str, str, str], Tuple[float, Optional[str]]] = {}
+
+
+class Logo(NamedTuple):
+    imagen: ImageReader
+    ancho: int  # píxeles del archivo original: la geometría del dibujo no cambia
+    alto: int
+
+
+def limpiar() -> None:
+    """Vacía los cachés (pruebas y benchmark)."""
+    with _lock:
+        _logos.clear()
+        _rutas.clear()
+    _matriz_qr.cache_clear()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Logos
+# ─────────────────────────────────────────────────────────────────────────────
+def _candidatos(emp: Any):
+    logo = getattr(emp, "logo", None)
+    if logo:
+        yield logo if os.path.isabs(logo) else os.path.join(settings.DATA_DIR, logo)
+    emp_id = getattr(emp, "id", None)
+    if emp_id:
+        yield os.path.join(settings.DATA_DIR, "logos", "empresas", f"{emp_id}.png")
+        yield os.path.join(settings.DATA_DIR, "logos", f"{emp_id}.png")
+
+
+def ruta_logo_empresa(emp: Any) -> Optional[str]:
+    """Ruta del logo de la empresa, o None si no tiene."""
+    if emp is None:
+        return None
+    clave = (str(getattr(emp, "id", "")), str(getattr(emp, "logo", None) or ""), settings.DATA_DIR)
+    ahora = time.monotonic()
+    with _lock:
+        entrada = _rutas.get(clave)
+        if entrada is not None and entrada[0] > ahora:
+            return entrada[1]
+    ruta = next((p for p in _candidatos(emp) if os.path.isfile(p)), None)
+    with _lock:
+        _rutas[clave] = (ahora + LOGO_RUTA_TTL_S, ruta)
+    return ruta
+
+
+def _decodificar(ruta: str, max_w: Optional[float], max_h: Optional[float]) -> Logo:
+    with PILImage.open(ruta) as original:
+        original.load()
+        ancho, alto = original.size
+        im = original if original.mode in ("RGB", "RGBA") else original.convert("RGBA")
+        if max_w and max_h:
+            escala = min(max_w * PX_POR_PUNTO / ancho, max_h * PX_POR_PUNTO / alto)
+            if escala < 1:
+                nuevo = (max(1, round(ancho * escala)), max(1, round(alto * escala)))
+                im = im.resize(nuevo, PILImage.LANCZOS)
+        if im is original:
+            im = original.copy()  # independiente del archivo, que se cierra aquí
+    return Logo(ImageReader(im), ancho, alto)
+
+
+def logo(ruta: Optional[str], max_w: Optional[float] = None, max_h: Optional[float] = None) -> Optional[Logo]:
+    """
+    Logo decodificado (y reducido a la caja `max_w` × `max_h` en puntos, si se
+    indica). None si no hay ruta o no se puede leer; los generadores siguen
+    sin logo, como antes.
+    """
+    if not ruta:
+        return None
+    try:
+        st = os.stat(ruta)
+    except OSError:
+        return None
+    clave = (ruta, st.st_mtime_ns, st.st_size, max_w, max_h)
+    with _lock:
+        entrada = _logos.get(clave)
+        if entrada is not None:
+            _logos.move_to_end(clave)
+            return entrada
+    try:
+        entrada = _decodificar(ruta, max_w, max_h)
+    except Exception as e:
+        logger.warning("[PDF] No se pudo leer el logo %s: %s", ruta, e)
+        return None
+    with _lock:
+        _logos[clave] = entrada
+        while len(_logos) > LOGOS_MAX:
+            _logos.popitem(last=False)
+    return entrada
+
+
+def ajustar(ancho: float, alto: float, max_w: float, max_h: float) -> Tuple[float, float]:
+    """Tamaño que cabe en la caja conservando la proporción."""
+    escala = min(max_w / ancho, max_h / alto)
+    return ancho * escala, alto * escala
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# QR
+# ─────────────────────────────────────────────────────────────────────────────
+@lru_cache(maxsize=512)
+def _matriz_qr(datos: str, version: Optional[int], borde: int) -> Tuple[int, Tuple[Tuple[int, int, int], ...]]:
+    """(módulos por lado, tramos oscuros (fila, columna, largo)) del QR con corrección M."""
+    import qrcode
+
+    qr = qrcode.QRCode(version=version, error_correction=qrcode.constants.ERROR_CORRECT_M, border=borde)
+    qr.add_data(datos)
+    qr.make(fit=True)
+    matriz = qr.get_matrix()
+    tramos = []
+    for fila, valores in enumerate(matriz):
+        col, n = 0, len(valores)
+        while col < n:
+            if valores[col]:
+                inicio = col
+                while col < n and valores[col]:
+                    col += 1
+                tramos.append((fila, inicio, col - inicio))
+            else:
+                col += 1
+    return len(matriz), tuple(tramos)
+
+
+def dibujar_qr(
+    c,
+    datos: str,
+    x: float,
+    y: float,
+    tamano: float,
+    *,
+    version: Optional[int] = None,
+    borde: int = 1,
+) -> None:
+    """Dibuja el QR (fondo blanco, módulos negros) con esquina inferior izquierda en (x, y)."""
+    n, tramos = _matriz_qr(datos, version, borde)
+    modulo = tamano / n
+    c.saveState()
+    c.setFillColor(colors.white)
+    c.rect(x, y, tamano, tamano, stroke=0, fill=1)
+    # Un solo path: sin líneas finas entre módulos vecinos al rasterizar
+    path = c.beginPath()
+    for fila, col, largo in tramos:
+        path.rect(x + col * modulo, y + tamano - (fila + 1) * modulo, largo * modulo, modulo)
+    c.setFillColor(colors.black)
+    c.drawPath(path, stroke=0, fill=1)
+    c.restoreState()
@@ -2,19 +2,30 @@
 """
 Consulta de estado de CFDI directamente en el SAT.
 
-Endpoint público (sin autenticación):
+Endpoint público (sin autenticación), configurable en settings.SAT_CONSULTA_URL:
   https://consultaqr.facturaelectronica.sat.gob.mx/ConsultaCFDIService.svc
 
 Documentación: DocumentacionWSConsulta_CFDIv1-2.pdf (oct 2018)
 
 La expresionImpresa tiene el formato:
   ?re=<RFC_EMISOR>&rr=<RFC_RECEPTOR>&tt=<TOTAL_17.6>&id=<UUID>
+
+Todas las consultas comparten un `httpx.Client` con keep-alive (antes se abría
+uno por consulta); es seguro usarlo desde varios hilos.
+
+Si el documento tiene su XML timbrado, la expresión se arma con el Total, los
+RFC y el UUID del propio XML (`datos_desde_xml`): son exactamente los que el
+SAT tiene registrados, aunque la BD haya cambiado después (total recalculado,
+RFC del cliente corregido, público en general). Así se evita el N-601.
 """
 
 from __future__ import annotations
 
 import html
 import logging
+import os
+import threading
+from collections import OrderedDict
 from dataclasses import dataclass
 from datetime import datetime
 from typing import Any, Optional, Tuple
@@ -22,11 +33,37 @@ from typing import Any, Optional, Tuple
 import httpx
 from lxml import etree
 
+from app.config import settings
+
 logger = logging.getLogger("app")
 
-SAT_CONSULTA_URL = (
-    "https://consultaqr.facturaelectronica.sat.gob.mx/ConsultaCFDIService.svc"
-)
+_client: Optional[httpx.Client] = None
+_lock = threading.Lock()
+
+
+def get_client() -> httpx.Client:
+    """Cliente compartido para el web service del SAT (se abre en la primera consulta)."""
+    global _client
+    with _lock:
+        if _client is None or _client.is_closed:
+            _client = httpx.Client(
+                verify=True,
+                limits=httpx.Limits(
+                    max_connections=settings.SAT_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.SAT_MAX_CONNECTIONS,
+                ),
+            )
+        return _client
+
+
+def cerrar_cliente() -> None:
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
 SAT_SOAP_ACTION = "http://tempuri.org/IConsultaCFDIService/Consulta"
 
 SOAP_TEMPLATE = """<?xml version="1.0" encoding="utf-8"?>
@@ -72,6 +109,85 @@ class AcuseSAT:
         return "rechazada" in (self.estatus_cancelacion or "").lower()
 
 
+# ─────────────────────────────────────────────────────────────────────────────
+# Datos de la expresión leídos del XML timbrado
+# ─────────────────────────────────────────────────────────────────────────────
+@dataclass(frozen=True)
+class DatosCFDI:
+    """Lo que el SAT tiene registrado del CFDI, tal como viene en el XML timbrado."""
+    rfc_emisor: str
+    rfc_receptor: str
+    total: str  # atributo Total sin reformatear
+    uuid: str
+
+
+# Parseos recientes, validados contra (mtime, tamaño) del archivo. Un XML
+# ilegible o incompleto también se recuerda (None) hasta que cambie.
+XML_CACHE_MAX = 1024
+
+_xml_cache: "OrderedDict[str, Tuple[Tuple[int, int], Optional[DatosCFDI]]]" = OrderedDict()
+_xml_cache_lock = threading.Lock()
+
+
+def _leer_datos_xml(xml_path: str) -> Optional[DatosCFDI]:
+    """Recorre el XML hasta el TimbreFiscalDigital sin construir el árbol completo."""
+    total = emisor = receptor = None
+    nivel = 0
+    try:
+        for evento, el in etree.iterparse(xml_path, events=("start", "end")):
+            if evento == "end":
+                nivel -= 1
+                el.clear()
+                continue
+            nivel += 1
+            local = etree.QName(el.tag).localname
+            if nivel == 1 and local == "Comprobante":
+                total = el.get("Total")
+            elif nivel == 2 and local == "Emisor":
+                emisor = el.get("Rfc")
+            elif nivel == 2 and local == "Receptor":
+                receptor = el.get("Rfc")
+            elif local == "TimbreFiscalDigital":
+                uuid = el.get("UUID")
+                if total and emisor and receptor and uuid:
+                    return DatosCFDI(
+                        rfc_emisor=emisor.strip().upper(),
+                        rfc_receptor=receptor.strip().upper(),
+                        total=total.strip(),
+                        uuid=uuid.strip().upper(),
+                    )
+                break
+    except (OSError, etree.XMLSyntaxError) as e:
+        logger.warning("[SAT] No se pudo leer el XML timbrado %s: %s", xml_path, e)
+    return None
+
+
+def datos_desde_xml(xml_path: Optional[str]) -> Optional[DatosCFDI]:
+    """
+    Total, RFCs y UUID del XML timbrado, o None si no hay archivo o le faltan
+    datos. Cacheado por ruta mientras el archivo no cambie.
+    """
+    if not xml_path:
+        return None
+    try:
+        st = os.stat(xml_path)
+    except OSError:
+        return None
+    firma = (st.st_mtime_ns, st.st_size)
+    with _xml_cache_lock:
+        entry = _xml_cache.get(xml_path)
+        if entry is not None and entry[0] == firma:
+            _xml_cache.move_to_end(xml_path)
+            return entry[1]
+    datos = _leer_datos_xml(xml_path)
+    with _xml_cache_lock:
+        _xml_cache[xml_path] = (firma, datos)
+        _xml_cache.move_to_end(xml_path)
+        while len(_xml_cache) > XML_CACHE_MAX:
+            _xml_cache.popitem(last=False)
+    return datos
+
+
 def _build_expresion(rfc_emisor: str, rfc_receptor: str, total: float, uuid: str) -> str:
     """
     Construye la expresionImpresa para el CFDI 4.0.
@@ -87,11 +203,18 @@ def consultar_cfdi(
     total: float,
     uuid: str,
     timeout: int = 15,
+    xml_path: Optional[str] = None,
 ) -> AcuseSAT:
     """
     Llama al web service del SAT y devuelve un AcuseSAT con el estado actual del CFDI.
+    Con `xml_path`, los datos del XML timbrado (si se pueden leer) sustituyen a
+    los recibidos, que quedan como respaldo.
     Lanza RuntimeError si hay problemas de red o respuesta inválida.
     """
+    datos = datos_desde_xml(xml_path)
+    if datos is not None:
+        rfc_emisor, rfc_receptor, uuid = datos.rfc_emisor, datos.rfc_receptor, datos.uuid
+        total = float(datos.total)
     expresion = _build_expresion(rfc_emisor, rfc_receptor, total, uuid)
     # Los & de la query string deben escaparse como &amp; dentro de XML;
     # de lo contrario el parser SOAP del SAT falla con DeserializationFailed.
@@ -103,8 +226,9 @@ def consultar_cfdi(
     }
 
     try:
-        with httpx.Client(timeout=timeout, verify=True) as client:
-            resp = client.post(SAT_CONSULTA_URL, content=body.encode("utf-8"), headers=headers)
+        resp = get_client().post(
+            settings.SAT_CONSULTA_URL, content=body.encode("utf-8"), headers=headers, timeout=timeout
+        )
     except httpx.TimeoutException as e:
         raise RuntimeError(f"Timeout al consultar el SAT ({timeout}s): {e}") from e
     except httpx.RequestError as e:
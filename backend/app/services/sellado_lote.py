@@ -0,0 +1,105 @@
+# app/services/sellado_lote.py
+"""
+Armado y sellado de CFDI 4.0 en lote.
+
+El armado del XML (lectura de BD, totales) corre en el proceso web con las
+facturas precargadas en pocas consultas; la parte de CPU (cadena original y
+firma RSA-SHA256) se reparte en el pool de procesos de `computo`. Cada worker
+es un proceso de larga vida: el XSLT compilado y las llaves CSD descifradas
+quedan en las cachés de `cfdi40_xml` de ese proceso, así que sólo el primer
+sello por empresa y worker paga el costo de abrir la llave (y de leer la
+contraseña de la BD: no viaja con la tarea).
+"""
+from __future__ import annotations
+
+import logging
+from typing import Dict, List, Optional, Sequence
+from uuid import UUID
+from xml.etree.ElementTree import tostring
+
+from sqlalchemy.orm import Session, selectinload
+
+from app.config import settings
+from app.models.factura import Factura
+from app.services import cfdi40_xml as cfdi
+from app.services import computo
+
+logger = logging.getLogger("app")
+
+# Por debajo de esto no vale la pena serializar hacia otro proceso
+_MIN_LOTE_POOL = 4
+
+
+def _cargar_facturas(db: Session, ids: Sequence[UUID]) -> Dict[UUID, Factura]:
+    facturas = (
+        db.query(Factura)
+        .options(
+            selectinload(Factura.empresa),
+            selectinload(Factura.cliente),
+            selectinload(Factura.conceptos),
+        )
+        .filter(Factura.id.in_(list(ids)))
+        .all()
+    )
+    return {f.id: f for f in facturas}
+
+
+def sellar_facturas_lote(
+    db: Session, factura_ids: Sequence[UUID], empresa_id: Optional[UUID] = None
+) -> List[dict]:
+    """
+    Arma y sella el XML CFDI 4.0 de cada factura (sin timbrar).
+    Devuelve, en el orden recibido: {"id", "ok", "xml", "error"}.
+    Si se pasa `empresa_id`, las facturas de otra empresa cuentan como no encontradas.
+    """
+    ids = list(dict.fromkeys(factura_ids))
+    facturas = _cargar_facturas(db, ids)
+
+    resultados: Dict[UUID, dict] = {}
+    pendientes = []  # (id, compro, empresa)
+    for fid in ids:
+        f = facturas.get(fid)
+        if f is None or (empresa_id is not None and f.empresa_id != empresa_id):
+            resultados[fid] = {"id": fid, "ok": False, "xml": None, "error": "Factura no encontrada"}
+            continue
+        try:
+            pendientes.append((fid, cfdi._armar_comprobante_cfdi40(db, f), f.empresa))
+        except Exception as e:
+            logger.warning("[Sellado] Error armando XML de %s: %s", fid, e)
+            resultados[fid] = {"id": fid, "ok": False, "xml": None, "error": str(e)}
+
+    if len(pendientes) >= _MIN_LOTE_POOL and computo.num_workers() > 1:
+        # El lote espera su turno en la cola del pool en vez de rechazarse
+        futuros = [
+            computo.enviar(
+                cfdi.sellar_xml,
+                *cfdi.tarea_sello(compro, emp),
+                tarea="sello_lote",
+                espera=settings.COMPUTO_TIMEOUT_S,
+            )
+            for _, compro, emp in pendientes
+        ]
+        sellos = []
+        for fut in futuros:
+            try:
+                sellos.append((fut.result(), None))
+            except Exception as e:
+                sellos.append((None, e))
+    else:
+        sellos = []
+        for _, compro, emp in pendientes:
+            try:
+                sellos.append((cfdi._calcular_sello_cfdi40(compro, emp), None))
+            except Exception as e:
+                sellos.append((None, e))
+
+    for (fid, compro, _), (sello, error) in zip(pendientes, sellos):
+        if error is not None:
+            logger.warning("[Sellado] Error sellando %s: %s", fid, error)
+            resultados[fid] = {"id": fid, "ok": False, "xml": None, "error": str(error)}
+            continue
+        compro.set("Sello", sello)
+        xml_final = tostring(compro, encoding="UTF-8", xml_declaration=True)
+        resultados[fid] = {"id": fid, "ok": True, "xml": xml_final.decode("utf-8"), "error": None}
+
+    return [resultados[fid] for fid in ids]
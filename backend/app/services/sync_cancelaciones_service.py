@@ -0,0 +1,532 @@
+# app/services/sync_cancelaciones_service.py
+"""
+Sincronización con el SAT de facturas y complementos de pago EN_CANCELACION.
+
+Tres etapas, sin una transacción larga abierta durante las consultas:
+
+1. Lectura: una consulta corta por tipo trae (id, uuid, RFCs, total) de los
+   pendientes y cierra la sesión.
+2. Consulta: `SAT_SYNC_CONCURRENCIA` hilos llaman al SAT con el cliente HTTP
+   compartido de `sat_cfdi_service`. Cada `SAT_SYNC_LOTE` respuestas se guarda
+   el avance en la ejecución.
+3. Aplicación: los acuses se aplican en lotes de `SAT_SYNC_LOTE`, con un commit
+   por lote. Sólo se tocan documentos que siguen EN_CANCELACION (alguien pudo
+   verificarlos a mano mientras tanto).
+
+Cada corrida queda en `ejecuciones_sync_sat` (avance, tiempos por etapa,
+conteo por estatus) para el panel de administración. La fila EN_CURSO evita
+que dos instancias corran a la vez; antes esto lo hacía un advisory lock de
+transacción que obligaba a mantener la transacción abierta todo el cron.
+
+Sondeo adaptativo (`sondear`, cada `SAT_POLL_INTERVALO_S`): en lugar del
+barrido diario, cada documento lleva `proxima_verificacion_sat`. Al solicitar
+la cancelación se programa a `SAT_POLL_PRIMERA_MIN`; mientras el SAT no la
+refleje se revisa cada `SAT_POLL_BASE_MIN`, y si espera la aceptación del
+receptor el intervalo se duplica en cada consulta hasta `SAT_POLL_MAX_MIN`
+(con ±20 % de jitter para repartir la carga). Cada ciclo consulta a lo más
+`SAT_POLL_RPM` × intervalo / 60 documentos, los más atrasados primero, y las
+reparte a lo largo del ciclo a razón de `SAT_POLL_RPM` (`Limitador`). Un
+advisory lock de transacción hace que sólo una instancia corra el ciclo a la
+vez (las demás lo saltan), así que el presupuesto es global y no por proceso.
+"""
+from __future__ import annotations
+
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import func, or_, text
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.cliente import Cliente
+from app.models.ejecucion_sync_sat import COMPLETADA, EN_CURSO, FALLIDA, EjecucionSyncSAT
+from app.models.empresa import Empresa
+from app.models.factura import Factura
+from app.models.pago import EstatusPago, Pago
+from app.services import sat_cfdi_service as sat_svc
+
+logger = logging.getLogger("app")
+
+_SAT_SYNC_LOCK_KEY = 0x53415453  # "SATS" en hex — clave fija para pg_advisory_xact_lock
+_SAT_POLL_LOCK_KEY = 0x53415450  # "SATP": un ciclo de sondeo a la vez entre instancias
+_MAX_ERRORES_DETALLE = 20
+
+FACTURA = "factura"
+PAGO = "pago"
+
+
+@dataclass(frozen=True)
+class Pendiente:
+    tipo: str  # factura | pago
+    id: UUID
+    uuid: str
+    rfc_emisor: str
+    rfc_receptor: str
+    total: float
+    xml_path: Optional[str] = None  # con XML, la consulta usa sus datos (sat_cfdi_service)
+
+
+def _rfc(valor: Optional[str]) -> str:
+    return (valor or "").strip().upper()
+
+
+def cargar_pendientes(
+    db: Session,
+    vencidos_a: Optional[datetime] = None,
+    limite: Optional[int] = None,
+    bloquear: bool = False,
+) -> List[Pendiente]:
+    """
+    Facturas y pagos EN_CANCELACION con UUID, como datos planos (sin ORM).
+    Con `vencidos_a` sólo los que toca verificar (próxima verificación vencida
+    o sin programar), los más atrasados primero y hasta `limite` en total.
+    `bloquear` (PostgreSQL) toma las filas con SKIP LOCKED para reclamarlas.
+    """
+    qf = (
+        db.query(
+            Factura.id, Factura.cfdi_uuid, Factura.total, Factura.xml_path, Empresa.rfc, Cliente.rfc,
+            Factura.proxima_verificacion_sat,
+        )
+        .outerjoin(Empresa, Factura.empresa_id == Empresa.id)
+        .outerjoin(Cliente, Factura.cliente_id == Cliente.id)
+        .filter(Factura.estatus == "EN_CANCELACION", Factura.cfdi_uuid.isnot(None))
+    )
+    qp = (
+        db.query(
+            Pago.id, Pago.uuid, Pago.xml_path, Empresa.rfc, Cliente.rfc, Pago.proxima_verificacion_sat,
+        )
+        .outerjoin(Empresa, Pago.empresa_id == Empresa.id)
+        .outerjoin(Cliente, Pago.cliente_id == Cliente.id)
+        .filter(Pago.estatus == EstatusPago.EN_CANCELACION, Pago.uuid.isnot(None))
+    )
+    if vencidos_a is not None:
+        qf = qf.filter(
+            or_(Factura.proxima_verificacion_sat.is_(None), Factura.proxima_verificacion_sat <= vencidos_a)
+        ).order_by(Factura.proxima_verificacion_sat.asc().nullsfirst())
+        qp = qp.filter(
+            or_(Pago.proxima_verificacion_sat.is_(None), Pago.proxima_verificacion_sat <= vencidos_a)
+        ).order_by(Pago.proxima_verificacion_sat.asc().nullsfirst())
+    if bloquear and db.bind.dialect.name == "postgresql":
+        qf = qf.with_for_update(skip_locked=True, of=Factura)
+        qp = qp.with_for_update(skip_locked=True, of=Pago)
+    if limite is not None:
+        # Hasta `limite` de cada tipo; el corte se hace tras mezclarlos
+        qf, qp = qf.limit(limite), qp.limit(limite)
+
+    pendientes = [
+        (proxima, Pendiente(FACTURA, fid, folio, _rfc(emisor), _rfc(receptor), float(total or 0), xml_path))
+        for fid, folio, total, xml_path, emisor, receptor, proxima in qf.all()
+    ] + [
+        # los complementos de pago timbran con Total=0
+        (proxima, Pendiente(PAGO, pid, folio, _rfc(emisor), _rfc(receptor), 0.0, xml_path))
+        for pid, folio, xml_path, emisor, receptor, proxima in qp.all()
+    ]
+    if vencidos_a is not None:
+        # Sin programar primero, luego el más atrasado, sin importar el tipo
+        pendientes.sort(key=lambda t: (t[0] is not None, t[0] or datetime.min))
+    if limite is not None:
+        pendientes = pendientes[:limite]
+    return [p for _, p in pendientes]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Programación del sondeo por documento
+# ─────────────────────────────────────────────────────────────────────────────
+def programar_sondeo(doc: Any, ahora: Optional[datetime] = None) -> None:
+    """Al quedar EN_CANCELACION: primera verificación en `SAT_POLL_PRIMERA_MIN`."""
+    ahora = ahora or datetime.utcnow()
+    doc.intentos_verificacion_sat = 0
+    doc.proxima_verificacion_sat = ahora + timedelta(minutes=settings.SAT_POLL_PRIMERA_MIN)
+
+
+def registrar_verificacion(
+    doc: Any, acuse: Optional[sat_svc.AcuseSAT] = None, ahora: Optional[datetime] = None
+) -> None:
+    """
+    Tras consultar el SAT (y aplicar el acuse): guarda la hora y programa la
+    siguiente. Resuelto → sin programar; esperando al receptor → backoff
+    exponencial; el SAT aún no lo refleja → `SAT_POLL_BASE_MIN`.
+    No hace commit.
+    """
+    ahora = ahora or datetime.utcnow()
+    doc.ultima_verificacion_sat = ahora
+    if getattr(doc.estatus, "value", doc.estatus) != "EN_CANCELACION":
+        doc.proxima_verificacion_sat = None
+        doc.intentos_verificacion_sat = 0
+        return
+    minutos = settings.SAT_POLL_BASE_MIN
+    if acuse is not None and acuse.en_proceso:
+        doc.intentos_verificacion_sat = (doc.intentos_verificacion_sat or 0) + 1
+        minutos = min(
+            settings.SAT_POLL_MAX_MIN,
+            settings.SAT_POLL_BASE_MIN * 2 ** (doc.intentos_verificacion_sat - 1),
+        )
+    doc.proxima_verificacion_sat = ahora + timedelta(minutes=minutos * random.uniform(0.8, 1.2))
+
+
+def _iniciar(db: Session, origen: str) -> Optional[EjecucionSyncSAT]:
+    """Registra la ejecución EN_CURSO, o None si otra instancia ya tiene una viva."""
+    if db.bind.dialect.name == "postgresql":
+        # Serializa el chequeo entre instancias; se libera con el commit
+        db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _SAT_SYNC_LOCK_KEY})
+    limite = datetime.utcnow() - timedelta(minutes=settings.SAT_SYNC_LEASE_MINUTOS)
+    for previa in db.query(EjecucionSyncSAT).filter(EjecucionSyncSAT.estado == EN_CURSO).all():
+        if previa.iniciado_en > limite:
+            db.rollback()
+            return None
+        previa.estado = FALLIDA
+        previa.error = "La ejecución no terminó (proceso detenido)."
+        previa.terminado_en = datetime.utcnow()
+    ejecucion = EjecucionSyncSAT(estado=EN_CURSO, origen=origen, iniciado_en=datetime.utcnow())
+    db.add(ejecucion)
+    db.commit()
+    return ejecucion
+
+
+class Limitador:
+    """
+    Ritmo global de consultas al SAT, compartido por todos los hilos: cada
+    llamada a `esperar()` reserva el siguiente turno libre, separados
+    `intervalo` segundos entre sí.
+    """
+
+    def __init__(self, intervalo: float):
+        self.intervalo = max(0.0, intervalo)
+        self.consultas = 0
+        self._lock = threading.Lock()
+        self._siguiente = time.monotonic()
+
+    def esperar(self) -> None:
+        with self._lock:
+            ahora = time.monotonic()
+            turno = max(ahora, self._siguiente)
+            self._siguiente = turno + self.intervalo
+            self.consultas += 1
+        if turno > ahora:
+            time.sleep(turno - ahora)
+
+
+def _consultar(p: Pendiente, limitador: Optional[Limitador] = None) -> sat_svc.AcuseSAT:
+    if limitador is not None:
+        limitador.esperar()
+    return sat_svc.consultar_cfdi(
+        rfc_emisor=p.rfc_emisor,
+        rfc_receptor=p.rfc_receptor,
+        total=p.total,
+        uuid=p.uuid,
+        xml_path=p.xml_path,
+    )
+
+
+def consultar_pendientes(
+    pendientes: List[Pendiente],
+    concurrencia: int,
+    progreso: Optional[Callable[[int], None]] = None,
+    cada: int = 100,
+    limitador: Optional[Limitador] = None,
+) -> List[Tuple[Pendiente, Optional[sat_svc.AcuseSAT], Optional[str]]]:
+    """
+    Consulta al SAT con hasta `concurrencia` hilos (y al ritmo de `limitador`,
+    si se da); (pendiente, acuse, error) por documento.
+    """
+    resultados = []
+    with ThreadPoolExecutor(max_workers=max(1, concurrencia), thread_name_prefix="sat-sync") as pool:
+        futuros = {pool.submit(_consultar, p, limitador): p for p in pendientes}
+        for n, futuro in enumerate(as_completed(futuros), start=1):
+            p = futuros[futuro]
+            try:
+                resultados.append((p, futuro.result(), None))
+            except Exception as exc:
+                logger.warning("[SAT Sync] Error verificando %s %s: %s", p.tipo, p.id, exc)
+                resultados.append((p, None, str(exc)))
+            if progreso and (n % cada == 0 or n == len(pendientes)):
+                progreso(n)
+    return resultados
+
+
+def _aplicar_lote(
+    db: Session, lote: List[Tuple[Pendiente, sat_svc.AcuseSAT]], por_estatus: Counter
+) -> int:
+    """Aplica los acuses a los documentos que siguen EN_CANCELACION; regresa cuántos cambiaron."""
+    acuses = {p.id: acuse for p, acuse in lote}
+    cambios = 0
+    ids_f = [p.id for p, _ in lote if p.tipo == FACTURA]
+    ids_p = [p.id for p, _ in lote if p.tipo == PAGO]
+    facturas = (
+        db.query(Factura).filter(Factura.id.in_(ids_f), Factura.estatus == "EN_CANCELACION").all()
+        if ids_f
+        else []
+    )
+    pagos = (
+        db.query(Pago).filter(Pago.id.in_(ids_p), Pago.estatus == EstatusPago.EN_CANCELACION).all()
+        if ids_p
+        else []
+    )
+    for f in facturas:
+        nuevo, hubo_cambio = sat_svc.aplicar_acuse_sat(f, acuses[f.id])
+        registrar_verificacion(f, acuses[f.id])
+        por_estatus[nuevo] += 1
+        if hubo_cambio:
+            cambios += 1
+            logger.info("[SAT Sync] Factura %s-%s → %s", f.serie, f.folio, nuevo)
+    for pg in pagos:
+        nuevo, hubo_cambio = sat_svc.aplicar_acuse_sat_pago(pg, acuses[pg.id])
+        registrar_verificacion(pg, acuses[pg.id])
+        por_estatus[nuevo] += 1
+        if hubo_cambio:
+            cambios += 1
+            logger.info("[SAT Sync] Pago %s → %s", pg.uuid, nuevo)
+    return cambios
+
+
+def sincronizar_cancelaciones(
+    session_factory: Optional[Callable[[], Session]] = None,
+    *,
+    origen: str = "cron",
+    concurrencia: Optional[int] = None,
+    lote: Optional[int] = None,
+) -> Optional[Dict]:
+    """
+    Corre la sincronización completa. Regresa el resumen de la ejecución, o
+    None si otra instancia ya estaba corriendo.
+    """
+    if session_factory is None:
+        from app.database import SessionLocal as session_factory
+    concurrencia = concurrencia or settings.SAT_SYNC_CONCURRENCIA
+    lote = max(1, lote or settings.SAT_SYNC_LOTE)
+
+    db = session_factory()
+    try:
+        ejecucion = _iniciar(db, origen)
+        if ejecucion is None:
+            logger.info("[SAT Sync] Otra instancia ya ejecuta la sincronización — saltando.")
+            return None
+        ejecucion_id = ejecucion.id
+        pendientes = cargar_pendientes(db)
+        ejecucion.total = len(pendientes)
+        db.commit()
+    finally:
+        db.close()
+
+    def actualizar(**campos) -> None:
+        s = session_factory()
+        try:
+            s.query(EjecucionSyncSAT).filter(EjecucionSyncSAT.id == ejecucion_id).update(campos)
+            s.commit()
+        finally:
+            s.close()
+
+    try:
+        n_facturas = sum(1 for p in pendientes if p.tipo == FACTURA)
+        logger.info(
+            "[SAT Sync] Verificando %d facturas y %d pagos EN_CANCELACION (%d hilos)",
+            n_facturas, len(pendientes) - n_facturas, concurrencia,
+        )
+
+        # ── Consulta ─────────────────────────────────────────────────────────
+        t0 = time.perf_counter()
+
+        def progreso(n: int) -> None:
+            logger.info("[SAT Sync] Consultados %d/%d", n, len(pendientes))
+            actualizar(consultados=n)
+
+        resultados = consultar_pendientes(pendientes, concurrencia, progreso, cada=lote)
+        consulta_ms = int((time.perf_counter() - t0) * 1000)
+        errores = [(p, err) for p, acuse, err in resultados if acuse is None]
+        ok = [(p, acuse) for p, acuse, _ in resultados if acuse is not None]
+
+        # ── Aplicación en lotes ──────────────────────────────────────────────
+        t0 = time.perf_counter()
+        por_estatus: Counter = Counter()
+        aplicados = cambios = 0
+        for i in range(0, len(ok), lote):
+            trozo = ok[i : i + lote]
+            s = session_factory()
+            try:
+                cambios += _aplicar_lote(s, trozo, por_estatus)
+                aplicados += len(trozo)
+                s.query(EjecucionSyncSAT).filter(EjecucionSyncSAT.id == ejecucion_id).update(
+                    {"aplicados": aplicados, "cambios": cambios}
+                )
+                s.commit()
+            except Exception:
+                s.rollback()
+                raise
+            finally:
+                s.close()
+        aplicacion_ms = int((time.perf_counter() - t0) * 1000)
+
+        resumen = {
+            "id": str(ejecucion_id),
+            "total": len(pendientes),
+            "consultados": len(resultados),
+            "aplicados": aplicados,
+            "cambios": cambios,
+            "errores": len(errores),
+            "consulta_ms": consulta_ms,
+            "aplicacion_ms": aplicacion_ms,
+            "detalle": {
+                "facturas": n_facturas,
+                "pagos": len(pendientes) - n_facturas,
+                "concurrencia": concurrencia,
+                "por_estatus": dict(por_estatus),
+                "errores": [
+                    {"tipo": p.tipo, "id": str(p.id), "error": err[:300]}
+                    for p, err in errores[:_MAX_ERRORES_DETALLE]
+                ],
+            },
+        }
+        actualizar(
+            estado=COMPLETADA,
+            consultados=len(resultados),
+            errores=len(errores),
+            consulta_ms=consulta_ms,
+            aplicacion_ms=aplicacion_ms,
+            detalle=resumen["detalle"],
+            terminado_en=datetime.utcnow(),
+        )
+        logger.info(
+            "[SAT Sync] Terminado: %d documentos, %d cambios, %d errores — consulta %d ms, aplicación %d ms",
+            len(pendientes), cambios, len(errores), consulta_ms, aplicacion_ms,
+        )
+        return resumen
+    except Exception as exc:
+        actualizar(estado=FALLIDA, error=str(exc)[:2000], terminado_en=datetime.utcnow())
+        raise
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Sondeo adaptativo
+# ─────────────────────────────────────────────────────────────────────────────
+_ultimo_sondeo: Dict[str, Any] = {}
+
+
+def cupo_por_ciclo() -> int:
+    return max(1, int(settings.SAT_POLL_RPM * settings.SAT_POLL_INTERVALO_S / 60))
+
+
+def _turno_sondeo(db: Session) -> bool:
+    """
+    Toma el turno del ciclo entre instancias (PostgreSQL) sin esperar. El lock
+    es de transacción: se libera al cerrar `db`, aunque el proceso muera.
+    """
+    if db.bind.dialect.name != "postgresql":
+        return True
+    return bool(
+        db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": _SAT_POLL_LOCK_KEY}).scalar()
+    )
+
+
+def sondear(
+    session_factory: Optional[Callable[[], Session]] = None, ahora: Optional[datetime] = None
+) -> Dict[str, Any]:
+    """
+    Un ciclo del sondeo: reclama los documentos vencidos (hasta el cupo),
+    los consulta en el SAT y aplica los acuses con su siguiente programación.
+    Los reclamados se marcan a `SAT_POLL_RECLAMO_MIN`, así que otra instancia no
+    los toma y, si la consulta falla, se reintentan al vencer el reclamo.
+    Si otra instancia está en su ciclo, éste se salta (`omitido`).
+    """
+    if session_factory is None:
+        from app.database import SessionLocal as session_factory
+    ahora = ahora or datetime.utcnow()
+
+    # Sesión aparte sólo para el lock: se mantiene abierta todo el ciclo
+    turno = session_factory()
+    try:
+        if not _turno_sondeo(turno):
+            logger.info("[SAT Sondeo] Otra instancia está en su ciclo — saltando.")
+            return {"en": ahora.isoformat(), "omitido": True, "consultados": 0, "cambios": 0, "errores": 0}
+        resumen = _ciclo_sondeo(session_factory, ahora)
+    finally:
+        turno.rollback()
+        turno.close()
+    _ultimo_sondeo.clear()
+    _ultimo_sondeo.update(resumen)
+    return resumen
+
+
+def _ciclo_sondeo(session_factory: Callable[[], Session], ahora: datetime) -> Dict[str, Any]:
+    db = session_factory()
+    try:
+        pendientes = cargar_pendientes(db, vencidos_a=ahora, limite=cupo_por_ciclo(), bloquear=True)
+        reclamo = ahora + timedelta(minutes=settings.SAT_POLL_RECLAMO_MIN)
+        for modelo, tipo in ((Factura, FACTURA), (Pago, PAGO)):
+            ids = [p.id for p in pendientes if p.tipo == tipo]
+            if ids:
+                db.query(modelo).filter(modelo.id.in_(ids)).update(
+                    {modelo.proxima_verificacion_sat: reclamo}, synchronize_session=False
+                )
+        db.commit()
+    finally:
+        db.close()
+
+    resumen: Dict[str, Any] = {"en": ahora.isoformat(), "consultados": len(pendientes), "cambios": 0, "errores": 0}
+    if pendientes:
+        t0 = time.perf_counter()
+        # El cupo se reparte en el ciclo en lugar de salir en ráfaga
+        limitador = Limitador(60 / max(1, settings.SAT_POLL_RPM))
+        resultados = consultar_pendientes(
+            pendientes, min(settings.SAT_SYNC_CONCURRENCIA, len(pendientes)), limitador=limitador
+        )
+        ok = [(p, acuse) for p, acuse, _ in resultados if acuse is not None]
+        por_estatus: Counter = Counter()
+        s = session_factory()
+        try:
+            resumen["cambios"] = _aplicar_lote(s, ok, por_estatus) if ok else 0
+            s.commit()
+        except Exception:
+            s.rollback()
+            raise
+        finally:
+            s.close()
+        resumen["errores"] = len(resultados) - len(ok)
+        resumen["por_estatus"] = dict(por_estatus)
+        resumen["ms"] = int((time.perf_counter() - t0) * 1000)
+        logger.info(
+            "[SAT Sondeo] %d consultados, %d cambios, %d errores en %d ms",
+            resumen["consultados"], resumen["cambios"], resumen["errores"], resumen["ms"],
+        )
+    return resumen
+
+
+def estado_sondeo(db: Session, ahora: Optional[datetime] = None) -> Dict[str, Any]:
+    """Presupuesto, cola (vencidos / programados) y último ciclo, para el panel de administración."""
+    ahora = ahora or datetime.utcnow()
+    cola: Dict[str, Dict[str, int]] = {}
+    for modelo, tipo, estatus in (
+        (Factura, FACTURA, "EN_CANCELACION"),
+        (Pago, PAGO, EstatusPago.EN_CANCELACION),
+    ):
+        base = db.query(func.count(modelo.id)).filter(modelo.estatus == estatus)
+        cola[tipo] = {
+            "en_cancelacion": base.scalar() or 0,
+            "vencidos": base.filter(
+                or_(modelo.proxima_verificacion_sat.is_(None), modelo.proxima_verificacion_sat <= ahora)
+            ).scalar() or 0,
+        }
+    return {
+        "activo": settings.SAT_POLL_ACTIVO,
+        "intervalo_s": settings.SAT_POLL_INTERVALO_S,
+        "rpm": settings.SAT_POLL_RPM,
+        "cupo_por_ciclo": cupo_por_ciclo(),
+        "cola": cola,
+        "ultimo": dict(_ultimo_sondeo) or None,
+    }
+
+
+def ultimas_ejecuciones(db: Session, limite: int = 20) -> List[EjecucionSyncSAT]:
+    return (
+        db.query(EjecucionSyncSAT)
+        .order_by(EjecucionSyncSAT.iniciado_en.desc())
+        .limit(limite)
+        .all()
+    )
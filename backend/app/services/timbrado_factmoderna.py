@@ -4,13 +4,14 @@ from __future__ import annotations
 import os
 import re
 import base64
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from uuid import UUID
 from datetime import datetime, timezone
 
-import httpx
 from xml.etree.ElementTree import Element, SubElement, tostring, fromstring
 
+import httpx
+
 from sqlalchemy.orm import Session
 
 from app.config import settings
@@ -18,6 +19,12 @@ from app.models.factura import Factura
 from app.models.pago import Pago, EstatusPago
 from app.services.cfdi40_xml import build_cfdi40_xml_sin_timbrar
 from app.services.pago20_xml import build_pago20_xml_sin_timbrar
+from app.services.pac_http import post_soap, post_soap_stream
+from app.services.pac_respuesta import leer_respuesta_timbrado
+from app.services.pac_errors import RespuestaPAC, error_de_red, error_http
+from app.services.pac_router import ProveedorPAC
+from app.services.sync_cancelaciones_service import programar_sondeo
+from app.services import pdf_cache
 
 try:
     from app.core.logger import logger
@@ -149,16 +156,6 @@ def _etree_strip_ns(tag: str) -> str:
     return tag
 
 
-def _find_first_text(root, local_names) -> Optional[str]:
-    wanted = {n.lower() for n in local_names}
-    for el in root.iter():
-        if _etree_strip_ns(el.tag).lower() in wanted:
-            txt = (el.text or "").strip()
-            if txt:
-                return txt
-    return None
-
-
 # ─────────────────────────────────────────────────────────────────────────────
 # SOAP request builder: CANCELACIÓN
 # ─────────────────────────────────────────────────────────────────────────────
@@ -215,7 +212,7 @@ def _parse_cancel_response(root) -> dict:
     """
     Extrae Code/Message de la respuesta SOAP de cancelación.
     Devuelve {"code": "...", "message": "..."} si los encuentra.
-    Lanza RuntimeError en Fault o si no se encuentra información.
+    Lanza RespuestaPAC en Fault y RuntimeError si no se encuentra información.
     """
     # Fault?
     for el in root.iter():
@@ -228,7 +225,7 @@ def _parse_cancel_response(root) -> dict:
                     code = (ch.text or "").strip()
                 if ln == "faultstring":
                     msg = (ch.text or "").strip()
-            raise RuntimeError(
+            raise RespuestaPAC(
                 f"PAC cancelación Fault: {code or ''} {msg or ''}".strip()
             )
 
@@ -376,29 +373,103 @@ def _save_bytes(path: str, data: bytes) -> None:
         f.write(data)
 
 
-def _save_b64(path: str, b64: Optional[str]) -> Optional[str]:
-    if not b64:
-        return None
-    try:
-        _save_bytes(path, base64.b64decode(b64))
-        return path
-    except Exception:
-        return None
-
-
 # ─────────────────────────────────────────────────────────────────────────────
 # Servicio principal
 # ─────────────────────────────────────────────────────────────────────────────
-class FacturacionModernaPAC:
+class FacturacionModernaPAC(ProveedorPAC):
     """
     Timbrado CFDI 4.0 vía SOAP con Facturación Moderna.
-    - Loguea el SOAP (truncado) y previews de XML timbrado (inicio/fin).
-    - Extrae TFD por XML y regex.
+    - Lee la respuesta en streaming (`pac_respuesta`): el Base64 se decodifica
+      directo a disco y el TFD se extrae en la misma pasada (regex como fallback).
+    - Loguea el SOAP (truncado) por muestreo o si hay error.
     - Guarda XML/PDF/CBB/TXT en disco y persiste campos TFD en DB.
     """
 
-    def __init__(self, *, timeout: float = 60.0):
+    nombre = "facturacion_moderna"
+    rfcs_certificacion = ("FLI081010EK2",)
+
+    def __init__(
+        self,
+        *,
+        timeout: Optional[float] = None,
+        url: Optional[str] = None,
+        nombre: Optional[str] = None,
+    ):
+        # None → timeouts por operación de settings (FM_TIMEOUT_*)
         self.timeout = timeout
+        # None → FM_TIMBRADO_URL, leída en cada llamada
+        self.url = url
+        if nombre:
+            self.nombre = nombre
+
+    def _url(self) -> str:
+        return self.url or _fm_url()
+
+    def descargar_acuse(self, doc, *, forzar: bool = False) -> bytes:
+        from app.services.acuse_cancelacion_service import descargar_acuse_xml
+
+        return descargar_acuse_xml(doc, forzar=forzar)
+
+    def _enviar_timbrado(
+        self,
+        url: str,
+        env: bytes,
+        headers: Dict[str, str],
+        doc,
+        *,
+        adjuntos: List[str],
+    ) -> Dict[str, Any]:
+        """
+        POST de timbrado y lectura en streaming de la respuesta. Regresa
+        {tfd, no_certificado, xml_path, pdf?, cbb?, txt?} con los archivos ya
+        en su nombre final dentro de DATA_DIR/cfdis.
+        """
+        out_dir = _ensure_cfdi_dir()
+        try:
+            with post_soap_stream("timbrar", url, env, headers, timeout=self.timeout) as resp:
+                if resp.status_code >= 400:
+                    soap_txt = resp.read().decode(resp.encoding or "utf-8", "replace")
+                    (logger.warning if logger else print)(
+                        f"[PAC SOAP] HTTP {resp.status_code}\n{soap_txt[:settings.FM_LOG_SOAP_MAX_BYTES]}"
+                    )
+                    raise error_http(resp.status_code, soap_txt, f"HTTP {resp.status_code} del PAC: {soap_txt}")
+                leido = leer_respuesta_timbrado(
+                    resp.iter_bytes(), out_dir, adjuntos=adjuntos, contexto=f"PAC SOAP HTTP {resp.status_code}"
+                )
+        except (httpx.HTTPError, httpx.InvalidURL) as e:
+            raise error_de_red(e, "timbrar") from e
+
+        try:
+            tfd = {k: v for k, v in leido.lector.tfd.items() if v}
+            no_certificado = leido.lector.no_certificado
+            if not tfd.get("uuid"):
+                # XML que el parser incremental no pudo leer: XML → regex sobre el archivo
+                with open(leido.cfdi.ruta, "rb") as fh:
+                    cfdi_bytes = fh.read()
+                tfd = _parse_tfd_fields(cfdi_bytes)
+                no_certificado = no_certificado or _parse_comprobante_no_certificado(cfdi_bytes)
+            if not tfd.get("uuid"):
+                (logger.warning if logger else print)(
+                    "⚠️ TFD no detectado por parser/regex. Verifica respuesta del PAC."
+                )
+                # Aún así guardamos el XML para inspección.
+                os.replace(
+                    leido.cfdi.ruta,
+                    os.path.join(out_dir, _build_base_filename(doc, None) + "-SINUUID.xml"),
+                )
+                raise RuntimeError("El PAC no devolvió UUID en el TFD.")
+
+            base_name = _build_base_filename(doc, tfd["uuid"])
+            res: Dict[str, Any] = {"tfd": tfd, "no_certificado": no_certificado}
+            res["xml_path"] = os.path.join(out_dir, base_name + ".xml")
+            os.replace(leido.cfdi.ruta, res["xml_path"])
+            for nombre, salida in leido.adjuntos.items():
+                ext = ".png" if nombre == "cbb" else "." + nombre
+                res[nombre] = os.path.join(out_dir, base_name + ext)
+                os.replace(salida.ruta, res[nombre])
+            return res
+        finally:
+            leido.descartar()
 
     def timbrar_factura(
         self,
@@ -442,103 +513,23 @@ class FacturacionModernaPAC:
             "Content-Type": "text/xml; charset=utf-8",
             "SOAPAction": "requestTimbrarCFDI",
         }
-        url = _fm_url()
-
-        try:
-            with httpx.Client(timeout=self.timeout) as client:
-                resp = client.post(url, content=env, headers=headers)
-        except Exception as e:
-            raise RuntimeError(f"Error de red al timbrar: {e}") from e
-
-        # Log SOAP (truncado)
-        soap_txt = resp.text
-        soap_log = (
-            soap_txt
-            if len(soap_txt) <= 20000
-            else soap_txt[:20000] + "\n... [truncated]"
-        )
-        (logger.info if logger else print)(
-            f"[PAC SOAP] HTTP {resp.status_code}\n{soap_log}"
-        )
-        if resp.status_code >= 400:
-            raise RuntimeError(f"HTTP {resp.status_code} del PAC: {soap_txt}")
-
-        # 4) Parse SOAP → obtener <xml> (Base64)
-        try:
-            root = fromstring(resp.content)
-        except Exception as e:
-            raise RuntimeError(f"Respuesta SOAP inválida: {e}")
-
-        # Detecta Fault si existe
-        for el in root.iter():
-            if _etree_strip_ns(el.tag) == "Fault":
-                code = None
-                msg = None
-                for ch in el:
-                    ln = _etree_strip_ns(ch.tag)
-                    if ln == "faultcode":
-                        code = (ch.text or "").strip()
-                    if ln == "faultstring":
-                        msg = (ch.text or "").strip()
-                raise RuntimeError(
-                    f"PAC devolvió Fault: {code or ''} {msg or ''}".strip()
-                )
-
-        cfdi_b64 = _find_first_text(
-            root,
-            ["xml", "cfdi", "xmlTimbrado", "cfdiTimbrado", "response", "returnXml"],
+        url = self._url()
+
+        # 4-7) POST, lectura en streaming y archivos en disco
+        res = self._enviar_timbrado(
+            url,
+            env,
+            headers,
+            f,
+            adjuntos=[
+                nombre
+                for nombre, pedido in (("pdf", generar_pdf), ("cbb", generar_cbb), ("txt", generar_txt))
+                if pedido
+            ],
         )
-        if not cfdi_b64:
-            raise RuntimeError(
-                "No se encontró el nodo <xml> (CFDI timbrado en Base64) en la respuesta del PAC."
-            )
-
-        # Adjuntos opcionales
-        pdf_b64 = _find_first_text(root, ["pdf", "PDF"]) if generar_pdf else None
-        cbb_b64 = _find_first_text(root, ["cbb", "CBB"]) if generar_cbb else None
-        txt_b64 = _find_first_text(root, ["txt", "TXT"]) if generar_txt else None
-
-        # 5) Decodificar el CFDI timbrado
-        try:
-            cfdi_bytes = base64.b64decode(cfdi_b64)
-        except Exception as e:
-            raise RuntimeError(f"No se pudo decodificar el XML timbrado (base64): {e}")
-
-        # Debug: previews de inicio/fin
-        head = cfdi_bytes[:400].decode("utf-8", "ignore")
-        tail = cfdi_bytes[-400:].decode("utf-8", "ignore")
-        (logger.info if logger else print)(f"[CFDI preview:head]\n{head}")
-        (logger.info if logger else print)(f"[CFDI preview:tail]\n{tail}")
-
-        # 6) Extraer TFD (XML → regex fallback)
-        tfd = _parse_tfd_fields(cfdi_bytes)
-        if not tfd.get("uuid"):
-            (logger.warning if logger else print)(
-                "⚠️ TFD no detectado por parser/regex. Verifica respuesta del PAC."
-            )
-            # Aún así guardamos el XML y respondemos con detalle para inspección.
-            out_dir = _ensure_cfdi_dir()
-            xml_only = os.path.join(
-                out_dir, _build_base_filename(f, None) + "-SINUUID.xml"
-            )
-            _save_bytes(xml_only, cfdi_bytes)
-            raise RuntimeError("El PAC no devolvió UUID en el TFD.")
-
-        # 7) Guardar archivos en disco
-        out_dir = _ensure_cfdi_dir()
-        base_name = _build_base_filename(f, tfd["uuid"])
-        xml_path = os.path.join(out_dir, base_name + ".xml")
-        _save_bytes(xml_path, cfdi_bytes)
-
-        pdf_path = os.path.join(out_dir, base_name + ".pdf") if pdf_b64 else None
-        cbb_path = os.path.join(out_dir, base_name + ".png") if cbb_b64 else None
-        txt_path = os.path.join(out_dir, base_name + ".txt") if txt_b64 else None
-        if pdf_b64:
-            _save_b64(pdf_path, pdf_b64)
-        if cbb_b64:
-            _save_b64(cbb_path, cbb_b64)
-        if txt_b64:
-            _save_b64(txt_path, txt_b64)
+        tfd = res["tfd"]
+        xml_path = res["xml_path"]
+        pdf_path, cbb_path, txt_path = res.get("pdf"), res.get("cbb"), res.get("txt")
 
         # 8) Persistir en DB
         f.cfdi_uuid = tfd.get("uuid")
@@ -571,16 +562,18 @@ class FacturacionModernaPAC:
         if hasattr(f, "xml_path"):
             f.xml_path = xml_path
         if hasattr(f, "pdf_path"):
-            f.pdf_path = pdf_path if pdf_b64 else None
+            f.pdf_path = pdf_path
         if hasattr(f, "cbb_path"):
-            setattr(f, "cbb_path", cbb_path if cbb_b64 else None)
+            setattr(f, "cbb_path", cbb_path)
         if hasattr(f, "txt_path"):
-            setattr(f, "txt_path", txt_path if txt_b64 else None)
+            setattr(f, "txt_path", txt_path)
 
         f.estatus = "TIMBRADA"
         db.add(f)
         db.commit()
         db.refresh(f)
+        # El usuario casi siempre descarga o envía el PDF enseguida
+        pdf_cache.programar_prerender(pdf_cache.FACTURA, f.id)
 
         # 9) Respuesta
         out: Dict[str, Any] = {
@@ -595,14 +588,12 @@ class FacturacionModernaPAC:
             "sello_sat": f.sello_sat,
             "xml_path": xml_path,
         }
-        if pdf_b64:
+        if pdf_path:
             out["pdf_path"] = pdf_path
-        if cbb_b64:
+        if cbb_path:
             out["cbb_path"] = cbb_path
-        if txt_b64:
+        if txt_path:
             out["txt_path"] = txt_path
-        # si quieres exponer el XML timbrado en base64:
-        out["cfdi_b64"] = cfdi_b64
         return out
 
     def timbrar_pago(
@@ -646,103 +637,23 @@ class FacturacionModernaPAC:
             "Content-Type": "text/xml; charset=utf-8",
             "SOAPAction": "requestTimbrarCFDI",
         }
-        url = _fm_url()
-
-        try:
-            with httpx.Client(timeout=self.timeout) as client:
-                resp = client.post(url, content=env, headers=headers)
-        except Exception as e:
-            raise RuntimeError(f"Error de red al timbrar: {e}") from e
-
-        # Log SOAP (truncado)
-        soap_txt = resp.text
-        soap_log = (
-            soap_txt
-            if len(soap_txt) <= 20000
-            else soap_txt[:20000] + "\n... [truncated]"
-        )
-        (logger.info if logger else print)(
-            f"[PAC SOAP] HTTP {resp.status_code}\n{soap_log}"
+        url = self._url()
+
+        # 4-7) POST, lectura en streaming y archivos en disco
+        res = self._enviar_timbrado(
+            url,
+            env,
+            headers,
+            p,
+            adjuntos=[
+                nombre
+                for nombre, pedido in (("pdf", generar_pdf), ("cbb", generar_cbb), ("txt", generar_txt))
+                if pedido
+            ],
         )
-        if resp.status_code >= 400:
-            raise RuntimeError(f"HTTP {resp.status_code} del PAC: {soap_txt}")
-
-        # 4) Parse SOAP → obtener <xml> (Base64)
-        try:
-            root = fromstring(resp.content)
-        except Exception as e:
-            raise RuntimeError(f"Respuesta SOAP inválida: {e}")
-
-        # Detecta Fault si existe
-        for el in root.iter():
-            if _etree_strip_ns(el.tag) == "Fault":
-                code = None
-                msg = None
-                for ch in el:
-                    ln = _etree_strip_ns(ch.tag)
-                    if ln == "faultcode":
-                        code = (ch.text or "").strip()
-                    if ln == "faultstring":
-                        msg = (ch.text or "").strip()
-                raise RuntimeError(
-                    f"PAC devolvió Fault: {code or ''} {msg or ''}".strip()
-                )
-
-        cfdi_b64 = _find_first_text(
-            root,
-            ["xml", "cfdi", "xmlTimbrado", "cfdiTimbrado", "response", "returnXml"],
-        )
-        if not cfdi_b64:
-            raise RuntimeError(
-                "No se encontró el nodo <xml> (CFDI timbrado en Base64) en la respuesta del PAC."
-            )
-
-        # Adjuntos opcionales
-        pdf_b64 = _find_first_text(root, ["pdf", "PDF"]) if generar_pdf else None
-        cbb_b64 = _find_first_text(root, ["cbb", "CBB"]) if generar_cbb else None
-        txt_b64 = _find_first_text(root, ["txt", "TXT"]) if generar_txt else None
-
-        # 5) Decodificar el CFDI timbrado
-        try:
-            cfdi_bytes = base64.b64decode(cfdi_b64)
-        except Exception as e:
-            raise RuntimeError(f"No se pudo decodificar el XML timbrado (base64): {e}")
-
-        # Debug: previews de inicio/fin
-        head = cfdi_bytes[:400].decode("utf-8", "ignore")
-        tail = cfdi_bytes[-400:].decode("utf-8", "ignore")
-        (logger.info if logger else print)(f"[CFDI preview:head]\n{head}")
-        (logger.info if logger else print)(f"[CFDI preview:tail]\n{tail}")
-
-    # 6) Extraer TFD (XML → regex fallback)
-        tfd = _parse_tfd_fields(cfdi_bytes)
-        if not tfd.get("uuid"):
-            (logger.warning if logger else print)(
-                "⚠️ TFD no detectado por parser/regex. Verifica respuesta del PAC."
-            )
-            # Aún así guardamos el XML y respondemos con detalle para inspección.
-            out_dir = _ensure_cfdi_dir()
-            xml_only = os.path.join(
-                out_dir, _build_base_filename(p, None) + "-SINUUID.xml"
-            )
-            _save_bytes(xml_only, cfdi_bytes)
-            raise RuntimeError("El PAC no devolvió UUID en el TFD.")
-
-        # 7) Guardar archivos en disco
-        out_dir = _ensure_cfdi_dir()
-        base_name = _build_base_filename(p, tfd["uuid"])
-        xml_path = os.path.join(out_dir, base_name + ".xml")
-        _save_bytes(xml_path, cfdi_bytes)
-
-        pdf_path = os.path.join(out_dir, base_name + ".pdf") if pdf_b64 else None
-        cbb_path = os.path.join(out_dir, base_name + ".png") if cbb_b64 else None
-        txt_path = os.path.join(out_dir, base_name + ".txt") if txt_b64 else None
-        if pdf_b64:
-            _save_b64(pdf_path, pdf_b64)
-        if cbb_b64:
-            _save_b64(cbb_path, cbb_b64)
-        if txt_b64:
-            _save_b64(txt_path, txt_b64)
+        tfd = res["tfd"]
+        xml_path = res["xml_path"]
+        pdf_path, cbb_path, txt_path = res.get("pdf"), res.get("cbb"), res.get("txt")
 
         # 8) Persistir en DB
         p.uuid = tfd.get("uuid")
@@ -771,22 +682,23 @@ class FacturacionModernaPAC:
         p.sello_cfdi = tfd.get("sello_cfdi")
         p.rfc_proveedor_sat = tfd.get("rfc_prov_certif")
         # Comprobante@NoCertificado (emisor)
-        p.no_certificado = _parse_comprobante_no_certificado(cfdi_bytes)
+        p.no_certificado = res["no_certificado"]
 
         # Paths
         if hasattr(p, "xml_path"):
             p.xml_path = xml_path
         if hasattr(p, "pdf_path"):
-            p.pdf_path = pdf_path if pdf_b64 else None
+            p.pdf_path = pdf_path
         # if hasattr(p, "cbb_path"):
-        #     setattr(p, "cbb_path", cbb_path if cbb_b64 else None)
+        #     setattr(p, "cbb_path", cbb_path)
         # if hasattr(p, "txt_path"):
-        #     setattr(p, "txt_path", txt_path if txt_b64 else None)
+        #     setattr(p, "txt_path", txt_path)
 
         p.estatus = "TIMBRADO"
         db.add(p)
         db.commit()
         db.refresh(p)
+        pdf_cache.programar_prerender(pdf_cache.PAGO, p.id)
 
         # 9) Respuesta
         out: Dict[str, Any] = {
@@ -801,14 +713,12 @@ class FacturacionModernaPAC:
             "sello_sat": p.sello_sat,
             "xml_path": xml_path,
         }
-        if pdf_b64:
+        if pdf_path:
             out["pdf_path"] = pdf_path
-        if cbb_b64:
+        if cbb_path:
             out["cbb_path"] = cbb_path
-        if txt_b64:
+        if txt_path:
             out["txt_path"] = txt_path
-        # si quieres exponer el XML timbrado en base64:
-        out["cfdi_b64"] = cfdi_b64
         return out
 
     def solicitar_cancelacion_cfdi(
@@ -870,14 +780,13 @@ class FacturacionModernaPAC:
             "Content-Type": "text/xml; charset=utf-8",
             "SOAPAction": "requestCancelarCFDI",
         }
-        url = _fm_url()
+        url = self._url()
 
         # 3) POST
         try:
-            with httpx.Client(timeout=self.timeout) as client:
-                resp = client.post(url, content=env, headers=headers)
+            resp = post_soap("cancelar", url, env, headers, timeout=self.timeout)
         except Exception as e:
-            raise RuntimeError(f"Error de red al solicitar cancelación: {e}") from e
+            raise error_de_red(e, "solicitar cancelación") from e
 
         soap_txt = resp.text
         soap_log = (
@@ -895,12 +804,13 @@ class FacturacionModernaPAC:
             if not is_pendiente:
                 # SAT caído/intermitente: mensaje claro en vez del XML crudo
                 if "servicio no disponible" in soap_lower or "error al consultar estatus" in soap_lower:
-                    raise RuntimeError(
+                    raise RespuestaPAC(
                         "El SAT no está disponible en este momento para procesar cancelaciones. "
                         "No es un problema del sistema ni del CFDI; intenta de nuevo en unos minutos."
                     )
-                raise RuntimeError(
-                    f"HTTP {resp.status_code} del PAC (cancelación): {soap_txt}"
+                raise error_http(
+                    resp.status_code, soap_txt,
+                    f"HTTP {resp.status_code} del PAC (cancelación): {soap_txt}",
                 )
             # Si hay solicitud previa o está en cola, marcamos EN_CANCELACION y salimos
             if "previa" in soap_lower or "solicitud de cancelacion" in soap_lower:
@@ -908,9 +818,11 @@ class FacturacionModernaPAC:
                 f.estatus = "EN_CANCELACION"
                 if not f.fecha_solicitud_cancelacion:
                     f.fecha_solicitud_cancelacion = _dt.utcnow()
+                programar_sondeo(f)
                 db.add(f)
                 db.commit()
                 db.refresh(f)
+                pdf_cache.programar_prerender(pdf_cache.FACTURA, f.id)
                 return {
                     "estatus": f.estatus,
                     "uuid": uuid,
@@ -975,6 +887,7 @@ class FacturacionModernaPAC:
                     rfc_receptor=receptor_rfc,
                     total=float(f.total or 0),
                     uuid=uuid,
+                    xml_path=f.xml_path,
                 )
                 if acuse.encontrado and acuse.cancelado_por_sat:
                     cancelada_confirmada_sat = True
@@ -996,11 +909,16 @@ class FacturacionModernaPAC:
             f.estatus = "EN_CANCELACION"
             if hasattr(f, "fecha_solicitud_cancelacion") and not f.fecha_solicitud_cancelacion:
                 f.fecha_solicitud_cancelacion = _dt.utcnow()
+            programar_sondeo(f)
         # ---------------------------------------------
 
         db.add(f)
         db.commit()
         db.refresh(f)
+        if f.estatus != "TIMBRADA":
+            pdf_cache.programar_prerender(
+                pdf_cache.FACTURA, f.id, acuse=cancelada_confirmada_sat
+            )
 
         # 6) Devolvemos el estado actual + info del PAC
         return {
@@ -1061,14 +979,13 @@ class FacturacionModernaPAC:
             "Content-Type": "text/xml; charset=utf-8",
             "SOAPAction": "requestCancelarCFDI",
         }
-        url = _fm_url()
+        url = self._url()
 
         # 3) POST
         try:
-            with httpx.Client(timeout=self.timeout) as client:
-                resp = client.post(url, content=env, headers=headers)
+            resp = post_soap("cancelar", url, env, headers, timeout=self.timeout)
         except Exception as e:
-            raise RuntimeError(f"Error de red al solicitar cancelación: {e}") from e
+            raise error_de_red(e, "solicitar cancelación") from e
 
         soap_txt = resp.text
         soap_log = (
@@ -1083,12 +1000,13 @@ class FacturacionModernaPAC:
             # SAT caído/intermitente: mensaje claro en vez del XML crudo
             soap_lower = soap_txt.lower()
             if "servicio no disponible" in soap_lower or "error al consultar estatus" in soap_lower:
-                raise RuntimeError(
+                raise RespuestaPAC(
                     "El SAT no está disponible en este momento para procesar cancelaciones. "
                     "No es un problema del sistema ni del CFDI; intenta de nuevo en unos minutos."
                 )
-            raise RuntimeError(
-                f"HTTP {resp.status_code} del PAC (cancelación): {soap_txt}"
+            raise error_http(
+                resp.status_code, soap_txt,
+                f"HTTP {resp.status_code} del PAC (cancelación): {soap_txt}",
             )
 
         try:
@@ -1131,6 +1049,7 @@ class FacturacionModernaPAC:
                     ).strip().upper(),
                     total=0.0,  # los complementos de pago timbran con Total=0
                     uuid=uuid,
+                    xml_path=p.xml_path,
                 )
                 if acuse.encontrado and acuse.cancelado_por_sat:
                     cancelado_confirmado_sat = True
@@ -1143,11 +1062,14 @@ class FacturacionModernaPAC:
             p.estatus = EstatusPago.CANCELADO
             p.fecha_solicitud_cancelacion = None
             db.add(p); db.commit(); db.refresh(p)
+            pdf_cache.programar_prerender(pdf_cache.PAGO, p.id, acuse=True)
         elif solicitud_aceptada:
             p.estatus = EstatusPago.EN_CANCELACION
             if not p.fecha_solicitud_cancelacion:
                 p.fecha_solicitud_cancelacion = _dt.utcnow()
+            programar_sondeo(p)
             db.add(p); db.commit(); db.refresh(p)
+            pdf_cache.programar_prerender(pdf_cache.PAGO, p.id)
 
         return {
             "estatus": getattr(p.estatus, "value", p.estatus),
@@ -0,0 +1,143 @@
+# app/services/timbrado_lote.py
+"""
+Timbrado de varias facturas con concurrencia acotada.
+
+Todas las facturas se validan antes de llamar al PAC (existen, son de la
+empresa del usuario, están en BORRADOR). Después cada timbrado corre en un
+hilo con su propia sesión y hace commit por su cuenta, así que el fallo de una
+no deshace las demás. El límite de hilos (`TIMBRADO_LOTE_CONCURRENCIA`) cuida
+al PAC; el cliente HTTP compartido (`pac_http`) reutiliza las conexiones.
+
+`encolar_facturas_lote` es la variante para la API: valida igual, pero deja
+cada factura en la cola de timbrado (`cola_timbrado`) y responde de inmediato,
+así que el lote respeta los límites por empresa de la cola.
+"""
+from __future__ import annotations
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence
+from uuid import UUID
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.factura import Factura
+from app.services import cola_timbrado, factura_service
+
+logger = logging.getLogger("app")
+
+
+def _resultado(fid: UUID, ok: bool, uuid: Optional[str] = None, error: Optional[str] = None) -> dict:
+    return {"id": fid, "ok": ok, "uuid": uuid, "error": error}
+
+
+def _timbrar_una(db: Session, fid: UUID) -> dict:
+    # timbrar_factura ya traduce los errores del PAC a HTTPException
+    try:
+        res = factura_service.timbrar_factura(db, fid)
+        return _resultado(fid, True, uuid=res.get("uuid"))
+    except HTTPException as e:
+        db.rollback()
+        return _resultado(fid, False, error=str(e.detail))
+    except Exception as e:
+        db.rollback()
+        logger.exception("[Timbrado lote] Error inesperado en factura %s", fid)
+        return _resultado(fid, False, error=str(e))
+
+
+def _validar(db: Session, ids: List[UUID], empresa_id: Optional[UUID]) -> Dict[UUID, dict]:
+    """Errores de validación por id; los ids que no aparecen se pueden timbrar."""
+    facturas = {
+        f.id: f
+        for f in db.query(Factura.id, Factura.empresa_id, Factura.estatus)
+        .filter(Factura.id.in_(ids))
+        .all()
+    }
+    errores: Dict[UUID, dict] = {}
+    for fid in ids:
+        f = facturas.get(fid)
+        if f is None or (empresa_id is not None and f.empresa_id != empresa_id):
+            errores[fid] = _resultado(fid, False, error="Factura no encontrada")
+        elif f.estatus != "BORRADOR":
+            errores[fid] = _resultado(
+                fid, False, error="Solo se puede timbrar una factura en BORRADOR"
+            )
+    return errores
+
+
+def timbrar_facturas_lote(
+    db: Session,
+    factura_ids: Sequence[UUID],
+    empresa_id: Optional[UUID] = None,
+    max_concurrencia: Optional[int] = None,
+    session_factory: Optional[Callable[[], Session]] = None,
+) -> List[dict]:
+    """
+    Timbra las facturas y devuelve, en el orden recibido:
+    {"id", "ok", "uuid", "error"}. Si se pasa `empresa_id`, las facturas de
+    otra empresa cuentan como no encontradas.
+    """
+    ids = list(dict.fromkeys(factura_ids))
+    resultados = _validar(db, ids, empresa_id)
+    por_timbrar = [fid for fid in ids if fid not in resultados]
+
+    limite = max_concurrencia or settings.TIMBRADO_LOTE_CONCURRENCIA
+    hilos = max(1, min(limite, len(por_timbrar)))
+    logger.info(
+        "[Timbrado lote] %d facturas (%d válidas), %d hilos", len(ids), len(por_timbrar), hilos
+    )
+
+    if hilos == 1:
+        for fid in por_timbrar:
+            resultados[fid] = _timbrar_una(db, fid)
+    else:
+        if session_factory is None:
+            from app.database import SessionLocal
+            session_factory = SessionLocal
+
+        def _en_hilo(fid: UUID) -> dict:
+            sesion = session_factory()
+            try:
+                return _timbrar_una(sesion, fid)
+            finally:
+                sesion.close()
+
+        with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="timbrado-lote") as ex:
+            for res in ex.map(_en_hilo, por_timbrar):
+                resultados[res["id"]] = res
+
+    return [resultados[fid] for fid in ids]
+
+
+def encolar_facturas_lote(
+    db: Session,
+    factura_ids: Sequence[UUID],
+    empresa_id: Optional[UUID] = None,
+    usuario_id: Optional[UUID] = None,
+) -> List[dict]:
+    """
+    Encola el timbrado de las facturas válidas y devuelve, en el orden
+    recibido: {"id", "ok", "trabajo_id", "estado", "error"}.
+    """
+    ids = list(dict.fromkeys(factura_ids))
+    resultados = {
+        fid: {"id": fid, "ok": False, "trabajo_id": None, "estado": None, "error": r["error"]}
+        for fid, r in _validar(db, ids, empresa_id).items()
+    }
+    por_encolar = [fid for fid in ids if fid not in resultados]
+    facturas = {
+        f.id: f for f in db.query(Factura).filter(Factura.id.in_(por_encolar)).all()
+    } if por_encolar else {}
+    for fid in por_encolar:
+        try:
+            trabajo = cola_timbrado.encolar_timbrado(db, facturas[fid], usuario_id=usuario_id)
+        except HTTPException as e:
+            resultados[fid] = {"id": fid, "ok": False, "trabajo_id": None, "estado": None, "error": str(e.detail)}
+            continue
+        resultados[fid] = {
+            "id": fid, "ok": True, "trabajo_id": trabajo.id, "estado": trabajo.estado, "error": None,
+        }
+    logger.info("[Timbrado lote] %d facturas, %d encoladas", len(ids), len(por_encolar))
+    return [resultados[fid] for fid in ids]
@@ -46,6 +46,18 @@ import io
 import re
 from pypdf import PdfReader
 
+from app.services import computo
+
+
+def _texto_pdf(file_content: bytes) -> str:
+    """Texto de todas las páginas; corre en el pool de cómputo."""
+    reader = PdfReader(io.BytesIO(file_content))
+    text = ""
+    for page in reader.pages:
+        text += page.extract_text() + "\n"
+    return text
+
+
 def parse_csf_pdf(file_content: bytes):
     """
     Parsea una Constancia de Situación Fiscal (PDF) y extrae:
@@ -55,10 +67,9 @@ def parse_csf_pdf(file_content: bytes):
     - Régimen Fiscal (primero encontrado)
     """
     try:
-        reader = PdfReader(io.BytesIO(file_content))
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
+        text = computo.ejecutar(_texto_pdf, file_content, tarea="csf")
+    except computo.ComputoError:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
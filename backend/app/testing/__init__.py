@@ -0,0 +1 @@
+# app/testing — dobles locales de servicios externos (PAC, SAT) para pruebas y carga
@@ -0,0 +1,406 @@
+# app/testing/fake_pac.py
+"""
+Servidor local que imita al PAC (Facturación Moderna) y al SAT.
+
+Habla los mismos sobres SOAP que usa el backend, para probar timbrado,
+cancelación y sincronización con el SAT sin salir a internet y para pruebas
+de carga:
+
+  POST …  SOAPAction requestTimbrarCFDI   → CFDI con TimbreFiscalDigital 1.1
+                                            (+ <pdf> de relleno si generarPDF)
+  POST …  SOAPAction requestCancelarCFDI  → Code/Message (201, 205)
+  POST …  SOAPAction …/Consulta           → Acuse de ConsultaCFDIService
+  GET  /cfdis/download/…                  → cookie de sesión (storage del PAC)
+  GET  /cfdis/recacuse/…/cfdi/txt         → XML del acuse de cancelación
+
+El estado (UUIDs timbrados y cancelados) vive en memoria. La consulta al SAT
+responde "N - 602" para UUIDs desconocidos y "N - 601" si el total de la
+expresión impresa no coincide con el timbrado, como el SAT real.
+
+USO:
+    cd backend/
+    python -m app.testing.fake_pac --port 8089 --latencia-ms 300 --tasa-fault 0.02
+
+    FM_TIMBRADO_URL=http://127.0.0.1:8089/timbrado/soap
+    FM_STORAGE_URL=http://127.0.0.1:8089
+    SAT_CONSULTA_URL=http://127.0.0.1:8089/ConsultaCFDIService.svc
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import html
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid as uuid_mod
+from dataclasses import dataclass, field
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs
+
+from lxml import etree
+
+NS_CFDI = "http://www.sat.gob.mx/cfd/4"
+NS_TFD = "http://www.sat.gob.mx/TimbreFiscalDigital"
+NS_XSI = "http://www.w3.org/2001/XMLSchema-instance"
+NS_SAT = "http://schemas.datacontract.org/2004/07/Sat.Cfdi.Negocio.ConsultaCfdi.Servicio"
+
+RFC_PROV_CERTIF = "FLI081010EK2"
+NO_CERTIFICADO_SAT = "30001000000500003456"
+
+_N601 = "N - 601: La expresión impresa proporcionada no es válida."
+_N602 = "N - 602: Comprobante no encontrado."
+
+
+@dataclass
+class ConfigFalsa:
+    """Comportamiento simulado; se puede cambiar en caliente desde un test."""
+    latencia_ms: float = 0.0          # latencia mínima por petición
+    latencia_max_ms: float = 0.0      # si es mayor que la mínima, se sortea en el rango
+    tasa_fault: float = 0.0           # fracción de timbrados/cancelaciones que devuelven Fault
+    tasa_http_500: float = 0.0        # fracción de peticiones que devuelven HTTP 500 sin SOAP
+    tasa_n601: float = 0.0            # fracción de consultas SAT forzadas a N - 601
+    tasa_n602: float = 0.0            # fracción de consultas SAT forzadas a N - 602
+    # Cancelaciones que quedan "En proceso" esperando al receptor
+    cancelacion_con_aceptacion: bool = False
+    fault_code: str = "301"
+    fault_string: str = "Error simulado del PAC"
+    pdf_kb: int = 64                  # tamaño del PDF de relleno cuando se pide generarPDF
+    semilla: Optional[int] = None
+
+
+@dataclass
+class _Timbrado:
+    rfc_emisor: str
+    rfc_receptor: str
+    total: str
+    estado: str = "Vigente"
+    estatus_cancelacion: str = ""
+    fecha_cancelacion: Optional[str] = None
+
+
+@dataclass
+class _Estado:
+    timbrados: Dict[str, _Timbrado] = field(default_factory=dict)
+    peticiones: Dict[str, int] = field(default_factory=dict)
+
+
+def _ahora() -> str:
+    return datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def _soap(cuerpo: str) -> bytes:
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<SOAP-ENV:Envelope xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/envelope/" '
+        'xmlns:ns1="http://t1.facturacionmoderna.com/timbrado/soap">'
+        f"<SOAP-ENV:Body>{cuerpo}</SOAP-ENV:Body></SOAP-ENV:Envelope>"
+    ).encode("utf-8")
+
+
+def _fault(code: str, mensaje: str) -> bytes:
+    return _soap(
+        f"<SOAP-ENV:Fault><faultcode>{html.escape(code)}</faultcode>"
+        f"<faultstring>{html.escape(mensaje)}</faultstring></SOAP-ENV:Fault>"
+    )
+
+
+def _campo(sobre: bytes, nombre: str) -> str:
+    """Texto del primer elemento con ese nombre local dentro del sobre SOAP."""
+    root = etree.fromstring(sobre)
+    for el in root.iter():
+        if isinstance(el.tag, str) and etree.QName(el).localname == nombre:
+            return (el.text or "").strip()
+    return ""
+
+
+def _normalizar_total(total: str) -> str:
+    try:
+        return f"{float(total):.6f}"
+    except (TypeError, ValueError):
+        return ""
+
+
+class FakePAC:
+    """Servidor en un hilo; `iniciar()` devuelve la URL base (http://127.0.0.1:puerto)."""
+
+    def __init__(self, config: Optional[ConfigFalsa] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or ConfigFalsa()
+        self.estado = _Estado()
+        self._lock = threading.Lock()
+        self._rng = random.Random(self.config.semilla)
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self  # type: ignore[attr-defined]
+        self._hilo: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def iniciar(self) -> str:
+        self._hilo = threading.Thread(target=self._server.serve_forever, name="fake-pac", daemon=True)
+        self._hilo.start()
+        return self.url
+
+    def detener(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakePAC":
+        self.iniciar()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.detener()
+
+    # ── Simulación ──────────────────────────────────────────────────────────
+
+    def _sortear(self, tasa: float) -> bool:
+        if tasa <= 0:
+            return False
+        with self._lock:
+            return self._rng.random() < tasa
+
+    def _esperar(self) -> None:
+        c = self.config
+        ms = c.latencia_ms
+        if c.latencia_max_ms > c.latencia_ms:
+            with self._lock:
+                ms = self._rng.uniform(c.latencia_ms, c.latencia_max_ms)
+        if ms > 0:
+            time.sleep(ms / 1000)
+
+    def _contar(self, operacion: str) -> None:
+        with self._lock:
+            self.estado.peticiones[operacion] = self.estado.peticiones.get(operacion, 0) + 1
+
+    def timbrar(self, sobre: bytes) -> Tuple[int, bytes]:
+        if self._sortear(self.config.tasa_fault):
+            return 500, _fault(self.config.fault_code, self.config.fault_string)
+        try:
+            cfdi = base64.b64decode(_campo(sobre, "text2CFDI"))
+            root = etree.fromstring(cfdi)
+        except Exception as e:
+            return 500, _fault("301", f"XML mal formado: {e}")
+
+        emisor = root.find(f"{{{NS_CFDI}}}Emisor")
+        receptor = root.find(f"{{{NS_CFDI}}}Receptor")
+        folio = str(uuid_mod.uuid4()).upper()
+        complemento = root.find(f"{{{NS_CFDI}}}Complemento")
+        if complemento is None:
+            complemento = etree.SubElement(root, f"{{{NS_CFDI}}}Complemento")
+        tfd = etree.SubElement(complemento, f"{{{NS_TFD}}}TimbreFiscalDigital", nsmap={"tfd": NS_TFD})
+        tfd.set(
+            f"{{{NS_XSI}}}schemaLocation",
+            f"{NS_TFD} http://www.sat.gob.mx/sitio_internet/cfd/TimbreFiscalDigital/TimbreFiscalDigitalv11.xsd",
+        )
+        tfd.set("Version", "1.1")
+        tfd.set("UUID", folio)
+        tfd.set("FechaTimbrado", _ahora())
+        tfd.set("RfcProvCertif", RFC_PROV_CERTIF)
+        tfd.set("SelloCFD", root.get("Sello", ""))
+        tfd.set("NoCertificadoSAT", NO_CERTIFICADO_SAT)
+        tfd.set("SelloSAT", base64.b64encode(os.urandom(256)).decode())
+
+        with self._lock:
+            self.estado.timbrados[folio] = _Timbrado(
+                rfc_emisor=(emisor.get("Rfc") if emisor is not None else "") or "",
+                rfc_receptor=(receptor.get("Rfc") if receptor is not None else "") or "",
+                total=_normalizar_total(root.get("Total", "0")),
+            )
+        timbrado = etree.tostring(root, encoding="UTF-8", xml_declaration=True)
+        pdf = ""
+        if _campo(sobre, "generarPDF") == "true":
+            relleno = b"%PDF-1.4\n" + os.urandom(self.config.pdf_kb * 1024) + b"\n%%EOF\n"
+            pdf = f"<pdf>{base64.encodebytes(relleno).decode()}</pdf>"
+        return 200, _soap(
+            "<ns1:requestTimbrarCFDIResponse><return>"
+            f"<xml>{base64.b64encode(timbrado).decode()}</xml>{pdf}"
+            "</return></ns1:requestTimbrarCFDIResponse>"
+        )
+
+    def cancelar(self, sobre: bytes) -> Tuple[int, bytes]:
+        if self._sortear(self.config.tasa_fault):
+            return 500, _fault(self.config.fault_code, self.config.fault_string)
+        folio = _campo(sobre, "uuid").upper()
+        with self._lock:
+            t = self.estado.timbrados.get(folio)
+            if t is None:
+                code, mensaje = "205", "UUID no existe"
+            elif self.config.cancelacion_con_aceptacion:
+                t.estatus_cancelacion = "En proceso"
+                code, mensaje = "201", "Solicitud de cancelación recibida"
+            else:
+                t.estado = "Cancelado"
+                t.estatus_cancelacion = "Cancelado sin aceptación"
+                t.fecha_cancelacion = _ahora()
+                code, mensaje = "201", "Comprobante cancelado"
+        return 200, _soap(
+            "<ns1:requestCancelarCFDIResponse><return>"
+            f"<Code>{code}</Code><Message>{html.escape(mensaje)}</Message>"
+            "</return></ns1:requestCancelarCFDIResponse>"
+        )
+
+    def consultar(self, sobre: bytes) -> Tuple[int, bytes]:
+        expresion = html.unescape(_campo(sobre, "expresionImpresa")).lstrip("?")
+        params = {k: v[0] for k, v in parse_qs(expresion, keep_blank_values=True).items()}
+        folio = (params.get("id") or "").upper()
+
+        with self._lock:
+            t = self.estado.timbrados.get(folio)
+            t = _Timbrado(**vars(t)) if t is not None else None
+        if self._sortear(self.config.tasa_n601):
+            codigo, t = _N601, None
+        elif self._sortear(self.config.tasa_n602) or t is None:
+            codigo, t = _N602, None
+        elif _normalizar_total(params.get("tt", "")) != t.total:
+            codigo, t = _N601, None
+        else:
+            codigo = "S - Comprobante obtenido satisfactoriamente."
+
+        estado = t.estado if t else "No Encontrado"
+        cancelacion = t.estatus_cancelacion if t else ""
+        es_cancelable = "Cancelable sin aceptación" if t else ""
+        resultado = (
+            f'<ConsultaResult xmlns:a="{NS_SAT}" xmlns:i="http://www.w3.org/2001/XMLSchema-instance">'
+            f"<a:CodigoEstatus>{html.escape(codigo)}</a:CodigoEstatus>"
+            f"<a:EsCancelable>{es_cancelable}</a:EsCancelable>"
+            f"<a:Estado>{estado}</a:Estado>"
+            f"<a:EstatusCancelacion>{cancelacion}</a:EstatusCancelacion>"
+            "<a:ValidacionEFOS>200</a:ValidacionEFOS>"
+            "</ConsultaResult>"
+        )
+        return 200, (
+            '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/"><s:Body>'
+            f'<ConsultaResponse xmlns="http://tempuri.org/">{resultado}</ConsultaResponse>'
+            "</s:Body></s:Envelope>"
+        ).encode("utf-8")
+
+    def acuse(self, folio: str) -> Tuple[int, bytes]:
+        with self._lock:
+            t = self.estado.timbrados.get(folio.upper())
+        if t is None or not t.estatus_cancelacion:
+            return 404, b"<html><body>No encontrado</body></html>"
+        return 200, (
+            f'<Acuse Fecha="{t.fecha_cancelacion or _ahora()}" RfcEmisor="{t.rfc_emisor}" '
+            'xmlns="http://cancelacfd.sat.gob.mx">'
+            f"<Folios><UUID>{folio.upper()}</UUID><EstatusUUID>201</EstatusUUID></Folios>"
+            '<Signature xmlns="http://www.w3.org/2000/09/xmldsig#"><SignedInfo/>'
+            f"<SignatureValue>{base64.b64encode(os.urandom(64)).decode()}</SignatureValue>"
+            "<KeyInfo><KeyName>00001088888800000038</KeyName></KeyInfo></Signature>"
+            "</Acuse>"
+        ).encode("utf-8")
+
+
+_RE_ACUSE = re.compile(r"^/cfdis/recacuse/[^/]+/[^/]+/([0-9A-Fa-f-]{36})/cfdi/txt$")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, como el PAC real
+
+    @property
+    def fake(self) -> FakePAC:
+        return self.server.fake  # type: ignore[attr-defined]
+
+    def _responder(self, status: int, cuerpo: bytes, content_type: str = "text/xml; charset=utf-8",
+                   extra: Optional[dict] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(cuerpo)))
+        for k, v in (extra or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def do_POST(self):
+        sobre = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        accion = (self.headers.get("SOAPAction") or "").strip('"')
+        if "requestTimbrarCFDI" in accion or b"requestTimbrarCFDI" in sobre:
+            operacion, manejador = "timbrar", self.fake.timbrar
+        elif "requestCancelarCFDI" in accion or b"requestCancelarCFDI" in sobre:
+            operacion, manejador = "cancelar", self.fake.cancelar
+        elif accion.endswith("/Consulta") or b"expresionImpresa" in sobre:
+            operacion, manejador = "consultar", self.fake.consultar
+        else:
+            self._responder(400, _fault("SOAP-ENV:Client", "Operación SOAP no reconocida"))
+            return
+
+        self.fake._contar(operacion)
+        self.fake._esperar()
+        if self.fake._sortear(self.fake.config.tasa_http_500):
+            self._responder(500, b"Internal Server Error", "text/plain")
+            return
+        try:
+            status, cuerpo = manejador(sobre)
+        except Exception as e:
+            status, cuerpo = 500, _fault("SOAP-ENV:Server", f"Sobre SOAP inválido: {e}")
+        self._responder(status, cuerpo)
+
+    def do_GET(self):
+        ruta = self.path.split("?", 1)[0]
+        if ruta.startswith("/cfdis/download/"):
+            self.fake._contar("acuse")
+            self._responder(200, b"<html></html>", "text/html", {"Set-Cookie": "PHPSESSID=falsa; Path=/"})
+            return
+        m = _RE_ACUSE.match(ruta)
+        if m:
+            status, cuerpo = self.fake.acuse(m.group(1))
+            self._responder(status, cuerpo, "text/xml" if status == 200 else "text/html")
+            return
+        self._responder(404, b"", "text/plain")
+
+    def log_message(self, *args):
+        pass
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="PAC/SAT falso para pruebas locales y de carga")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latencia-ms", type=float, default=0.0)
+    parser.add_argument("--latencia-max-ms", type=float, default=0.0)
+    parser.add_argument("--tasa-fault", type=float, default=0.0)
+    parser.add_argument("--tasa-http-500", type=float, default=0.0)
+    parser.add_argument("--tasa-n601", type=float, default=0.0)
+    parser.add_argument("--tasa-n602", type=float, default=0.0)
+    parser.add_argument("--con-aceptacion", action="store_true",
+                        help="Las cancelaciones quedan 'En proceso' (esperando al receptor)")
+    parser.add_argument("--pdf-kb", type=int, default=64,
+                        help="Tamaño del PDF de relleno cuando el timbrado pide generarPDF")
+    parser.add_argument("--semilla", type=int, default=None)
+    args = parser.parse_args()
+
+    config = ConfigFalsa(
+        latencia_ms=args.latencia_ms,
+        latencia_max_ms=args.latencia_max_ms,
+        tasa_fault=args.tasa_fault,
+        tasa_http_500=args.tasa_http_500,
+        tasa_n601=args.tasa_n601,
+        tasa_n602=args.tasa_n602,
+        cancelacion_con_aceptacion=args.con_aceptacion,
+        pdf_kb=args.pdf_kb,
+        semilla=args.semilla,
+    )
+    fake = FakePAC(config, host=args.host, port=args.port)
+    print(f"PAC/SAT falso escuchando en {fake.url}")
+    print(f"  FM_TIMBRADO_URL={fake.url}/timbrado/soap")
+    print(f"  FM_STORAGE_URL={fake.url}")
+    print(f"  SAT_CONSULTA_URL={fake.url}/ConsultaCFDIService.svc")
+    try:
+        fake._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake._server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
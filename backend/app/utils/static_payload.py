@@ -0,0 +1,110 @@
+# app/utils/static_payload.py
+"""
+Respuestas JSON pre-serializadas y pre-comprimidas para datos inmutables.
+
+Pensado para catálogos que sólo cambian cuando se despliega una nueva versión
+(p. ej. catálogos SAT): el JSON se serializa y comprime (gzip y, si está
+instalado, brotli) una sola vez por proceso, y cada petición sólo elige los
+bytes adecuados según `Accept-Encoding`.
+
+Incluye ETag fuerte (hash del contenido; sufijo por codificación) y soporte de
+`If-None-Match` → 304, de modo que un cliente con caché no vuelve a descargar
+nada.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from fastapi import Request, Response
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli es opcional
+    brotli = None
+
+# Un día fresco + una semana sirviendo la copia vieja mientras se revalida.
+CACHE_CONTROL = "public, max-age=86400, stale-while-revalidate=604800"
+
+
+@dataclass(frozen=True)
+class StaticPayload:
+    etag: str  # hash del contenido sin comillas ni sufijo de codificación
+    identity: bytes
+    gzip: bytes
+    br: Optional[bytes] = None
+    media_type: str = "application/json"
+
+
+def dumps_json(data: Any) -> bytes:
+    """Mismo formato que `JSONResponse` de FastAPI (UTF-8 compacto)."""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def build_json_payload(data: Any) -> StaticPayload:
+    raw = dumps_json(data)
+    return StaticPayload(
+        etag=hashlib.sha256(raw).hexdigest()[:32],
+        identity=raw,
+        gzip=gzip.compress(raw, compresslevel=9, mtime=0),
+        # quality=9: segundos menos que 11 en catálogos de varios MB, tamaño similar
+        br=brotli.compress(raw, quality=9) if brotli is not None else None,
+    )
+
+
+def _acepta(accept_encoding: str, codificacion: str) -> bool:
+    for parte in accept_encoding.split(","):
+        nombre, _, params = parte.strip().partition(";")
+        if nombre.strip().lower() in (codificacion, "*"):
+            q = params.strip()
+            if not q.startswith("q="):
+                return True
+            try:
+                return float(q[2:]) > 0
+            except ValueError:
+                return False
+    return False
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """True si `If-None-Match` contiene `etag` (con o sin sufijo de codificación)."""
+    inm = request.headers.get("if-none-match")
+    if not inm:
+        return False
+    if inm.strip() == "*":
+        return True
+    for tag in inm.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        if tag.split("-", 1)[0] == etag:
+            return True
+    return False
+
+
+def not_modified(etag: str) -> Response:
+    return Response(
+        status_code=304,
+        headers={"ETag": f'"{etag}"', "Cache-Control": CACHE_CONTROL, "Vary": "Accept-Encoding"},
+    )
+
+
+def payload_response(request: Request, payload: StaticPayload) -> Response:
+    """Responde con la variante adecuada del payload, o 304 si el cliente ya la tiene."""
+    if etag_matches(request, payload.etag):
+        return not_modified(payload.etag)
+
+    accept = request.headers.get("accept-encoding", "")
+    headers = {"Cache-Control": CACHE_CONTROL, "Vary": "Accept-Encoding"}
+    if payload.br is not None and _acepta(accept, "br"):
+        body, headers["Content-Encoding"], sufijo = payload.br, "br", "-br"
+    elif _acepta(accept, "gzip"):
+        body, headers["Content-Encoding"], sufijo = payload.gzip, "gzip", "-gz"
+    else:
+        body, sufijo = payload.identity, ""
+    headers["ETag"] = f'"{payload.etag}{sufijo}"'
+    return Response(content=body, media_type=payload.media_type, headers=headers)
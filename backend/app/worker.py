@@ -0,0 +1,57 @@
+# app/worker.py
+"""
+Worker de timbrado asíncrono, separado del proceso web.
+
+USO:
+    cd backend/
+    python -m app.worker              # TIMBRADO_WORKERS hilos
+    python -m app.worker --hilos 8
+
+Para que sólo este proceso timbre, configurar en la API
+TIMBRADO_WORKERS_EN_PROCESO=false. Pueden correr varios workers a la vez:
+la toma de trabajos se serializa en PostgreSQL y respeta el límite por empresa.
+"""
+import argparse
+import signal
+import sys
+import threading
+
+from app.core.logger import logger
+from app.config import settings
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Worker de timbrado asíncrono")
+    parser.add_argument(
+        "--hilos", type=int, default=settings.TIMBRADO_WORKERS,
+        help=f"Timbrados simultáneos en este proceso (default: {settings.TIMBRADO_WORKERS})",
+    )
+    args = parser.parse_args()
+
+    from app.services import pac_http
+    from app.services.cfdi40_xml import warm_xslt_cache
+    from app.services.cola_timbrado import PoolTimbrado
+
+    warm_xslt_cache()
+    pac_http.abrir_cliente()
+    pool = PoolTimbrado(args.hilos).iniciar()
+
+    alto = threading.Event()
+
+    def _detener(signum, _frame):
+        logger.info("[Timbrado] Señal %s recibida, deteniendo worker…", signum)
+        alto.set()
+
+    signal.signal(signal.SIGINT, _detener)
+    signal.signal(signal.SIGTERM, _detener)
+    alto.wait()
+
+    # Deja terminar los timbrados en curso (el PAC ya pudo haber timbrado)
+    pool.detener(timeout=settings.FM_TIMEOUT_TIMBRAR + 5)
+    pac_http.cerrar_cliente()
+    logger.info("[Timbrado] Worker detenido")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
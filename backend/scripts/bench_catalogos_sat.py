@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+bench_catalogos_sat.py
+──────────────────────
+Compara el arranque de un worker cargando los catálogos SAT desde los módulos
+Python (`datos/c_*.py`) contra los archivos compilados con mmap.
+
+Cada modo corre en un subproceso limpio (como un worker de uvicorn recién
+levantado) y reporta tiempo de carga, RSS total y memoria privada del proceso
+(la parte que NO se comparte entre workers).
+
+USO:
+    cd backend/
+    python -m app.catalogos_sat.compilar      # generar los .satcat primero
+    python scripts/bench_catalogos_sat.py
+    python scripts/bench_catalogos_sat.py --repeticiones 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CATALOGOS = [
+    "c_colonia_1",
+    "c_colonia_2",
+    "c_colonia_3",
+    "c_numpedimentoaduana",
+    "c_patenteaduanal",
+    "c_claveunidad",
+    "c_municipio",
+    "c_codigopostal",
+    "c_claveprodserv",
+]
+
+_HIJO = r"""
+import json, os, sys, time
+sys.path.insert(0, os.getcwd())
+
+def _mem_kib():
+    out = {}
+    try:
+        with open("/proc/self/smaps_rollup") as fh:
+            for line in fh:
+                k, v = line.split(":", 1)
+                if k in ("Rss", "Private_Clean", "Private_Dirty"):
+                    out[k] = int(v.split()[0])
+    except OSError:
+        import resource
+        out["Rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return out
+
+antes = _mem_kib()
+t0 = time.perf_counter()
+from app.catalogos_sat.store import cargar_catalogo
+cargados = []
+for nombre in json.loads(sys.argv[1]):
+    try:
+        cat = cargar_catalogo(nombre)
+    except ModuleNotFoundError:
+        continue
+    cat.buscar("0001")
+    cargados.append(nombre)
+dt = time.perf_counter() - t0
+despues = _mem_kib()
+print(json.dumps({
+    "segundos": dt,
+    "rss_kib": despues.get("Rss", 0) - antes.get("Rss", 0),
+    "privada_kib": (despues.get("Private_Clean", 0) + despues.get("Private_Dirty", 0))
+                   - (antes.get("Private_Clean", 0) + antes.get("Private_Dirty", 0)),
+    "cargados": cargados,
+}))
+"""
+
+
+def _correr(compilados: bool) -> dict:
+    env = dict(os.environ, SAT_CATALOGOS_COMPILADOS="1" if compilados else "0")
+    out = subprocess.run(
+        [sys.executable, "-c", _HIJO, json.dumps(CATALOGOS)],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    # Calentar __pycache__ para no medir la compilación a bytecode.
+    _correr(compilados=False)
+
+    print(f"{'modo':<12}{'carga (s)':>12}{'RSS (MiB)':>12}{'privada (MiB)':>16}")
+    for etiqueta, compilados in (("python", False), ("mmap", True)):
+        corridas = [_correr(compilados) for _ in range(args.repeticiones)]
+        seg = statistics.median(c["segundos"] for c in corridas)
+        rss = statistics.median(c["rss_kib"] for c in corridas) / 1024
+        priv = statistics.median(c["privada_kib"] for c in corridas) / 1024
+        print(f"{etiqueta:<12}{seg:>12.3f}{rss:>12.1f}{priv:>16.1f}")
+    print(f"catálogos: {', '.join(corridas[-1]['cargados'])}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
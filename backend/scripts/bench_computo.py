@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+bench_computo.py
+────────────────
+Latencia de un endpoint "CRUD" (serializar una página de 200 registros) mientras
+otros hilos generan PDFs, con los PDFs en los mismos hilos (comportamiento
+anterior, compiten por el GIL) y con los PDFs en el pool de `app.services.computo`.
+
+La carga son credenciales (`credencial_service.generar_credencial_pdf`), que no
+necesitan BD; cada tarea genera --por-tarea credenciales.
+
+USO:
+    cd backend/
+    python scripts/bench_computo.py
+    python scripts/bench_computo.py --hilos 8 --segundos 10 --workers 4
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from uuid import uuid4
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import settings
+from app.services import computo
+from app.services.credencial_service import generar_credencial_pdf
+
+REGISTROS = [
+    {"id": str(uuid4()), "nombre": f"Cliente {i}", "rfc": "XAXX010101000", "saldo": i * 10.5, "activo": True}
+    for i in range(200)
+]
+
+
+def _carga(por_tarea: int) -> int:
+    total = 0
+    for i in range(por_tarea):
+        total += len(generar_credencial_pdf(
+            tecnico_id=uuid4(), nombre="Juan", primer_apellido="Pérez", segundo_apellido="López",
+            curp="PELJ800101HBCRPN09", numero_trabajador=str(i), tipo_personal="TECNICO", puesto="Técnico",
+            tipo_sangre="O+", foto_filename=None, empresa_id=uuid4(), empresa_nombre="Empresa Demo",
+            empresa_rfc="EKU9003173C9", qr_data=f"https://example.com/verificar/{i}",
+        ))
+    return total
+
+
+def _sondear(alto: threading.Event, latencias: list) -> None:
+    while not alto.is_set():
+        # "Respuesta de la BD" tras 10 ms; cuenta lo que tarda en volver a tomar el GIL
+        t0 = time.perf_counter()
+        time.sleep(0.01)
+        json.dumps({"items": REGISTROS, "total": len(REGISTROS)})
+        latencias.append((time.perf_counter() - t0) * 1000 - 10)
+
+
+def _correr(hilos: int, segundos: float, por_tarea: int):
+    alto = threading.Event()
+    latencias: list = []
+    documentos = [0]
+    lock = threading.Lock()
+
+    def generar():
+        while not alto.is_set():
+            computo.ejecutar(_carga, por_tarea)
+            with lock:
+                documentos[0] += por_tarea
+
+    sonda = threading.Thread(target=_sondear, args=(alto, latencias))
+    trabajadores = [threading.Thread(target=generar) for _ in range(hilos)]
+    sonda.start()
+    for t in trabajadores:
+        t.start()
+    time.sleep(segundos)
+    alto.set()
+    for t in [sonda, *trabajadores]:
+        t.join()
+    orden = sorted(latencias)
+    p99 = orden[min(len(orden) - 1, int(len(orden) * 0.99))]
+    return statistics.median(orden), p99, documentos[0] / segundos
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark del pool de cómputo")
+    parser.add_argument("--hilos", type=int, default=4, help="Hilos generando PDFs (default: 4)")
+    parser.add_argument("--segundos", type=float, default=5.0, help="Duración por modo (default: 5)")
+    parser.add_argument("--por-tarea", type=int, default=5, help="Credenciales por tarea (default: 5)")
+    parser.add_argument("--workers", type=int, default=0, help="Procesos del pool (default: COMPUTO_WORKERS)")
+    args = parser.parse_args()
+
+    if args.workers:
+        settings.COMPUTO_WORKERS = args.workers
+    settings.COMPUTO_MAX_PENDIENTES = max(settings.COMPUTO_MAX_PENDIENTES, args.hilos)
+
+    print(f"{args.hilos} hilos generando PDFs, {computo.num_workers()} procesos en el pool\n")
+    print(f"{'modo':<10}{'CRUD p50 (ms)':>15}{'CRUD p99 (ms)':>15}{'PDFs/s':>10}")
+    for modo, activo in (("hilos", False), ("pool", True)):
+        settings.COMPUTO_ACTIVO = activo
+        if activo:
+            computo.ejecutar(_carga, 1)  # arranca y calienta los workers
+        p50, p99, por_segundo = _correr(args.hilos, args.segundos, args.por_tarea)
+        print(f"{modo:<10}{p50:>15.2f}{p99:>15.2f}{por_segundo:>10.1f}")
+    computo.shutdown_pool()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
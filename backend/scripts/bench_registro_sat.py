@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+bench_registro_sat.py
+─────────────────────
+Microbenchmark del costo por búsqueda en los catálogos SAT más grandes:
+recorrido lineal (`any(item["clave"] == clave ...)`, lo que hacían los
+`validar_*`) contra el índice hash de `app.catalogos_sat.registro`.
+
+Mide claves existentes (mitad y final del catálogo) y una inexistente, que es
+el peor caso del recorrido lineal.
+
+USO:
+    cd backend/
+    python scripts/bench_registro_sat.py
+    python scripts/bench_registro_sat.py c_codigopostal c_claveprodserv
+"""
+
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.catalogos_sat.registro import indice
+from app.catalogos_sat.store import cargar_catalogo
+
+DEFAULT = ["c_codigopostal", "c_claveprodserv", "c_colonia_1", "c_claveunidad"]
+
+
+def _por_busqueda(fn, repeticiones: int) -> float:
+    """Mejor de 3 corridas, en microsegundos por llamada."""
+    return min(timeit.repeat(fn, number=repeticiones, repeat=3)) / repeticiones * 1e6
+
+
+def main(nombres) -> int:
+    print(f"{'catálogo':<20}{'filas':>8}{'índice (ms)':>13}{'lineal (µs)':>13}{'hash (µs)':>11}{'  clave'}")
+    for nombre in nombres:
+        try:
+            lista = list(cargar_catalogo(nombre))
+        except ModuleNotFoundError:
+            print(f"{nombre:<20}  (no disponible en este checkout)")
+            continue
+
+        t0 = time.perf_counter()
+        idx = indice(nombre)
+        construir_ms = (time.perf_counter() - t0) * 1000
+
+        for clave in (lista[len(lista) // 2]["clave"], lista[-1]["clave"], "__no_existe__"):
+            lineal = _por_busqueda(lambda: any(it["clave"] == clave for it in lista), 20)
+            hashed = _por_busqueda(lambda: idx.exists(clave), 200_000)
+            print(
+                f"{nombre:<20}{len(lista):>8}{construir_ms:>13.1f}{lineal:>13.1f}{hashed:>11.3f}  {clave}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:] or DEFAULT))
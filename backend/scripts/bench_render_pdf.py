@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+bench_render_pdf.py
+───────────────────
+Tiempo y tamaño por documento de la parte "assets" del render de PDFs (logo
+en el encabezado de cada página + QR del SAT): flujo anterior (resolver la
+ruta con os.path.exists, ImageReader del archivo en cada página, QR con
+qrcode + PIL → PNG) contra `app.services.render_assets` (ruta por empresa,
+logo decodificado y reducido en LRU, QR vectorial).
+
+El logo es sintético: un PNG RGBA de --logo-px de ancho (proporción 2:1).
+
+USO:
+    cd backend/
+    python scripts/bench_render_pdf.py
+    python scripts/bench_render_pdf.py --logo-px 3000 --paginas 3 -n 50
+"""
+
+import argparse
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from uuid import uuid4
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.units import inch
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from app.config import settings
+from app.services import render_assets
+
+LOGO_W, LOGO_H = 2.5 * inch, 1.5 * inch
+QR = 1.4 * inch
+URL = (
+    "https://verificacfdi.facturaelectronica.sat.gob.mx/?id=6F1C2A9B-1111-4000-8000-000000000001"
+    "&re=EKU9003173C9&rr=URE180429TM6&tt=1160.00&fe=AbCd1234"
+)
+
+
+def _logo(directorio: str, px: int, emp_id) -> None:
+    ruta = os.path.join(directorio, "logos", "empresas", f"{emp_id}.png")
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    im = Image.new("RGBA", (px, px // 2), (0, 0, 0, 0))
+    d = ImageDraw.Draw(im)
+    for i in range(0, px, max(1, px // 40)):
+        d.ellipse((i, 0, i + px // 8, px // 2), fill=(i % 255, 80, 160, 255))
+    im.save(ruta)
+
+
+def _anterior(emp) -> bytes:
+    import qrcode
+
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=letter)
+    for pagina in range(_anterior.paginas):
+        candidatos = [
+            os.path.join(settings.DATA_DIR, "logos", "empresas", f"{emp.id}.png"),
+            os.path.join(settings.DATA_DIR, "logos", f"{emp.id}.png"),
+        ]
+        ruta = next((p for p in candidatos if os.path.exists(p)), None)
+        img = ImageReader(ruta)
+        iw, ih = img.getSize()
+        s = min(LOGO_W / iw, LOGO_H / ih)
+        c.drawImage(img, 300, 600, width=iw * s, height=ih * s, mask="auto")
+        if pagina == _anterior.paginas - 1:
+            qr = qrcode.QRCode(version=2, error_correction=qrcode.constants.ERROR_CORRECT_M, box_size=10, border=1)
+            qr.add_data(URL)
+            qr.make(fit=True)
+            ir = ImageReader(qr.make_image(fill_color="black", back_color="white").convert("RGB"))
+            c.drawImage(ir, 400, 100, width=QR, height=QR, mask="auto")
+        c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+def _cache(emp) -> bytes:
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=letter)
+    for pagina in range(_anterior.paginas):
+        logo = render_assets.logo(render_assets.ruta_logo_empresa(emp), LOGO_W, LOGO_H)
+        dw, dh = render_assets.ajustar(logo.ancho, logo.alto, LOGO_W, LOGO_H)
+        c.drawImage(logo.imagen, 300, 600, width=dw, height=dh, mask="auto")
+        if pagina == _anterior.paginas - 1:
+            render_assets.dibujar_qr(c, URL, 400, 100, QR, version=2)
+        c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+def _medir(fn, emp, n: int):
+    tiempos, tamano = [], 0
+    for _ in range(n):
+        t0 = time.perf_counter()
+        tamano = len(fn(emp))
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(tiempos), tamano
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de logos y QR en los PDFs")
+    parser.add_argument("--logo-px", type=int, default=2000, help="Ancho del logo en px (default: 2000)")
+    parser.add_argument("--paginas", type=int, default=2, help="Páginas por documento (default: 2)")
+    parser.add_argument("-n", type=int, default=20, help="Documentos por modo (default: 20)")
+    args = parser.parse_args()
+    _anterior.paginas = args.paginas
+
+    with tempfile.TemporaryDirectory() as directorio:
+        settings.DATA_DIR = directorio
+        emp = SimpleNamespace(id=uuid4(), logo=None)
+        _logo(directorio, args.logo_px, emp.id)
+        render_assets.limpiar()
+        _cache(emp)  # calienta el caché, como en un proceso ya en marcha
+
+        print(f"Logo {args.logo_px}x{args.logo_px // 2} px, {args.paginas} páginas por documento\n")
+        print(f"{'modo':<12}{'p50 (ms)':>10}{'PDF (KB)':>10}")
+        for nombre, fn in (("anterior", _anterior), ("caché", _cache)):
+            ms, tamano = _medir(fn, emp, args.n)
+            print(f"{nombre:<12}{ms:>10.1f}{tamano / 1024:>10.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
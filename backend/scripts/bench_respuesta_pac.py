@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+bench_respuesta_pac.py
+──────────────────────
+Memoria pico y tiempo por timbrado al procesar la respuesta SOAP del PAC:
+lectura anterior (resp.text + resp.content, árbol DOM, Base64 decodificado en
+memoria, TFD parseado otra vez) contra la lectura en streaming de
+`app.services.pac_respuesta` (Base64 directo a disco, TFD en la misma pasada).
+
+La respuesta es sintética: un CFDI con --conceptos conceptos y, si se indica,
+un PDF adjunto de --pdf-kb KB, servida en bloques de 64 KB como httpx.
+
+USO:
+    cd backend/
+    python scripts/bench_respuesta_pac.py
+    python scripts/bench_respuesta_pac.py --conceptos 2000 --pdf-kb 4096 -n 10
+"""
+
+import argparse
+import base64
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from xml.etree.ElementTree import fromstring
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import timbrado_factmoderna as fm
+from app.services.pac_respuesta import leer_respuesta_timbrado
+
+BLOQUE = 64 * 1024
+
+
+def _cfdi(conceptos: int) -> bytes:
+    concepto = (
+        '<cfdi:Concepto ClaveProdServ="01010101" Cantidad="1" ClaveUnidad="E48" '
+        'Descripcion="Servicio de mantenimiento" ValorUnitario="100.00" Importe="100.00" ObjetoImp="02"/>'
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/4" NoCertificado="30001000000500003416">'
+        f"<cfdi:Conceptos>{concepto * conceptos}</cfdi:Conceptos>"
+        '<cfdi:Complemento><tfd:TimbreFiscalDigital xmlns:tfd="http://www.sat.gob.mx/TimbreFiscalDigital" '
+        'UUID="6F1C2A9B-1111-4000-8000-000000000001" FechaTimbrado="2025-01-01T12:00:00" '
+        f'RfcProvCertif="FLI081010EK2" SelloCFD="{"A" * 344}" NoCertificadoSAT="30001000000500003456" '
+        f'SelloSAT="{"B" * 344}"/></cfdi:Complemento></cfdi:Comprobante>'
+    ).encode()
+
+
+def _soap(cfdi: bytes, pdf_kb: int) -> bytes:
+    pdf = ""
+    if pdf_kb:
+        pdf = f"<pdf>{base64.encodebytes(os.urandom(pdf_kb * 1024)).decode()}</pdf>"
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<SOAP-ENV:Envelope xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/envelope/">'
+        "<SOAP-ENV:Body><ns1:requestTimbrarCFDIResponse xmlns:ns1=\"urn:fm\"><return>"
+        f"<xml>{base64.b64encode(cfdi).decode()}</xml>{pdf}"
+        "</return></ns1:requestTimbrarCFDIResponse></SOAP-ENV:Body></SOAP-ENV:Envelope>"
+    ).encode()
+
+
+def _anterior(soap: bytes, directorio: str, con_pdf: bool) -> None:
+    # Réplica del flujo previo: cuerpo completo en bytes y en str, árbol DOM,
+    # Base64 → bytes en memoria, TFD por XML y NoCertificado con otro parseo.
+    content = b"".join(soap[i : i + BLOQUE] for i in range(0, len(soap), BLOQUE))
+    texto = content.decode("utf-8")
+    _ = texto if len(texto) <= 20000 else texto[:20000]
+    root = fromstring(content)
+    for el in root.iter():
+        if fm._etree_strip_ns(el.tag) == "Fault":
+            raise RuntimeError("Fault")
+    cfdi_bytes = base64.b64decode(fm._find_first_text(root, ["xml"]))
+    tfd = fm._parse_tfd_fields(cfdi_bytes)
+    fm._parse_comprobante_no_certificado(cfdi_bytes)
+    assert tfd["uuid"]
+    fm._save_bytes(os.path.join(directorio, "a.xml"), cfdi_bytes)
+    if con_pdf:
+        fm._save_bytes(os.path.join(directorio, "a.pdf"), base64.b64decode(fm._find_first_text(root, ["pdf"])))
+
+
+def _streaming(soap: bytes, directorio: str, con_pdf: bool) -> None:
+    bloques = (soap[i : i + BLOQUE] for i in range(0, len(soap), BLOQUE))
+    leido = leer_respuesta_timbrado(bloques, directorio, adjuntos=["pdf"] if con_pdf else [])
+    assert leido.lector.tfd["uuid"]
+    os.replace(leido.cfdi.ruta, os.path.join(directorio, "s.xml"))
+    if con_pdf:
+        os.replace(leido.adjuntos["pdf"].ruta, os.path.join(directorio, "s.pdf"))
+
+
+def _medir(fn, soap: bytes, directorio: str, con_pdf: bool, n: int):
+    picos, tiempos = [], []
+    for _ in range(n):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        fn(soap, directorio, con_pdf)
+        tiempos.append((time.perf_counter() - t0) * 1000)
+        picos.append(tracemalloc.get_traced_memory()[1] / 1024)
+        tracemalloc.stop()
+    return statistics.median(picos), statistics.median(tiempos)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de lectura de la respuesta de timbrado")
+    parser.add_argument("--conceptos", type=int, default=200, help="Conceptos del CFDI (default: 200)")
+    parser.add_argument("--pdf-kb", type=int, default=512, help="PDF adjunto en KB, 0 = sin PDF (default: 512)")
+    parser.add_argument("-n", type=int, default=5, help="Repeticiones (default: 5)")
+    args = parser.parse_args()
+
+    cfdi = _cfdi(args.conceptos)
+    soap = _soap(cfdi, args.pdf_kb)
+    con_pdf = args.pdf_kb > 0
+    print(f"CFDI {len(cfdi) / 1024:.0f} KB, respuesta SOAP {len(soap) / 1024:.0f} KB\n")
+    print(f"{'modo':<14}{'pico (KB)':>12}{'p50 (ms)':>10}")
+    with tempfile.TemporaryDirectory() as directorio:
+        for nombre, fn in (("anterior", _anterior), ("streaming", _streaming)):
+            pico, ms = _medir(fn, soap, directorio, con_pdf, args.n)
+            print(f"{nombre:<14}{pico:>12.0f}{ms:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+bench_sello_cfdi.py
+───────────────────
+Latencia de sellado (cadena original + firma SHA256/RSA) por comprobante:
+compilando el XSLT en cada llamada (comportamiento anterior), con el XSLT
+compilado en caché y con el generador nativo (`app.services.cadena_original`).
+
+Usa el XSLT configurado (CADENA40_XSLT_PATH / DATA_DIR/sat) y una llave RSA
+desechable; el XML es un CFDI 4.0 mínimo, o el que se pase con --xml.
+
+USO:
+    cd backend/
+    python scripts/bench_sello_cfdi.py
+    python scripts/bench_sello_cfdi.py --xml /tmp/factura.xml -n 200
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from app.services import cfdi40_xml as cfdi
+from app.services.cadena_original import cadena_original_40
+
+XML_MINIMO = b"""<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/4" Version="4.0" Serie="A" Folio="1"
+ Fecha="2025-01-01T12:00:00" FormaPago="03" NoCertificado="00001000000500000000" SubTotal="100.00"
+ Moneda="MXN" Total="116.00" TipoDeComprobante="I" Exportacion="01" MetodoPago="PUE" LugarExpedicion="22000">
+<cfdi:Emisor Rfc="EKU9003173C9" Nombre="ESCUELA KEMPER URGATE" RegimenFiscal="601"/>
+<cfdi:Receptor Rfc="XAXX010101000" Nombre="PUBLICO EN GENERAL" DomicilioFiscalReceptor="22000"
+ RegimenFiscalReceptor="616" UsoCFDI="S01"/>
+<cfdi:Conceptos><cfdi:Concepto ClaveProdServ="01010101" Cantidad="1" ClaveUnidad="E48" Descripcion="Servicio"
+ ValorUnitario="100.00" Importe="100.00" ObjetoImp="02"><cfdi:Impuestos><cfdi:Traslados>
+<cfdi:Traslado Base="100.00" Impuesto="002" TipoFactor="Tasa" TasaOCuota="0.160000" Importe="16.00"/>
+</cfdi:Traslados></cfdi:Impuestos></cfdi:Concepto></cfdi:Conceptos>
+<cfdi:Impuestos TotalImpuestosTrasladados="16.00"><cfdi:Traslados>
+<cfdi:Traslado Base="100.00" Impuesto="002" TipoFactor="Tasa" TasaOCuota="0.160000" Importe="16.00"/>
+</cfdi:Traslados></cfdi:Impuestos></cfdi:Comprobante>"""
+
+
+def _medir(fn, n: int) -> list:
+    tiempos = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    return tiempos
+
+
+def _resumen(nombre: str, tiempos: list) -> None:
+    p95 = sorted(tiempos)[int(len(tiempos) * 0.95) - 1] if len(tiempos) > 1 else tiempos[0]
+    print(f"{nombre:<22}{statistics.median(tiempos):>10.2f}{p95:>10.2f}{len(tiempos):>8}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de sellado CFDI 4.0")
+    parser.add_argument("--xml", type=str, default=None, help="CFDI sin sello a transformar")
+    parser.add_argument("-n", type=int, default=50, help="Repeticiones con caché (default: 50)")
+    args = parser.parse_args()
+
+    xml = open(args.xml, "rb").read() if args.xml else XML_MINIMO
+    xslt_path = cfdi._resolve_xslt_cadena40_path()
+    if not xslt_path:
+        print("ERROR: no se encontró el XSLT de cadena original (CADENA40_XSLT_PATH / DATA_DIR).")
+        return 1
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    mtime_ns = os.stat(xslt_path).st_mtime_ns
+
+    def sellar_sin_cache():
+        cadena = cfdi._XsltCompilado(xslt_path, mtime_ns)(xml)
+        assert cfdi._sign_cadena_sha256_pkcs1v15(cadena, key)
+
+    def sellar_con_cache():
+        cadena = cfdi._build_cadena_original_40_xslt(xml)
+        assert cadena and cfdi._sign_cadena_sha256_pkcs1v15(cadena, key)
+
+    def sellar_nativa():
+        cadena = cadena_original_40(xml)
+        assert cfdi._sign_cadena_sha256_pkcs1v15(cadena, key)
+
+    t0 = time.perf_counter()
+    cfdi.warm_xslt_cache()
+    print(f"XSLT: {xslt_path} — precompilado en {(time.perf_counter() - t0) * 1000:.0f} ms\n")
+
+    print(f"{'modo':<22}{'p50 (ms)':>10}{'p95 (ms)':>10}{'n':>8}")
+    _resumen("compilar por llamada", _medir(sellar_sin_cache, max(5, args.n // 10)))
+    _resumen("XSLT en caché", _medir(sellar_con_cache, args.n))
+    _resumen("cadena nativa", _medir(sellar_nativa, args.n))
+    if cadena_original_40(xml) != cfdi._build_cadena_original_40_xslt(xml):
+        print("\nAVISO: la cadena nativa difiere de la del XSLT para este XML.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
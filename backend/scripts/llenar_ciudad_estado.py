@@ -17,6 +17,14 @@ Flujo recomendado para producción (evita problemas de SSL/red):
   # 3. Ejecutar en producción usando el archivo local (sin llamadas externas)
   docker exec crm_prod-backend-1 python scripts/llenar_ciudad_estado.py --db app_prod --cp-file /tmp/cp_lookup.json --force
 
+Modo masivo sin red (--offline): resuelve el estado de TODOS los clientes con los
+catálogos SAT locales (app.catalogos_sat.codigos_postales) en segundos. La ciudad
+no viene en los catálogos SAT; si además se pasa --cp-file se toma de ahí, y si
+no, se conserva la que ya tenga el cliente.
+
+  docker exec crm_prod-backend-1 python scripts/llenar_ciudad_estado.py --db app_prod --offline
+  docker exec crm_prod-backend-1 python scripts/llenar_ciudad_estado.py --db app_prod --offline --cp-file /tmp/cp_lookup.json
+
 Parámetros:
   --dry-run          Solo muestra los primeros 20 resultados sin guardar
   --force            Actualiza aunque ya tengan ciudad/estado
@@ -26,8 +34,10 @@ Parámetros:
   --db NOMBRE        Base de datos (default: app | producción: app_prod)
   --exportar-cp FILE Consulta la API y guarda el lookup de CPs en un JSON (para producción)
   --cp-file FILE     Usa un JSON de lookup local en lugar de llamar a la API
+  --offline          Resuelve el estado con los catálogos SAT locales (sin red)
 """
 
+import os
 import sys
 import time
 import argparse
@@ -37,6 +47,8 @@ import json
 import psycopg2
 from psycopg2.extras import execute_batch
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 # ---------------------------------------------------------------------------
 # Config
 # ---------------------------------------------------------------------------
@@ -104,6 +116,24 @@ def lookup_cp(cp: str, cache: dict) -> tuple[str | None, str | None]:
     return result
 
 
+def lookup_cp_offline(cp: str, cache: dict) -> tuple[str | None, str | None]:
+    """
+    Resuelve (ciudad, estado) sin red: estado desde los catálogos SAT locales,
+    ciudad sólo si viene en el lookup JSON cargado con --cp-file.
+    """
+    from app.catalogos_sat.codigos_postales import resolver_codigo_postal
+
+    cp = limpiar_cp(cp)
+    if not cp or cp == "00000":
+        return None, None
+
+    ciudad, estado = (cache.get(cp) or (None, None))[:2]
+    info = resolver_codigo_postal(cp)
+    if info and info["estado_nombre"]:
+        estado = info["estado_nombre"]
+    return ciudad, estado
+
+
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
@@ -148,10 +178,13 @@ def procesar(
     force: bool,
     batch_size: int,
     cache: dict,
+    lookup=lookup_cp,
 ):
     """
     Consulta clientes, resuelve CPs y actualiza ciudad/estado.
     modo: "fiscal" | "servicio" | "ambos"
+    lookup: lookup_cp (API) o lookup_cp_offline (catálogos SAT locales)
+    Sólo se escriben los campos resueltos; nunca se borra un valor existente.
     """
 
     hacer_fiscal   = modo in ("fiscal", "ambos")
@@ -221,10 +254,12 @@ def procesar(
                 if cp_raw.strip() != cp_limpio:
                     cambios["codigo_postal"] = cp_limpio
                     lineas.append(f"fiscal: CP corregido '{cp_raw.strip()}' → '{cp_limpio}'")
-                ciudad, estado = lookup_cp(cp_limpio, cache)
+                ciudad, estado = lookup(cp_limpio, cache)
                 if ciudad or estado:
-                    cambios["ciudad"] = ciudad
-                    cambios["estado"] = estado
+                    if ciudad:
+                        cambios["ciudad"] = ciudad
+                    if estado:
+                        cambios["estado"] = estado
                     lineas.append(f"fiscal: {ciudad}, {estado} (CP {cp_limpio})")
                     ok += 1
                 else:
@@ -241,10 +276,12 @@ def procesar(
                 if serv_cp_raw.strip() != serv_cp_limpio:
                     cambios["serv_codigo_postal"] = serv_cp_limpio
                     lineas.append(f"servicio: CP corregido '{serv_cp_raw.strip()}' → '{serv_cp_limpio}'")
-                ciudad, estado = lookup_cp(serv_cp_limpio, cache)
+                ciudad, estado = lookup(serv_cp_limpio, cache)
                 if ciudad or estado:
-                    cambios["serv_ciudad"] = ciudad
-                    cambios["serv_estado"] = estado
+                    if ciudad:
+                        cambios["serv_ciudad"] = ciudad
+                    if estado:
+                        cambios["serv_estado"] = estado
                     lineas.append(f"servicio: {ciudad}, {estado} (CP {serv_cp_limpio})")
                 else:
                     lineas.append(f"servicio: CP {serv_cp_limpio} no encontrado")
@@ -300,8 +337,14 @@ def main():
                         help="Consulta la API y guarda el lookup en un JSON (para usar en producción)")
     parser.add_argument("--cp-file",       type=str, default=None, metavar="FILE",
                         help="Usa un JSON de lookup local en lugar de llamar a la API")
+    parser.add_argument("--offline",       action="store_true",
+                        help="Resuelve el estado con los catálogos SAT locales, sin red")
     args = parser.parse_args()
 
+    if args.offline and args.exportar_cp:
+        print("ERROR: --exportar-cp consulta la API; no se puede combinar con --offline.")
+        sys.exit(1)
+
     if args.solo_fiscal and args.solo_servicio:
         print("ERROR: No puedes usar --solo-fiscal y --solo-servicio al mismo tiempo.")
         sys.exit(1)
@@ -339,6 +382,7 @@ def main():
                 force=args.force,
                 batch_size=args.batch,
                 cache=cache,
+                lookup=lookup_cp_offline if args.offline else lookup_cp,
             )
     finally:
         cur.close()
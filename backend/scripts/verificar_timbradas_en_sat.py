@@ -25,6 +25,17 @@ USO:
     # Combinar parámetros:
     python scripts/verificar_timbradas_en_sat.py --mes 2026-01 --dry-run --empresa-id <UUID>
 
+    # ── Volumen grande: año completo en paralelo y reanudable ─────────────────
+
+    # 4 hilos consultando el SAT, a lo más 2 consultas/s entre todos:
+    python scripts/verificar_timbradas_en_sat.py --anio 2025 --workers 4 --delay 0.5
+
+    # Si se interrumpió (Ctrl+C, caída de red, etc.), continuar donde se quedó:
+    python scripts/verificar_timbradas_en_sat.py --anio 2025 --workers 4 --resume
+
+    # Empezar de cero aunque exista el checkpoint de una corrida anterior:
+    python scripts/verificar_timbradas_en_sat.py --anio 2025 --workers 4 --sobrescribir-checkpoint
+
     # ── Casos especiales ──────────────────────────────────────────────────────
 
     # Forzar CANCELADA por UUID (cuando tienes el acuse oficial pero el SAT
@@ -55,16 +66,39 @@ REQUISITOS:
 NOTA sobre N-601:
     El web service del SAT requiere que RFC_emisor + RFC_receptor + total + UUID
     coincidan exactamente. Si el total en BD difiere del timbrado, el SAT responde
-    N-601. Con --corregir-n601 el script prueba totales en el rango
-    [total_bd - tolerancia, total_bd + tolerancia] en pasos de 0.01 hasta que el
-    SAT responda, revelando el estado real. Si encuentra el total correcto, lo
+    N-601. Por eso, si la factura tiene su XML timbrado (xml_path), la consulta
+    usa el Total, los RFC y el UUID del XML (--rfc-emisor / --rfc-receptor
+    siguen mandando si se indican); si el total del XML difiere del de la BD, se
     corrige en BD junto con el estatus.
+
+    Sólo sin XML, y con --corregir-n601, el script busca el total a ciegas:
+    primero los totales más probables según los importes de la factura (total
+    redondeado a centavos, subtotal - descuento + impuestos, con y sin la
+    retención local) y después [total_bd - tolerancia, total_bd + tolerancia]
+    en pasos de 0.01, de la diferencia más chica a la más grande.
+
+NOTA sobre --workers / --resume:
+    Los hilos sólo consultan al SAT; comparten un limitador que deja a lo más
+    una consulta cada --delay segundos en total (incluidas las de
+    --corregir-n601), así que subir --workers no sube el ritmo por encima de
+    lo tolerado: sólo evita que la latencia del SAT lo frene. Los resultados se
+    aplican en el hilo principal y se hace commit cada --lote facturas.
+    Tras cada commit se agregan al checkpoint (un UUID por línea) las facturas
+    con respuesta del SAT; con --resume se omiten. Errores (de red o
+    cualquier otro al consultar) y N-601 sin resolver no se marcan, así que se
+    reintentan al reanudar. Si el checkpoint ya existe, sin --resume el script
+    se niega a borrarlo a menos que se pase --sobrescribir-checkpoint. En
+    --dry-run el checkpoint no se escribe.
 """
 
 import argparse
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from datetime import datetime, timezone
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Optional, Sequence
 from uuid import UUID
 import calendar
 
@@ -73,8 +107,11 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.database import SessionLocal
+from app.models.cliente import Cliente
+from app.models.empresa import Empresa
 from app.models.factura import Factura
 from app.services import sat_cfdi_service as sat_svc
+from app.services.sync_cancelaciones_service import Limitador, registrar_verificacion
 
 # ─────────────────────────────────────────────────────────────────────────────
 
@@ -109,6 +146,13 @@ def parse_args():
             "Por defecto se usa el mes actual."
         ),
     )
+    parser.add_argument(
+        "--anio",
+        type=int,
+        default=None,
+        metavar="YYYY",
+        help="Verificar un año completo (ej: 2025). Excluyente con --mes.",
+    )
     parser.add_argument(
         "--uuid",
         type=str,
@@ -159,9 +203,10 @@ def parse_args():
         "--corregir-n601",
         action="store_true",
         help=(
-            "Cuando el SAT devuelve N-601, probar totales cercanos (±tolerancia "
-            "en pasos de $0.01) para encontrar el total real y obtener el estado "
-            "verdadero. Si lo encuentra, corrige total y estatus en la BD."
+            "Facturas sin XML timbrado: cuando el SAT devuelve N-601, probar los "
+            "totales más probables y luego totales cercanos (±tolerancia en pasos "
+            "de $0.01) para encontrar el total real y obtener el estado verdadero. "
+            "Si lo encuentra, corrige total y estatus en la BD."
         ),
     )
     parser.add_argument(
@@ -178,47 +223,211 @@ def parse_args():
         "--delay",
         type=float,
         default=0.5,
-        help="Segundos de espera entre consultas al SAT (default: 0.5)",
+        help=(
+            "Separación mínima en segundos entre consultas al SAT, sumando "
+            "todos los hilos (default: 0.5, es decir 120 consultas/min)"
+        ),
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Hilos consultando al SAT en paralelo (default: 1)",
+    )
+    parser.add_argument(
+        "--lote",
+        type=int,
+        default=50,
+        metavar="N",
+        help="Facturas por commit y por registro en el checkpoint (default: 50)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Omitir las facturas ya verificadas según el checkpoint de una corrida anterior",
+    )
+    parser.add_argument(
+        "--sobrescribir-checkpoint",
+        action="store_true",
+        help="Empezar un checkpoint nuevo aunque ya exista uno (se pierde el avance guardado)",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--checkpoint",
+        type=str,
+        default=None,
+        metavar="RUTA",
+        help=(
+            "Archivo de checkpoint (default: .verificar_sat_<rango>[_<empresa>].ckpt "
+            "en el directorio actual)"
+        ),
+    )
+    args = parser.parse_args()
+    if args.mes and args.anio:
+        parser.error("--mes y --anio son excluyentes")
+    if args.workers < 1 or args.lote < 1:
+        parser.error("--workers y --lote deben ser al menos 1")
+    if args.resume and args.sobrescribir_checkpoint:
+        parser.error("--resume y --sobrescribir-checkpoint son excluyentes")
+    return args
 
 
 def utcnow() -> datetime:
     return datetime.now(timezone.utc).replace(tzinfo=None)
 
 
+class _Checkpoint:
+    """
+    UUIDs ya verificados, uno por línea. Se agrega y sincroniza a disco tras
+    cada commit, así que una línea a medias por un corte sólo pierde ese UUID.
+    Sin `reanudar` ni `sobrescribir`, un checkpoint existente no se toca
+    (FileExistsError).
+    """
+
+    def __init__(self, ruta: str, reanudar: bool, escribir: bool, sobrescribir: bool = False):
+        self.ruta = ruta
+        self.hechos: set[str] = set()
+        if reanudar and os.path.exists(ruta):
+            with open(ruta, encoding="utf-8") as fh:
+                self.hechos = {linea.strip().upper() for linea in fh if linea.strip()}
+        modo = "a" if reanudar else "w" if sobrescribir else "x"
+        self._fh = open(ruta, modo, encoding="utf-8") if escribir else None
+
+    def registrar(self, uuids: list[str]) -> None:
+        if self._fh is None or not uuids:
+            return
+        self._fh.write("".join(f"{u}\n" for u in uuids))
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+
+    def cerrar(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+
+
+def _duracion(segundos: float) -> str:
+    segundos = int(segundos)
+    h, resto = divmod(segundos, 3600)
+    m, s = divmod(resto, 60)
+    return f"{h}h{m:02d}m{s:02d}s" if h else f"{m}m{s:02d}s"
+
+
+class _Avance:
+    """Throughput y ETA de la corrida."""
+
+    def __init__(self, total: int, limitador: Limitador):
+        self.total = total
+        self.limitador = limitador
+        self.t0 = time.monotonic()
+
+    def linea(self, hechas: int) -> str:
+        transcurrido = max(time.monotonic() - self.t0, 1e-6)
+        ritmo = hechas / transcurrido
+        eta = (self.total - hechas) / ritmo if ritmo else 0
+        return (
+            f"  ⏱ {hechas}/{self.total} ({hechas * 100 / self.total:.1f} %) · "
+            f"{ritmo * 60:.0f} facturas/min · "
+            f"{self.limitador.consultas / transcurrido:.2f} consultas SAT/s · "
+            f"transcurrido {_duracion(transcurrido)} · ETA {_duracion(eta)}"
+        )
+
+
+@dataclass(frozen=True)
+class _Pendiente:
+    """Datos planos de la factura para los hilos (sin objetos ORM)."""
+    id: UUID
+    uuid: str
+    folio: str
+    estatus: str
+    rfc_emisor: str
+    rfc_receptor: str
+    total: float
+    xml_path: Optional[str] = None
+    # Totales a probar primero si hay que buscarlo (sin XML y N-601)
+    sugeridos: tuple[Decimal, ...] = ()
+
+
+@dataclass
+class _Resultado:
+    pendiente: _Pendiente
+    acuse: Optional[sat_svc.AcuseSAT] = None
+    error: Optional[str] = None
+    # Datos con que se consultó: del XML timbrado si lo había
+    desde_xml: bool = False
+    rfc_emisor: str = ""
+    rfc_receptor: str = ""
+    total_consultado: float = 0.0
+    # Sólo con --corregir-n601 cuando el SAT respondió N-601 (sin XML)
+    total_correcto: Optional[float] = None
+    acuse_correcto: Optional[sat_svc.AcuseSAT] = None
+
+
+def _pesos(valor: float) -> str:
+    """$1160.00, o con los decimales que traiga si no son centavos exactos (BD con 6)."""
+    if abs(valor - round(valor, 2)) < 1e-9:
+        return f"${valor:.2f}"
+    return f"${valor:.6f}".rstrip("0")
+
+
+def _centavos(valor) -> Decimal:
+    return Decimal(str(valor or 0)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+def _totales_sugeridos(total, subtotal, descuento, trasladados, retenidos, retencion_local) -> tuple[Decimal, ...]:
+    """
+    Totales con que pudo timbrarse la factura, del más al menos probable: el
+    total redondeado a centavos (el CFDI lleva 2 decimales y la BD 6), la suma
+    de los importes redondeados y ambos menos la retención local.
+    """
+    redondeado = _centavos(total)
+    por_importes = _centavos(subtotal) - _centavos(descuento) + _centavos(trasladados) - _centavos(retenidos)
+    candidatos = [redondeado, por_importes]
+    local = _centavos(retencion_local)
+    if local:
+        candidatos += [redondeado - local, por_importes - local]
+    exacto = Decimal(str(total or 0))
+    vistos: list[Decimal] = []
+    for c in candidatos:
+        if c > 0 and c != exacto and c not in vistos:
+            vistos.append(c)
+    return tuple(vistos)
+
+
 def _buscar_total_correcto(
     rfc_emisor: str,
     rfc_receptor: str,
     uuid: str,
     total_bd: float,
-    tolerancia: float = 1.00,
-    delay: float = 0.3,
+    tolerancia: float,
+    limitador: Limitador,
+    sugeridos: Sequence[Decimal] = (),
 ):
     """
-    Cuando el SAT responde N-601, el total en BD no coincide con el timbrado.
-    Esta función prueba candidatos en el rango [total_bd - tolerancia, total_bd + tolerancia]
-    en pasos de $0.01, alternando hacia arriba y hacia abajo desde el valor base,
-    para minimizar llamadas en el caso más frecuente (discrepancia de 1-2 centavos).
+    Último recurso cuando el SAT responde N-601 y no hay XML timbrado del que
+    leer el total. Prueba primero los `sugeridos` y después el rango
+    [total_bd - tolerancia, total_bd + tolerancia] en pasos de $0.01,
+    alternando hacia arriba y hacia abajo desde el valor base, para minimizar
+    llamadas en el caso más frecuente (discrepancia de 1-2 centavos).
 
     Retorna (total_correcto: float, acuse: AcuseSAT) si el SAT responde,
     o (None, None) si agota todos los candidatos sin éxito.
     """
-    import decimal
-
-    base = decimal.Decimal(str(total_bd)).quantize(decimal.Decimal("0.01"))
-    paso = decimal.Decimal("0.01")
-    max_pasos = int(round(decimal.Decimal(str(tolerancia)) / paso))
+    base = _centavos(total_bd)
+    paso = Decimal("0.01")
+    max_pasos = int(round(Decimal(str(tolerancia)) / paso))
 
-    # Orden: +0.01, -0.01, +0.02, -0.02, ... para encontrar rápido diferencias pequeñas
-    candidatos = []
+    # Orden: sugeridos, +0.01, -0.01, +0.02, -0.02, ... para encontrar rápido diferencias pequeñas
+    candidatos = list(sugeridos)
     for n in range(1, max_pasos + 1):
         candidatos.append(base + paso * n)
         candidatos.append(base - paso * n)
 
+    probados = {Decimal(str(total_bd))}
     for candidato in candidatos:
-        if candidato <= 0:
+        if candidato <= 0 or candidato in probados:
             continue
+        probados.add(candidato)
+        limitador.esperar()
         try:
             acuse = sat_svc.consultar_cfdi(
                 rfc_emisor=rfc_emisor,
@@ -230,7 +439,6 @@ def _buscar_total_correcto(
                 return float(candidato), acuse
         except RuntimeError:
             pass
-        time.sleep(delay)
 
     return None, None
 
@@ -287,10 +495,246 @@ def _forzar_canceladas(db, uuids: list[str], dry_run: bool) -> None:
     print()
 
 
+def _consultar(p: _Pendiente, args, limitador: Limitador) -> _Resultado:
+    """
+    Corre en los hilos: sólo habla con el SAT, no toca la BD. Cualquier error
+    queda en `resultado.error`; esa factura no va al checkpoint y se reintenta
+    con --resume.
+    """
+    try:
+        return _consultar_sat(p, args, limitador)
+    except Exception as e:
+        return _Resultado(p, error=str(e) or type(e).__name__)
+
+
+def _consultar_sat(p: _Pendiente, args, limitador: Limitador) -> _Resultado:
+    # Datos del XML timbrado si lo hay; --rfc-emisor / --rfc-receptor mandan sobre él
+    datos = sat_svc.datos_desde_xml(p.xml_path)
+    resultado = _Resultado(
+        p,
+        desde_xml=datos is not None,
+        rfc_emisor=p.rfc_emisor if datos is None or args.rfc_emisor else datos.rfc_emisor,
+        rfc_receptor=p.rfc_receptor if datos is None or args.rfc_receptor else datos.rfc_receptor,
+        total_consultado=p.total if datos is None else float(datos.total),
+    )
+    uuid = p.uuid if datos is None else datos.uuid
+
+    limitador.esperar()
+    resultado.acuse = sat_svc.consultar_cfdi(
+        rfc_emisor=resultado.rfc_emisor,
+        rfc_receptor=resultado.rfc_receptor,
+        total=resultado.total_consultado,
+        uuid=uuid,
+    )
+
+    acuse = resultado.acuse
+    if not acuse.encontrado and "601" in acuse.codigo_estatus and args.corregir_n601 and datos is None:
+        # ── Sin XML: buscar el total correcto probando candidatos ─────────
+        resultado.total_correcto, resultado.acuse_correcto = _buscar_total_correcto(
+            rfc_emisor=resultado.rfc_emisor,
+            rfc_receptor=resultado.rfc_receptor,
+            uuid=uuid,
+            total_bd=p.total,
+            tolerancia=args.tolerancia,
+            limitador=limitador,
+            sugeridos=p.sugeridos,
+        )
+    return resultado
+
+
+def _procesar(r: _Resultado, factura: Optional[Factura], args, cont: dict) -> tuple[str, bool]:
+    """
+    Aplica el resultado a la factura (sin commit) y actualiza los contadores.
+    Regresa (mensaje, verificada); sólo las verificadas van al checkpoint.
+    """
+    p = r.pendiente
+    if r.error is not None:
+        cont["errores"] += 1
+        return f"ERROR SAT: {r.error}", False
+    if factura is None:
+        cont["errores"] += 1
+        return "ERROR: la factura ya no existe en BD", False
+
+    acuse = r.acuse
+    total_sat = r.total_consultado
+    prefijo = ""
+
+    if not acuse.encontrado:
+        es_n601 = "601" in acuse.codigo_estatus
+        if r.acuse_correcto is None:
+            if es_n601 and r.desde_xml:
+                cont["no_encontradas"] += 1
+                return (
+                    f"NO ENCONTRADO en SAT ({acuse.codigo_estatus}) aun con los datos del XML timbrado "
+                    f"(total ${r.total_consultado:.2f}). Requiere revisión manual.",
+                    False,
+                )
+            if es_n601 and args.corregir_n601:
+                cont["n601_sin_resolver"] += 1
+                return (
+                    f"N-601 (total BD=${p.total:.2f}, sin XML) — no se encontró total en "
+                    f"±${args.tolerancia:.2f}. Requiere revisión manual o ampliar --tolerancia.",
+                    False,
+                )
+            hint = ""
+            if es_n601:
+                hint = " ⚠ Sin XML timbrado: usa --corregir-n601 para buscar el total real."
+            cont["no_encontradas"] += 1
+            return f"NO ENCONTRADO en SAT ({acuse.codigo_estatus}){hint}", False
+
+        # Tenemos el total correcto y el acuse real del SAT
+        acuse, total_sat = r.acuse_correcto, r.total_correcto
+        diff = total_sat - p.total
+        prefijo = (
+            f"N-601 (total BD={_pesos(p.total)}) — total correcto: {_pesos(total_sat)} "
+            f"(diferencia: {'+' if diff >= 0 else ''}{diff:.6f}".rstrip("0").rstrip(".") + ")  →  "
+        )
+
+    estatus_anterior = factura.estatus
+    # aplicar_acuse_sat muta factura.estatus y fecha_solicitud_cancelacion
+    # y devuelve (nuevo_estatus, hubo_cambio)
+    nuevo_estatus, cambio = sat_svc.aplicar_acuse_sat(factura, acuse, ahora=utcnow())
+    if not args.dry_run:
+        registrar_verificacion(factura, acuse)
+    sat_info = f"SAT={acuse.estado}/{acuse.estatus_cancelacion or 'sin estatus'}"
+    corrige_total = abs(total_sat - p.total) >= 0.001
+
+    if not cambio and not corrige_total:
+        cont["sin_cambio"] += 1
+        return prefijo + f"Sin cambio  ({sat_info})", True
+
+    cambios = []
+    if corrige_total:
+        if not args.dry_run:
+            factura.total = total_sat
+        origen = " (XML timbrado)" if r.desde_xml else ""
+        cambios.append(f"total {_pesos(p.total)} → {_pesos(total_sat)}{origen}")
+    tag = ""
+    if cambio:
+        cambios.append(f"{estatus_anterior} → {nuevo_estatus}")
+        if nuevo_estatus == "CANCELADA":
+            tag = "  CANCELADA ✓"
+            cont["canceladas"] += 1
+        elif nuevo_estatus == "TIMBRADA" and estatus_anterior == "EN_CANCELACION":
+            tag = "  REVERTIDA a TIMBRADA (receptor rechazó)"
+            cont["revertidas"] += 1
+        elif nuevo_estatus == "EN_CANCELACION":
+            tag = "  EN_CANCELACION"
+            cont["en_proceso"] += 1
+    else:
+        cont["sin_cambio"] += 1
+
+    accion = "[DRY-RUN] Se corregiría" if args.dry_run else "ACTUALIZADA"
+    return prefijo + f"{accion}: {', '.join(cambios)}{tag}  ({sat_info})", True
+
+
+def _aplicar_lote(db, lote: list[_Resultado], args, cont: dict, checkpoint: Optional[_Checkpoint]) -> None:
+    """
+    Aplica un lote de resultados con un solo commit, imprime una línea por
+    factura y registra en el checkpoint las verificadas (ya confirmadas en BD).
+    """
+    ids = [r.pendiente.id for r in lote if r.error is None]
+    facturas = {f.id: f for f in db.query(Factura).filter(Factura.id.in_(ids)).all()} if ids else {}
+
+    lineas, verificadas = [], []
+    for r in lote:
+        mensaje, verificada = _procesar(r, facturas.get(r.pendiente.id), args, cont)
+        lineas.append((r, mensaje))
+        if verificada:
+            verificadas.append(r.pendiente.uuid)
+
+    if args.dry_run:
+        db.rollback()
+    else:
+        db.commit()
+        if checkpoint is not None:
+            checkpoint.registrar(verificadas)
+
+    for r, mensaje in lineas:
+        p = r.pendiente
+        cont["procesadas"] += 1
+        print(
+            f"[{cont['procesadas']:>5}/{cont['total']}] {p.folio:<20} "
+            f"UUID: {p.uuid}  Estatus: {p.estatus}  →  {mensaje}"
+        )
+        if args.verbose:
+            expr = sat_svc._build_expresion(r.rfc_emisor, r.rfc_receptor, r.total_consultado, p.uuid)
+            print(f"  [VERBOSE] Datos de    : {'XML timbrado' if r.desde_xml else 'BD'}")
+            print(f"  [VERBOSE] RFC emisor  : {r.rfc_emisor!r}")
+            print(f"  [VERBOSE] RFC receptor: {r.rfc_receptor!r}")
+            print(f"  [VERBOSE] Total       : {r.total_consultado}")
+            print(f"  [VERBOSE] expresion   : {expr}")
+
+
+def _cargar_pendientes(query, args) -> list[_Pendiente]:
+    filas = (
+        query.outerjoin(Empresa, Factura.empresa_id == Empresa.id)
+        .outerjoin(Cliente, Factura.cliente_id == Cliente.id)
+        .with_entities(
+            Factura.id, Factura.cfdi_uuid, Factura.serie, Factura.folio, Factura.estatus,
+            Factura.total, Factura.subtotal, Factura.descuento, Factura.impuestos_trasladados,
+            Factura.impuestos_retenidos, Factura.retencion_local_monto, Factura.xml_path,
+            Empresa.rfc, Cliente.rfc,
+        )
+        .order_by(Factura.fecha_emision)
+        .all()
+    )
+    return [
+        _Pendiente(
+            id=fid,
+            uuid=cfdi_uuid.strip().upper(),
+            folio=f"{serie or ''}-{folio or ''}" if serie else str(folio or fid),
+            estatus=estatus,
+            rfc_emisor=(args.rfc_emisor or rfc_emisor or "").strip().upper(),
+            rfc_receptor=(args.rfc_receptor or rfc_receptor or "").strip().upper(),
+            total=float(total or 0),
+            xml_path=xml_path,
+            sugeridos=_totales_sugeridos(total, subtotal, descuento, trasladados, retenidos, retencion_local),
+        )
+        for (
+            fid, cfdi_uuid, serie, folio, estatus, total, subtotal, descuento, trasladados,
+            retenidos, retencion_local, xml_path, rfc_emisor, rfc_receptor,
+        ) in filas
+    ]
+
+
+def _rango(args) -> tuple[datetime, datetime, str, str]:
+    """(inicio, fin, etiqueta para mostrar, clave para el checkpoint)."""
+    if args.anio:
+        return (
+            datetime(args.anio, 1, 1),
+            datetime(args.anio, 12, 31, 23, 59, 59, 999999),
+            f"año solicitado ({args.anio})",
+            str(args.anio),
+        )
+    if args.mes:
+        try:
+            año, mes = args.mes.split("-")
+            año, mes = int(año), int(mes)
+            if not (1 <= mes <= 12):
+                raise ValueError
+        except ValueError:
+            print(f"ERROR: --mes '{args.mes}' no tiene el formato correcto. Use YYYY-MM (ej: 2026-03).")
+            sys.exit(1)
+        etiqueta = f"mes solicitado ({args.mes})"
+    else:
+        hoy = utcnow()
+        año, mes = hoy.year, hoy.month
+        etiqueta = "mes en curso"
+    ultimo_dia = calendar.monthrange(año, mes)[1]
+    return (
+        datetime(año, mes, 1, 0, 0, 0),
+        datetime(año, mes, ultimo_dia, 23, 59, 59, 999999),
+        etiqueta,
+        f"{año:04d}-{mes:02d}",
+    )
+
+
 def main():
     args = parse_args()
 
     db = SessionLocal()
+    checkpoint = None
     try:
         # ── Modo --forzar-cancelada: no consulta el SAT, actualiza directo ────
         if args.forzar_cancelada:
@@ -304,7 +748,7 @@ def main():
 
         # ── Modo --uuid: verificar uno o varios CFDIs por UUID ───────────────
         if args.uuid:
-            facturas = []
+            ids = []
             for raw_uuid in args.uuid:
                 raw_uuid = raw_uuid.strip().upper()
                 factura = db.query(Factura).filter(
@@ -313,41 +757,22 @@ def main():
                 if not factura:
                     print(f"ADVERTENCIA: No se encontró factura con cfdi_uuid = {raw_uuid} (ignorada)")
                     continue
-                facturas.append(factura)
-            if not facturas:
+                ids.append(factura.id)
+            if not ids:
                 print("ERROR: Ningún UUID encontrado en BD.")
                 sys.exit(1)
-            print(f"Modo UUID puntual: {len(facturas)} factura(s)\n")
+            pendientes = _cargar_pendientes(db.query(Factura).filter(Factura.id.in_(ids)), args)
+            print(f"Modo UUID puntual: {len(pendientes)} factura(s)\n")
 
         else:
-            # ── Calcular rango del mes ────────────────────────────────────────
-            if args.mes:
-                try:
-                    año, mes = args.mes.split("-")
-                    año, mes = int(año), int(mes)
-                    if not (1 <= mes <= 12):
-                        raise ValueError
-                except ValueError:
-                    print(f"ERROR: --mes '{args.mes}' no tiene el formato correcto. Use YYYY-MM (ej: 2026-03).")
-                    sys.exit(1)
-                ultimo_dia = calendar.monthrange(año, mes)[1]
-                inicio_mes = datetime(año, mes, 1, 0, 0, 0)
-                fin_mes    = datetime(año, mes, ultimo_dia, 23, 59, 59, 999999)
-                etiqueta_rango = f"mes solicitado ({args.mes})"
-            else:
-                hoy = utcnow()
-                inicio_mes = hoy.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-                ultimo_dia = calendar.monthrange(hoy.year, hoy.month)[1]
-                fin_mes    = hoy.replace(day=ultimo_dia, hour=23, minute=59, second=59, microsecond=999999)
-                etiqueta_rango = "mes en curso"
-
-            print(f"Rango: {inicio_mes.strftime('%Y-%m-%d')} al {fin_mes.strftime('%Y-%m-%d')} ({etiqueta_rango})")
+            inicio, fin, etiqueta_rango, clave = _rango(args)
+            print(f"Rango: {inicio.strftime('%Y-%m-%d')} al {fin.strftime('%Y-%m-%d')} ({etiqueta_rango})")
 
             query = db.query(Factura).filter(
                 Factura.estatus.in_(statuses),
                 Factura.cfdi_uuid.isnot(None),
-                Factura.fecha_emision >= inicio_mes,
-                Factura.fecha_emision <= fin_mes,
+                Factura.fecha_emision >= inicio,
+                Factura.fecha_emision <= fin,
             )
 
             if args.empresa_id:
@@ -357,197 +782,103 @@ def main():
                     print(f"ERROR: --empresa-id '{args.empresa_id}' no es un UUID válido.")
                     sys.exit(1)
                 query = query.filter(Factura.empresa_id == emp_uuid)
+                clave += f"_{emp_uuid.hex[:8]}"
+
+            pendientes = _cargar_pendientes(query, args)
 
-            facturas = query.order_by(Factura.fecha_emision).all()
+            # ── Checkpoint ────────────────────────────────────────────────────
+            ruta = args.checkpoint or f".verificar_sat_{clave}.ckpt"
+            if args.resume and not os.path.exists(ruta):
+                print(f"ADVERTENCIA: no existe el checkpoint {ruta}; se verifica todo el rango.")
+            try:
+                checkpoint = _Checkpoint(
+                    ruta,
+                    reanudar=args.resume,
+                    escribir=not args.dry_run,
+                    sobrescribir=args.sobrescribir_checkpoint,
+                )
+            except FileExistsError:
+                print(
+                    f"ERROR: ya existe el checkpoint {ruta} de una corrida anterior. Usa --resume "
+                    "para continuarla o --sobrescribir-checkpoint para empezar de cero."
+                )
+                sys.exit(1)
+            if checkpoint.hechos:
+                antes = len(pendientes)
+                pendientes = [p for p in pendientes if p.uuid not in checkpoint.hechos]
+                print(f"Reanudando desde {ruta}: {antes - len(pendientes)} ya verificada(s), se omiten.")
 
-        total = len(facturas)
+        total = len(pendientes)
         if total == 0:
             print("No se encontraron facturas para verificar.")
             return
 
-        print(f"\n{'[DRY-RUN] ' if args.dry_run else ''}Verificando {total} factura(s) contra el SAT...\n")
+        limitador = Limitador(args.delay)
+        avance = _Avance(total, limitador)
+        workers = min(args.workers, total)
+        print(
+            f"\n{'[DRY-RUN] ' if args.dry_run else ''}Verificando {total} factura(s) contra el SAT "
+            f"({workers} hilo(s), ≤ {60 / args.delay if args.delay > 0 else float('inf'):.0f} consultas/min, "
+            f"commit cada {args.lote})...\n"
+        )
         print(f"{'─'*80}")
 
         # Contadores
-        sin_cambio     = 0
-        canceladas     = 0
-        revertidas     = 0    # EN_CANCELACION → TIMBRADA (por rechazo o vencimiento 72h)
-        en_proceso     = 0
-        errores        = 0
-        no_encontradas = 0
-        n601_sin_resolver = 0
-
-        for i, factura in enumerate(facturas, start=1):
-            rfc_emisor   = (args.rfc_emisor  or getattr(getattr(factura, "empresa", None), "rfc", None) or "").strip().upper()
-            rfc_receptor = (args.rfc_receptor or getattr(getattr(factura, "cliente", None), "rfc", None) or "").strip().upper()
-            total_factura = float(factura.total or 0)
-
-            folio_display = (
-                f"{factura.serie or ''}-{factura.folio or ''}"
-                if getattr(factura, "serie", None)
-                else str(getattr(factura, "folio", factura.id))
-            )
-            print(
-                f"[{i:>4}/{total}] {folio_display:<20} "
-                f"UUID: {factura.cfdi_uuid}  "
-                f"Estatus actual: {factura.estatus}",
-                end="  →  ",
-                flush=True,
-            )
-
-            if args.verbose:
-                from app.services.sat_cfdi_service import _build_expresion
-                expr = _build_expresion(rfc_emisor, rfc_receptor, total_factura, factura.cfdi_uuid)
-                print(f"\n  [VERBOSE] RFC emisor  : {rfc_emisor!r}")
-                print(f"  [VERBOSE] RFC receptor: {rfc_receptor!r}")
-                print(f"  [VERBOSE] Total       : {total_factura}")
-                print(f"  [VERBOSE] expresion   : {expr}")
-                print("  →  ", end="", flush=True)
+        cont = dict.fromkeys(
+            (
+                "procesadas", "sin_cambio", "canceladas",
+                "revertidas",  # EN_CANCELACION → TIMBRADA (por rechazo o vencimiento 72h)
+                "en_proceso", "errores", "no_encontradas", "n601_sin_resolver",
+            ),
+            0,
+        )
+        cont["total"] = total
 
-            # ── Consultar SAT ─────────────────────────────────────────────────
-            try:
-                acuse = sat_svc.consultar_cfdi(
-                    rfc_emisor=rfc_emisor,
-                    rfc_receptor=rfc_receptor,
-                    total=total_factura,
-                    uuid=factura.cfdi_uuid,
-                )
-            except RuntimeError as e:
-                print(f"ERROR SAT: {e}")
-                errores += 1
-                time.sleep(args.delay)
-                continue
-
-            # ── Determinar nuevo estatus (lógica canónica centralizada) ──────────
-            estatus_anterior = factura.estatus
-
-            if not acuse.encontrado:
-                es_n601 = "601" in acuse.codigo_estatus
-
-                if es_n601 and args.corregir_n601:
-                    # ── Buscar el total correcto probando centavos cercanos ────
-                    print(
-                        f"N-601 (total BD=${total_factura:.2f}) — buscando total correcto "
-                        f"(±${args.tolerancia:.2f})...",
-                        flush=True,
-                    )
-                    total_correcto, acuse_correcto = _buscar_total_correcto(
-                        rfc_emisor=rfc_emisor.strip().upper(),
-                        rfc_receptor=rfc_receptor.strip().upper(),
-                        uuid=factura.cfdi_uuid,
-                        total_bd=total_factura,
-                        tolerancia=args.tolerancia,
-                        delay=args.delay,
-                    )
-
-                    if acuse_correcto is None:
-                        print(
-                            f"           → No se encontró total en ±${args.tolerancia:.2f}. "
-                            "Requiere revisión manual o ampliar --tolerancia."
-                        )
-                        n601_sin_resolver += 1
-                        continue
-
-                    # Tenemos el total correcto y el acuse real del SAT
-                    diff = total_correcto - total_factura
-                    print(
-                        f"           → Total correcto: ${total_correcto:.2f} "
-                        f"(diferencia: {'+' if diff >= 0 else ''}{diff:.2f})",
-                        flush=True,
-                    )
-
-                    # Aplicar el acuse usando la lógica canónica
-                    nuevo_estatus, cambio = sat_svc.aplicar_acuse_sat(
-                        factura, acuse_correcto, ahora=utcnow()
-                    )
-                    sat_info = f"SAT={acuse_correcto.estado}/{acuse_correcto.estatus_cancelacion or 'sin estatus'}"
-
-                    if not cambio and abs(diff) < 0.001:
-                        print(f"           → Sin cambio de estatus  ({sat_info})")
-                        sin_cambio += 1
-                    else:
-                        if args.dry_run:
-                            cambios = []
-                            if cambio:
-                                cambios.append(f"estatus {estatus_anterior} → {nuevo_estatus}")
-                            if abs(diff) >= 0.001:
-                                cambios.append(f"total ${total_factura:.2f} → ${total_correcto:.2f}")
-                            print(f"           → [DRY-RUN] Se corregiría: {', '.join(cambios)}  ({sat_info})")
-                        else:
-                            cambios = []
-                            if abs(diff) >= 0.001:
-                                factura.total = total_correcto
-                                cambios.append(f"total ${total_factura:.2f} → ${total_correcto:.2f}")
-                            if cambio:
-                                cambios.append(f"estatus {estatus_anterior} → {nuevo_estatus}")
-                                if nuevo_estatus == "CANCELADA":
-                                    canceladas += 1
-                                elif nuevo_estatus == "EN_CANCELACION":
-                                    en_proceso += 1
-                                elif nuevo_estatus == "TIMBRADA" and estatus_anterior == "EN_CANCELACION":
-                                    revertidas += 1
-                            db.add(factura)
-                            db.commit()
-                            print(f"           → CORREGIDA: {', '.join(cambios)}  ({sat_info})")
-                        if cambio and nuevo_estatus not in ("CANCELADA", "EN_CANCELACION", "TIMBRADA"):
-                            sin_cambio += 1
-                else:
-                    hint = ""
-                    if es_n601:
-                        hint = " ⚠ Usa --corregir-n601 para buscar el total real automáticamente."
-                    print(f"NO ENCONTRADO en SAT ({acuse.codigo_estatus}){hint}")
-                    no_encontradas += 1
-
-                time.sleep(args.delay)
-                continue
-
-            # aplicar_acuse_sat muta factura.estatus y fecha_solicitud_cancelacion
-            # y devuelve (nuevo_estatus, hubo_cambio)
-            nuevo_estatus, cambio = sat_svc.aplicar_acuse_sat(factura, acuse, ahora=utcnow())
-
-            # ── Resultado ─────────────────────────────────────────────────────
-            sat_info = f"SAT={acuse.estado}/{acuse.estatus_cancelacion or 'sin estatus'}"
-
-            if not cambio:
-                print(f"Sin cambio  ({sat_info})")
-                sin_cambio += 1
-            else:
-                tag = ""
-                if nuevo_estatus == "CANCELADA":
-                    tag = "CANCELADA ✓"
-                    canceladas += 1
-                elif nuevo_estatus == "TIMBRADA" and estatus_anterior == "EN_CANCELACION":
-                    tag = "REVERTIDA a TIMBRADA (receptor rechazó)"
-                    revertidas += 1
-                elif nuevo_estatus == "EN_CANCELACION":
-                    tag = "EN_CANCELACION"
-                    en_proceso += 1
-
-                if args.dry_run:
-                    print(f"[DRY-RUN] {estatus_anterior} → {nuevo_estatus}  {tag}  ({sat_info})")
-                else:
-                    # Los campos ya fueron mutados por aplicar_acuse_sat
-                    db.add(factura)
-                    db.commit()
-                    print(f"ACTUALIZADA: {estatus_anterior} → {nuevo_estatus}  {tag}  ({sat_info})")
-
-            time.sleep(args.delay)
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="verificar-sat")
+        lote: list[_Resultado] = []
+        try:
+            futuros = [pool.submit(_consultar, p, args, limitador) for p in pendientes]
+            for futuro in as_completed(futuros):
+                lote.append(futuro.result())
+                if len(lote) >= args.lote:
+                    # Un lote cortado a la mitad no se reaplica: se repite con --resume
+                    trozo, lote = lote, []
+                    _aplicar_lote(db, trozo, args, cont, checkpoint)
+                    print(avance.linea(cont["procesadas"]), flush=True)
+            if lote:
+                trozo, lote = lote, []
+                _aplicar_lote(db, trozo, args, cont, checkpoint)
+        except KeyboardInterrupt:
+            # Lo ya consultado se guarda; lo que estaba en vuelo se reintenta con --resume
+            print("\nInterrumpido: guardando lo ya consultado...", flush=True)
+            pool.shutdown(wait=False, cancel_futures=True)
+            db.rollback()
+            if lote:
+                _aplicar_lote(db, lote, args, cont, checkpoint)
+            if checkpoint is not None and not args.dry_run:
+                print(f"Para continuar, repite el comando con --resume (checkpoint: {checkpoint.ruta}).")
+            raise SystemExit(130)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
 
         # ── Resumen ───────────────────────────────────────────────────────────
         print(f"\n{'─'*80}")
         print(f"RESUMEN {'(DRY-RUN — sin cambios en BD)' if args.dry_run else ''}:")
-        print(f"  Total procesadas        : {total}")
-        print(f"  Sin cambio              : {sin_cambio}")
-        print(f"  → CANCELADA             : {canceladas}")
-        print(f"  → EN_CANCELACION        : {en_proceso}")
-        print(f"  → Revertidas a TIMBRADA : {revertidas}")
-        print(f"  No encontradas SAT      : {no_encontradas}")
+        print(f"  Total procesadas        : {cont['procesadas']}")
+        print(f"  Sin cambio              : {cont['sin_cambio']}")
+        print(f"  → CANCELADA             : {cont['canceladas']}")
+        print(f"  → EN_CANCELACION        : {cont['en_proceso']}")
+        print(f"  → Revertidas a TIMBRADA : {cont['revertidas']}")
+        print(f"  No encontradas SAT      : {cont['no_encontradas']}")
         if args.corregir_n601:
-            print(f"  N-601 sin resolver      : {n601_sin_resolver}")
-        print(f"  Errores SAT             : {errores}")
+            print(f"  N-601 sin resolver      : {cont['n601_sin_resolver']}")
+        print(f"  Errores SAT             : {cont['errores']}")
+        print(avance.linea(cont["procesadas"]))
         print()
 
     finally:
+        if checkpoint is not None:
+            checkpoint.cerrar()
         db.close()
 
 
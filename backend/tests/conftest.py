@@ -17,6 +17,10 @@ os.environ.setdefault("SECRET_KEY", "test-secret-key-for-testing-only")
 os.environ.setdefault("ALGORITHM", "HS256")
 os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
 os.environ.setdefault("ENCRYPTION_KEY", "2oUnSlmpjN0_TYGhPvJBEK0t3rimeuP3CRcDfH7kLX4=")
+# Sin pre-render en hilos: compartirían la conexión de la transacción de prueba
+os.environ.setdefault("PDF_PRERENDER_ACTIVO", "false")
+# PDFs y sellos en el hilo de la prueba: los workers del pool no ven la BD en memoria
+os.environ.setdefault("COMPUTO_ACTIVO", "false")
 
 from app.main import app as fastapi_app  # noqa: E402
 from app.database import get_db          # noqa: E402
@@ -110,3 +114,78 @@ def auth_client(client, usuario_admin):
     _, token = usuario_admin
     client.headers.update({"Authorization": f"Bearer {token}"})
     return client
+
+
+def _generar_csd(password: str):
+    """.cer DER autofirmado + .key PKCS#8 DER cifrada, como los del SAT."""
+    from datetime import datetime, timedelta, timezone
+
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    nombre = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "CSD PRUEBA")])
+    ahora = datetime.now(timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(nombre)
+        .issuer_name(nombre)
+        .public_key(key.public_key())
+        .serial_number(int.from_bytes(b"30001000000500003416", "big"))
+        .not_valid_before(ahora - timedelta(days=1))
+        .not_valid_after(ahora + timedelta(days=365))
+        .sign(key, hashes.SHA256())
+    )
+    key_der = key.private_bytes(
+        serialization.Encoding.DER,
+        serialization.PrivateFormat.PKCS8,
+        serialization.BestAvailableEncryption(password.encode()),
+    )
+    return cert.public_bytes(serialization.Encoding.DER), key_der
+
+
+@pytest.fixture(scope="function")
+def csd_dir(tmp_path, monkeypatch):
+    """CERT_DIR temporal; `instalar(empresa_id, password)` escribe un CSD de prueba."""
+    from app.config import settings
+    from app.services.cfdi40_xml import invalidar_csd_cache
+
+    monkeypatch.setattr(settings, "CERT_DIR", str(tmp_path))
+    invalidar_csd_cache()
+
+    def instalar(empresa_id, password="12345678a"):
+        cer, key = _generar_csd(password)
+        (tmp_path / f"{empresa_id}.cer").write_bytes(cer)
+        (tmp_path / f"{empresa_id}.key").write_bytes(key)
+        return tmp_path
+
+    yield instalar
+    invalidar_csd_cache()
+
+
+@pytest.fixture(scope="function")
+def fake_pac(tmp_path, monkeypatch):
+    """
+    PAC/SAT falso local (`app.testing.fake_pac`) con FM_TIMBRADO_URL,
+    FM_STORAGE_URL y SAT_CONSULTA_URL apuntando a él. DATA_DIR va a tmp_path.
+    Devuelve el FakePAC: `fake_pac.config` ajusta latencia y fallas en caliente.
+    """
+    from app.config import settings
+    from app.services import acuse_cancelacion_service, pac_http, sat_cfdi_service
+    from app.testing.fake_pac import FakePAC
+
+    fake = FakePAC()
+    url = fake.iniciar()
+    monkeypatch.setattr(settings, "FM_TIMBRADO_URL", f"{url}/timbrado/soap")
+    monkeypatch.setattr(settings, "FM_STORAGE_URL", url)
+    monkeypatch.setattr(settings, "SAT_CONSULTA_URL", f"{url}/ConsultaCFDIService.svc")
+    monkeypatch.setattr(settings, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(acuse_cancelacion_service, "_ACUSES_DIR", str(tmp_path / "acuses"))
+    pac_http.cerrar_cliente()
+    sat_cfdi_service.cerrar_cliente()
+    yield fake
+    pac_http.cerrar_cliente()
+    sat_cfdi_service.cerrar_cliente()
+    fake.detener()
@@ -0,0 +1,62 @@
+# tests/test_api_catalogos.py
+"""Catálogos completos: payload pre-comprimido, ETag/304 y paginación opcional."""
+
+
+def test_catalogo_unidades_etag_y_304(client):
+    r = client.get("/api/catalogos/unidades")
+    assert r.status_code == 200
+    etag = r.headers["etag"]
+    assert etag.startswith('"') and "max-age" in r.headers["cache-control"]
+    assert {"value", "label"} <= set(r.json()[0])
+
+    r2 = client.get("/api/catalogos/unidades", headers={"If-None-Match": etag})
+    assert r2.status_code == 304
+    assert r2.content == b""
+
+
+def test_catalogo_unidades_precomprimido(client):
+    r = client.get("/api/catalogos/unidades", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.headers["etag"].endswith('-gz"')
+    assert len(r.json()) > 1000
+
+    r_id = client.get("/api/catalogos/unidades", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in r_id.headers
+    assert r_id.json() == r.json()
+
+
+def test_catalogo_unidades_paginado(client):
+    completo = client.get("/api/catalogos/unidades").json()
+    r = client.get("/api/catalogos/unidades", params={"offset": 10, "limit": 5})
+    assert r.status_code == 200
+    assert r.json() == completo[10:15]
+    assert int(r.headers["x-total-count"]) == len(completo)
+
+
+def test_busqueda_unidades_limit(client):
+    r = client.get("/api/catalogos/busqueda/unidades", params={"q": "pieza", "limit": 2})
+    assert r.status_code == 200
+    assert len(r.json()) <= 2
+
+
+def test_resolver_cp(client):
+    r = client.get("/api/catalogos/cp/22000")
+    assert r.status_code == 200
+    body = r.json()
+    assert (body["codigo_postal"], body["estado"], body["estado_nombre"]) == ("22000", "BCN", "BAJA CALIFORNIA")
+    assert body["colonias_claves"] and all(c.isdigit() for c in body["colonias_claves"])
+    assert "municipio" not in body and "colonias" not in body
+
+    # Quien llama no puede alterar lo que guarda el caché
+    from app.catalogos_sat.codigos_postales import resolver_codigo_postal
+
+    resolver_codigo_postal("22000")["colonias_claves"].clear()
+    assert resolver_codigo_postal("22000")["colonias_claves"] == body["colonias_claves"]
+
+    assert client.get("/api/catalogos/cp/2280").json()["codigo_postal"] == "02280"
+
+
+def test_resolver_cp_no_encontrado_e_invalido(client):
+    assert client.get("/api/catalogos/cp/99999").status_code == 404
+    assert client.get("/api/catalogos/cp/22a00").status_code == 422
+    assert client.get("/api/catalogos/cp/123456").status_code == 422
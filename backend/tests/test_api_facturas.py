@@ -194,3 +194,79 @@ def test_timbrar_cancelar_y_pago(auth_client, db_session):
     assert fac_c["estatus"] == "CANCELADA"
     assert fac_c["status_pago"] == "NO_APLICA"  # o lo que corresponda
     assert fac_c["fecha_cancelacion"] is not None
+
+
+def _empresa_cliente_con_csd(db_session, csd_dir):
+    emp = Empresa(
+        nombre="EMPRESA SELLO",
+        nombre_comercial="EMPRESA SELLO",
+        ruc="RUC-S",
+        rfc="EKU9003173C9",
+        regimen_fiscal="601",
+        codigo_postal="01000",
+        contrasena="12345678a",
+    )
+    cli = Cliente(
+        nombre_comercial="CLIENTE S",
+        nombre_razon_social="CLIENTE S SA DE CV",
+        rfc="URE180429TM6",
+        regimen_fiscal="601",
+        codigo_postal="02020",
+    )
+    cli.empresas.append(emp)
+    db_session.add_all([emp, cli])
+    db_session.commit()
+    csd_dir(emp.id)
+    return emp, cli
+
+
+@pytest.mark.parametrize("usar_pool", [False, True])
+def test_sellar_lote(auth_client, db_session, csd_dir, monkeypatch, usar_pool):
+    from concurrent.futures import Future
+    from uuid import UUID
+
+    from app.services import cfdi40_xml, sellado_lote
+
+    tareas = []
+    if usar_pool:
+        monkeypatch.setattr(sellado_lote, "_MIN_LOTE_POOL", 1)
+        monkeypatch.setattr(sellado_lote.settings, "SELLADO_WORKERS", 2)
+
+        # Los workers (forkserver) no ven la BD en memoria ni el CERT_DIR de la
+        # prueba: la tarea corre aquí, pero con los mismos argumentos
+        def enviar(fn, *args, tarea=None, espera=None):
+            tareas.append(args)
+            futuro = Future()
+            futuro.set_result(fn(*args))
+            return futuro
+
+        monkeypatch.setattr(sellado_lote.computo, "enviar", enviar)
+        monkeypatch.setattr(
+            cfdi40_xml, "_contrasena_csd_desde_bd",
+            lambda empresa_id: db_session.get(Empresa, UUID(empresa_id)).contrasena,
+        )
+
+    emp, cli = _empresa_cliente_con_csd(db_session, csd_dir)
+    ids = []
+    payload = {**construir_factura_payload(str(emp.id), str(cli.id)), "metodo_pago": "PUE", "forma_pago": "03"}
+    for _ in range(3):
+        r = auth_client.post("/api/facturas/", json=payload)
+        assert r.status_code == 201, r.text
+        ids.append(r.json()["id"])
+    inexistente = "00000000-0000-0000-0000-000000000bad"
+
+    try:
+        r = auth_client.post("/api/facturas/sellar-lote", json={"ids": ids + [inexistente]})
+    finally:
+        sellado_lote.computo.shutdown_pool()
+    assert r.status_code == 200, r.text
+    data = r.json()
+    assert (data["total"], data["sellados"], data["errores"]) == (4, 3, 1)
+    assert [it["id"] for it in data["resultados"]] == ids + [inexistente]
+    for it in data["resultados"][:3]:
+        assert it["ok"] and 'Sello="' in it["xml"] and 'NoCertificado="30001000000500003416"' in it["xml"]
+    assert data["resultados"][3] == {"id": inexistente, "ok": False, "xml": None, "error": "Factura no encontrada"}
+    if usar_pool:
+        # La contraseña del CSD no viaja al worker, sólo su huella
+        assert len(tareas) == 3
+        assert all(args[1] == str(emp.id) and "12345678a" not in args for args in tareas)
@@ -0,0 +1,98 @@
+# tests/test_cadena_original.py
+"""Tests de la cadena original: caché de XSLT y generador nativo."""
+import os
+from pathlib import Path
+from xml.etree.ElementTree import Element, SubElement, tostring
+
+import pytest
+
+from app.services import cfdi40_xml as cfdi
+from app.services.cadena_original import (
+    NS_CFDI,
+    CadenaNoSoportada,
+    cadena_original_40,
+    normalize_space,
+)
+
+XSLT = """<?xml version="1.0" encoding="UTF-8"?>
+<xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+<xsl:output method="text" encoding="UTF-8"/>
+<xsl:template match="/">||{marca}|<xsl:value-of select="/a/@x"/>||</xsl:template>
+</xsl:stylesheet>
+"""
+
+
+@pytest.fixture
+def xslt_path(tmp_path):
+    ruta = tmp_path / "cadenaoriginal_4_0.xslt"
+    ruta.write_text(XSLT.format(marca="v1"), encoding="utf-8")
+    yield str(ruta)
+    cfdi._xslt_cache.pop(str(ruta), None)
+
+
+def test_compila_una_vez_y_reutiliza(xslt_path):
+    primero = cfdi._get_xslt_compilado(xslt_path)
+    assert primero.motor == "lxml"
+    assert primero(b'<a x="1"/>') == "||v1|1||"
+    assert cfdi._get_xslt_compilado(xslt_path) is primero
+
+
+def test_recompila_si_cambia_mtime(xslt_path):
+    primero = cfdi._get_xslt_compilado(xslt_path)
+    with open(xslt_path, "w", encoding="utf-8") as f:
+        f.write(XSLT.format(marca="v2"))
+    st = os.stat(xslt_path)
+    os.utime(xslt_path, ns=(st.st_atime_ns, primero.mtime_ns + 1_000_000_000))
+
+    segundo = cfdi._get_xslt_compilado(xslt_path)
+    assert segundo is not primero
+    assert segundo(b'<a x="2"/>') == "||v2|2||"
+
+
+# ── Generador nativo ─────────────────────────────────────────────────────────
+FIXTURES = Path(__file__).parent / "fixtures" / "cfdi"
+CORPUS = sorted(FIXTURES.glob("*.xml"))
+
+
+@pytest.mark.parametrize("xml_path", CORPUS, ids=lambda p: p.stem)
+def test_nativa_coincide_con_esperada(xml_path):
+    esperada = xml_path.with_suffix(".cadena.txt").read_text(encoding="utf-8")
+    assert cadena_original_40(xml_path.read_bytes()) == esperada
+
+
+def test_nativa_normalize_space_de_xpath():
+    assert normalize_space("  a \t b\r\n c  ") == "a b c"
+    assert normalize_space("a\u00a0b") == "a\u00a0b"  # NBSP no es blanco en XPath
+
+
+def test_nativa_acepta_element_con_prefijos_literales():
+    # pago20_xml arma el árbol con tags "cfdi:..." y xmlns como atributos
+    comprobante = Element("cfdi:Comprobante", {"xmlns:cfdi": NS_CFDI, "Version": "4.0"})
+    SubElement(comprobante, "cfdi:Emisor", {"Rfc": "EKU9003173C9", "Nombre": "X", "RegimenFiscal": "601"})
+    assert cadena_original_40(comprobante) == cadena_original_40(tostring(comprobante))
+    assert "|EKU9003173C9|X|601" in cadena_original_40(comprobante)
+
+
+def test_nativa_rechaza_complementos_no_cubiertos():
+    xml = (
+        b'<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/4" Version="4.0">'
+        b'<cfdi:Complemento><x:Otro xmlns:x="urn:otro"/></cfdi:Complemento></cfdi:Comprobante>'
+    )
+    with pytest.raises(CadenaNoSoportada):
+        cadena_original_40(xml)
+    with pytest.raises(CadenaNoSoportada):
+        cadena_original_40(b'<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/3" Version="3.3"/>')
+
+
+def _xslt_oficial():
+    ruta = cfdi._resolve_xslt_cadena40_path()
+    if not ruta:
+        pytest.skip("XSLT oficial de cadena original no disponible (DATA_DIR/sat)")
+    return ruta
+
+
+@pytest.mark.parametrize("xml_path", CORPUS, ids=lambda p: p.stem)
+def test_nativa_identica_al_xslt_oficial(xml_path):
+    _xslt_oficial()
+    xml = xml_path.read_bytes()
+    assert cadena_original_40(xml) == cfdi._build_cadena_original_40_xslt(xml)
@@ -0,0 +1,147 @@
+# tests/test_catalogos_sat.py
+"""Tests del almacén compilado (mmap), el registro de índices y la búsqueda de catálogos SAT."""
+import pytest
+
+from app.catalogos_sat import store
+from app.catalogos_sat.busqueda import IndiceBusqueda, normalizar
+from app.catalogos_sat.registro import IndiceCatalogo, indice
+
+FILAS = [
+    {"clave": "03", "descripcion": "Transferencia electrónica de fondos"},
+    {"clave": "01", "descripcion": "Efectivo"},
+    {"clave": "1803", "descripcion": "47187"},
+    {"clave": "01", "descripcion": "Duplicado"},
+    {"clave": "99", "descripcion": "Por definir"},
+]
+
+
+@pytest.fixture
+def catalogo(tmp_path):
+    ruta = str(tmp_path / "c_prueba.satcat")
+    assert store.escribir_catalogo(FILAS, ruta) == len(FILAS)
+    return store.CatalogoCompilado(ruta)
+
+
+def test_roundtrip_conserva_orden_y_contenido(catalogo):
+    assert len(catalogo) == len(FILAS)
+    assert list(catalogo) == FILAS
+    assert catalogo[0] == FILAS[0]
+    assert catalogo[-1] == FILAS[-1]
+    assert catalogo[1:3] == FILAS[1:3]
+    assert catalogo.columnas == ("clave", "descripcion")
+
+
+@pytest.mark.parametrize(
+    "clave,esperado",
+    [
+        ("01", {"clave": "01", "descripcion": "Efectivo"}),  # primera aparición
+        ("1803", {"clave": "1803", "descripcion": "47187"}),
+        ("99", {"clave": "99", "descripcion": "Por definir"}),
+        ("02", None),
+        ("", None),
+    ],
+)
+def test_buscar_por_clave(catalogo, clave, esperado):
+    assert catalogo.buscar(clave) == esperado
+
+
+def test_respaldo_en_memoria_tiene_misma_api():
+    cat = store.CatalogoEnMemoria(FILAS)
+    assert cat.buscar("01") == {"clave": "01", "descripcion": "Efectivo"}
+    assert cat.buscar("02") is None
+    assert list(cat.claves()) == [f["clave"] for f in FILAS]
+
+
+def test_archivo_invalido(tmp_path):
+    ruta = tmp_path / "roto.satcat"
+    ruta.write_bytes(b"NOPE" * 16)
+    with pytest.raises(ValueError):
+        store.CatalogoCompilado(str(ruta))
+
+
+# ── Registro de índices ──────────────────────────────────────────────────────
+def test_indice_exists_get_label():
+    idx = IndiceCatalogo("c_prueba", store.CatalogoEnMemoria(FILAS))
+    assert idx.exists("01") and "1803" in idx
+    assert not idx.exists("02") and not idx.exists(None)
+    assert idx.get("01") == {"clave": "01", "descripcion": "Efectivo"}
+    assert idx.label("99") == "Por definir"
+    assert idx.label("02") is None
+    assert idx.label("02", "") == ""
+    assert len(idx) == 4  # "01" duplicado cuenta una vez
+
+
+def test_indice_por_otra_columna():
+    idx = IndiceCatalogo("c_prueba", store.CatalogoEnMemoria(FILAS), columna="descripcion")
+    assert idx.get("Por definir")["clave"] == "99"
+
+
+def test_indice_se_construye_una_vez():
+    assert indice("c_formapago") is indice("c_formapago")
+    assert indice("c_formapago").label("03") == "Transferencia electrónica de fondos"
+    assert indice("c_regimenfiscal").exists("601")
+
+
+# ── Búsqueda para autocompletar ──────────────────────────────────────────────
+UNIDADES = [
+    {"clave": "A19", "descripcion": "Becquerel por metro cúbico"},
+    {"clave": "H87", "descripcion": "Pieza"},
+    {"clave": "H870", "descripcion": "Otra unidad"},
+    {"clave": "XKI", "descripcion": "Kit (Conjunto de piezas)"},
+    {"clave": "MTQ", "descripcion": "Metro cúbico"},
+    {"clave": "E48", "descripcion": "Unidad de servicio"},
+]
+
+
+@pytest.fixture
+def buscador():
+    return IndiceBusqueda(store.CatalogoEnMemoria(UNIDADES))
+
+
+def test_normalizar_quita_acentos_y_mayusculas():
+    assert normalizar("Metro CÚBICO") == "metro cubico"
+    assert normalizar(None) == ""
+
+
+def test_busqueda_ranking_clave_exacta_prefijo_subcadena(buscador):
+    claves = [r["clave"] for r in buscador.buscar("h87")]
+    assert claves[:2] == ["H87", "H870"]
+
+
+def test_busqueda_sin_acentos(buscador):
+    claves = [r["clave"] for r in buscador.buscar("metro cubico")]
+    assert set(claves) == {"A19", "MTQ"}
+
+
+def test_busqueda_prefijo_de_palabra_antes_que_subcadena(buscador):
+    claves = [r["clave"] for r in buscador.buscar("piez")]
+    assert claves == ["H87", "XKI"]
+    assert [r["clave"] for r in buscador.buscar("nidad")] == ["H870", "E48"]
+
+
+def test_busqueda_limit_y_vacios(buscador):
+    assert len(buscador.buscar("u", limit=2)) == 2
+    assert buscador.buscar("   ") == []
+    assert buscador.buscar("zzz") == []
+
+
+# ── Resolución de CP sin red ─────────────────────────────────────────────────
+@pytest.mark.parametrize(
+    "cp,esperado",
+    [("2280", "02280"), (" 22126 ", "22126"), ("C.P. 64000", "64000"), ("", ""), (None, "")],
+)
+def test_limpiar_codigo_postal(cp, esperado):
+    from app.catalogos_sat.codigos_postales import limpiar_codigo_postal
+
+    assert limpiar_codigo_postal(cp) == esperado
+
+
+@pytest.mark.parametrize(
+    "cp,estado",
+    [("01000", "CMX"), ("22126", "BCN"), ("23000", "BCS"), ("64000", "NLE"), ("99000", "ZAC")],
+)
+def test_estado_por_prefijo(cp, estado):
+    from app.catalogos_sat.codigos_postales import ESTADOS_MX, _estado_por_prefijo
+
+    assert _estado_por_prefijo(cp) == estado
+    assert estado in ESTADOS_MX
@@ -0,0 +1,195 @@
+from datetime import datetime, timedelta
+from uuid import UUID
+
+import pytest
+from fastapi import HTTPException
+
+from app.models.cliente import Cliente
+from app.models.empresa import Empresa
+from app.models.factura import Factura
+from app.models.trabajo_timbrado import COMPLETADO, EN_COLA, EN_PROCESO, FALLIDO
+from app.services import cola_timbrado
+from app.services import factura_service
+
+from tests.test_api_facturas import construir_factura_payload
+
+
+@pytest.fixture
+def sin_workers(monkeypatch):
+    """Los trabajos se quedan en cola: el test los procesa a mano."""
+    monkeypatch.setattr(cola_timbrado.settings, "TIMBRADO_WORKERS_EN_PROCESO", False)
+
+
+@pytest.fixture
+def sesion_worker(db_session):
+    """Sesión aparte (como la de un worker) cuyo rollback no deshace el test."""
+    from sqlalchemy.orm import Session
+
+    sesion = Session(bind=db_session.connection(), join_transaction_mode="create_savepoint")
+    yield sesion
+    sesion.close()
+
+
+def _empresa_cliente(db_session, nombre):
+    emp = Empresa(
+        nombre=nombre,
+        nombre_comercial=nombre,
+        ruc=f"RUC-{nombre}",
+        rfc="EKU9003173C9",
+        regimen_fiscal="601",
+        codigo_postal="01000",
+        contrasena="x",
+    )
+    cli = Cliente(
+        nombre_comercial=f"CLIENTE {nombre}",
+        nombre_razon_social=f"CLIENTE {nombre} SA DE CV",
+        rfc="URE180429TM6",
+        regimen_fiscal="601",
+        codigo_postal="02020",
+    )
+    cli.empresas.append(emp)
+    db_session.add_all([emp, cli])
+    db_session.commit()
+    return emp, cli
+
+
+def _crear_facturas(auth_client, emp, cli, n):
+    ids = []
+    for _ in range(n):
+        r = auth_client.post("/api/facturas/", json=construir_factura_payload(str(emp.id), str(cli.id)))
+        assert r.status_code == 201, r.text
+        ids.append(r.json()["id"])
+    return ids
+
+
+def test_timbrar_asincrono_encola_y_consulta_estado(auth_client, db_session, sin_workers):
+    emp, cli = _empresa_cliente(db_session, "ASYNC")
+    (fid,) = _crear_facturas(auth_client, emp, cli, 1)
+
+    r = auth_client.post(f"/api/facturas/{fid}/timbrar", params={"asincrono": "true"})
+    assert r.status_code == 202, r.text
+    trabajo = r.json()
+    assert trabajo["estado"] == EN_COLA and trabajo["factura_id"] == fid
+    assert r.headers["location"] == f"/api/facturas/timbrado/trabajos/{trabajo['id']}"
+
+    # Reintentar mientras sigue en cola devuelve el mismo trabajo
+    r = auth_client.post(f"/api/facturas/{fid}/timbrar", params={"asincrono": "true"})
+    assert r.status_code == 202 and r.json()["id"] == trabajo["id"]
+
+    r = auth_client.get(f"/api/facturas/timbrado/trabajos/{trabajo['id']}")
+    assert r.status_code == 200 and r.json()["estado"] == EN_COLA
+
+    r = auth_client.get("/api/facturas/timbrado/trabajos/00000000-0000-0000-0000-000000000bad")
+    assert r.status_code == 404
+
+
+def test_tomar_trabajo_respeta_limite_por_empresa(
+    auth_client, db_session, sesion_worker, sin_workers, monkeypatch
+):
+    emp_a, cli_a = _empresa_cliente(db_session, "A")
+    emp_b, cli_b = _empresa_cliente(db_session, "B")
+    monkeypatch.setattr(cola_timbrado.settings, "TIMBRADO_LIMITE_POR_EMPRESA", 5)
+    monkeypatch.setattr(cola_timbrado.settings, "TIMBRADO_LIMITES_EMPRESA", {str(emp_a.id): 1})
+
+    ids_a = _crear_facturas(auth_client, emp_a, cli_a, 3)
+    ids_b = _crear_facturas(auth_client, emp_b, cli_b, 1)
+    for fid in ids_a + ids_b:
+        cola_timbrado.encolar_timbrado(db_session, db_session.get(Factura, UUID(fid)))
+
+    primero = cola_timbrado.tomar_trabajo(sesion_worker)
+    segundo = cola_timbrado.tomar_trabajo(sesion_worker)
+    assert primero.empresa_id == emp_a.id and primero.estado == EN_PROCESO
+    assert segundo.empresa_id == emp_b.id  # A ya está en su límite
+    assert cola_timbrado.tomar_trabajo(sesion_worker) is None
+
+    # Al terminar el de A se libera un lugar para el siguiente de A
+    cola_timbrado._terminar(sesion_worker, primero.id, COMPLETADO)
+    tercero = cola_timbrado.tomar_trabajo(sesion_worker)
+    assert tercero.empresa_id == emp_a.id and tercero.intentos == 1
+
+
+def test_ejecutar_trabajo_guarda_resultado_o_error(
+    auth_client, db_session, sesion_worker, sin_workers, monkeypatch
+):
+    emp, cli = _empresa_cliente(db_session, "EJEC")
+    ok_id, falla_id = _crear_facturas(auth_client, emp, cli, 2)
+
+    def timbrar_falso(db, factura_id):
+        if str(factura_id) == falla_id:
+            raise HTTPException(status_code=409, detail="CFDI40147 RFC inválido")
+        f = db.get(Factura, factura_id)
+        f.estatus, f.cfdi_uuid = "TIMBRADA", "11111111-2222-3333-4444-555555555555"
+        db.commit()
+        return {"ok": True, "timbrada": True, "uuid": f.cfdi_uuid}
+
+    monkeypatch.setattr(factura_service, "timbrar_factura", timbrar_falso)
+    for fid in (ok_id, falla_id):
+        cola_timbrado.encolar_timbrado(db_session, db_session.get(Factura, UUID(fid)))
+
+    estados = []
+    while (trabajo := cola_timbrado.tomar_trabajo(sesion_worker)) is not None:
+        estados.append(cola_timbrado.ejecutar_trabajo(sesion_worker, trabajo))
+    assert sorted(estados) == [COMPLETADO, FALLIDO]
+
+    por_factura = {
+        str(t.factura_id): t
+        for t in sesion_worker.query(cola_timbrado.TrabajoTimbrado).all()
+    }
+    ok, falla = por_factura[ok_id], por_factura[falla_id]
+    assert ok.resultado == {"uuid": "11111111-2222-3333-4444-555555555555"}
+    assert ok.terminado_en is not None
+    assert falla.estado == FALLIDO and falla.error == "CFDI40147 RFC inválido"
+
+    r = auth_client.get(f"/api/facturas/timbrado/trabajos/{ok.id}")
+    assert r.json()["estado"] == COMPLETADO and r.json()["resultado"]["uuid"].startswith("1111")
+
+
+def test_encolar_concurrente_devuelve_el_trabajo_activo(auth_client, db_session, sesion_worker, sin_workers, monkeypatch):
+    from sqlalchemy.exc import IntegrityError
+    from app.models.trabajo_timbrado import TrabajoTimbrado
+
+    emp, cli = _empresa_cliente(db_session, "CARRERA")
+    (fid,) = _crear_facturas(auth_client, emp, cli, 1)
+    primero = cola_timbrado.encolar_timbrado(db_session, db_session.get(Factura, UUID(fid)))
+
+    # El índice único parcial no admite un segundo trabajo activo
+    with pytest.raises(IntegrityError):
+        with sesion_worker.begin_nested():
+            sesion_worker.add(TrabajoTimbrado(empresa_id=emp.id, factura_id=UUID(fid), estado=EN_PROCESO))
+            sesion_worker.flush()
+
+    # Otro encolado que no vio el trabajo (check-then-insert) recibe el existente
+    buscar = cola_timbrado._activo_de_factura
+    llamadas = []
+    monkeypatch.setattr(
+        cola_timbrado, "_activo_de_factura",
+        lambda db, f: buscar(db, f) if llamadas.append(f) or len(llamadas) > 1 else None,
+    )
+    segundo = cola_timbrado.encolar_timbrado(sesion_worker, sesion_worker.get(Factura, UUID(fid)))
+    assert segundo.id == primero.id and len(llamadas) == 2
+
+
+def test_colgados_no_se_reencolan(auth_client, db_session, sesion_worker, sin_workers):
+    emp, cli = _empresa_cliente(db_session, "COLG")
+    timbrada_id, pendiente_id = _crear_facturas(auth_client, emp, cli, 2)
+    for fid in (timbrada_id, pendiente_id):
+        cola_timbrado.encolar_timbrado(db_session, db_session.get(Factura, UUID(fid)))
+    while cola_timbrado.tomar_trabajo(sesion_worker) is not None:
+        pass
+
+    # El worker cayó: uno alcanzó a guardar el timbrado, el otro no se sabe
+    f = sesion_worker.get(Factura, UUID(timbrada_id))
+    f.estatus, f.cfdi_uuid = "TIMBRADA", "11111111-2222-3333-4444-555555555555"
+    for t in sesion_worker.query(cola_timbrado.TrabajoTimbrado).all():
+        t.iniciado_en = datetime.utcnow() - timedelta(hours=1)
+    sesion_worker.commit()
+
+    assert cola_timbrado.recuperar_colgados(sesion_worker) == 2
+    por_factura = {
+        str(t.factura_id): t
+        for t in sesion_worker.query(cola_timbrado.TrabajoTimbrado).all()
+    }
+    timbrada, pendiente = por_factura[timbrada_id], por_factura[pendiente_id]
+    assert timbrada.estado == COMPLETADO and timbrada.resultado["uuid"].startswith("1111")
+    assert pendiente.estado == FALLIDO and "verificar en el PAC" in pendiente.error
+    assert cola_timbrado.tomar_trabajo(sesion_worker) is None
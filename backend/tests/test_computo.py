@@ -0,0 +1,72 @@
+# tests/test_computo.py
+"""Pool de procesos para trabajo de CPU: ejecución fuera del proceso, contrapresión, timeouts y métricas."""
+import os
+import time
+
+import pytest
+
+from app.services import computo
+
+
+def _pid() -> int:
+    return os.getpid()
+
+
+def _dormir(segundos: float) -> float:
+    time.sleep(segundos)
+    return segundos
+
+
+def _fallar(mensaje: str) -> None:
+    raise ValueError(mensaje)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(computo.settings, "COMPUTO_ACTIVO", True)
+    monkeypatch.setattr(computo.settings, "COMPUTO_WORKERS", 1)
+    computo.shutdown_pool()
+    computo.reiniciar_metricas()
+    yield
+    computo.shutdown_pool()
+    computo.reiniciar_metricas()
+
+
+def test_ejecutar_en_otro_proceso_con_metricas(pool):
+    assert computo.ejecutar(_pid) != os.getpid()
+    assert computo.ejecutar(_dormir, 0.01, tarea="dormir") == 0.01
+    with pytest.raises(ValueError, match="sin datos"):
+        computo.ejecutar(_fallar, "sin datos")
+
+    m = computo.metricas()
+    assert m["activo"] and m["workers"] == 1 and m["pool_iniciado"] and m["pendientes"] == 0
+    assert m["tareas"]["pid"]["total"] == 1 and m["tareas"]["fallar"]["errores"] == 1
+    assert m["tareas"]["dormir"]["ejecucion_p50_ms"] >= 10
+
+
+def test_contrapresion_y_timeout(pool, monkeypatch):
+    monkeypatch.setattr(computo.settings, "COMPUTO_MAX_PENDIENTES", 1)
+    monkeypatch.setattr(computo.settings, "COMPUTO_ESPERA_S", 0.05)
+
+    ocupado = computo.enviar(_dormir, 0.5)
+    with pytest.raises(computo.ComputoSaturado) as exc:
+        computo.ejecutar(_pid)
+    assert exc.value.status_code == 503 and exc.value.headers["Retry-After"]
+    assert ocupado.result(timeout=30) == 0.5
+
+    # El lugar se libera al terminar; el timeout lo conserva hasta que acaba la tarea
+    with pytest.raises(computo.ComputoTimeout) as exc:
+        computo.ejecutar(_dormir, 0.5, timeout=0.05)
+    assert exc.value.status_code == 504
+    time.sleep(0.6)
+    assert computo.ejecutar(_pid) != os.getpid()
+
+    tareas = computo.metricas()["tareas"]
+    assert tareas["pid"]["rechazadas"] == 1 and tareas["dormir"]["timeouts"] == 1
+
+
+def test_inactivo_corre_en_el_hilo(monkeypatch):
+    monkeypatch.setattr(computo.settings, "COMPUTO_ACTIVO", False)
+    computo.reiniciar_metricas()
+    assert computo.ejecutar(_pid) == os.getpid()
+    assert computo.metricas()["tareas"]["pid"]["en_linea"] == 1
@@ -0,0 +1,104 @@
+# tests/test_csd_cache.py
+"""Tests de la caché de CSD (certificado y llave privada) por empresa."""
+import io
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import cfdi40_xml as cfdi
+
+EMPRESA_ID = "00000000-0000-0000-0000-0000000000c5"
+PASSWORD = "12345678a"
+
+
+@pytest.fixture
+def cert_dir(csd_dir):
+    return csd_dir(EMPRESA_ID, PASSWORD)
+
+
+@pytest.fixture
+def contador(monkeypatch):
+    llamadas = {"cer": 0, "key": 0}
+    read_cert, read_key = cfdi._read_csd_cert, cfdi._read_csd_key
+
+    def cert(path):
+        llamadas["cer"] += 1
+        return read_cert(path)
+
+    def key(path, pwd):
+        llamadas["key"] += 1
+        return read_key(path, pwd)
+
+    monkeypatch.setattr(cfdi, "_read_csd_cert", cert)
+    monkeypatch.setattr(cfdi, "_read_csd_key", key)
+    return llamadas
+
+
+def _empresa(contrasena=PASSWORD):
+    return SimpleNamespace(id=EMPRESA_ID, contrasena=contrasena)
+
+
+def test_cert_y_llave_se_leen_una_vez(cert_dir, contador):
+    no_cert, cert_b64, _ = cfdi._load_csd_cert_for_empresa(_empresa())
+    assert no_cert == "30001000000500003416" and cert_b64
+    assert cfdi._load_csd_cert_for_empresa(_empresa())[1] == cert_b64
+
+    key = cfdi._load_csd_key_for_empresa(_empresa())
+    assert key is not None
+    assert cfdi._load_csd_key_for_empresa(_empresa()) is key
+    assert contador == {"cer": 1, "key": 1}
+
+
+def test_cambio_de_password_o_archivo_invalida(cert_dir, contador):
+    key = cfdi._load_csd_key_for_empresa(_empresa())
+    assert cfdi._load_csd_key_for_empresa(_empresa("otra")) is None
+    assert contador["key"] == 2
+
+    ruta = cert_dir / f"{EMPRESA_ID}.key"
+    st = os.stat(ruta)
+    os.utime(ruta, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    nueva = cfdi._load_csd_key_for_empresa(_empresa())
+    assert nueva is not None and nueva is not key
+    assert contador["key"] == 3
+
+
+def test_worker_lee_la_contrasena_solo_si_falta_la_llave(cert_dir, contador):
+    leidas = []
+
+    def contrasena():
+        leidas.append(EMPRESA_ID)
+        return PASSWORD
+
+    huella = cfdi._huella_contrasena(PASSWORD)
+    assert PASSWORD not in huella
+    key = cfdi._load_csd_key(EMPRESA_ID, huella, contrasena)
+    assert key is not None and cfdi._load_csd_key(EMPRESA_ID, huella, contrasena) is key
+    # Misma entrada de caché que la del proceso web con la misma contraseña
+    assert cfdi._load_csd_key_for_empresa(_empresa()) is key
+    assert len(leidas) == 1 and contador["key"] == 1
+
+
+def test_fallo_se_cachea_por_ttl(cert_dir, contador, monkeypatch):
+    assert cfdi._load_csd_key_for_empresa(_empresa("mala")) is None
+    assert cfdi._load_csd_key_for_empresa(_empresa("mala")) is None
+    assert contador["key"] == 1
+
+    monkeypatch.setattr(cfdi, "CSD_NEGATIVE_TTL", 0.0)
+    cfdi.invalidar_csd_cache(EMPRESA_ID)
+    cfdi._load_csd_key_for_empresa(_empresa("mala"))
+    cfdi._load_csd_key_for_empresa(_empresa("mala"))
+    assert contador["key"] == 3
+
+
+def test_guardar_certificado_invalida(cert_dir, contador, monkeypatch):
+    from app.services import certificado
+
+    monkeypatch.setattr(certificado, "CERT_DIR", str(cert_dir))
+    cfdi._load_csd_cert_for_empresa(_empresa())
+    with open(cert_dir / f"{EMPRESA_ID}.cer", "rb") as f:
+        nuevo = f.read()
+    certificado.CertificadoService.guardar(SimpleNamespace(file=io.BytesIO(nuevo)), f"{EMPRESA_ID}.cer")
+    assert (EMPRESA_ID, "cer") not in cfdi._csd_cache
+    cfdi._load_csd_cert_for_empresa(_empresa())
+    assert contador["cer"] == 2
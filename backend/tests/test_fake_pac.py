@@ -0,0 +1,67 @@
+# tests/test_fake_pac.py
+"""Timbrado, cancelación y consulta SAT de punta a punta contra el PAC/SAT falso."""
+from uuid import UUID
+
+from app.models.factura import Factura
+from app.services import acuse_cancelacion_service, sat_cfdi_service
+
+from tests.test_api_facturas import _empresa_cliente_con_csd, construir_factura_payload
+
+
+def _factura(auth_client, db_session, csd_dir):
+    emp, cli = _empresa_cliente_con_csd(db_session, csd_dir)
+    payload = {
+        **construir_factura_payload(str(emp.id), str(cli.id)),
+        "metodo_pago": "PUE",
+        "forma_pago": "03",
+    }
+    r = auth_client.post("/api/facturas/", json=payload)
+    assert r.status_code == 201, r.text
+    return r.json()["id"]
+
+
+def test_timbrar_consultar_y_cancelar(auth_client, db_session, csd_dir, fake_pac):
+    fid = _factura(auth_client, db_session, csd_dir)
+
+    r = auth_client.post(f"/api/facturas/{fid}/timbrar")
+    assert r.status_code == 200, r.text
+    folio = r.json()["uuid"]
+    f = db_session.get(Factura, UUID(fid))
+    db_session.refresh(f)
+    assert f.estatus == "TIMBRADA" and f.cfdi_uuid == folio
+    assert f.no_certificado_sat == "30001000000500003456" and f.sello_sat
+    with open(f.xml_path, "rb") as fh:
+        assert b"tfd:TimbreFiscalDigital" in fh.read()
+
+    acuse = sat_cfdi_service.consultar_cfdi("EKU9003173C9", "URE180429TM6", float(f.total), folio)
+    assert acuse.encontrado and acuse.estado == "Vigente"
+    # Total distinto → N - 601, como el SAT
+    acuse = sat_cfdi_service.consultar_cfdi("EKU9003173C9", "URE180429TM6", float(f.total) + 1, folio)
+    assert acuse.codigo_estatus.startswith("N - 601")
+
+    r = auth_client.post(f"/api/facturas/{fid}/cancelar", json={"motivo_cancelacion": "02"})
+    assert r.status_code == 200, r.text
+    db_session.refresh(f)
+    assert f.estatus == "CANCELADA"
+    assert b"<Acuse" in acuse_cancelacion_service.descargar_acuse_xml(f)
+    assert fake_pac.estado.peticiones == {"timbrar": 1, "consultar": 3, "cancelar": 1, "acuse": 1}
+
+
+def test_fault_del_pac_deja_factura_en_borrador(auth_client, db_session, csd_dir, fake_pac):
+    fid = _factura(auth_client, db_session, csd_dir)
+    fake_pac.config.tasa_fault = 1.0
+    fake_pac.config.fault_string = "CFDI40102 - El resultado de la digestión debe ser igual"
+
+    r = auth_client.post(f"/api/facturas/{fid}/timbrar")
+    assert r.status_code == 400
+    assert "CFDI40102" in r.json()["error"]["detail"]
+    f = db_session.get(Factura, UUID(fid))
+    db_session.refresh(f)
+    assert f.estatus == "BORRADOR" and f.cfdi_uuid is None
+
+
+def test_consulta_uuid_desconocido_es_n602(fake_pac):
+    acuse = sat_cfdi_service.consultar_cfdi(
+        "EKU9003173C9", "URE180429TM6", 116.0, "6F1C2A9B-0000-4000-8000-000000000000"
+    )
+    assert not acuse.encontrado and acuse.codigo_estatus.startswith("N - 602")
@@ -0,0 +1,62 @@
+# tests/test_pac_http.py
+"""Tests del cliente HTTP compartido del PAC (keep-alive y tiempos)."""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.services import pac_http
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = b"<ok/>"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def servidor():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    hilo = threading.Thread(target=srv.serve_forever, daemon=True)
+    hilo.start()
+    yield f"http://127.0.0.1:{srv.server_address[1]}/soap"
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture(autouse=True)
+def cliente_limpio():
+    pac_http.cerrar_cliente()
+    pac_http._stats.clear()
+    yield
+    pac_http.cerrar_cliente()
+    pac_http._stats.clear()
+
+
+def test_reutiliza_conexion_y_mide_tiempos(servidor):
+    for _ in range(3):
+        r = pac_http.post_soap("timbrar", servidor, b"<x/>", {"Content-Type": "text/xml"})
+        assert r.status_code == 200 and r.content == b"<ok/>"
+
+    stats = pac_http.estadisticas()["timbrar"]
+    assert stats["peticiones"] == 3
+    assert stats["reutilizadas"] == 2  # sólo la primera abre TCP
+    assert stats["total_ms_prom"] > 0
+
+
+def test_cliente_se_reabre_tras_cerrar(servidor):
+    primero = pac_http.get_client()
+    assert pac_http.get_client() is primero
+    pac_http.cerrar_cliente()
+    assert pac_http.post_soap("cancelar", servidor, b"<x/>", {}).status_code == 200
+    assert pac_http.get_client() is not primero
@@ -0,0 +1,103 @@
+# tests/test_pac_respuesta.py
+"""Lectura en streaming de la respuesta de timbrado: Base64 → archivo, TFD en una pasada."""
+import base64
+import os
+from uuid import UUID
+
+import pytest
+
+from app.models.factura import Factura
+from app.services.pac_errors import RespuestaPAC
+from app.services.pac_respuesta import leer_respuesta_timbrado
+from app.services.timbrado_factmoderna import FacturacionModernaPAC
+
+from tests.test_fake_pac import _factura
+
+CFDI = (
+    b'<?xml version="1.0" encoding="UTF-8"?>'
+    b'<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/4" NoCertificado="30001000000500003416">'
+    b'<cfdi:Complemento><tfd:TimbreFiscalDigital xmlns:tfd="http://www.sat.gob.mx/TimbreFiscalDigital"'
+    b' UUID="6F1C2A9B-1111-4000-8000-000000000001" FechaTimbrado="2025-01-01T12:00:00"'
+    b' RfcProvCertif="FLI081010EK2" SelloCFD="abc" NoCertificadoSAT="30001000000500003456" SelloSAT="xyz"/>'
+    b"</cfdi:Complemento></cfdi:Comprobante>"
+)
+
+
+def _soap(cuerpo: str) -> bytes:
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<SOAP-ENV:Envelope xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/envelope/">'
+        f"<SOAP-ENV:Body><return>{cuerpo}</return></SOAP-ENV:Body></SOAP-ENV:Envelope>"
+    ).encode()
+
+
+def _bloques(datos: bytes, tamano: int):
+    return (datos[i : i + tamano] for i in range(0, len(datos), tamano))
+
+
+@pytest.mark.parametrize("tamano", [1, 7, 4096])
+def test_decodifica_por_bloques_y_extrae_tfd(tmp_path, tamano):
+    pdf = os.urandom(5000)
+    soap = _soap(
+        f"<xml>{base64.b64encode(CFDI).decode()}</xml>"
+        f"<pdf>{base64.encodebytes(pdf).decode()}</pdf>"
+    )
+    leido = leer_respuesta_timbrado(_bloques(soap, tamano), str(tmp_path), adjuntos=["pdf"])
+
+    assert leido.lector.tfd["uuid"] == "6F1C2A9B-1111-4000-8000-000000000001"
+    assert leido.lector.tfd["no_certificado_sat"] == "30001000000500003456"
+    assert leido.lector.no_certificado == "30001000000500003416"
+    with open(leido.cfdi.ruta, "rb") as fh:
+        assert fh.read() == CFDI
+    with open(leido.adjuntos["pdf"].ruta, "rb") as fh:
+        assert fh.read() == pdf
+
+
+def test_adjunto_no_pedido_no_se_escribe(tmp_path):
+    soap = _soap(f"<xml>{base64.b64encode(CFDI).decode()}</xml><pdf>{base64.b64encode(b'x' * 99).decode()}</pdf>")
+    leido = leer_respuesta_timbrado([soap], str(tmp_path))
+    assert leido.adjuntos == {}
+    assert os.listdir(tmp_path) == [os.path.basename(leido.cfdi.ruta)]
+
+
+def test_fault_levanta_y_no_deja_temporales(tmp_path):
+    soap = _soap(
+        "<SOAP-ENV:Fault><faultcode>301</faultcode><faultstring>XML mal formado</faultstring></SOAP-ENV:Fault>"
+    )
+    with pytest.raises(RespuestaPAC, match="PAC devolvió Fault: 301 XML mal formado"):
+        leer_respuesta_timbrado(_bloques(soap, 5), str(tmp_path))
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize(
+    "cuerpo, mensaje",
+    [
+        ("<otro>nada</otro>", "No se encontró el nodo <xml>"),
+        ("<xml>no*es*base64</xml>", "base64"),
+    ],
+)
+def test_respuestas_invalidas(tmp_path, cuerpo, mensaje):
+    with pytest.raises(RuntimeError, match=mensaje):
+        leer_respuesta_timbrado([_soap(cuerpo)], str(tmp_path))
+    assert os.listdir(tmp_path) == []
+
+
+def test_soap_truncado_es_invalido(tmp_path):
+    with pytest.raises(RuntimeError, match="Respuesta SOAP inválida"):
+        leer_respuesta_timbrado([_soap("<xml>QUJD")[:-30]], str(tmp_path))
+    assert os.listdir(tmp_path) == []
+
+
+def test_timbrado_con_pdf_del_pac(auth_client, db_session, csd_dir, fake_pac):
+    fake_pac.config.pdf_kb = 256
+    fid = _factura(auth_client, db_session, csd_dir)
+
+    res = FacturacionModernaPAC().timbrar_factura(db=db_session, factura_id=UUID(fid), generar_pdf=True)
+    f = db_session.get(Factura, UUID(fid))
+    assert f.estatus == "TIMBRADA" and f.cfdi_uuid == res["uuid"]
+    assert f.pdf_path == res["pdf_path"]
+    with open(res["pdf_path"], "rb") as fh:
+        contenido = fh.read()
+    assert contenido.startswith(b"%PDF-1.4") and len(contenido) > 256 * 1024
+    # Sólo quedan los archivos finales, sin temporales
+    assert not [n for n in os.listdir(os.path.dirname(res["xml_path"])) if n.startswith(".pac-")]
@@ -0,0 +1,298 @@
+# tests/test_pac_router.py
+"""Router multi-PAC: elección por latencia/errores, failover, reintentos, circuit breaker y no doble timbrado."""
+import socket
+import time
+from uuid import UUID
+
+import pytest
+
+from app.models.factura import Factura
+from app.services import pac_router
+from app.services.pac_errors import ErrorRedPAC, RespuestaPAC, error_http
+from app.services.pac_router import (
+    ABIERTO, CERRADO, SEMIABIERTO, PACNoDisponible, PACRouter, ProveedorPAC,
+)
+
+from tests.test_fake_pac import _factura
+
+
+@pytest.fixture(autouse=True)
+def _sin_espera(monkeypatch):
+    monkeypatch.setattr(pac_router.settings, "PAC_REINTENTO_BASE_S", 0.0)
+
+
+class _Proveedor(ProveedorPAC):
+    def __init__(self, nombre, error=None, fallas=None):
+        self.nombre = nombre
+        self.error = error
+        # Si se indica, sólo las primeras `fallas` llamadas levantan el error
+        self.fallas = fallas
+        self.llamadas = 0
+
+    def timbrar_factura(self, *, db, factura_id, **opciones):
+        self.llamadas += 1
+        if self.error and (self.fallas is None or self.llamadas <= self.fallas):
+            raise self.error
+        return {"timbrada": True, "uuid": f"UUID-{self.nombre}"}
+
+    def timbrar_pago(self, *, db, pago_id, **opciones):
+        raise AssertionError("no usado")
+
+    def solicitar_cancelacion_cfdi(self, *, db, factura_id, motivo, folio_sustitucion=None):
+        raise AssertionError("no usado")
+
+    def solicitar_cancelacion_pago(self, *, db, pago_id, motivo, folio_sustituto=None):
+        raise AssertionError("no usado")
+
+    def descargar_acuse(self, doc, *, forzar=False):
+        raise AssertionError("no usado")
+
+
+def _timbrar(router, ya_hecho=None):
+    return router._ejecutar(
+        "timbrar", lambda p: p.timbrar_factura(db=None, factura_id=None), ya_hecho
+    )
+
+
+def test_failover_si_la_conexion_no_se_abrio(monkeypatch):
+    monkeypatch.setattr(pac_router.settings, "PAC_REINTENTOS", 2)
+    caido = _Proveedor("a", ErrorRedPAC("Error de red al timbrar: refused", enviada=False))
+    sano = _Proveedor("b")
+    router = PACRouter([caido, sano])
+
+    assert _timbrar(router)["uuid"] == "UUID-b"
+    m = router.metricas()
+    assert m["failovers"] == 1
+    # 1 intento + 2 reintentos en el caído antes de pasar al siguiente
+    assert caido.llamadas == 3
+    assert m["proveedores"]["a"]["errores"] == 3 and m["proveedores"]["b"]["elegido"] == 1
+    # El caído queda al final del orden
+    assert m["orden"] == ["b", "a"]
+
+
+def test_sin_failover_si_la_peticion_pudo_llegar(monkeypatch):
+    monkeypatch.setattr(pac_router.settings, "PAC_FAILOVER_TRAS_ENVIO", False)
+    lento = _Proveedor("a", ErrorRedPAC("Error de red al timbrar: ReadTimeout", enviada=True))
+    otro = _Proveedor("b")
+    with pytest.raises(ErrorRedPAC):
+        _timbrar(PACRouter([lento, otro]))
+    assert otro.llamadas == 0
+
+
+def test_no_reenvia_si_ya_tiene_uuid():
+    caido = _Proveedor("a", ErrorRedPAC("refused", enviada=False))
+    otro = _Proveedor("b")
+    res = _timbrar(PACRouter([caido, otro]), ya_hecho=lambda: {"timbrada": True, "uuid": "PREVIO"})
+    assert res["uuid"] == "PREVIO" and otro.llamadas == 0
+
+
+def test_reintenta_el_mismo_proveedor_si_no_se_envio():
+    intermitente = _Proveedor("a", ErrorRedPAC("refused", enviada=False), fallas=1)
+    otro = _Proveedor("b")
+    router = PACRouter([intermitente, otro])
+    assert _timbrar(router)["uuid"] == "UUID-a"
+    assert intermitente.llamadas == 2 and otro.llamadas == 0
+    assert router.metricas()["failovers"] == 0
+
+
+def test_no_reintenta_si_ya_tiene_uuid():
+    intermitente = _Proveedor("a", ErrorRedPAC("refused", enviada=False), fallas=1)
+    res = _timbrar(PACRouter([intermitente]), ya_hecho=lambda: {"timbrada": True, "uuid": "PREVIO"})
+    assert res["uuid"] == "PREVIO" and intermitente.llamadas == 1
+
+
+def test_circuito_abre_y_falla_rapido(monkeypatch):
+    monkeypatch.setattr(pac_router.settings, "PAC_REINTENTOS", 0)
+    monkeypatch.setattr(pac_router.settings, "PAC_CB_MIN_MUESTRAS", 3)
+    monkeypatch.setattr(pac_router.settings, "PAC_CB_ENFRIAMIENTO_S", 60.0)
+    caido = _Proveedor("a", ErrorRedPAC("refused", enviada=False))
+    router = PACRouter([caido])
+
+    for _ in range(3):
+        with pytest.raises(ErrorRedPAC):
+            _timbrar(router)
+    assert router.circuitos() == {"a": ABIERTO}
+
+    with pytest.raises(PACNoDisponible, match="Intenta de nuevo en 60 s"):
+        _timbrar(router)
+    assert caido.llamadas == 3
+    assert router.metricas()["proveedores"]["a"]["circuito"]["aperturas"] == 1
+
+
+def test_circuito_semiabierto_cierra_con_sonda_exitosa(monkeypatch):
+    monkeypatch.setattr(pac_router.settings, "PAC_REINTENTOS", 0)
+    monkeypatch.setattr(pac_router.settings, "PAC_CB_MIN_MUESTRAS", 2)
+    monkeypatch.setattr(pac_router.settings, "PAC_CB_ENFRIAMIENTO_S", 0.05)
+    prov = _Proveedor("a", ErrorRedPAC("refused", enviada=False), fallas=3)
+    router = PACRouter([prov])
+
+    for _ in range(2):
+        with pytest.raises(ErrorRedPAC):
+            _timbrar(router)
+    assert router.circuitos() == {"a": ABIERTO}
+
+    # La sonda falla: vuelve a abrir
+    time.sleep(0.06)
+    with pytest.raises(ErrorRedPAC):
+        _timbrar(router)
+    assert router.circuitos() == {"a": ABIERTO}
+
+    # La siguiente sonda sale bien: cierra y limpia la ventana
+    time.sleep(0.06)
+    assert _timbrar(router)["uuid"] == "UUID-a"
+    assert router.circuitos() == {"a": CERRADO}
+    assert router.metricas()["proveedores"]["a"]["muestras"] == 0
+
+
+def _semiabierto(router, nombre, monkeypatch):
+    monkeypatch.setattr(pac_router.settings, "PAC_CB_ENFRIAMIENTO_S", 0.0)
+    router._circuitos[nombre]._abrir()
+
+
+def test_sonda_se_libera_si_la_llamada_no_mide_al_pac(monkeypatch):
+    monkeypatch.setattr(pac_router.settings, "PAC_REINTENTOS", 0)
+    roto = _Proveedor("a", KeyError("bug local"), fallas=1)
+    router = PACRouter([roto])
+    _semiabierto(router, "a", monkeypatch)
+
+    with pytest.raises(KeyError):
+        _timbrar(router)
+    assert router.circuitos() == {"a": SEMIABIERTO}
+    # La sonda quedó libre: la siguiente llamada la hace y cierra el circuito
+    assert _timbrar(router)["uuid"] == "UUID-a"
+    assert router.circuitos() == {"a": CERRADO}
+
+
+def test_sonda_se_libera_si_ya_estaba_aplicado(monkeypatch):
+    monkeypatch.setattr(pac_router.settings, "PAC_REINTENTOS", 0)
+    caido = _Proveedor("a", ErrorRedPAC("refused", enviada=False))
+    respaldo = _Proveedor("b")
+    router = PACRouter([caido, respaldo])
+    _semiabierto(router, "b", monkeypatch)
+
+    res = _timbrar(router, ya_hecho=lambda: {"timbrada": True, "uuid": "PREVIO"})
+    assert res["uuid"] == "PREVIO" and respaldo.llamadas == 0
+    assert router.metricas()["proveedores"]["b"]["circuito"]["sonda_en_curso"] is False
+
+
+def test_5xx_sin_fault_cuenta_como_falla(monkeypatch):
+    monkeypatch.setattr(pac_router.settings, "PAC_FAILOVER_TRAS_ENVIO", False)
+    gateway = _Proveedor("a", error_http(502, "<html>Bad Gateway</html>", "HTTP 502 del PAC"))
+    router = PACRouter([gateway])
+    with pytest.raises(RuntimeError, match="HTTP 502"):
+        _timbrar(router)
+    assert router.metricas()["proveedores"]["a"]["errores"] == 1
+    # Sin failover: la petición llegó al servidor
+    assert gateway.llamadas == 1
+
+
+def test_fault_y_4xx_cuentan_como_respuesta(monkeypatch):
+    fault = "<soap:Envelope><soap:Body><soap:Fault><faultstring>CFDI40102</faultstring></soap:Fault></soap:Body></soap:Envelope>"
+    for error in (error_http(500, fault, "HTTP 500 del PAC"), error_http(400, "<html/>", "HTTP 400 del PAC")):
+        assert isinstance(error, RespuestaPAC)
+        router = PACRouter([_Proveedor("a", error)])
+        with pytest.raises(RespuestaPAC):
+            _timbrar(router)
+        m = router.metricas()["proveedores"]["a"]
+        assert m["errores"] == 0 and m["muestras"] == 1
+
+
+def test_error_local_no_cuenta_ni_cierra_el_circuito(monkeypatch):
+    monkeypatch.setattr(pac_router.settings, "PAC_REINTENTOS", 0)
+    sin_llave = _Proveedor("a", RuntimeError("No se pudo cargar la llave privada del CSD"), fallas=1)
+    router = PACRouter([sin_llave])
+    with pytest.raises(RuntimeError, match="llave privada"):
+        _timbrar(router)
+    assert router.metricas()["proveedores"]["a"]["muestras"] == 0
+
+    # Como sonda tampoco cierra el circuito: sólo la libera
+    _semiabierto(router, "a", monkeypatch)
+    sin_llave.llamadas, sin_llave.fallas = 0, 1
+    with pytest.raises(RuntimeError):
+        _timbrar(router)
+    assert router.circuitos() == {"a": SEMIABIERTO}
+    assert router.metricas()["proveedores"]["a"]["circuito"]["sonda_en_curso"] is False
+
+
+def test_mensaje_con_sonda_en_curso(monkeypatch):
+    router = PACRouter([_Proveedor("a")])
+    _semiabierto(router, "a", monkeypatch)
+    assert router._circuitos["a"].permitir()  # otra petición tomó la sonda
+    with pytest.raises(PACNoDisponible, match="Se está verificando"):
+        _timbrar(router)
+
+
+def test_circuito_abierto_pasa_al_respaldo(monkeypatch):
+    monkeypatch.setattr(pac_router.settings, "PAC_CB_ENFRIAMIENTO_S", 60.0)
+    a, b = _Proveedor("a"), _Proveedor("b")
+    router = PACRouter([a, b])
+    router._circuitos["a"]._abrir()
+    assert _timbrar(router)["uuid"] == "UUID-b"
+    assert a.llamadas == 0
+
+
+def test_proveedor_incompleto_no_se_instancia():
+    class _SoloTimbra(ProveedorPAC):
+        def timbrar_factura(self, *, db, factura_id, **opciones):
+            return {}
+
+    with pytest.raises(TypeError, match="abstract"):
+        _SoloTimbra()
+
+
+def test_prefiere_el_mas_rapido():
+    a, b = _Proveedor("a"), _Proveedor("b")
+    router = PACRouter([a, b])
+    for _ in range(5):
+        router._ventanas["a"].registrar(True, 900.0)
+        router._ventanas["b"].registrar(True, 120.0)
+    assert [p.nombre for p in router.orden()] == ["b", "a"]
+    assert _timbrar(router)["uuid"] == "UUID-b"
+
+
+@pytest.fixture
+def router_con_respaldo(fake_pac, monkeypatch):
+    """Endpoint principal sin servicio (conexión rechazada) y el PAC falso de respaldo."""
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    puerto_muerto = s.getsockname()[1]
+    s.close()
+    monkeypatch.setattr(pac_router.settings, "FM_TIMBRADO_URL", f"http://127.0.0.1:{puerto_muerto}/soap")
+    monkeypatch.setattr(pac_router.settings, "FM_TIMBRADO_URLS_RESPALDO", [f"{fake_pac.url}/timbrado/soap"])
+    pac_router.reiniciar_router()
+    yield fake_pac
+    pac_router.reiniciar_router()
+
+
+def test_timbrado_hace_failover_al_respaldo(auth_client, db_session, csd_dir, router_con_respaldo):
+    fid = _factura(auth_client, db_session, csd_dir)
+
+    r = auth_client.post(f"/api/facturas/{fid}/timbrar")
+    assert r.status_code == 200, r.text
+    f = db_session.get(Factura, UUID(fid))
+    db_session.refresh(f)
+    assert f.estatus == "TIMBRADA"
+    assert router_con_respaldo.estado.peticiones["timbrar"] == 1
+
+    m = auth_client.get("/health/pac").json()
+    assert m["failovers"] == 1
+    assert m["proveedores"]["facturacion_moderna"]["errores"] == 1 + pac_router.settings.PAC_REINTENTOS
+    assert m["proveedores"]["facturacion_moderna_respaldo1"]["elegido"] == 1
+
+
+def test_circuito_abierto_devuelve_503(auth_client, db_session, csd_dir, fake_pac, monkeypatch):
+    monkeypatch.setattr(pac_router.settings, "FM_TIMBRADO_URL", f"{fake_pac.url}/timbrado/soap")
+    monkeypatch.setattr(pac_router.settings, "FM_TIMBRADO_URLS_RESPALDO", [])
+    monkeypatch.setattr(pac_router.settings, "PAC_CB_ENFRIAMIENTO_S", 60.0)
+    pac_router.reiniciar_router()
+    try:
+        fid = _factura(auth_client, db_session, csd_dir)
+        pac_router.get_router()._circuitos["facturacion_moderna"]._abrir()
+
+        r = auth_client.post(f"/api/facturas/{fid}/timbrar")
+        assert r.status_code == 503, r.text
+        assert "Intenta de nuevo" in r.json()["error"]["detail"]
+        assert fake_pac.estado.peticiones.get("timbrar", 0) == 0
+        assert auth_client.get("/health/pac").json()["proveedores"]["facturacion_moderna"]["circuito"]["estado"] == ABIERTO
+    finally:
+        pac_router.reiniciar_router()
@@ -0,0 +1,106 @@
+# tests/test_paquete.py
+"""Paquete ZIP por periodo: XML + PDF timbrados e índice CSV, generado en streaming."""
+import csv
+import io
+import os
+import zipfile
+from dataclasses import replace
+from datetime import date, timedelta
+from uuid import UUID
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app import database
+from app.models.factura import Factura
+from app.services import paquete_service, pdf_cache, pdf_factura
+
+from tests.test_fake_pac import _factura
+
+
+@pytest.fixture
+def sesiones_worker(db_session, monkeypatch):
+    """Los hilos del ZIP abren sesión con SessionLocal: aquí sobre la transacción de prueba."""
+    sesiones = lambda: Session(bind=db_session.connection(), join_transaction_mode="create_savepoint")
+    monkeypatch.setattr(database, "SessionLocal", sesiones)
+    # Un solo hilo: comparten la conexión de SQLite
+    monkeypatch.setattr(paquete_service.settings, "PAQUETE_WORKERS", 1)
+    return sesiones
+
+
+def _timbrada(auth_client, db_session, csd_dir):
+    fid = _factura(auth_client, db_session, csd_dir)
+    assert auth_client.post(f"/api/facturas/{fid}/timbrar").status_code == 200
+    f = db_session.get(Factura, UUID(fid))
+    db_session.refresh(f)
+    return f
+
+
+def _paquete(auth_client, empresa_id, desde, hasta):
+    r = auth_client.get(
+        "/api/facturas/paquete", params={"empresa_id": str(empresa_id), "desde": str(desde), "hasta": str(hasta)}
+    )
+    assert r.status_code == 200, r.text
+    assert r.headers["content-type"] == "application/zip"
+    zf = zipfile.ZipFile(io.BytesIO(r.content))
+    assert zf.testzip() is None
+    indice = list(csv.DictReader(io.StringIO(zf.read("indice.csv").decode("utf-8-sig"))))
+    return r, zf, indice
+
+
+def test_paquete_con_xml_pdf_e_indice(auth_client, db_session, csd_dir, fake_pac, sesiones_worker, monkeypatch):
+    f = _timbrada(auth_client, db_session, csd_dir)
+    renders = []
+    render = pdf_factura.render_factura_pdf_bytes_from_model
+    monkeypatch.setattr(
+        pdf_factura, "render_factura_pdf_bytes_from_model", lambda db, fid, **kw: renders.append(fid) or render(db, fid, **kw)
+    )
+    hoy = (f.fecha_emision or f.fecha_timbrado).date()
+
+    r, zf, indice = _paquete(auth_client, f.empresa_id, hoy, hoy)
+    base = f"EKU9003173C9-{f.serie}-{f.folio}"
+    assert sorted(zf.namelist()) == sorted([f"xml/{base}.xml", f"pdf/{base}.pdf", "indice.csv"])
+    with open(f.xml_path, "rb") as fh:
+        assert zf.read(f"xml/{base}.xml") == fh.read()
+    assert zf.read(f"pdf/{base}.pdf").startswith(b"%PDF") and len(renders) == 1
+    assert f'filename="facturas_EKU9003173C9_{hoy:%Y%m%d}-{hoy:%Y%m%d}.zip"' in r.headers["content-disposition"]
+    assert [(i["uuid"], i["estatus"], i["xml"], i["observaciones"]) for i in indice] == [
+        (f.cfdi_uuid, "TIMBRADA", f"xml/{base}.xml", "")
+    ]
+
+    # El PDF ya quedó en el caché: la segunda descarga no lo vuelve a generar
+    ruta, _ = pdf_cache.obtener_pdf(db_session, pdf_factura.load_factura_full(db_session, f.id))
+    _paquete(auth_client, f.empresa_id, hoy, hoy)
+    assert len(renders) == 1 and os.path.exists(ruta)
+
+    # Fuera del periodo: sólo el índice vacío
+    _, zf, indice = _paquete(auth_client, f.empresa_id, hoy + timedelta(days=1), hoy + timedelta(days=30))
+    assert zf.namelist() == ["indice.csv"] and indice == []
+
+
+def test_paquete_anota_xml_faltante(auth_client, db_session, csd_dir, fake_pac, sesiones_worker):
+    f = _timbrada(auth_client, db_session, csd_dir)
+    os.remove(f.xml_path)
+    hoy = (f.fecha_emision or f.fecha_timbrado).date()
+
+    _, zf, indice = _paquete(auth_client, f.empresa_id, hoy, hoy)
+    assert [n.split("/")[0] for n in zf.namelist()] == ["pdf", "indice.csv"]
+    assert indice[0]["xml"] == "" and indice[0]["observaciones"] == "XML no encontrado"
+
+
+def test_generar_zip_entrega_por_bloques(auth_client, db_session, csd_dir, fake_pac, sesiones_worker, monkeypatch):
+    f = _timbrada(auth_client, db_session, csd_dir)
+    monkeypatch.setattr(paquete_service, "BLOQUE", 4096)
+    (doc,) = paquete_service.documentos_facturas(db_session, f.empresa_id, date(2000, 1, 1), date(2100, 1, 1))
+    # El mismo comprobante con 20 nombres, como un periodo con muchos documentos
+    documentos = [replace(doc, nombre=f"{doc.nombre}-{i}") for i in range(20)]
+    bloques = list(paquete_service.generar_zip(documentos, session_factory=sesiones_worker))
+    assert len(bloques) > 20 and max(len(b) for b in bloques) < 64 * 1024
+    assert len(zipfile.ZipFile(io.BytesIO(b"".join(bloques))).namelist()) == 41
+
+
+def test_paquete_valida_periodo(auth_client, usuario_admin):
+    usuario, _ = usuario_admin
+    params = {"empresa_id": str(usuario.empresa_id), "desde": "2025-02-01", "hasta": "2025-01-01"}
+    assert auth_client.get("/api/facturas/paquete", params=params).status_code == 400
+    assert auth_client.get("/api/pagos/paquete", params={**params, "hasta": "2025-02-28"}).status_code == 200
@@ -0,0 +1,182 @@
+# tests/test_pdf_cache.py
+"""Caché en disco del PDF final: clave por estatus/plantilla/logo, ETag, pre-render y administración."""
+import os
+from datetime import datetime
+from uuid import UUID, uuid4
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app.models.factura import Factura
+from app.models.pago import EstatusPago, Pago
+from app.services import acuse_cancelacion_service, factura_service, pago_service, pdf_cache, pdf_factura, pdf_pago
+
+from tests.test_fake_pac import _factura
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    """Cuenta los render reales del PDF."""
+    llamadas = []
+    render = pdf_factura.render_factura_pdf_bytes_from_model
+
+    def contar(db, factura_id, **kw):
+        llamadas.append(factura_id)
+        return render(db, factura_id, **kw)
+
+    monkeypatch.setattr(pdf_factura, "render_factura_pdf_bytes_from_model", contar)
+    return llamadas
+
+
+def _timbrada(auth_client, db_session, csd_dir):
+    fid = _factura(auth_client, db_session, csd_dir)
+    assert auth_client.post(f"/api/facturas/{fid}/timbrar").status_code == 200
+    return fid
+
+
+def _archivos(fid):
+    carpeta = os.path.join(pdf_cache.directorio(), fid)
+    return sorted(os.listdir(carpeta)) if os.path.isdir(carpeta) else []
+
+
+def test_descarga_desde_cache_con_etag(auth_client, db_session, csd_dir, fake_pac, renders):
+    fid = _timbrada(auth_client, db_session, csd_dir)
+
+    r = auth_client.get(f"/api/facturas/{fid}/pdf")
+    assert r.status_code == 200, r.text
+    assert r.content.startswith(b"%PDF") and r.headers["content-type"] == "application/pdf"
+    etag = r.headers["etag"]
+    assert r.headers["last-modified"] and _archivos(fid) == [f"{etag.strip(chr(34))}.pdf"]
+
+    # Segunda descarga y correo: mismo archivo, sin volver a renderizar
+    assert auth_client.get(f"/api/facturas/{fid}/pdf").content == r.content
+    assert factura_service.generar_pdf_bytes(db_session, UUID(fid), preview=False) == r.content
+    assert len(renders) == 1
+
+    r = auth_client.get(f"/api/facturas/{fid}/pdf", headers={"If-None-Match": etag})
+    assert r.status_code == 304 and r.headers["etag"] == etag and not r.content
+
+
+def test_cambio_de_estatus_o_plantilla_invalida(auth_client, db_session, csd_dir, fake_pac, renders, monkeypatch):
+    fid = _timbrada(auth_client, db_session, csd_dir)
+    etag_timbrada = auth_client.get(f"/api/facturas/{fid}/pdf").headers["etag"]
+
+    f = db_session.get(Factura, UUID(fid))
+    f.estatus = "CANCELADA"
+    db_session.commit()
+    etag_cancelada = auth_client.get(f"/api/facturas/{fid}/pdf").headers["etag"]
+    assert etag_cancelada != etag_timbrada and len(renders) == 2
+    # La versión anterior se borra al escribir la nueva
+    assert _archivos(fid) == [f"{etag_cancelada.strip(chr(34))}.pdf"]
+
+    monkeypatch.setattr(pdf_cache, "_version", "otra-plantilla")
+    assert auth_client.get(f"/api/facturas/{fid}/pdf").headers["etag"] != etag_cancelada
+    assert len(renders) == 3
+
+
+def test_datos_editables_de_la_empresa_invalidan(auth_client, db_session, csd_dir, fake_pac, renders):
+    fid = _timbrada(auth_client, db_session, csd_dir)
+    etag = auth_client.get(f"/api/facturas/{fid}/pdf").headers["etag"]
+    emp = db_session.get(Factura, UUID(fid)).empresa
+
+    for campo, valor in (("beneficiario", "OTRO BENEFICIARIO"), ("telefono", "5550000000"), ("email", "nuevo@x.mx")):
+        setattr(emp, campo, valor)
+        db_session.commit()
+        nuevo = auth_client.get(f"/api/facturas/{fid}/pdf").headers["etag"]
+        assert nuevo != etag, campo
+        etag = nuevo
+    assert len(renders) == 4
+
+
+def test_borrador_no_tiene_pdf_final(auth_client, db_session, csd_dir, fake_pac):
+    fid = _factura(auth_client, db_session, csd_dir)
+    assert auth_client.get(f"/api/facturas/{fid}/pdf").status_code == 409
+    assert _archivos(fid) == []
+
+
+def test_administracion_del_cache(auth_client, db_session, csd_dir, fake_pac, renders, monkeypatch):
+    fid = _timbrada(auth_client, db_session, csd_dir)
+    sesiones = lambda: Session(bind=db_session.connection(), join_transaction_mode="create_savepoint")
+
+    resumen = pdf_cache.reconstruir(sesiones)
+    assert (resumen["generados"], resumen["vigentes"], resumen["errores"]) == (1, 0, 0)
+    assert pdf_cache.reconstruir(sesiones)["vigentes"] == 1 and len(renders) == 1
+
+    estado = auth_client.get("/api/facturas/pdf/cache").json()
+    assert estado["archivos"] == 1 and estado["bytes"] > 0
+
+    lanzadas = []
+    monkeypatch.setattr(pdf_cache, "reconstruir", lambda **kw: lanzadas.append(kw))
+    r = auth_client.post("/api/facturas/pdf/cache/reconstruir")
+    assert r.status_code == 202 and lanzadas == [{"empresa_id": None}]
+
+    r = auth_client.delete("/api/facturas/pdf/cache")
+    assert r.status_code == 200 and r.json() == {"eliminados": 1}
+    assert _archivos(fid) == [] and auth_client.get("/api/facturas/pdf/cache").json()["archivos"] == 0
+
+
+def test_timbrar_y_cancelar_programan_prerender(auth_client, db_session, csd_dir, fake_pac, monkeypatch):
+    programados = []
+    monkeypatch.setattr(pdf_cache, "programar_prerender", lambda tipo, doc_id, **kw: programados.append((tipo, doc_id, kw)))
+    fid = _timbrada(auth_client, db_session, csd_dir)
+    assert programados == [(pdf_cache.FACTURA, UUID(fid), {})]
+
+    r = auth_client.post(f"/api/facturas/{fid}/cancelar", json={"motivo_cancelacion": "02"})
+    assert r.status_code == 200, r.text
+    assert programados[-1] == (pdf_cache.FACTURA, UUID(fid), {"acuse": True})
+
+
+def test_prerender_deja_pdf_y_acuse_listos(auth_client, db_session, csd_dir, fake_pac, renders, monkeypatch):
+    sesiones = lambda: Session(bind=db_session.connection(), join_transaction_mode="create_savepoint")
+
+    def prerender(fid, **kw):
+        # Se invoca a mano: el hook de la API usaría SessionLocal en otro hilo
+        monkeypatch.setattr(pdf_cache.settings, "PDF_PRERENDER_ACTIVO", True)
+        try:
+            return pdf_cache.programar_prerender(pdf_cache.FACTURA, UUID(fid), session_factory=sesiones, **kw).result()
+        finally:
+            monkeypatch.setattr(pdf_cache.settings, "PDF_PRERENDER_ACTIVO", False)
+
+    fid = _timbrada(auth_client, db_session, csd_dir)
+    antes = pdf_cache.metricas_prerender()
+    ruta = prerender(fid)
+    assert ruta and os.path.exists(ruta) and len(renders) == 1
+    # La primera descarga ya es lectura del archivo
+    assert auth_client.get(f"/api/facturas/{fid}/pdf").status_code == 200 and len(renders) == 1
+
+    metricas = auth_client.get("/api/facturas/pdf/cache").json()["prerender"]
+    assert metricas["generados"] == antes["generados"] + 1 and metricas["p50_ms"] >= 0
+
+    assert auth_client.post(f"/api/facturas/{fid}/cancelar", json={"motivo_cancelacion": "02"}).status_code == 200
+    f = db_session.get(Factura, UUID(fid))
+    db_session.refresh(f)
+    assert f.estatus == "CANCELADA"
+    prerender(fid, acuse=True)
+    assert len(renders) == 2 and fake_pac.estado.peticiones["acuse"] == 1
+    assert os.path.exists(os.path.join(acuse_cancelacion_service._ACUSES_DIR, f"{f.cfdi_uuid}.xml"))
+    assert pdf_cache.metricas_prerender()["acuses"] == antes["acuses"] + 1
+
+
+def test_pdf_de_pago_timbrado_desde_cache(auth_client, db_session, csd_dir, fake_pac, monkeypatch):
+    renders = []
+    render = pdf_pago.render_pago_pdf_bytes_from_model
+    monkeypatch.setattr(
+        pdf_pago, "render_pago_pdf_bytes_from_model", lambda db, pid, **kw: renders.append(pid) or render(db, pid, **kw)
+    )
+    f = db_session.get(Factura, UUID(_factura(auth_client, db_session, csd_dir)))
+    pago = Pago(
+        empresa_id=f.empresa_id, cliente_id=f.cliente_id, folio="1", fecha_pago=datetime(2025, 1, 15),
+        forma_pago_p="03", moneda_p="MXN", monto=100, estatus=EstatusPago.TIMBRADO, uuid=str(uuid4()).upper(),
+    )
+    db_session.add(pago)
+    db_session.commit()
+
+    pdf, nombre = pago_service.get_pago_pdf(db_session, pago.id)
+    assert pdf.startswith(b"%PDF") and nombre == "Pago-1.pdf"
+    assert pago_service.get_pago_pdf(db_session, pago.id)[0] == pdf and len(renders) == 1
+    assert _archivos(str(pago.id)) == [f"{pdf_cache.clave_pdf_pago(pago)}.pdf"]
+
+    pago.estatus = EstatusPago.CANCELADO
+    db_session.commit()
+    assert pago_service.get_pago_pdf(db_session, pago.id)[0] != pdf and len(renders) == 2
+    assert pdf_cache.purgar(db_session, empresa_id=f.empresa_id) == 1
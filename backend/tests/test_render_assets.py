@@ -0,0 +1,89 @@
+# tests/test_render_assets.py
+"""Caché de logos (ruta por empresa, imagen decodificada y reducida) y QR vectorial."""
+import io
+import os
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+import qrcode
+from PIL import Image
+from reportlab.pdfgen import canvas
+
+from app.services import render_assets
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(render_assets.settings, "DATA_DIR", str(tmp_path))
+    render_assets.limpiar()
+    yield tmp_path
+    render_assets.limpiar()
+
+
+def _png(ruta, tamano=(1200, 600), color=(200, 30, 30, 255)):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    Image.new("RGBA", tamano, color).save(ruta)
+    return str(ruta)
+
+
+def test_ruta_logo_por_empresa_cacheada(data_dir, monkeypatch):
+    emp = SimpleNamespace(id=uuid4(), logo=None)
+    convencional = _png(data_dir / "logos" / "empresas" / f"{emp.id}.png")
+
+    sondeos = []
+    isfile = os.path.isfile
+    monkeypatch.setattr(render_assets.os.path, "isfile", lambda p: sondeos.append(p) or isfile(p))
+    assert render_assets.ruta_logo_empresa(emp) == convencional
+    assert render_assets.ruta_logo_empresa(emp) == convencional and len(sondeos) == 1
+
+    # Cambiar el logo de la empresa cambia la clave; relativo a DATA_DIR
+    monkeypatch.setattr(render_assets, "LOGO_RUTA_TTL_S", 0)
+    emp.logo = "logos/subido.png"
+    subido = _png(data_dir / "logos" / "subido.png")
+    assert render_assets.ruta_logo_empresa(emp) == subido
+
+    # Al vencer el TTL se vuelve a resolver
+    os.remove(subido)
+    assert render_assets.ruta_logo_empresa(emp) == convencional
+    assert render_assets.ruta_logo_empresa(SimpleNamespace(id=uuid4(), logo=None)) is None
+
+
+def test_logo_decodificado_reducido_y_cacheado(data_dir):
+    ruta = _png(data_dir / "logo.png", tamano=(3000, 1500))
+
+    logo = render_assets.logo(ruta, 180, 108)
+    assert (logo.ancho, logo.alto) == (3000, 1500)  # geometría del original
+    assert logo.imagen.getSize() == (540, 270)  # 3 px por punto de la caja
+    assert render_assets.logo(ruta, 180, 108) is logo
+    assert render_assets.ajustar(logo.ancho, logo.alto, 180, 108) == (180, 90)
+
+    # Otro archivo en la misma ruta → otra firma, se vuelve a leer
+    _png(ruta, tamano=(300, 300))
+    os.utime(ruta, ns=(0, os.stat(ruta).st_mtime_ns + 10**9))
+    nuevo = render_assets.logo(ruta, 180, 108)
+    assert nuevo is not logo and nuevo.imagen.getSize() == (300, 300)
+
+    assert render_assets.logo(str(data_dir / "no-existe.png"), 180, 108) is None
+    (data_dir / "roto.png").write_bytes(b"no es png")
+    assert render_assets.logo(str(data_dir / "roto.png")) is None
+
+
+def test_qr_vectorial_con_la_matriz_de_qrcode(data_dir):
+    datos = "https://verificacfdi.facturaelectronica.sat.gob.mx/?id=ABC&re=EKU9003173C9&rr=XAXX010101000&tt=116.00"
+    qr = qrcode.QRCode(version=2, error_correction=qrcode.constants.ERROR_CORRECT_M, border=1)
+    qr.add_data(datos)
+    qr.make(fit=True)
+    matriz = qr.get_matrix()
+
+    n, tramos = render_assets._matriz_qr(datos, 2, 1)
+    assert n == len(matriz)
+    assert sum(largo for _, _, largo in tramos) == sum(sum(fila) for fila in matriz)
+    for fila, col, largo in tramos:
+        assert all(matriz[fila][col : col + largo])
+
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf)
+    render_assets.dibujar_qr(c, datos, 10, 10, 100, version=2)
+    c.save()
+    assert b"/Subtype /Image" not in buf.getvalue()
@@ -0,0 +1,305 @@
+# tests/test_sync_cancelaciones.py
+"""Sincronización de cancelaciones con el SAT: barrido por lotes y sondeo adaptativo."""
+import threading
+import time
+import uuid as uuid_mod
+from datetime import datetime, timedelta
+from uuid import UUID
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app.models.ejecucion_sync_sat import COMPLETADA, EN_CURSO, FALLIDA, EjecucionSyncSAT
+from app.models.factura import Factura
+from app.models.pago import EstatusPago, Pago
+from app.services import sat_cfdi_service, sync_cancelaciones_service
+from app.testing.fake_pac import _normalizar_total, _Timbrado
+
+from tests.test_cola_timbrado import _crear_facturas, _empresa_cliente
+
+
+@pytest.fixture
+def sesiones(db_session):
+    """Fábrica de sesiones sobre la conexión del test (cada commit es un savepoint)."""
+    return lambda: Session(bind=db_session.connection(), join_transaction_mode="create_savepoint")
+
+
+def _en_cancelacion(auth_client, db_session, fake_pac, estados):
+    """Una factura EN_CANCELACION por estado SAT ('Cancelado', 'Vigente', …) registrada en el SAT falso."""
+    emp, cli = _empresa_cliente(db_session, "SYNC")
+    ids = _crear_facturas(auth_client, emp, cli, len(estados))
+    for fid, (estado, estatus_cancelacion) in zip(ids, estados):
+        f = db_session.get(Factura, UUID(fid))
+        f.estatus = "EN_CANCELACION"
+        f.cfdi_uuid = str(uuid_mod.uuid4()).upper()
+        fake_pac.estado.timbrados[f.cfdi_uuid] = _Timbrado(
+            rfc_emisor=emp.rfc,
+            rfc_receptor=cli.rfc,
+            total=_normalizar_total(str(f.total)),
+            estado=estado,
+            estatus_cancelacion=estatus_cancelacion,
+        )
+    db_session.commit()
+    return ids
+
+
+def test_sincroniza_por_lotes_y_guarda_ejecucion(auth_client, db_session, fake_pac, sesiones):
+    ids = _en_cancelacion(
+        auth_client,
+        db_session,
+        fake_pac,
+        [("Cancelado", "Cancelado sin aceptación")] * 3
+        + [("Vigente", "En proceso")] * 2
+        + [("Vigente", "Solicitud rechazada")],
+    )
+
+    resumen = sync_cancelaciones_service.sincronizar_cancelaciones(sesiones, concurrencia=4, lote=2)
+    assert (resumen["total"], resumen["consultados"], resumen["cambios"], resumen["errores"]) == (6, 6, 4, 0)
+    assert resumen["detalle"]["por_estatus"] == {"CANCELADA": 3, "EN_CANCELACION": 2, "TIMBRADA": 1}
+    assert fake_pac.estado.peticiones["consultar"] == 6
+
+    estatus = [db_session.get(Factura, UUID(i)) for i in ids]
+    for f in estatus:
+        db_session.refresh(f)
+    assert [f.estatus for f in estatus] == ["CANCELADA"] * 3 + ["EN_CANCELACION"] * 2 + ["TIMBRADA"]
+
+    r = auth_client.get("/api/facturas/sat/sincronizaciones")
+    assert r.status_code == 200, r.text
+    (ejecucion,) = r.json()
+    assert ejecucion["estado"] == COMPLETADA and ejecucion["aplicados"] == 6 and ejecucion["cambios"] == 4
+    assert ejecucion["consulta_ms"] is not None and ejecucion["terminado_en"]
+
+
+def test_errores_del_sat_no_detienen_la_corrida(auth_client, db_session, fake_pac, sesiones, monkeypatch):
+    ids = _en_cancelacion(auth_client, db_session, fake_pac, [("Cancelado", "")] * 2)
+    consultar = sat_cfdi_service.consultar_cfdi
+    folio_malo = db_session.get(Factura, UUID(ids[0])).cfdi_uuid
+
+    def consultar_con_falla(**kw):
+        if kw["uuid"] == folio_malo:
+            raise RuntimeError("Timeout al consultar el SAT (15s)")
+        return consultar(**kw)
+
+    monkeypatch.setattr(sat_cfdi_service, "consultar_cfdi", consultar_con_falla)
+    resumen = sync_cancelaciones_service.sincronizar_cancelaciones(sesiones, concurrencia=2)
+    assert (resumen["errores"], resumen["cambios"]) == (1, 1)
+    assert resumen["detalle"]["errores"][0]["id"] == ids[0]
+    f = db_session.get(Factura, UUID(ids[0]))
+    db_session.refresh(f)
+    assert f.estatus == "EN_CANCELACION"
+
+
+def test_consultas_concurrentes_acotadas(auth_client, db_session, fake_pac, sesiones, monkeypatch):
+    _en_cancelacion(auth_client, db_session, fake_pac, [("Vigente", "En proceso")] * 8)
+    en_vuelo, maximo, lock = [0], [0], threading.Lock()
+    consultar = sat_cfdi_service.consultar_cfdi
+
+    def consultar_lento(**kw):
+        with lock:
+            en_vuelo[0] += 1
+            maximo[0] = max(maximo[0], en_vuelo[0])
+        time.sleep(0.03)
+        with lock:
+            en_vuelo[0] -= 1
+        return consultar(**kw)
+
+    monkeypatch.setattr(sat_cfdi_service, "consultar_cfdi", consultar_lento)
+    sync_cancelaciones_service.sincronizar_cancelaciones(sesiones, concurrencia=3)
+    assert 1 < maximo[0] <= 3
+
+
+def test_no_corre_si_otra_instancia_esta_en_curso(db_session, sesiones):
+    db_session.add(EjecucionSyncSAT(estado=EN_CURSO, iniciado_en=datetime.utcnow()))
+    db_session.commit()
+    assert sync_cancelaciones_service.sincronizar_cancelaciones(sesiones) is None
+
+
+def test_ejecucion_colgada_se_marca_fallida(db_session, sesiones, fake_pac):
+    vieja = EjecucionSyncSAT(estado=EN_CURSO, iniciado_en=datetime.utcnow() - timedelta(days=1))
+    db_session.add(vieja)
+    db_session.commit()
+
+    resumen = sync_cancelaciones_service.sincronizar_cancelaciones(sesiones)
+    assert resumen is not None and resumen["total"] == 0
+    db_session.refresh(vieja)
+    assert vieja.estado == FALLIDA
+
+
+# ── Sondeo adaptativo ─────────────────────────────────────────────────────────
+def _acuse(estado, estatus_cancelacion):
+    return sat_cfdi_service.AcuseSAT("S - Comprobante obtenido", estado, "", estatus_cancelacion)
+
+
+def test_programacion_con_backoff(monkeypatch):
+    monkeypatch.setattr(sync_cancelaciones_service.random, "uniform", lambda a, b: 1.0)
+    monkeypatch.setattr(sync_cancelaciones_service.settings, "SAT_POLL_BASE_MIN", 5.0)
+    monkeypatch.setattr(sync_cancelaciones_service.settings, "SAT_POLL_MAX_MIN", 30.0)
+    ahora = datetime(2026, 1, 1, 12, 0)
+    f = Factura(estatus="EN_CANCELACION")
+
+    sync_cancelaciones_service.programar_sondeo(f, ahora)
+    assert f.proxima_verificacion_sat == ahora + timedelta(minutes=2)
+
+    # Esperando al receptor: 5, 10, 20, 30 (tope)
+    esperas = []
+    for _ in range(4):
+        sync_cancelaciones_service.registrar_verificacion(f, _acuse("Vigente", "En proceso"), ahora)
+        esperas.append((f.proxima_verificacion_sat - ahora).total_seconds() / 60)
+    assert esperas == [5, 10, 20, 30]
+    assert f.ultima_verificacion_sat == ahora
+
+    # El SAT aún no refleja la solicitud: intervalo base, sin crecer
+    sync_cancelaciones_service.registrar_verificacion(f, _acuse("Vigente", ""), ahora)
+    assert f.proxima_verificacion_sat == ahora + timedelta(minutes=5)
+
+    # Resuelta: deja de sondearse
+    f.estatus = "CANCELADA"
+    sync_cancelaciones_service.registrar_verificacion(f, _acuse("Cancelado", "Cancelado sin aceptación"), ahora)
+    assert f.proxima_verificacion_sat is None and f.intentos_verificacion_sat == 0
+
+
+def test_sondeo_respeta_cupo_y_vencimientos(auth_client, db_session, fake_pac, sesiones, monkeypatch):
+    # Cupo de 2 por ciclo, una consulta cada 0.5 s
+    monkeypatch.setattr(sync_cancelaciones_service.settings, "SAT_POLL_RPM", 120)
+    monkeypatch.setattr(sync_cancelaciones_service.settings, "SAT_POLL_INTERVALO_S", 1)
+    ids = _en_cancelacion(
+        auth_client,
+        db_session,
+        fake_pac,
+        [("Cancelado", "Cancelado sin aceptación")] + [("Vigente", "En proceso")] * 3,
+    )
+    ahora = datetime.utcnow()
+    f0, f1, f2, f3 = (db_session.get(Factura, UUID(i)) for i in ids)
+    f0.proxima_verificacion_sat = None                           # sin programar: primero
+    f1.proxima_verificacion_sat = ahora - timedelta(hours=1)     # el más atrasado
+    f2.proxima_verificacion_sat = ahora - timedelta(minutes=1)   # vencido, pero excede el cupo
+    f3.proxima_verificacion_sat = ahora + timedelta(hours=1)     # aún no toca
+    db_session.commit()
+
+    t0 = time.monotonic()
+    resumen = sync_cancelaciones_service.sondear(sesiones, ahora=ahora)
+    assert (resumen["consultados"], resumen["cambios"], resumen["errores"]) == (2, 1, 0)
+    # Las consultas se reparten en el ciclo, no salen en ráfaga
+    assert time.monotonic() - t0 >= 0.5
+    for f in (f0, f1, f2, f3):
+        db_session.refresh(f)
+    assert f0.estatus == "CANCELADA" and f0.proxima_verificacion_sat is None
+    assert f1.estatus == "EN_CANCELACION" and f1.intentos_verificacion_sat == 1
+    assert f1.ultima_verificacion_sat is not None and f1.proxima_verificacion_sat > ahora
+    assert f2.ultima_verificacion_sat is None and f3.ultima_verificacion_sat is None
+
+    estado = auth_client.get("/api/facturas/sat/sondeo").json()
+    assert estado["cupo_por_ciclo"] == 2 and estado["ultimo"]["consultados"] == 2
+    assert estado["cola"]["factura"]["en_cancelacion"] == 3
+
+
+def test_pendientes_mezclan_facturas_y_pagos_por_atraso(auth_client, db_session, fake_pac):
+    ids = _en_cancelacion(auth_client, db_session, fake_pac, [("Vigente", "En proceso")] * 2)
+    ahora = datetime.utcnow()
+    f0, f1 = (db_session.get(Factura, UUID(i)) for i in ids)
+    f0.proxima_verificacion_sat = ahora - timedelta(minutes=1)
+    f1.proxima_verificacion_sat = ahora - timedelta(minutes=2)
+    pago = Pago(
+        empresa_id=f0.empresa_id, cliente_id=f0.cliente_id, folio="1", fecha_pago=ahora, forma_pago_p="03",
+        moneda_p="MXN", monto=100, estatus=EstatusPago.EN_CANCELACION, uuid=str(uuid_mod.uuid4()).upper(),
+        proxima_verificacion_sat=ahora - timedelta(hours=1),
+    )
+    db_session.add(pago)
+    db_session.commit()
+
+    # El pago más atrasado no espera a que se agoten las facturas
+    pendientes = sync_cancelaciones_service.cargar_pendientes(db_session, vencidos_a=ahora, limite=2)
+    assert [(p.tipo, p.id) for p in pendientes] == [
+        (sync_cancelaciones_service.PAGO, pago.id),
+        (sync_cancelaciones_service.FACTURA, f1.id),
+    ]
+
+
+def test_sondeo_se_salta_si_otra_instancia_tiene_el_turno(auth_client, db_session, fake_pac, sesiones, monkeypatch):
+    ids = _en_cancelacion(auth_client, db_session, fake_pac, [("Cancelado", "Cancelado sin aceptación")])
+    monkeypatch.setattr(sync_cancelaciones_service, "_turno_sondeo", lambda db: False)
+
+    resumen = sync_cancelaciones_service.sondear(sesiones)
+    assert resumen["omitido"] and resumen["consultados"] == 0
+    f = db_session.get(Factura, UUID(ids[0]))
+    db_session.refresh(f)
+    assert f.estatus == "EN_CANCELACION" and f.ultima_verificacion_sat is None
+
+
+def test_limitador_separa_turnos():
+    limitador = sync_cancelaciones_service.Limitador(0.05)
+    t0 = time.monotonic()
+    hilos = [threading.Thread(target=limitador.esperar) for _ in range(4)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert limitador.consultas == 4 and time.monotonic() - t0 >= 0.15
+
+
+def test_cancelacion_con_aceptacion_programa_sondeo(auth_client, db_session, csd_dir, fake_pac):
+    from tests.test_fake_pac import _factura
+
+    fake_pac.config.cancelacion_con_aceptacion = True
+    fid = _factura(auth_client, db_session, csd_dir)
+    assert auth_client.post(f"/api/facturas/{fid}/timbrar").status_code == 200
+    r = auth_client.post(f"/api/facturas/{fid}/cancelar", json={"motivo_cancelacion": "02"})
+    assert r.status_code == 200, r.text
+
+    f = db_session.get(Factura, UUID(fid))
+    db_session.refresh(f)
+    assert f.estatus == "EN_CANCELACION"
+    espera = f.proxima_verificacion_sat - datetime.utcnow()
+    assert timedelta(0) < espera <= timedelta(minutes=sync_cancelaciones_service.settings.SAT_POLL_PRIMERA_MIN)
+
+
+# ── Datos de la consulta desde el XML timbrado ────────────────────────────────
+_XML = (
+    '<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/4" Total="{total}">'
+    '<cfdi:Emisor Rfc="EKU9003173C9"/><cfdi:Receptor Rfc="xaxx010101000"/>'
+    '<cfdi:Complemento><tfd:TimbreFiscalDigital xmlns:tfd="http://www.sat.gob.mx/TimbreFiscalDigital"'
+    ' UUID="6f1c2a9b-1111-4000-8000-000000000001"/></cfdi:Complemento></cfdi:Comprobante>'
+)
+
+
+def test_datos_desde_xml_cacheados_por_archivo(tmp_path, monkeypatch):
+    ruta = tmp_path / "cfdi.xml"
+    ruta.write_text(_XML.format(total="1160.01"))
+    lecturas = []
+    leer = sat_cfdi_service._leer_datos_xml
+    monkeypatch.setattr(sat_cfdi_service, "_leer_datos_xml", lambda p: lecturas.append(p) or leer(p))
+
+    datos = sat_cfdi_service.datos_desde_xml(str(ruta))
+    assert datos == sat_cfdi_service.DatosCFDI(
+        "EKU9003173C9", "XAXX010101000", "1160.01", "6F1C2A9B-1111-4000-8000-000000000001"
+    )
+    assert sat_cfdi_service.datos_desde_xml(str(ruta)) == datos and len(lecturas) == 1
+
+    # Si el archivo cambia se vuelve a leer
+    ruta.write_text(_XML.format(total="99.50") + " ")
+    assert sat_cfdi_service.datos_desde_xml(str(ruta)).total == "99.50" and len(lecturas) == 2
+
+    # Sin archivo o sin timbre: None (la consulta usa los datos de la BD)
+    assert sat_cfdi_service.datos_desde_xml(str(tmp_path / "no.xml")) is None
+    sin_timbre = tmp_path / "sin_timbre.xml"
+    sin_timbre.write_text('<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/4" Total="1"/>')
+    assert sat_cfdi_service.datos_desde_xml(str(sin_timbre)) is None
+
+
+def test_sync_consulta_con_el_total_timbrado(auth_client, db_session, csd_dir, fake_pac, sesiones):
+    from tests.test_fake_pac import _factura
+
+    fid = _factura(auth_client, db_session, csd_dir)
+    assert auth_client.post(f"/api/facturas/{fid}/timbrar").status_code == 200
+    f = db_session.get(Factura, UUID(fid))
+    db_session.refresh(f)
+    fake_pac.estado.timbrados[f.cfdi_uuid].estado = "Cancelado"
+    # La BD ya no coincide con lo timbrado: con sus datos el SAT respondería N - 601
+    f.total = f.total + 1
+    f.estatus = "EN_CANCELACION"
+    db_session.commit()
+
+    resumen = sync_cancelaciones_service.sincronizar_cancelaciones(sesiones)
+    assert (resumen["errores"], resumen["cambios"]) == (0, 1)
+    db_session.refresh(f)
+    assert f.estatus == "CANCELADA"
@@ -0,0 +1,78 @@
+import threading
+import time
+from uuid import UUID, uuid4
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.factura import Factura
+from app.services import cola_timbrado, factura_service
+from app.services import timbrado_lote
+
+from tests.test_cola_timbrado import _crear_facturas, _empresa_cliente
+
+UUID_FALSO = "11111111-2222-3333-4444-{:012d}"
+
+
+def test_timbrar_lote_encola_y_reporta_por_factura(auth_client, db_session, monkeypatch):
+    emp, cli = _empresa_cliente(db_session, "LOTE")
+    ok_id, otra_id, timbrada_id = _crear_facturas(auth_client, emp, cli, 3)
+    f = db_session.get(Factura, UUID(timbrada_id))
+    f.estatus = "TIMBRADA"
+    db_session.commit()
+
+    def timbrar_falso(db, factura_id):
+        raise AssertionError("el lote no debe llamar al PAC dentro de la petición")
+
+    monkeypatch.setattr(factura_service, "timbrar_factura", timbrar_falso)
+    monkeypatch.setattr(cola_timbrado.settings, "TIMBRADO_WORKERS_EN_PROCESO", False)
+    # Un trabajo ya activo se reutiliza
+    previo = cola_timbrado.encolar_timbrado(db_session, db_session.get(Factura, UUID(otra_id)))
+    inexistente = "00000000-0000-0000-0000-000000000bad"
+
+    r = auth_client.post(
+        "/api/facturas/timbrar-lote", json={"ids": [ok_id, otra_id, timbrada_id, inexistente]}
+    )
+    assert r.status_code == 202, r.text
+    data = r.json()
+    assert (data["total"], data["encoladas"], data["errores"]) == (4, 2, 2)
+    assert [it["id"] for it in data["resultados"]] == [ok_id, otra_id, timbrada_id, inexistente]
+    assert data["resultados"][0]["ok"] and data["resultados"][0]["estado"] == "EN_COLA"
+    assert data["resultados"][1]["trabajo_id"] == str(previo.id)
+    assert data["resultados"][2]["error"] == "Solo se puede timbrar una factura en BORRADOR"
+    assert data["resultados"][3]["error"] == "Factura no encontrada"
+
+    trabajo = cola_timbrado.obtener_trabajo(db_session, UUID(data["resultados"][0]["trabajo_id"]))
+    assert str(trabajo.factura_id) == ok_id and trabajo.usuario_id is not None
+
+    r = auth_client.post(
+        "/api/facturas/timbrar-lote", json={"ids": [str(uuid4()) for _ in range(501)]}
+    )
+    assert r.status_code == 422
+
+
+def test_timbrar_lote_concurrencia_acotada(auth_client, db_session, monkeypatch, tmp_path):
+    emp, cli = _empresa_cliente(db_session, "PARALELO")
+    ids = _crear_facturas(auth_client, emp, cli, 6)
+
+    en_vuelo, maximo, lock = [0], [0], threading.Lock()
+
+    def timbrar_falso(db, factura_id):
+        with lock:
+            en_vuelo[0] += 1
+            maximo[0] = max(maximo[0], en_vuelo[0])
+        time.sleep(0.05)
+        with lock:
+            en_vuelo[0] -= 1
+        return {"ok": True, "uuid": str(factura_id)}
+
+    monkeypatch.setattr(factura_service, "timbrar_factura", timbrar_falso)
+    # Cada hilo abre su propia sesión
+    sesiones = sessionmaker(bind=create_engine(f"sqlite:///{tmp_path / 'hilos.db'}"))
+
+    resultados = timbrado_lote.timbrar_facturas_lote(
+        db_session, [UUID(i) for i in ids], max_concurrencia=3, session_factory=sesiones
+    )
+    assert [str(r["id"]) for r in resultados] == ids
+    assert all(r["ok"] and r["uuid"] == str(r["id"]) for r in resultados)
+    assert 1 < maximo[0] <= 3